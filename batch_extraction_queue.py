@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import time
+
+
+class BatchExtractionQueue:
+    """
+    Kolejka ekstrakcji offline dla reprocess / backfillu (Batch API zgodne z OpenAI).
+
+    Zadania (jeden request /v1/chat/completions na mail) zapisywane są w pliku JSONL, wysyłane jednym
+    plikiem do endpointu batchy, a wyniki pobierane po zakończeniu batcha. Requesty batcha nie liczą się
+    do dziennego limitu pętli na żywo (OpenAIHandler.daily_limit).
+
+    Stan (<job_file>.state.json) przechowuje id wysłanego batcha - przerwany reprocess przy kolejnym
+    uruchomieniu czeka na ten sam batch zamiast wysyłać zadania ponownie.
+    """
+
+    ENDPOINT = "/v1/chat/completions"
+    TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+    def __init__(self, client, job_file="batch_jobs.jsonl", completion_window="24h", poll_interval=60, max_wait_hours=24):
+        self.client = client
+        self.job_file = job_file
+        self.state_file = job_file + ".state.json"
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait_hours * 3600
+        self.jobs = 0
+        self.state = self._load_state()
+
+    @classmethod
+    def from_config(cls):
+        """Kolejka z ustawień BATCH_QUEUE (osobny klient - endpoint modeli GitHub nie obsługuje batchy)"""
+        import config
+        from openai import OpenAI
+
+        settings = getattr(config, 'BATCH_QUEUE', {})
+        client = OpenAI(base_url=settings.get('base_url'), api_key=settings.get('api_key') or config.OPENAI_API_KEY)
+        return cls(
+            client,
+            job_file=settings.get('job_file', 'batch_jobs.jsonl'),
+            completion_window=settings.get('completion_window', '24h'),
+            poll_interval=settings.get('poll_interval', 60),
+            max_wait_hours=settings.get('max_wait_hours', 24)
+        )
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.error(f"Błąd podczas ładowania stanu kolejki offline: {e}")
+        return {}
+
+    def _save_state(self):
+        tmp_file = self.state_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logging.error(f"Błąd podczas zapisywania stanu kolejki offline: {e}")
+
+    @property
+    def submitted(self):
+        """Czy batch z poprzedniego uruchomienia czeka na wyniki"""
+        return bool(self.state.get('batch_id'))
+
+    def clear(self):
+        """Usuwa plik zadań i stan (nowa kolejka)"""
+        for path in (self.job_file, self.state_file):
+            if os.path.exists(path):
+                os.remove(path)
+        self.jobs = 0
+        self.state = {}
+
+    def add(self, custom_id, model, messages, temperature=0.1):
+        """Dopisuje zadanie do pliku JSONL"""
+        job = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.ENDPOINT,
+            "body": {"model": model, "messages": messages, "temperature": temperature}
+        }
+        with open(self.job_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(job, ensure_ascii=False) + "\n")
+        self.jobs += 1
+
+    def submit(self):
+        """Wysyła plik zadań i tworzy batch; zwraca id batcha"""
+        with open(self.job_file, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self.ENDPOINT,
+            completion_window=self.completion_window
+        )
+        self.state = {'batch_id': batch.id, 'input_file_id': input_file.id, 'jobs': self.jobs, 'submitted_at': time.time()}
+        self._save_state()
+        logging.info(f"📤 Kolejka offline: wysłano {self.jobs} zadań (batch {batch.id})")
+        return batch.id
+
+    def wait(self):
+        """Czeka na zakończenie batcha; zwraca obiekt batcha albo None po przekroczeniu max_wait_hours"""
+        batch_id = self.state['batch_id']
+        deadline = time.time() + self.max_wait
+        last_status = None
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status != last_status:
+                counts = getattr(batch, 'request_counts', None)
+                progress = f" ({counts.completed}/{counts.total})" if counts else ""
+                logging.info(f"⏳ Kolejka offline: batch {batch_id} - {batch.status}{progress}")
+                last_status = batch.status
+            if batch.status in self.TERMINAL_STATUSES:
+                return batch
+            if time.time() >= deadline:
+                logging.warning(f"⚠️ Kolejka offline: batch {batch_id} niezakończony - wyniki przy kolejnym uruchomieniu")
+                return None
+            time.sleep(self.poll_interval)
+
+    def results(self, batch):
+        """Treści odpowiedzi zakończonych zadań: {custom_id: treść}"""
+        if not batch.output_file_id:
+            logging.warning(f"⚠️ Kolejka offline: batch {batch.id} ({batch.status}) bez pliku wyników")
+            return {}
+
+        contents = {}
+        errors = 0
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                response = item.get('response') or {}
+                if item.get('error') or response.get('status_code') != 200:
+                    errors += 1
+                    continue
+                contents[item['custom_id']] = response['body']['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                logging.warning(f"⚠️ Kolejka offline: niepoprawna linia wyników: {e}")
+                errors += 1
+
+        logging.info(f"📥 Kolejka offline: {len(contents)} odpowiedzi, {errors} błędów")
+        return contents
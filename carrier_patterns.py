@@ -0,0 +1,224 @@
+import logging
+import re
+import threading
+import time
+
+
+class PatternRegistry:
+    """
+    Rejestr skompilowanych wzorców regex przewoźników (klucz: przewoźnik + nazwa).
+
+    Wzorce są kompilowane raz przy imporcie modułu i mają nazwane grupy
+    (package_number, pickup_code, date...). Nazwa może wskazywać listę wzorców -
+    search zwraca pierwsze trafienie w kolejności listy (jak dawne pętle po patterns).
+    Wzorce zależne od danych z maila (np. kod paczkomatu) są rejestrowane jako szablony
+    i kompilowane raz na wartość.
+
+    Dla każdego wzorca zliczane są wywołania, trafienia i łączny czas - get_stats / log_stats
+    pokazują najwolniejsze wzorce.
+    """
+
+    TEMPLATE_CACHE_SIZE = 64
+
+    def __init__(self):
+        self._patterns = {}   # (przewoźnik, nazwa) -> [(klucz statystyk, skompilowany wzorzec)]
+        self._templates = {}  # (przewoźnik, nazwa) -> (szablon, flagi, {wartości: skompilowany wzorzec})
+        self._stats = {}      # klucz statystyk -> [wywołania, trafienia, czas]
+        self._lock = threading.Lock()
+
+    def add(self, carrier, name, patterns, flags=0):
+        """Rejestruje wzorzec (albo listę wzorców sprawdzanych po kolei)"""
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        entries = []
+        for index, pattern in enumerate(patterns):
+            stats_key = f"{carrier}.{name}" if len(patterns) == 1 else f"{carrier}.{name}[{index}]"
+            entries.append((stats_key, re.compile(pattern, flags)))
+            self._stats[stats_key] = [0, 0, 0.0]
+        self._patterns[(carrier, name)] = entries
+
+    def add_template(self, carrier, name, template, flags=0):
+        """Rejestruje szablon wzorca - wartości ({code}...) są wstawiane przez re.escape przy wyszukiwaniu"""
+        self._templates[(carrier, name)] = (template, flags, {})
+        self._stats[f"{carrier}.{name}"] = [0, 0, 0.0]
+
+    def _compiled(self, carrier, name, values):
+        if not values:
+            return self._patterns[(carrier, name)]
+
+        template, flags, compiled = self._templates[(carrier, name)]
+        key = tuple(sorted(values.items()))
+        regex = compiled.get(key)
+        if regex is None:
+            regex = re.compile(template.format(**{k: re.escape(str(v)) for k, v in values.items()}), flags)
+            with self._lock:
+                if len(compiled) >= self.TEMPLATE_CACHE_SIZE:
+                    compiled.clear()
+                compiled[key] = regex
+        return [(f"{carrier}.{name}", regex)]
+
+    def _run(self, stats_key, regex, text):
+        start = time.perf_counter()
+        match = regex.search(text)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stats = self._stats[stats_key]
+            stats[0] += 1
+            stats[1] += match is not None
+            stats[2] += elapsed
+        return match
+
+    def search(self, carrier, name, text, **values):
+        """Pierwsze trafienie wzorca (lub listy wzorców) albo None"""
+        if not text:
+            return None
+        for stats_key, regex in self._compiled(carrier, name, values):
+            match = self._run(stats_key, regex, text)
+            if match:
+                return match
+        return None
+
+    def search_each(self, carrier, name, text, **values):
+        """Trafienia kolejnych wzorców z listy (dla pętli, które dodatkowo sprawdzają wynik)"""
+        if not text:
+            return
+        for stats_key, regex in self._compiled(carrier, name, values):
+            match = self._run(stats_key, regex, text)
+            if match:
+                yield match
+
+    def get_stats(self, top=None):
+        """Statystyki wzorców posortowane malejąco po łącznym czasie"""
+        with self._lock:
+            rows = [
+                {'pattern': key, 'calls': calls, 'hits': hits, 'total_ms': round(elapsed * 1000, 3),
+                 'avg_us': round(elapsed / calls * 1e6, 1) if calls else 0.0}
+                for key, (calls, hits, elapsed) in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:top] if top else rows
+
+    def log_stats(self, top=10):
+        rows = [row for row in self.get_stats() if row['calls']][:top]
+        if not rows:
+            return
+        logging.info(f"🔎 Najwolniejsze wzorce przewoźników (top {len(rows)}):")
+        for row in rows:
+            logging.info(f"   {row['pattern']}: {row['calls']} wywołań, {row['hits']} trafień, "
+                         f"{row['total_ms']} ms (śr. {row['avg_us']} µs)")
+
+    def reset_stats(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats[:] = [0, 0, 0.0]
+
+
+PATTERNS = PatternRegistry()
+
+# --- AliExpress ---
+PATTERNS.add('AliExpress', 'order_number_subject', [
+    r'(?:Zamówienie|Order|Order ID|Your)[:\s#]+(?P<order_number>\d{10,})',  # Order 123... lub Your 123...
+    r'(?P<order_number>\d{15,16})\s+is\s+closed'                             # 123... is closed
+], re.IGNORECASE)
+PATTERNS.add('AliExpress', 'order_number_body',
+             r'(?:Order ID|Order No\.|Numer zamówienia|Zamówienie)[:\s]+(?P<order_number>\d{10,})', re.IGNORECASE)
+PATTERNS.add('AliExpress', 'order_number_any',
+             r'[Oo]rder(?:\s+|\s*[:#]\s*)(?P<order_number>\d{10,})|[Zz]amów[^\d]+(?P<order_number_pl>\d{10,})')
+PATTERNS.add('AliExpress', 'order_link',
+             r'(?P<link>https://www\.aliexpress\.com/p/order/detail\.html\?orderId=\d+[^\s"<>]+)')
+
+# --- InPost ---
+PATTERNS.add('InPost', 'package_number_24', r'(?<!\d)(?P<package_number>\d{24})(?!\d)')
+PATTERNS.add('InPost', 'package_number_long', r'(?P<package_number>\d{20,30})')
+PATTERNS.add('InPost', 'package_number_subject', r'[Pp]aczka\s+(?P<package_number>\d+)')
+PATTERNS.add('InPost', 'package_number_fallback', r'(?P<package_number>\d{24})')
+PATTERNS.add('InPost', 'pickup_code', r'(?:Kod odbioru|Kod|PIN)[:\s]+(?P<pickup_code>\d{6})')
+PATTERNS.add('InPost', 'pickup_code_label', r"Kod odbioru:\s*(?P<pickup_code>\d+)")
+PATTERNS.add('InPost', 'pickup_code_fallback', r'(?:kod odbioru|kodem|kod)[:\s]*(?P<pickup_code>\d{6})', re.IGNORECASE)
+PATTERNS.add('InPost', 'pickup_code_html', [
+    r'[Kk]od\s+odbioru[:=\s]*[\s<>]*(?P<pickup_code>\d{6})[\s<>]*',                   # "Kod odbioru: 123456"
+    r'<[^>]*>Kod\s+odbioru<[^>]*>[^<]*<[^>]*>(?P<pickup_code>\d{6})<',                # HTML z ozdobnikami
+    r'Twój kod[^\d]*(?P<pickup_code>\d{6})',                                           # w tytule lub nagłówku
+    r'<(?:b|strong)[^>]*>(?P<pickup_code>\d{6})<\/(?:b|strong)>',                      # w <b> lub <strong>
+    r'(?:kod\s+(?:paczki|przesyłki|do\s+odbioru))[^\d<>]*(?P<pickup_code>\d{6})'      # "kod paczki" / "kod przesyłki"
+], re.IGNORECASE)
+PATTERNS.add('InPost', 'location_code', r'(?P<location_code>[A-Z]{3}\d{2}[A-Z]{3,4})')
+PATTERNS.add('InPost', 'location_code_short', r'(?P<location_code>[A-Z]{3}\d{2}[A-Z]{2,4})')
+PATTERNS.add_template('InPost', 'pickup_address_after_code',
+                      r'{code}[^<>\n]*?(?P<address>[^<>\n]{{10,100}}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{{1,3}})[^<>\n]{{5,100}})',
+                      re.IGNORECASE)
+PATTERNS.add('InPost', 'pickup_address', [
+    r'(?:adres|miejsce|znajduje się|lokalizacja)[^<>\n:]*:?[^<>\n]*?(?P<address>[^<>\n]{10,100}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{1,3})[^<>\n]{5,100})',
+    r'(?:na stacji|przy)[^<>\n]*?(?P<address>[^<>\n]{5,100})'
+], re.IGNORECASE)
+PATTERNS.add('InPost', 'pickup_deadline', [
+    r'[Cc]zas na odbi[óo]r\s+do[:\s]*[^<]*?(?P<date>\d{1,2}[/-]\d{1,2}).*?(?P<hour>\d{1,2}:\d{2})',
+    r'[Tt]ermin\s+odbioru[:\s]*[^<]*?(?P<date>\d{1,2}[/-]\d{1,2})'
+])
+PATTERNS.add('InPost', 'phone', r'(?:telefon|phone|tel)[^<>:\d]*[:<>]*\s*(?P<phone>[+]?[\d\s\-]{7,15})', re.IGNORECASE)
+PATTERNS.add('InPost', 'trade_order_id', r'tradeOrderId=(?P<order_number>\d+)')
+
+# --- DHL ---
+PATTERNS.add('DHL', 'jjd', r'(?P<package_number>JJD\d+)')
+PATTERNS.add('DHL', 'jjd_numbered', r'o numerze (?P<package_number>JJD\d+)')
+PATTERNS.add('DHL', 'tracking_number', r'(?P<package_number>JJD\d{18,25}|3S\d{10,15}|JVGL\d{10,15})')
+PATTERNS.add('DHL', 'secondary_package_number', r'przesyłki\s+(?P<package_number>\d{8,15})')
+PATTERNS.add('DHL', 'expected_delivery_date',
+             r'planowane doręczenie[^\d]+(?P<date>[\d]{1,2}-[\d]{1,2}-[\d]{4})', re.IGNORECASE)
+PATTERNS.add('DHL', 'delivery_date', r'w dniu (?P<date>\d{2}-\d{2}-\d{4})')
+PATTERNS.add('DHL', 'sender', r'paczkę od (?P<sender>[^?]+)\?')
+PATTERNS.add('DHL', 'sender_uppercase', r'paczk[aę] od (?P<sender>[A-Z]+)[?]')
+PATTERNS.add('DHL', 'pickup_code', [
+    r'podając PIN (?P<pickup_code>\d{6})',
+    r'PIN do odbioru[^:]*:\s*(?P<pickup_code>\d{6})',
+    r'PIN:\s*(?P<pickup_code>\d{6})'
+], re.IGNORECASE)
+PATTERNS.add('DHL', 'pickup_code_pin', r'PIN\s+(?P<pickup_code>\d{6})')
+PATTERNS.add('DHL', 'pickup_code_fallback', r'PIN\s*(?P<pickup_code>\d{6})', re.IGNORECASE)
+PATTERNS.add('DHL', 'pickup_deadline', r'odbierz ją do (?P<date>\d{2}-\d{2}-\d{4})', re.IGNORECASE)
+PATTERNS.add('DHL', 'pickup_deadline_exact', r'odbierz ją do (?P<date>\d{2}-\d{2}-\d{4})')
+PATTERNS.add('DHL', 'pickup_location', [
+    r'DHL BOX[^A-Z0-9]*(?P<location>[A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)',
+    r'AUTOMAT[^A-Z0-9]*(?P<location>[A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)'
+], re.IGNORECASE)
+PATTERNS.add('DHL', 'pickup_location_automat',
+             r'AUTOMAT[^A-Z0-9]*(?P<location>[A-Za-z\s,.]+\d{1,5},\s*\d{5}\s[A-Załż]+)', re.IGNORECASE)
+PATTERNS.add('DHL', 'available_hours', r'Godziny otwarcia:(?P<hours>.*?)(?:\n\n|\r\n\r\n|$)', re.DOTALL)
+
+# --- DPD ---
+PATTERNS.add('DPD', 'pickup_code_label', r"Kod odbioru:\s*(?P<pickup_code>\d+)")
+PATTERNS.add('DPD', 'package_number_long', r'(?P<package_number>\d{20,30})')
+PATTERNS.add('DPD', 'delivery_date', r'w dniu (?P<date>\d{2}-\d{2}-\d{4})')
+PATTERNS.add('DPD', 'package_number_fallback', r'(?P<package_number>\d{13}[A-Z]?)')
+PATTERNS.add('DPD', 'reference_number', r'Numer\s+referencyjny[^:]*:\s*(?P<reference_number>[A-Z0-9]+)')
+
+# --- GLS ---
+PATTERNS.add('GLS', 'package_number', [
+    r'(?P<package_number>GL\d+)',                # GL + cyfry
+    r'(?P<package_number>\d{10,15})',            # 10-15 cyfr
+    r'przesyłki[:\s]+(?P<package_number>\w+)'    # Po słowie "przesyłki"
+], re.IGNORECASE)
+PATTERNS.add('GLS', 'package_number_sent', [
+    r'(?P<package_number>GL\d+)',
+    r'(?P<package_number>\d{10,15})',
+    r'przesyłki[:\s]+(?P<package_number>\w+)',
+    r'numer[:\s]+(?P<package_number>\w+)'        # Po słowie "numer"
+], re.IGNORECASE)
+
+# --- Poczta Polska ---
+# Radzi sobie z HTML np. "numerze <strong>PX..." lub linkami "numer=PX..."
+PATTERNS.add('PocztaPolska', 'package_number',
+             r'(?:numerze|numer=)\s*(?:<strong>|<b>|&nbsp;)?\s*(?P<package_number>[A-Z]{2}\d{9,}[A-Z]{0,2}|00\d{18})')
+PATTERNS.add('PocztaPolska', 'package_number_px', r'\b(?P<package_number>PX\d{9,}[A-Z]{0,2})\b')
+PATTERNS.add('PocztaPolska', 'package_number_fallback',
+             r'(?P<package_number>PX\d{10,})|(?P<package_number_00>\(00\)\d{18})')
+PATTERNS.add('PocztaPolska', 'pickup_code', r'(?:Kod|PIN)[:\s]+(?P<pickup_code>\d{6})', re.IGNORECASE)
+PATTERNS.add('PocztaPolska', 'courier_phone', r'Telefon do kuriera:?\s*(?P<phone>\d{3}[\s-]?\d{3}[\s-]?\d{3})')
+
+# --- Wspólne ---
+PATTERNS.add('Common', 'date', [
+    r'(?P<date>\d{2}[.-]\d{2}[.-]\d{4})',  # DD.MM.YYYY
+    r'(?P<date>\d{4}-\d{2}-\d{2})',        # YYYY-MM-DD
+    r'(?P<date>\d{2}/\d{2}/\d{4})'         # DD/MM/YYYY
+])
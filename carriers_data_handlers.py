@@ -1,9 +1,23 @@
 import logging
 import re
+import email.utils
+from datetime import datetime
+from parsed_email import ParsedEmail
+from carrier_patterns import PATTERNS
 
 class BaseDataHandler:
     """Bazowa klasa do obsługi danych z emaili od różnych przewoźników"""
     
+    # Fragmenty adresu nadawcy (From) typowe dla przewoźnika - używane przy wstępnej klasyfikacji po nagłówkach
+    sender_patterns = []
+    
+    # Ile pierwszych znaków treści sprawdza can_handle (None = cała treść)
+    body_window = None
+    
+    # Pola wymagane, aby wynik tanich ekstraktorów (temat + regexy) uznać za kompletny i pominąć AI.
+    # Status -> lista pól; status spoza słownika (albo "unknown") zawsze trafia do AI.
+    required_fields = {'delivered': []}
+    
     def __init__(self, email_handler):
         """
         Inicjalizacja obiektu handlera
@@ -28,6 +42,47 @@ class BaseDataHandler:
         """
         return False
     
+    def classifier_rules(self):
+        """
+        Reguły dla skompilowanego klasyfikatora (email_classifier.py) - te same słowa kluczowe co w can_handle.
+        Lista krotek (znacznik, zakres, wzorzec_regex, rozróżnianie_wielkości_liter),
+        zakres: 'subject' albo 'body' (pierwsze body_window znaków treści).
+        """
+        return []
+    
+    def matches_tags(self, tags):
+        """Decyzja klasyfikatora na podstawie znaczników trafionych reguł (odpowiednik can_handle)"""
+        return 'match' in tags
+    
+    def matches_sender(self, sender):
+        """Sprawdza czy nadawca (nagłówek From) pasuje do przewoźnika"""
+        if not sender:
+            return False
+        sender_lower = sender.lower()
+        return any(pattern in sender_lower for pattern in self.sender_patterns)
+    
+    def is_candidate(self, subject, sender):
+        """
+        Wstępna klasyfikacja na podstawie samych nagłówków (bez treści).
+        Używana do decyzji, czy w ogóle pobierać treść wiadomości.
+        """
+        return self.matches_sender(sender) or self.can_handle(subject, "")
+    
+    def get_email_date(self, email_message):
+        """
+        Data wysłania maila (czas lokalny serwera, '%Y-%m-%d %H:%M:%S') lub None.
+        Dla ParsedEmail używana jest data zdekodowana już przy pobieraniu.
+        """
+        if email_message is None:
+            return None
+        if isinstance(email_message, ParsedEmail):
+            return email_message.date.astimezone().strftime('%Y-%m-%d %H:%M:%S') if email_message.date else None
+        
+        date_tuple = email.utils.parsedate_tz(email_message.get('Date'))
+        if date_tuple:
+            return datetime.fromtimestamp(email.utils.mktime_tz(date_tuple)).strftime('%Y-%m-%d %H:%M:%S')
+        return None
+    
     def process(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
         """
         Przetwarza email i zwraca wyodrębnione dane
@@ -45,6 +100,20 @@ class BaseDataHandler:
         # Bazowa implementacja, klasy potomne powinny nadpisać tę metodę
         return None
     
+    def quick_extract(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        """
+        Tanie ekstraktory bez AI (status z tematu, regexy). Zwraca słownik albo None.
+        Wynik jest używany zamiast AI tylko wtedy, gdy missing_fields nie zwraca braków.
+        """
+        return self.parse_delivery_status(subject, recipient, body, self.name)
+    
+    def missing_fields(self, data):
+        """Brakujące wymagane pola wyniku (pusta lista = kompletny), None gdy status wymaga AI"""
+        required = self.required_fields.get((data or {}).get("status"))
+        if required is None:
+            return None
+        return [field for field in required if not data.get(field)]
+    
     def parse_delivery_status(self, subject, recipient, body, carrier):
         """
         Zwraca informacje o dostarczeniu przesyłki, jeśli dotyczy.
@@ -73,27 +142,41 @@ class BaseDataHandler:
 class AliexpressDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od AliExpress"""
     
+    sender_patterns = ['aliexpress']
+    
+    # ✅ TYLKO BARDZO SPECYFICZNE SŁOWA KLUCZOWE
+    keywords = [
+        "zamówienie potwierdzone",        # Potwierdzenie zamówienia
+        "order confirmed",                # Order confirmation
+        "potwierdzenie zakupu",          # Purchase confirmation
+        "is closed",                     # Order closed
+        "zamówienie zostało zamknięte",  # Order closed PL
+        "order has been closed",         # Order closed EN
+        "delivery notification",         # Delivery notification
+        "zamówienie zakończone",         # Order completed
+        "order completed",                # Order completed EN
+        "zamówienie wysłane"
+    ]
+    body_window = 1000
+    
+    # Potwierdzenie zamówienia idzie do AI (nazwa produktu, link, adres - regex ich nie wyciąga)
+    required_fields = {
+        'delivered': [],
+        'transit': ['order_number'],
+        'closed': ['order_number']
+    }
+    
     def __init__(self, email_handler):
         """Inicjalizacja handlera AliExpress"""
         super().__init__(email_handler)
         self.name = "AliExpress"
     
+    def classifier_rules(self):
+        return [('match', scope, re.escape(keyword), False) for keyword in self.keywords for scope in ('subject', 'body')]
+    
     def can_handle(self, subject, body):
         """Sprawdza czy to email od AliExpress"""
-        
-        # ✅ TYLKO BARDZO SPECYFICZNE SŁOWA KLUCZOWE
-        keywords = [
-            "zamówienie potwierdzone",        # Potwierdzenie zamówienia
-            "order confirmed",                # Order confirmation
-            "potwierdzenie zakupu",          # Purchase confirmation
-            "is closed",                     # Order closed
-            "zamówienie zostało zamknięte",  # Order closed PL
-            "order has been closed",         # Order closed EN
-            "delivery notification",         # Delivery notification
-            "zamówienie zakończone",         # Order completed
-            "order completed",                # Order completed EN
-            "zamówienie wysłane"
-        ]
+        keywords = self.keywords
         
         # SPRAWDŹ TEMAT
         for keyword in keywords:
@@ -103,7 +186,7 @@ class AliexpressDataHandler(BaseDataHandler):
         
         # ✅ SPRAWDŹ TREŚĆ - TYLKO BARDZO SPECYFICZNE WSKAŹNIKI
         if body:
-            body_sample = body[:1000].lower()
+            body_sample = body[:self.body_window].lower()
             
             # Sprawdź słowa kluczowe w treści
             for keyword in keywords:
@@ -113,6 +196,10 @@ class AliexpressDataHandler(BaseDataHandler):
             
         return False
     
+    def quick_extract(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        return (super().quick_extract(subject, body, recipient, email_source, recipient_name, email_message)
+                or self.process(subject, body, recipient, email_source, recipient_name, email_message))
+    
     def parse_transit_status(self, subject, recipient, carrier):
         """
         Sprawdza czy to email o przesyłce w drodze
@@ -168,22 +255,14 @@ class AliexpressDataHandler(BaseDataHandler):
         Przetwarza email od AliExpress używając REGEX (bez dzwonienia do OpenAI).
         Naprawia błąd limitów API i poprawnie wyciąga numer zamówienia.
         """
-        import re
-        import email.utils
-        
         logging.debug(f"Wejscie do fun process AliExpress (Regex): {subject}")
         
         # 1. Wyciągnij datę z obiektu email (jeśli dostępny)
         email_date = None
-        if email_message:
-            try:
-                date_tuple = email.utils.parsedate_tz(email_message.get('Date'))
-                if date_tuple:
-                    local_date = email.utils.mktime_tz(date_tuple)
-                    from datetime import datetime
-                    email_date = datetime.fromtimestamp(local_date).strftime('%Y-%m-%d %H:%M:%S')
-            except Exception as e:
-                logging.warning(f"Błąd daty w handlerze Ali: {e}")
+        try:
+            email_date = self.get_email_date(email_message)
+        except Exception as e:
+            logging.warning(f"Błąd daty w handlerze Ali: {e}")
 
         # 2. Wyciągnij klucz użytkownika
         user_key = recipient.split('@')[0].lower() if recipient and '@' in recipient else "unknown"
@@ -211,22 +290,16 @@ class AliexpressDataHandler(BaseDataHandler):
         
         # Wzorzec 1: Szukaj w temacie
         # DODANO: 'Your' oraz obsługę numeru występującego przed 'is closed'
-        patterns = [
-            r'(?:Zamówienie|Order|Order ID|Your)[:\s#]+(\d{10,})',  # Standardowe: Order 123... lub Your 123...
-            r'(\d{15,16})\s+is\s+closed'                             # Specyficzne: 123... is closed
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, subject, re.IGNORECASE)
-            if match:
-                order_number = match.group(1)
-                break
+        # Wzorce: "Order 123..." / "Your 123..." oraz "123... is closed" (carrier_patterns.py)
+        match = PATTERNS.search('AliExpress', 'order_number_subject', subject)
+        if match:
+            order_number = match.group('order_number')
 
         # Jeśli nie znaleziono w temacie, szukaj w treści
         if not order_number and body:
-            match_body = re.search(r'(?:Order ID|Order No\.|Numer zamówienia|Zamówienie)[:\s]+(\d{10,})', body, re.IGNORECASE)
+            match_body = PATTERNS.search('AliExpress', 'order_number_body', body)
             if match_body:
-                order_number = match_body.group(1)
+                order_number = match_body.group('order_number')
 
         # Logowanie wyniku
         if order_number:
@@ -255,28 +328,46 @@ class AliexpressDataHandler(BaseDataHandler):
 class InPostDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od InPost"""
     
+    sender_patterns = ['inpost']
+    
+    # Słowa kluczowe związane z InPost (sprawdzany tylko temat)
+    keywords = [
+        "inpost",
+        "paczkomat",
+        "appkomat",
+        "InPost - Potwierdzenie nadania przesyłki",
+        "paczka już na ciebie czeka",
+        "paczka została odebrana",
+        "paczka odebrana",
+        "paczka została dostarczona",
+        "została dostarczona",
+        "zostaładostarczona"
+    ]
+    
+    # Przy odbiorze regex nie wyciąga adresu paczkomatu - taki mail idzie do AI
+    required_fields = {
+        'delivered': [],
+        'shipment_sent': ['package_number'],
+        'transit': ['package_number'],
+        'pickup': ['package_number', 'pickup_code', 'pickup_location']
+    }
+    
     def __init__(self, email_handler):
         """Inicjalizacja handlera InPost"""
         super().__init__(email_handler)
         self.name = "InPost"
     
+    def classifier_rules(self):
+        # can_handle porównuje słowa kluczowe bez zmiany wielkości liter z tematem w małych literach
+        return [('match', 'subject', re.escape(keyword), False) for keyword in self.keywords if keyword == keyword.lower()]
+    
+    def quick_extract(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        return (super().quick_extract(subject, body, recipient, email_source, recipient_name, email_message)
+                or self.process(subject, body, recipient, email_source, recipient_name, email_message))
+    
     def can_handle(self, subject, body):
         """Sprawdza czy to email od InPost"""
-        # Słowa kluczowe związane z InPost
-        keywords = [
-            "inpost",
-            "paczkomat",
-            "appkomat",
-            "InPost - Potwierdzenie nadania przesyłki",
-            "paczka już na ciebie czeka",
-            "paczka została odebrana",
-            "paczka odebrana",
-            "paczka została dostarczona",
-            "została dostarczona",
-            "zostaładostarczona"
-        ]
-        
-        for keyword in keywords:
+        for keyword in self.keywords:
             if keyword in subject.lower():
                 logging.info(f"✅ InPost: Znaleziono keyword '{keyword}' w temacie")
                 return True
@@ -287,20 +378,12 @@ class InPostDataHandler(BaseDataHandler):
         Przetwarza email od InPost używając Regex.
         Poprawiona logika statusów (rozróżnia Utworzenie od Odbioru).
         """
-        import re
-        import email.utils
-        
         # 1. Data
         email_date = None
-        if email_message:
-            try:
-                date_tuple = email.utils.parsedate_tz(email_message.get('Date'))
-                if date_tuple:
-                    local_date = email.utils.mktime_tz(date_tuple)
-                    from datetime import datetime
-                    email_date = datetime.fromtimestamp(local_date).strftime('%Y-%m-%d %H:%M:%S')
-            except Exception:
-                pass
+        try:
+            email_date = self.get_email_date(email_message)
+        except Exception:
+            pass
 
         subject_lower = subject.lower()
         body_lower = body.lower() if body else ""
@@ -328,21 +411,21 @@ class InPostDataHandler(BaseDataHandler):
         # 3. Wyciąganie numeru paczki (24 cyfry)
         package_number = None
         # Szukamy 24 cyfr (standard InPost)
-        match = re.search(r'(?<!\d)(\d{24})(?!\d)', body)
+        match = PATTERNS.search('InPost', 'package_number_24', body)
         if not match:
              # Czasem w temacie
-             match = re.search(r'(?<!\d)(\d{24})(?!\d)', subject)
+             match = PATTERNS.search('InPost', 'package_number_24', subject)
         
         if match:
-            package_number = match.group(1)
+            package_number = match.group('package_number')
 
         # 4. Wyciąganie kodu odbioru (tylko dla statusu pickup)
         pickup_code = None
         if status == "pickup":
             # Szukamy 6 cyfr kod odbioru
-            code_match = re.search(r'(?:Kod odbioru|Kod|PIN)[:\s]+(\d{6})', body)
+            code_match = PATTERNS.search('InPost', 'pickup_code', body)
             if code_match:
-                pickup_code = code_match.group(1)
+                pickup_code = code_match.group('pickup_code')
 
         return {
             "carrier": "InPost",
@@ -408,9 +491,9 @@ class InPostDataHandler(BaseDataHandler):
                 data["item_link"] = openai_data["item_link"]
                 
             # Wyciągnij numer paczki InPost (długi ciąg numeryczny)
-            package_match = re.search(r'(\d{20,30})', body)
+            package_match = PATTERNS.search('InPost', 'package_number_long', body)
             if package_match:
-                package_number = package_match.group(1)
+                package_number = package_match.group('package_number')
                 logging.info(f"Wykryto numer przesyłki InPost: {package_number}")
                 data["package_number"] = package_number
 
@@ -420,14 +503,14 @@ class InPostDataHandler(BaseDataHandler):
             logging.error(f"Błąd podczas przetwarzania powiadomienia o odbiorze przez ChatGPT: {e}")
             
             # Awaryjne wyciągnięcie kodu odbioru za pomocą regex
-            code_match = re.search(r"Kod odbioru:\s*(\d+)", body)
+            code_match = PATTERNS.search('InPost', 'pickup_code_label', body)
             if code_match:
-                data["pickup_code"] = code_match.group(1)
+                data["pickup_code"] = code_match.group('pickup_code')
                 
             # Awaryjne wyciągnięcie numeru paczki
-            package_match = re.search(r'(\d{20,30})', body)
+            package_match = PATTERNS.search('InPost', 'package_number_long', body)
             if package_match:
-                package_number = package_match.group(1)
+                package_number = package_match.group('package_number')
                 logging.info(f"Wykryto numer przesyłki InPost: {package_number}")
                 data["package_number"] = package_number
         
@@ -449,9 +532,9 @@ class InPostDataHandler(BaseDataHandler):
         }
         
         # Wyciągnij numer paczki InPost (długi ciąg numeryczny)
-        package_match = re.search(r'(\d{20,30})', body)
+        package_match = PATTERNS.search('InPost', 'package_number_long', body)
         if package_match:
-            package_number = package_match.group(1)
+            package_number = package_match.group('package_number')
             logging.info(f"Wykryto numer przesyłki InPost: {package_number}")
             data["package_number"] = package_number
         
@@ -473,26 +556,26 @@ class InPostDataHandler(BaseDataHandler):
         }
         
         # Wyciągnij numer paczki z tematu
-        package_match = re.search(r'[Pp]aczka\s+(\d+)', subject)
+        package_match = PATTERNS.search('InPost', 'package_number_subject', subject)
         if package_match:
-            package_number = package_match.group(1)
+            package_number = package_match.group('package_number')
             data["package_number"] = package_number
             # Zapisz mapowanie użytkownik-paczka
             self.email_handler._save_user_package_mapping(user_key, package_number)
         
         # Wyciągnij numer paczki InPost (długi ciąg numeryczny)
-        long_package_match = re.search(r'(\d{20,30})', body)
+        long_package_match = PATTERNS.search('InPost', 'package_number_long', body)
         if long_package_match and not package_match:
-            package_number = long_package_match.group(1)
+            package_number = long_package_match.group('package_number')
             logging.info(f"Wykryto numer przesyłki InPost: {package_number}")
             data["package_number"] = package_number
             # Zapisz mapowanie użytkownik-paczka
             self.email_handler._save_user_package_mapping(user_key, package_number)
         
         # Wyciągnij numer zamówienia z treści (jeśli jest)
-        order_match = re.search(r'tradeOrderId=(\d+)', body)
+        order_match = PATTERNS.search('InPost', 'trade_order_id', body)
         if order_match:
-            order_number = order_match.group(1)
+            order_number = order_match.group('order_number')
             data["order_number"] = order_number
             self.email_handler._save_user_order_mapping(user_key, order_number)
         
@@ -504,29 +587,61 @@ class InPostDataHandler(BaseDataHandler):
 class DHLDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od DHL"""
     
+    sender_patterns = ['dhl']
+    
+    # Dodatkowe słowa kluczowe dla innych formatów maili DHL
+    dhl_keywords = [
+        "dhl",
+        "dhl box",
+        "automat dhl",
+        "dhl ecommerce"
+    ]
+    body_window = 500
+    
+    # Numer JJD z awaryjnych regexów jest jednoznaczny; odbiór wymaga jeszcze lokalizacji automatu (AI)
+    required_fields = {
+        'delivered': [],
+        'shipment_sent': ['package_number'],
+        'transit': ['package_number'],
+        'pickup': ['package_number', 'pickup_code', 'pickup_deadline', 'pickup_location']
+    }
+    
     def __init__(self, email_handler):
         """Inicjalizacja handlera DHL"""
         
         super().__init__(email_handler)
         self.name = "DHL"
     
+    def classifier_rules(self):
+        rules = [
+            ('notice', 'subject', re.escape("Powiadomienie o przesylce"), True),
+            ('jjd', 'subject', 'JJD', True),
+            ('jjd', 'body', 'JJD', True)
+        ]
+        rules.extend(('match', scope, re.escape(keyword), False) for keyword in self.dhl_keywords for scope in ('subject', 'body'))
+        return rules
+    
+    def matches_tags(self, tags):
+        return 'match' in tags or ('notice' in tags and 'jjd' in tags)
+    
+    def quick_extract(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        data = super().quick_extract(subject, body, recipient, email_source, recipient_name, email_message)
+        if data:
+            return data
+        # process() DHL wywołuje AI - tutaj tylko awaryjne regexy (bez opisu "awaryjnie" w polu info)
+        data = self.email_handler.openai_handler.general_fallback_extraction(body, subject, self.name, recipient)
+        data.pop("info", None)
+        return data
+    
     def can_handle(self, subject, body):
         """Sprawdza czy to email od DHL"""
         # Sprawdź, czy temat zawiera "Powiadomienie o przesylce" wraz z numerem JJD
-        if "Powiadomienie o przesylce" in subject and ("JJD" in subject or "JJD" in body[:500]):
+        if "Powiadomienie o przesylce" in subject and ("JJD" in subject or "JJD" in body[:self.body_window]):
             return True
-            
-        # Dodatkowe sprawdzenie dla innych formatów maili DHL
-        dhl_keywords = [
-            "dhl",
-            "dhl box",
-            "automat dhl",
-            "dhl ecommerce"
-        ]
         
         # Jeśli temat nie jest typowy, sprawdź treść dla dodatkowej weryfikacji
-        for keyword in dhl_keywords:
-            if keyword.lower() in subject.lower() or keyword.lower() in body.lower()[:500]:
+        for keyword in self.dhl_keywords:
+            if keyword.lower() in subject.lower() or keyword.lower() in body.lower()[:self.body_window]:
                 logging.info(f"✅ DHL: Znaleziono keyword '{keyword}' w temacie")
                 return True
                 
@@ -597,28 +712,28 @@ class DHLDataHandler(BaseDataHandler):
             # Awaryjne wyciąganie numeru przesyłki
             if not data.get("package_number"):
                 # Format numeru DHL: JJD + długi ciąg cyfr
-                jjd_match = re.search(r'(JJD\d+)', body)
+                jjd_match = PATTERNS.search('DHL', 'jjd', body)
                 if jjd_match:
-                    data["package_number"] = jjd_match.group(1)
+                    data["package_number"] = jjd_match.group('package_number')
                     logging.info(f"Wykryto numer przesyłki DHL (JJD): {data['package_number']}")
                 
                 # Drugi format numeru przesyłki: 8-15 cyfr w nawiasach
-                secondary_match = re.search(r'przesyłki\s+(\d{8,15})', body)
+                secondary_match = PATTERNS.search('DHL', 'secondary_package_number', body)
                 if secondary_match:
-                    data["secondary_package_number"] = secondary_match.group(1)
+                    data["secondary_package_number"] = secondary_match.group('package_number')
                     logging.info(f"Wykryto dodatkowy numer przesyłki DHL: {data['secondary_package_number']}")
                     
             # Wyciągnij datę planowanego doręczenia
             if not data.get("expected_delivery_date"):
-                date_match = re.search(r'planowane doręczenie[^\d]+([\d]{1,2}-[\d]{1,2}-[\d]{4})', body, re.IGNORECASE)
+                date_match = PATTERNS.search('DHL', 'expected_delivery_date', body)
                 if date_match:
-                    data["expected_delivery_date"] = date_match.group(1)
+                    data["expected_delivery_date"] = date_match.group('date')
                     
             # Wyciągnij nadawcę przesyłki
             if not data.get("sender"):
-                sender_match = re.search(r'paczkę od ([^?]+)\?', body)
+                sender_match = PATTERNS.search('DHL', 'sender', body)
                 if sender_match:
-                    data["sender"] = sender_match.group(1).strip()
+                    data["sender"] = sender_match.group('sender').strip()
                 
             logging.info(f"Wykryto powiadomienie o nadanej przesyłce DHL: {data}")
             
@@ -626,9 +741,9 @@ class DHLDataHandler(BaseDataHandler):
             logging.error(f"Błąd podczas przetwarzania powiadomienia DHL: {e}")
             
             # Awaryjne wyciąganie numeru przesyłki
-            jjd_match = re.search(r'(JJD\d+)', body)
+            jjd_match = PATTERNS.search('DHL', 'jjd', body)
             if jjd_match:
-                data["package_number"] = jjd_match.group(1)
+                data["package_number"] = jjd_match.group('package_number')
                 logging.info(f"Awaryjnie wykryto numer przesyłki DHL: {data['package_number']}")
         
         return data
@@ -669,51 +784,36 @@ class DHLDataHandler(BaseDataHandler):
             
             # Awaryjne wyciąganie numeru przesyłki
             if not data.get("package_number"):
-                jjd_match = re.search(r'(JJD\d+)', body)
+                jjd_match = PATTERNS.search('DHL', 'jjd', body)
                 if jjd_match:
-                    data["package_number"] = jjd_match.group(1)
+                    data["package_number"] = jjd_match.group('package_number')
                     logging.info(f"Wykryto numer przesyłki DHL (JJD): {data['package_number']}")
                     # Zapisz mapowanie użytkownik-przesyłka
                     self.email_handler._save_user_package_mapping(user_key, data["package_number"])
             
             # Wyciągnij PIN do odbioru
             if not data.get("pickup_code"):
-                pin_patterns = [
-                    r'podając PIN (\d{6})',
-                    r'PIN do odbioru[^:]*:\s*(\d{6})',
-                    r'PIN:\s*(\d{6})'
-                ]
-                
-                for pattern in pin_patterns:
-                    pin_match = re.search(pattern, body, re.IGNORECASE)
-                    if pin_match:
-                        data["pickup_code"] = pin_match.group(1)
-                        break
+                pin_match = PATTERNS.search('DHL', 'pickup_code', body)
+                if pin_match:
+                    data["pickup_code"] = pin_match.group('pickup_code')
             
             # Wyciągnij termin odbioru
             if not data.get("pickup_deadline"):
-                deadline_match = re.search(r'odbierz ją do (\d{2}-\d{2}-\d{4})', body, re.IGNORECASE)
+                deadline_match = PATTERNS.search('DHL', 'pickup_deadline', body)
                 if deadline_match:
-                    data["pickup_deadline"] = deadline_match.group(1)
+                    data["pickup_deadline"] = deadline_match.group('date')
             
             # Wyciągnij lokalizację automatu
             if not data.get("pickup_location"):
-                location_patterns = [
-                    r'DHL BOX[^A-Z0-9]*([A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)',
-                    r'AUTOMAT[^A-Z0-9]*([A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)'
-                ]
-                
-                for pattern in location_patterns:
-                    location_match = re.search(pattern, body, re.IGNORECASE)
-                    if location_match:
-                        data["pickup_location"] = location_match.group(1).strip()
-                        break
+                location_match = PATTERNS.search('DHL', 'pickup_location', body)
+                if location_match:
+                    data["pickup_location"] = location_match.group('location').strip()
             
             # Wyciągnij godziny otwarcia
             if not data.get("available_hours"):
-                hours_match = re.search(r'Godziny otwarcia:(.*?)(?:\n\n|\r\n\r\n|$)', body, re.DOTALL)
+                hours_match = PATTERNS.search('DHL', 'available_hours', body)
                 if hours_match:
-                    hours_text = hours_match.group(1).strip()
+                    hours_text = hours_match.group('hours').strip()
                     data["available_hours"] = hours_text.replace('\n', ' ')
                 
             logging.info(f"Wykryto powiadomienie o paczce DHL do odbioru: {data}")
@@ -722,9 +822,9 @@ class DHLDataHandler(BaseDataHandler):
             logging.error(f"Błąd podczas przetwarzania powiadomienia DHL o odbiorze: {e}")
             
             # Awaryjne wyciąganie danych
-            jjd_match = re.search(r'(JJD\d+)', body)
+            jjd_match = PATTERNS.search('DHL', 'jjd', body)
             if jjd_match:
-                data["package_number"] = jjd_match.group(1)
+                data["package_number"] = jjd_match.group('package_number')
                 logging.info(f"Awaryjnie wykryto numer przesyłki DHL: {data['package_number']}")
                 # Zapisz mapowanie użytkownik-przesyłka
                 self.email_handler._save_user_package_mapping(user_key, data["package_number"])
@@ -764,9 +864,9 @@ class DHLDataHandler(BaseDataHandler):
             
             # Awaryjne wyciąganie numeru przesyłki
             if not data.get("package_number"):
-                jjd_match = re.search(r'o numerze (JJD\d+)', body)
+                jjd_match = PATTERNS.search('DHL', 'jjd_numbered', body)
                 if jjd_match:
-                    data["package_number"] = jjd_match.group(1)
+                    data["package_number"] = jjd_match.group('package_number')
                     logging.info(f"Wykryto numer przesyłki DHL: {data['package_number']}")
                     # Zapisz mapowanie użytkownik-przesyłka
                     self.email_handler._save_user_package_mapping(user_key, data["package_number"])
@@ -774,9 +874,9 @@ class DHLDataHandler(BaseDataHandler):
             # Wyciągnij datę dostarczenia
             if not data.get("delivery_date"):
                 # Data może być w różnych formatach, szukamy najpierw bezpośrednio wymienionej daty
-                date_match = re.search(r'w dniu (\d{2}-\d{2}-\d{4})', body)
+                date_match = PATTERNS.search('DHL', 'delivery_date', body)
                 if date_match:
-                    data["delivery_date"] = date_match.group(1)
+                    data["delivery_date"] = date_match.group('date')
                 else:
                     # Alternatywnie, możemy użyć dzisiejszej daty, skoro przesyłka została odebrana
                     from datetime import datetime
@@ -789,9 +889,9 @@ class DHLDataHandler(BaseDataHandler):
             logging.error(f"Błąd podczas przetwarzania powiadomienia DHL o dostarczeniu: {e}")
             
             # Awaryjne wyciąganie numeru przesyłki
-            jjd_match = re.search(r'o numerze (JJD\d+)', body)
+            jjd_match = PATTERNS.search('DHL', 'jjd_numbered', body)
             if jjd_match:
-                data["package_number"] = jjd_match.group(1)
+                data["package_number"] = jjd_match.group('package_number')
                 logging.info(f"Awaryjnie wykryto numer przesyłki DHL: {data['package_number']}")
                 # Zapisz mapowanie użytkownik-przesyłka
                 self.email_handler._save_user_package_mapping(user_key, data["package_number"])
@@ -801,29 +901,42 @@ class DHLDataHandler(BaseDataHandler):
 class DPDDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od DPD"""
     
+    sender_patterns = ['dpd']
+    
+    # Wzorce DPD (temat + cała treść)
+    dpd_patterns = [
+        r'\bDPD\b',
+        r'dpd\..*\.pl',
+        # inne wzorce DPD
+    ]
+    # Jeśli w temacie jest wyraźnie "GLS", to nie jest DPD
+    excluded_subject_patterns = [r'\bGLS\b']
+    
     def __init__(self, email_handler):
         """Inicjalizacja handlera DPD"""
         
         super().__init__(email_handler)
         self.name = "DPD"
     
+    def classifier_rules(self):
+        rules = [('exclude', 'subject', pattern, False) for pattern in self.excluded_subject_patterns]
+        rules.extend(('match', scope, pattern, False) for pattern in self.dpd_patterns for scope in ('subject', 'body'))
+        return rules
+    
+    def matches_tags(self, tags):
+        return 'match' in tags and 'exclude' not in tags
+    
     def can_handle(self, subject, body):
         """Sprawdza czy email może być obsłużony przez DPD handler"""
         
         
         # ✅ UNIKAJ KOLIZJI Z GLS
-        # Jeśli w temacie jest wyraźnie "GLS", to nie jest DPD
-        if re.search(r'\bGLS\b', subject, re.IGNORECASE):
-            return False
+        for pattern in self.excluded_subject_patterns:
+            if re.search(pattern, subject, re.IGNORECASE):
+                return False
         
         # Sprawdź wzorce DPD
-        dpd_patterns = [
-            r'\bDPD\b',
-            r'dpd\..*\.pl',
-            # inne wzorce DPD
-        ]
-        
-        for pattern in dpd_patterns:
+        for pattern in self.dpd_patterns:
             if re.search(pattern, subject + " " + (body or ""), re.IGNORECASE):
                 logging.info(f"✅ DPD: Znaleziono keyword  w temacie")
                 return True
@@ -921,14 +1034,14 @@ class DPDDataHandler(BaseDataHandler):
             logging.error(f"Błąd podczas przetwarzania powiadomienia o odbiorze przez ChatGPT: {e}")
             
             # Awaryjne wyciągnięcie kodu odbioru za pomocą regex
-            code_match = re.search(r"Kod odbioru:\s*(\d+)", body)
+            code_match = PATTERNS.search('DPD', 'pickup_code_label', body)
             if code_match:
-                data["pickup_code"] = code_match.group(1)
+                data["pickup_code"] = code_match.group('pickup_code')
                 
             # Awaryjne wyciągnięcie numeru paczki
-            package_match = re.search(r'(\d{20,30})', body)
+            package_match = PATTERNS.search('DPD', 'package_number_long', body)
             if package_match:
-                package_number = package_match.group(1)
+                package_number = package_match.group('package_number')
                 logging.info(f"Wykryto numer przesyłki InPost: {package_number}")
                 data["package_number"] = package_number
         
@@ -1033,9 +1146,9 @@ class DPDDataHandler(BaseDataHandler):
             # Wyciągnij datę dostarczenia
             if not data.get("delivery_date"):
                 # Data może być w różnych formatach, szukamy najpierw bezpośrednio wymienionej daty
-                date_match = re.search(r'w dniu (\d{2}-\d{2}-\d{4})', body)
+                date_match = PATTERNS.search('DPD', 'delivery_date', body)
                 if date_match:
-                    data["delivery_date"] = date_match.group(1)
+                    data["delivery_date"] = date_match.group('date')
                 else:
                     # Alternatywnie, możemy użyć dzisiejszej daty, skoro przesyłka została odebrana
                     from datetime import datetime
@@ -1052,30 +1165,38 @@ class DPDDataHandler(BaseDataHandler):
 class GLSDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od GLS"""
     
+    sender_patterns = ['gls-poland', 'gls-group', '@gls']
+    
+    # ✅ BARDZO SILNE WZORCE GLS
+    gls_definitive_patterns = [
+        r'^GLS:',                         # Temat zaczyna się od "GLS:"
+        r'^Kurier GLS',                   # ✅ MOCNIEJSZY - zaczyna się od "Kurier GLS"
+        r'Kurier GLS',                    # ✅ WSZĘDZIE w temacie
+        r'\bGLS\b.*przesyłka',           # "GLS" + "przesyłka" 
+        r'przesyłka.*\bGLS\b',           # "przesyłka" + "GLS"
+        r'\bGLS\b.*nadana',              # "GLS" + "nadana"
+        r'\bGLS\b.*w drodze',            # ✅ NOWY - "GLS" + "w drodze"
+        r'w drodze.*\bGLS\b',            # ✅ NOWY - "w drodze" + "GLS"
+        r'General Logistics Systems',     # Pełna nazwa
+        r'opcje dostawy.*GLS',           # ✅ NOWY - dla tego konkretnego przypadku
+        r'GLS.*opcje dostawy',           # ✅ NOWY - odwrotnie
+        r'^Twoja paczka od.* informacja o dostawie',
+    ]
+    body_window = 500
+    
     def __init__(self, email_handler):
         """Inicjalizacja handlera GLS"""
         super().__init__(email_handler)
         self.name = "GLS"
     
+    def classifier_rules(self):
+        return [('match', scope, pattern, False) for pattern in self.gls_definitive_patterns for scope in ('subject', 'body')]
+    
     def can_handle(self, subject, body):
         """Sprawdza czy email może być obsłużony przez GLS handler"""
         
         
-        # ✅ BARDZO SILNE WZORCE GLS
-        gls_definitive_patterns = [
-            r'^GLS:',                         # Temat zaczyna się od "GLS:"
-            r'^Kurier GLS',                   # ✅ MOCNIEJSZY - zaczyna się od "Kurier GLS"
-            r'Kurier GLS',                    # ✅ WSZĘDZIE w temacie
-            r'\bGLS\b.*przesyłka',           # "GLS" + "przesyłka" 
-            r'przesyłka.*\bGLS\b',           # "przesyłka" + "GLS"
-            r'\bGLS\b.*nadana',              # "GLS" + "nadana"
-            r'\bGLS\b.*w drodze',            # ✅ NOWY - "GLS" + "w drodze"
-            r'w drodze.*\bGLS\b',            # ✅ NOWY - "w drodze" + "GLS"
-            r'General Logistics Systems',     # Pełna nazwa
-            r'opcje dostawy.*GLS',           # ✅ NOWY - dla tego konkretnego przypadku
-            r'GLS.*opcje dostawy',           # ✅ NOWY - odwrotnie
-            r'^Twoja paczka od.* informacja o dostawie',
-        ] 
+        gls_definitive_patterns = self.gls_definitive_patterns
         
         for pattern in gls_definitive_patterns:
             if re.search(pattern, subject, re.IGNORECASE):
@@ -1084,7 +1205,7 @@ class GLSDataHandler(BaseDataHandler):
         
         # Sprawdź także treść
         if body:
-            body_sample = body[:500].lower()
+            body_sample = body[:self.body_window].lower()
             for pattern in gls_definitive_patterns:
                 if re.search(pattern, body_sample, re.IGNORECASE):
                     logging.info(f"✅ GLS can_handle: SILNY wzorzec '{pattern}' w treści")
@@ -1164,20 +1285,11 @@ class GLSDataHandler(BaseDataHandler):
             
             # Awaryjne wyciąganie numeru przesyłki GLS
             if not data.get("package_number"):
-                # Format numeru GLS: różne wzorce
-                gls_patterns = [
-                    r'(GL\d+)',                    # GL + cyfry
-                    r'(\d{10,15})',               # 10-15 cyfr
-                    r'przesyłki[:\s]+(\w+)',      # Po słowie "przesyłki"
-                    r'numer[:\s]+(\w+)'           # Po słowie "numer"
-                ]
-                
-                for pattern in gls_patterns:
-                    match = re.search(pattern, body, re.IGNORECASE)
-                    if match:
-                        data["package_number"] = match.group(1)
-                        logging.info(f"Wykryto numer przesyłki GLS: {data['package_number']}")
-                        break
+                # Format numeru GLS: GL + cyfry, 10-15 cyfr, po słowie "przesyłki" lub "numer"
+                match = PATTERNS.search('GLS', 'package_number_sent', body)
+                if match:
+                    data["package_number"] = match.group('package_number')
+                    logging.info(f"Wykryto numer przesyłki GLS: {data['package_number']}")
             
             logging.info(f"Wykryto powiadomienie o nadanej przesyłce GLS: {data}")
             
@@ -1216,19 +1328,11 @@ class GLSDataHandler(BaseDataHandler):
             
             # Awaryjne wyciąganie danych
             if not data.get("package_number"):
-                gls_patterns = [
-                    r'(GL\d+)',
-                    r'(\d{10,15})',
-                    r'przesyłki[:\s]+(\w+)'
-                ]
-                
-                for pattern in gls_patterns:
-                    match = re.search(pattern, body, re.IGNORECASE)
-                    if match:
-                        data["package_number"] = match.group(1)
-                        # Zapisz mapowanie użytkownik-przesyłka
-                        self.email_handler._save_user_package_mapping(user_key, data["package_number"])
-                        break
+                match = PATTERNS.search('GLS', 'package_number', body)
+                if match:
+                    data["package_number"] = match.group('package_number')
+                    # Zapisz mapowanie użytkownik-przesyłka
+                    self.email_handler._save_user_package_mapping(user_key, data["package_number"])
             
             logging.info(f"Wykryto powiadomienie o paczce GLS do odbioru: {data}")
             
@@ -1264,19 +1368,11 @@ class GLSDataHandler(BaseDataHandler):
             
             # Awaryjne wyciąganie numeru przesyłki
             if not data.get("package_number"):
-                gls_patterns = [
-                    r'(GL\d+)',
-                    r'(\d{10,15})',
-                    r'przesyłki[:\s]+(\w+)'
-                ]
-                
-                for pattern in gls_patterns:
-                    match = re.search(pattern, body, re.IGNORECASE)
-                    if match:
-                        data["package_number"] = match.group(1)
-                        # Zapisz mapowanie użytkownik-przesyłka
-                        self.email_handler._save_user_package_mapping(user_key, data["package_number"])
-                        break
+                match = PATTERNS.search('GLS', 'package_number', body)
+                if match:
+                    data["package_number"] = match.group('package_number')
+                    # Zapisz mapowanie użytkownik-przesyłka
+                    self.email_handler._save_user_package_mapping(user_key, data["package_number"])
             
             # Dodaj dzisiejszą datę jako datę dostarczenia
             if not data.get("delivery_date"):
@@ -1296,24 +1392,41 @@ class GLSDataHandler(BaseDataHandler):
 class PocztaPolskaDataHandler(BaseDataHandler):
     """Klasa do obsługi danych z emaili od Poczty Polskiej / Pocztex"""
     
+    sender_patterns = ['poczta-polska', 'pocztex']
+    
+    keywords = [
+        "poczta polska", 
+        "pocztex", 
+        "e-info",
+        "informacja@poczta-polska.pl",
+        "przesyłka o numerze px",
+    ]
+    body_window = 1000
+    
+    # Bez 'transit' - process() ustawia go domyślnie, gdy żadna fraza statusu nie pasuje, więc o statusie decyduje AI
+    required_fields = {
+        'delivered': [],
+        'shipment_sent': ['package_number'],
+        'pickup': ['package_number', 'pickup_code', 'pickup_location']
+    }
+    
     def __init__(self, email_handler):
         super().__init__(email_handler)
         self.name = "PocztaPolska"
     
+    def quick_extract(self, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        return (super().quick_extract(subject, body, recipient, email_source, recipient_name, email_message)
+                or self.process(subject, body, recipient, email_source, recipient_name, email_message))
+    
+    def classifier_rules(self):
+        return [('match', scope, re.escape(keyword), False) for keyword in self.keywords for scope in ('subject', 'body')]
+    
     def can_handle(self, subject, body):
         """Sprawdza czy email pochodzi od Poczty Polskiej"""
-        keywords = [
-            "poczta polska", 
-            "pocztex", 
-            "e-info",
-            "informacja@poczta-polska.pl",
-            "przesyłka o numerze px",
-        ]
-        
         subject_lower = subject.lower()
-        body_lower = body.lower()[:1000] 
+        body_lower = body.lower()[:self.body_window] 
         
-        for keyword in keywords:
+        for keyword in self.keywords:
             if keyword in subject_lower or keyword in body_lower:
                 logging.info(f"✅ Poczta Polska: Znaleziono keyword '{keyword}'")
                 return True
@@ -1323,8 +1436,6 @@ class PocztaPolskaDataHandler(BaseDataHandler):
         """
         Przetwarza email od Poczty Polskiej (Tryb Czysty Regex)
         """
-        import re
-        
         # Dane domyślne
         data = {
             "email": recipient,
@@ -1342,26 +1453,26 @@ class PocztaPolskaDataHandler(BaseDataHandler):
         # 1. Wyciąganie Numeru Przesyłki (Najważniejsze!)
         # Obsługuje formaty: PX123456789PL oraz (00)123456...
         # Radzi sobie z HTML np. "numerze <strong>PX..." lub linkami "numer=PX..."
-        pkg_match = re.search(r'(?:numerze|numer=)\s*(?:<strong>|<b>|&nbsp;)?\s*([A-Z]{2}\d{9,}[A-Z]{0,2}|00\d{18})', body)
+        pkg_match = PATTERNS.search('PocztaPolska', 'package_number', body)
         
         if pkg_match:
-            data["package_number"] = pkg_match.group(1)
+            data["package_number"] = pkg_match.group('package_number')
         else:
             # Fallback: szukaj po prostu formatu PX na początku słowa
-            fallback_match = re.search(r'\b(PX\d{9,}[A-Z]{0,2})\b', body)
+            fallback_match = PATTERNS.search('PocztaPolska', 'package_number_px', body)
             if fallback_match:
-                data["package_number"] = fallback_match.group(1)
+                data["package_number"] = fallback_match.group('package_number')
 
         # 2. Wyciąganie Kodu PIN (Odbiór w punkcie/skrytce)
-        pin_match = re.search(r'(?:Kod|PIN)[:\s]+(\d{6})', body, re.IGNORECASE)
+        pin_match = PATTERNS.search('PocztaPolska', 'pickup_code', body)
         if pin_match:
-            data["pickup_code"] = pin_match.group(1)
+            data["pickup_code"] = pin_match.group('pickup_code')
             data["status"] = "pickup"
 
         # 3. Telefon kuriera
-        phone_match = re.search(r'Telefon do kuriera:?\s*(\d{3}[\s-]?\d{3}[\s-]?\d{3})', body)
+        phone_match = PATTERNS.search('PocztaPolska', 'courier_phone', body)
         if phone_match:
-            raw_phone = phone_match.group(1).replace(" ", "").replace("-", "")
+            raw_phone = phone_match.group('phone').replace(" ", "").replace("-", "")
             data["courier_phone"] = raw_phone
 
         # 4. Określanie statusu na podstawie treści
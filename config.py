@@ -95,6 +95,269 @@ EMAIL_CHECK_SETTINGS = {
     'auto_expunge': True                # Automatycznie zapisuj zmiany
 }
 
+# ✅ PRZETWARZANIE STRUMIENIOWE (oszczędność pamięci przy reprocess / PROCESS_READ_EMAILS)
+# enabled             - True = wiadomości przetwarzane konto po koncie, bez trzymania wszystkich maili w pamięci
+#                       False = (Domyślnie) wszystkie maile pobierane do jednej listy i sortowane globalnie
+# max_emails_per_user - ile najnowszych maili na użytkownika trzymać do analizy (PROCESS_FROM_NEWEST = True);
+#                       gdy żaden z nich nie zostanie rozpoznany, starsze maile użytkownika są pomijane
+EMAIL_STREAMING = {
+    'enabled': False,
+    'max_emails_per_user': 5
+}
+
+# ✅ RÓWNOLEGŁE POBIERANIE EMAILI
+# enabled         - True = konta sprawdzane równolegle (pula wątków), False = po kolei (stara metoda)
+# max_workers     - maksymalna liczba kont sprawdzanych jednocześnie
+# provider_limits - limit jednoczesnych połączeń per dostawca (Interia/O2 nie lubią wielu sesji naraz)
+IMAP_PARALLEL_FETCH = {
+    'enabled': True,
+    'max_workers': 8,
+    'provider_limits': {
+        'gmail': 4,
+        'interia': 3,
+        'o2': 2
+    },
+    'default_provider_limit': 2
+}
+
+# ✅ SILNIK POBIERANIA IMAP
+# 'imaplib' - (Domyślnie) synchroniczny imaplib + pula wątków (IMAP_PARALLEL_FETCH)
+# 'asyncio' - wszystkie konta na jednej pętli asyncio (wymaga: pip install aioimaplib)
+#             Przy braku biblioteki automatycznie używany jest 'imaplib'.
+# IMAP_HEADER_FIRST_FETCH, IMAP_PARTIAL_FETCH i IMAP_BATCH_SETTINGS działają w obu silnikach tak samo.
+IMAP_FETCH_BACKEND = 'imaplib'
+
+# host_limits     - maksymalna liczba jednoczesnych połączeń per serwer IMAP (tylko silnik asyncio)
+# connect_timeout - timeout połączenia i powitania serwera (s)
+# command_timeout - timeout pojedynczej komendy IMAP (s)
+IMAP_ASYNC_FETCH = {
+    'host_limits': {
+        'imap.gmail.com': 10,
+        'poczta.interia.pl': 5,
+        'poczta.o2.pl': 3
+    },
+    'default_host_limit': 4,
+    'connect_timeout': 30,
+    'command_timeout': 60
+}
+
+# ✅ PULA SESJI IMAP (połączenia utrzymywane między cyklami)
+# enabled          - True = sesje są trzymane otwarte i ponownie używane, False = login/logout w każdym cyklu
+# max_sessions     - maksymalna liczba otwartych sesji (nadmiar zamykany wg LRU)
+# max_idle_seconds - sesja nieużywana dłużej jest zamykana (Interia/O2 rozłączają po ~30 min)
+IMAP_SESSION_POOL = {
+    'enabled': True,
+    'max_sessions': 60,
+    'max_idle_seconds': 1200
+}
+
+# ✅ SYNCHRONIZACJA PRZYROSTOWA IMAP (checkpointy UID)
+# enabled          - True = każdy cykl pyta tylko o nowe wiadomości (UID n+1:*), False = pełny skan SINCE co cykl
+# checkpoints_file - plik z UIDVALIDITY / ostatnim UID / HIGHESTMODSEQ per skrzynka
+# Zmiana UIDVALIDITY lub trybu (CHECK_ONLY_UNSEEN / PROCESS_READ_EMAILS) wymusza jednorazowy pełny skan.
+# Usunięcie pliku checkpointów = pełny skan przy następnym cyklu.
+IMAP_INCREMENTAL_SYNC = {
+    'enabled': True,
+    'checkpoints_file': 'imap_checkpoints.json'
+}
+
+# ✅ POBIERANIE DWUFAZOWE (najpierw nagłówki, potem treść)
+# enabled                - True = FETCH nagłówków (FROM SUBJECT DATE TO) dla całego zbioru, treść tylko dla maili od przewoźników
+#                          False = (Domyślnie) treść pobierana dla wszystkich znalezionych maili
+# extra_subject_keywords - dodatkowe słowa w temacie, przy których treść jest zawsze pobierana (np. przekazane maile)
+# UWAGA: maile przekazane (forward) lub ze skrzynek zbiorczych, rozpoznawane tylko po treści, są pomijane -
+# checkpoint synchronizacji przyrostowej nie wróci już do tych UID (pominięte nie są oznaczane jako przeczytane).
+# Włączać tylko dla skrzynek, do których przewoźnicy piszą bezpośrednio.
+IMAP_HEADER_FIRST_FETCH = {
+    'enabled': False,
+    'extra_subject_keywords': ['paczk', 'przesyłk', 'przesylk', 'zamówieni', 'kurier', 'parcel', 'shipment', 'tracking']
+}
+
+# ✅ FILTROWANIE NADAWCÓW PO STRONIE SERWERA (UID SEARCH ... OR FROM ...)
+# enabled              - True = SEARCH zwraca tylko maile od przewoźników (lista nadawców z handlerów w carriers_data_handlers.py)
+#                        False = (Domyślnie) szeroki SEARCH (SINCE / UNSEEN), filtrowanie dopiero po stronie bota
+# providers            - dostawcy, dla których filtr jest włączony (pusta lista = wszyscy)
+# unreliable_providers - dostawcy z zawodnym SEARCH - zawsze szeroki SEARCH
+# UWAGA: maile przekazane (forward) lub ze skrzynek zbiorczych mają innego nadawcę niż przewoźnik -
+# filtr je pomija, a checkpoint synchronizacji przyrostowej nie wróci już do tych UID.
+# Włączać tylko dla skrzynek, do których przewoźnicy piszą bezpośrednio.
+# Jeśli serwer odrzuci zapytanie z OR/FROM, bot sam wraca do szerokiego SEARCH dla tego dostawcy.
+IMAP_SENDER_FILTER = {
+    'enabled': False,
+    'providers': [],
+    'unreliable_providers': ['o2']
+}
+
+# ✅ PACZKOWANIE KOMEND IMAP (jeden FETCH/STORE na zbiór wiadomości, np. 4:19,22,31:40)
+# fetch_chunk_size  - ile pełnych wiadomości (RFC822) pobierać jednym FETCH
+# header_chunk_size - ile nagłówków pobierać jednym FETCH (faza 1)
+# store_chunk_size  - ile wiadomości oznaczać jako przeczytane jednym STORE
+IMAP_BATCH_SETTINGS = {
+    'fetch_chunk_size': 50,
+    'header_chunk_size': 500,
+    'store_chunk_size': 500
+}
+
+# ✅ CZĘŚCIOWE POBIERANIE MIME (BODYSTRUCTURE)
+# enabled - True = pobierane są tylko nagłówki i części text/plain + text/html (bez załączników: QR, etykiety PDF)
+#           False = pobierana jest cała wiadomość (RFC822)
+IMAP_PARTIAL_FETCH = {
+    'enabled': True
+}
+
+# ✅ LOKALNY CACHE WIADOMOŚCI (surowe .eml, klucz: konto + UIDVALIDITY + UID lub Message-ID)
+# enabled           - True = reprocess pobiera z serwera tylko wiadomości, których nie ma w cache
+# cache_dir         - katalog cache (pliki .eml nazwane skrótem SHA-256 treści)
+# max_size_mb       - limit rozmiaru; po przekroczeniu usuwane są najdawniej używane wiadomości (LRU)
+# mmap_threshold_kb - większe pliki są mapowane do pamięci przy odczycie nagłówków
+# Reprocess bez łączenia z IMAP: python3 main.py --reprocess-email adres@interia.pl --offline
+MESSAGE_CACHE = {
+    'enabled': True,
+    'cache_dir': 'message_cache',
+    'max_size_mb': 500,
+    'mmap_threshold_kb': 256
+}
+
+# ✅ TRYB PUSH - IMAP IDLE
+# enabled          - True = połączenia IDLE budzą bota od razu po nadejściu maila (tylko dla tego konta)
+#                    False = (Domyślnie) zwykłe odpytywanie co CHECK_INTERVAL
+# providers        - dostawcy obsługujący IDLE; pozostali (np. o2) są odpytywani co CHECK_INTERVAL
+# max_connections  - maksymalna liczba stałych połączeń IDLE (każde konto = 1 połączenie)
+# renew_seconds    - odnowienie IDLE przed 30-minutowym limitem serwera (RFC 2177)
+# debounce_seconds - krótkie okno na zebranie kilku powiadomień naraz
+IMAP_IDLE = {
+    'enabled': False,
+    'providers': ['gmail', 'interia'],
+    'max_connections': 20,
+    'renew_seconds': 25 * 60,
+    'reconnect_delay': 60,
+    'debounce_seconds': 2
+}
+
+# ✅ SKOMPILOWANY KLASYFIKATOR PRZEWOŹNIKÓW
+# enabled - True = tabele słów kluczowych i wzorców wszystkich handlerów zbudowane raz (tekst w małych literach raz na mail)
+#           False = can_handle każdego handlera po kolei (stara metoda, szczegółowe logi słów kluczowych)
+CARRIER_CLASSIFIER = {
+    'enabled': True
+}
+
+# ✅ EKSTRAKCJA FRAGMENTÓW DUŻYCH MAILI (general_extract_carrier_content)
+# merge_overlapping - True = nakładające się fragmenty łączone bez powtórzeń tekstu (w kolejności w mailu),
+#                     razem najwyżej max_chars znaków
+#                     False = fragmenty sklejane jak dotąd, w kolejności wzorców (także powtórzenia)
+SECTION_EXTRACTION = {
+    'merge_overlapping': False
+}
+
+# ✅ DOKUMENT HTML (parsowany raz na mail, wspólny dla ekstraktorów)
+# parser - 'auto' = lxml jeśli zainstalowany, inaczej html.parser; 'lxml' / 'html.parser' = wymuszony
+# prompt_text - True = do promptu (i wycinania fragmentów) trafia widoczny tekst + lista linków zamiast surowego HTML
+HTML_DOCUMENT = {
+    'parser': 'auto',
+    'prompt_text': False
+}
+
+# ✅ TREŚĆ MAILA (części text/plain i text/html)
+# single_part_body - True = ekstraktory dostają mniejszą z części zamiast sklejenia obu
+#                    (uwaga: część text/plain bywa skrócona - bez linków i kodów z HTML)
+EMAIL_BODY = {
+    'single_part_body': False
+}
+
+# ✅ SZYBKA ŚCIEŻKA BEZ AI
+# enabled - True = najpierw tanie ekstraktory (temat, regexy); AI tylko gdy brakuje pól wymaganych
+#           dla przewoźnika i statusu (required_fields w carriers_data_handlers.py)
+AI_FAST_PATH = {
+    'enabled': True
+}
+
+# ✅ BUDŻET TOKENÓW PROMPTU
+# Tokeny liczone tokenizerem modelu (tiktoken - opcjonalny: pip install tiktoken); bez niego szacunek
+# dopasowany do polskiego tekstu (słowa z diakrytykami, liczby i interpunkcja liczone osobno)
+# enabled           - True = treść maila przycinana do budżetu: limit minus instrukcje promptu przewoźnika
+#                     (liczone raz na szablon); najpierw fragmenty z wzorców przewoźnika, potem reszta maila.
+#                     Zużycie tokenów (prompt / odpowiedź) z odpowiedzi API logowane przy każdym requeście
+#                     False = limity znakowe jak dotąd (15000 / 12000 znaków, szacunek 4 znaki = 1 token)
+# max_prompt_tokens - limit całego promptu (endpoint modeli GitHub przyjmuje do 8000 tokenów wejścia)
+# reserve_tokens    - zapas na elementy promptu nieliczone osobno
+PROMPT_BUDGET = {
+    'enabled': True,
+    'max_prompt_tokens': 7600,
+    'reserve_tokens': 100
+}
+
+# ✅ KOMPAKTOWE SZABLONY PROMPTU (prompt_templates.py)
+# enabled - True = gdy szybka ścieżka (regexy) rozpoznała prawdopodobny status, prompt zawiera tylko schemat
+#           i jeden przykład dla tego statusu + uwagi przewoźnika (klucz: przewoźnik + status);
+#           status nieznany / bez szablonu - pełny prompt ze wszystkimi typami powiadomień
+# Wersja szablonu (version_id) jest częścią klucza cache odpowiedzi AI
+PROMPT_TEMPLATES = {
+    'enabled': True
+}
+
+# ✅ ZBIORCZE REQUESTY AI
+# enabled           - True = maile z cyklu, które trafią do AI, wysyłane po kilka w jednym requeście
+#                     (instrukcje promptu raz na batch, jeden odstęp rate limitu i jeden request z limitu dziennego)
+# max_emails        - maksymalna liczba maili w jednym requeście
+# max_prompt_tokens - budżet promptu w tokenach (liczonych jak w PROMPT_BUDGET; bez niego szacunek 4 znaki = 1 token)
+# Mail z błędną lub brakującą odpowiedzią w batchu przetwarzany jest osobnym requestem
+AI_BATCH = {
+    'enabled': False,
+    'max_emails': 8,
+    'max_prompt_tokens': 7000
+}
+
+# ✅ RÓWNOLEGŁE REQUESTY AI
+# enabled     - True = requesty AI dla maili z cyklu wysyłane równolegle (pula wątków) przed przetwarzaniem;
+#               zamiast stałego odstępu 3s obowiązuje limiter "openai" z rate_limiter.py (wywołania na minutę)
+# max_workers - maksymalna liczba jednoczesnych requestów
+# Wyniki są przetwarzane w kolejności cyklu (PROCESS_FROM_NEWEST), dzienny limit requestów bez zmian
+AI_CONCURRENCY = {
+    'enabled': False,
+    'max_workers': 4
+}
+
+# ✅ KOLEJKA OFFLINE AI (reprocess --batch)
+# Zadania ekstrakcji zapisywane do pliku JSONL i wysyłane jednym batchem (Batch API zgodne z OpenAI);
+# wyniki po zakończeniu batcha trafiają do arkusza jednym przebiegiem, bez zużywania limitu pętli na żywo.
+# base_url / api_key   - endpoint z obsługą batchy (endpoint modeli GitHub ich nie obsługuje); None = api.openai.com
+# job_file             - plik zadań; obok stan <job_file>.state.json (przerwany reprocess czeka na ten sam batch)
+# poll_interval        - co ile sekund sprawdzać status batcha
+# max_wait_hours       - po tylu godzinach reprocess kończy się bez zapisu (wyniki przy kolejnym uruchomieniu)
+BATCH_QUEUE = {
+    'base_url': None,
+    'api_key': os.getenv('OPENAI_BATCH_API_KEY'),
+    'job_file': 'batch_jobs.jsonl',
+    'completion_window': '24h',
+    'poll_interval': 60,
+    'max_wait_hours': 24
+}
+
+# ✅ CACHE ODPOWIEDZI AI (SQLite)
+# Klucz: przewoźnik + wersja promptu + temat + odbiorca + treść maila (bez różnic w białych znakach)
+# ttl_days    - po tylu dniach odpowiedź jest ignorowana i usuwana
+# max_entries - limit wpisów; po przekroczeniu usuwane są najdawniej użyte
+LLM_CACHE = {
+    'enabled': True,
+    'db_path': 'llm_cache.sqlite3',
+    'ttl_days': 30,
+    'max_entries': 5000
+}
+
+# ✅ SZABLONY POWIADOMIEŃ (fingerprint)
+# Odcisk = treść bez numerów, kodów, adresów i dat; ten sam odcisk = ten sam szablon przewoźnika
+# enabled           - True = potwierdzony szablon zastępuje request AI (wartości z kotwic, bez sprawdzania przez AI)
+#                     False = (Domyślnie) każdy mail spoza szybkiej ścieżki idzie do AI
+# min_confirmations - ile odpowiedzi AI musi zgodzić się z kotwicami, zanim szablon zastąpi request
+# max_templates     - limit zapamiętanych szablonów; po przekroczeniu usuwane są najdawniej użyte
+# UWAGA: gdy przewoźnik lekko zmieni szablon, kotwice mogą wyciągnąć błędny kod odbioru lub paczkomat.
+TEMPLATE_FINGERPRINT = {
+    'enabled': False,
+    'path': 'template_fingerprints.json',
+    'min_confirmations': 2,
+    'max_templates': 500
+}
+
 # Czy wysyłać powiadomienia mailowe o odbiorze? (True = Tak, False = Nie)
 SEND_EMAIL_NOTIFICATIONS = True
 
@@ -0,0 +1,170 @@
+import logging
+import re
+
+# Znaki specjalne regexa - wzorzec bez nich (i bez \d, \b...) jest zwykłym tekstem
+_REGEX_SPECIAL = set('.^$*+?{}[]|()')
+
+
+class CarrierClassifier:
+    """
+    Klasyfikator maili budowany raz przy starcie - zastępuje sekwencyjne wywołania can_handle.
+
+    Reguły wszystkich handlerów (classifier_rules - te same słowa kluczowe i wzorce co w can_handle)
+    są łączone w tabele na zakres (temat / treść):
+    - słowa kluczowe (zwykły tekst) - bez duplikatów, każde wskazuje listę (handler, znacznik, okno treści),
+      szukane raz przez str.find w tekście zamienionym na małe litery raz na mail,
+    - prawdziwe wzorce regex - kompilowane raz, uruchamiane tylko gdy w tekście jest ich stały fragment
+      i sprawdzane z endpos = okno treści (bez kopiowania body[:500]).
+
+    Pierwsze wystąpienie słowa kluczowego wystarcza do sprawdzenia okna treści (body[:window]),
+    więc wynik jest taki sam jak z can_handle. classify zwraca pasujące handlery
+    w kolejności priorytetu (kolejność data_handlers).
+    """
+
+    def __init__(self, handlers):
+        self.handlers = list(handlers)
+
+        # (zakres, rozróżnianie wielkości liter) -> {słowo kluczowe: [(indeks handlera, znacznik, okno)]}
+        self._keywords = {}
+        # [(zakres i rozróżnianie wielkości liter, skompilowany wzorzec, wymagany fragment, indeks handlera, znacznik, okno)]
+        self._patterns = []
+        rules_count = 0
+
+        for index, handler in enumerate(self.handlers):
+            for tag, scope, pattern, case_sensitive in handler.classifier_rules():
+                window = getattr(handler, 'body_window', None) if scope == 'body' else None
+                key = (scope, case_sensitive)
+                rules_count += 1
+
+                keyword = self._as_keyword(pattern)
+                if keyword is not None:
+                    if not case_sensitive:
+                        keyword = keyword.lower()
+                    self._keywords.setdefault(key, {}).setdefault(keyword, []).append((index, tag, window))
+                else:
+                    # Wzorce bez rozróżniania wielkości liter są dopasowywane do tekstu w małych literach
+                    # (bez re.IGNORECASE regex może szybko szukać stałego początku wzorca)
+                    if not case_sensitive:
+                        pattern = self._lower_pattern(pattern)
+                    self._patterns.append(
+                        (key, re.compile(pattern), self._required_literal(pattern), index, tag, window)
+                    )
+
+        # Słowo kluczowe szukane raz - do największego okna spośród handlerów, które go używają
+        self._keyword_limits = {
+            key: {
+                keyword: None if any(window is None for _, _, window in targets) else max(window for _, _, window in targets)
+                for keyword, targets in keywords.items()
+            }
+            for key, keywords in self._keywords.items()
+        }
+
+        keywords_count = sum(len(keywords) for keywords in self._keywords.values())
+        logging.info(f"🏷️ Klasyfikator: {rules_count} reguł z {len(self.handlers)} handlerów "
+                     f"({keywords_count} słów kluczowych, {len(self._patterns)} wzorców regex)")
+
+    @staticmethod
+    def _as_keyword(pattern):
+        """Zwraca wzorzec jako zwykły tekst (np. z re.escape) albo None, jeśli to prawdziwy regex"""
+        result = []
+        escaped = False
+        for char in pattern:
+            if escaped:
+                if char.isalnum():
+                    return None  # \b, \d, \s...
+                result.append(char)
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char in _REGEX_SPECIAL:
+                return None
+            else:
+                result.append(char)
+        return None if escaped else ''.join(result)
+
+    @staticmethod
+    def _required_literal(pattern):
+        """
+        Najdłuższy stały fragment, który musi wystąpić w dopasowaniu (np. 'nadana' dla \\bgls\\b.*nadana).
+        Regex jest uruchamiany tylko, gdy str.find znajdzie ten fragment. None dla wzorców z | ( [.
+        """
+        if any(char in pattern for char in '|(['):
+            return None
+
+        runs = [[]]
+        escaped = False
+        for char in pattern:
+            if escaped:
+                escaped = False
+                if char.isalnum():
+                    runs.append([])  # \b, \d...
+                else:
+                    runs[-1].append(char)
+            elif char == '\\':
+                escaped = True
+            elif char in '*+?{':
+                # Kwantyfikator dotyczy poprzedniego znaku - nie jest on wymagany
+                if runs[-1]:
+                    runs[-1].pop()
+                runs.append([])
+            elif char in _REGEX_SPECIAL:
+                runs.append([])
+            else:
+                runs[-1].append(char)
+
+        longest = max((''.join(run) for run in runs), key=len)
+        return longest if len(longest) >= 2 else None
+
+    @staticmethod
+    def _lower_pattern(pattern):
+        """Małe litery we wzorcu z pominięciem sekwencji ucieczki (\\b, \\d, \\S...)"""
+        result = []
+        escaped = False
+        for char in pattern:
+            result.append(char if escaped else char.lower())
+            escaped = char == '\\' and not escaped
+        return ''.join(result)
+
+    def classify(self, subject, body):
+        """Zwraca listę handlerów pasujących do maila (w kolejności priorytetu)"""
+        texts = {
+            ('subject', True): subject or "",
+            ('body', True): body or ""
+        }
+        texts[('subject', False)] = texts[('subject', True)].lower()
+        texts[('body', False)] = texts[('body', True)].lower()
+        hits = {}
+
+        for key, keywords in self._keywords.items():
+            text = texts[key]
+            if not text:
+                continue
+            limits = self._keyword_limits[key]
+            for keyword, targets in keywords.items():
+                limit = limits[keyword]
+                position = text.find(keyword, 0, limit if limit is not None else len(text))
+                if position == -1:
+                    continue
+                end = position + len(keyword)
+                for index, tag, window in targets:
+                    if window is None or end <= window:
+                        hits.setdefault(index, set()).add(tag)
+
+        for key, regex, literal, index, tag, window in self._patterns:
+            text = texts[key]
+            if not text or tag in hits.get(index, ()):
+                continue
+            end = window if window is not None else len(text)
+            if literal and text.find(literal, 0, end) == -1:
+                continue
+            if regex.search(text, 0, end):
+                hits.setdefault(index, set()).add(tag)
+
+        return [
+            handler for index, handler in enumerate(self.handlers)
+            if index in hits and handler.matches_tags(hits[index])
+        ]
+
+    def is_candidate(self, subject):
+        """Czy sam temat wystarcza do rozpoznania przewoźnika (wstępna klasyfikacja po nagłówkach)"""
+        return bool(self.classify(subject, ""))
@@ -1,6 +1,6 @@
 import imaplib
 import email
-from email.header import decode_header
+from email.message import Message
 import re
 from datetime import datetime, timedelta
 import config
@@ -8,9 +8,17 @@ import logging
 import json
 import os
 import time
+import heapq
+import queue
+import threading
 from openai_handler import OpenAIHandler
 import pytz
-from email.utils import parsedate_to_datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from imap_session_pool import IMAPSessionPool
+from imap_checkpoints import IMAPCheckpointStore
+from parsed_email import ParsedEmail, decode_subject, extract_recipient_name
+from imap_utils import parse_fetch_response, get_section, compress_message_set, chunked, split_fetch_messages, parse_bodystructure, find_text_parts
 
 class EmailHandler:
     def __init__(self):
@@ -48,7 +56,49 @@ class EmailHandler:
             DPDDataHandler(self),           
         ]
         
+        # Skompilowany klasyfikator (słowa kluczowe wszystkich handlerów naraz zamiast can_handle każdego handlera)
+        self.classifier = None
+        if getattr(config, 'CARRIER_CLASSIFIER', {}).get('enabled', False):
+            from email_classifier import CarrierClassifier
+            self.classifier = CarrierClassifier(self.data_handlers)
+        
         self.local_tz = pytz.timezone('Europe/Warsaw')
+        
+        # Dostawcy, dla których serwer odrzucił wyszukiwanie po nadawcach (szeroki SEARCH)
+        self.sender_filter_disabled = set()
+        
+        # Lokalny cache surowych wiadomości (reprocess bez ponownego pobierania z IMAP)
+        cache_settings = getattr(config, 'MESSAGE_CACHE', {})
+        self.message_cache = None
+        if cache_settings.get('enabled', False):
+            from message_cache import RawMessageCache
+            self.message_cache = RawMessageCache(
+                cache_settings.get('cache_dir', 'message_cache'),
+                max_bytes=cache_settings.get('max_size_mb', 500) * 1024 * 1024,
+                mmap_threshold=cache_settings.get('mmap_threshold_kb', 256) * 1024
+            )
+        
+        # Konta sprawdzone w ostatnim cyklu (używane przez obserwatora IDLE)
+        self.last_checked_configs = []
+        
+        # Pula sesji IMAP - połączenia utrzymywane między cyklami
+        pool_settings = getattr(config, 'IMAP_SESSION_POOL', {})
+        self.session_pool = None
+        if pool_settings.get('enabled', False):
+            self.session_pool = IMAPSessionPool(
+                self.connect_to_email_account,
+                max_sessions=pool_settings.get('max_sessions', 50),
+                max_idle_seconds=pool_settings.get('max_idle_seconds', 1200)
+            )
+        
+        # Checkpointy synchronizacji przyrostowej (UIDVALIDITY / ostatni UID / HIGHESTMODSEQ)
+        sync_settings = getattr(config, 'IMAP_INCREMENTAL_SYNC', {})
+        self.checkpoints = None
+        if sync_settings.get('enabled', False):
+            self.checkpoints = IMAPCheckpointStore(sync_settings.get('checkpoints_file', 'imap_checkpoints.json'))
+        # Checkpointy z bieżącego cyklu - zapisywane dopiero po przetworzeniu maili (commit_sync_checkpoints)
+        self.pending_checkpoints = {}
+        self._pending_checkpoints_lock = threading.Lock()
 
     def _load_mappings(self):
         """Wczytuje zapisane mapowania z pliku i normalizuje klucze"""
@@ -187,14 +237,70 @@ class EmailHandler:
         """
         Pobieranie e-maili z ostatnich X dni.
         Obsługuje logikę mieszaną: PROCESS_READ_EMAILS oraz CHECK_ONLY_UNSEEN.
+        Konta mogą być sprawdzane równolegle (IMAP_PARALLEL_FETCH), wynik zachowuje kolejność kont.
         """
         all_emails = []
         
+        valid_configs, fetch_params = self._prepare_fetch(email_configs_override)
+        
+        per_account_results = None
+        if getattr(config, 'IMAP_FETCH_BACKEND', 'imaplib') == 'asyncio':
+            per_account_results = self._fetch_accounts_async(valid_configs, fetch_params)
+        
+        if per_account_results is None:
+            parallel_settings = getattr(config, 'IMAP_PARALLEL_FETCH', {})
+            if parallel_settings.get('enabled', False) and len(valid_configs) > 1:
+                per_account_results = self._fetch_accounts_parallel(valid_configs, fetch_params)
+            else:
+                per_account_results = [self._fetch_account_emails(cfg, fetch_params) for cfg in valid_configs]
+        
+        # Scalanie w kolejności kont (tak jak przy pobieraniu sekwencyjnym)
+        for account_emails in per_account_results:
+            all_emails.extend(account_emails)
+        
+        if self.session_pool:
+            logging.info(f"🔌 Pula IMAP: {self.session_pool.get_stats()}")
+        
+        logging.info(f"📧 Łącznie pobrano {len(all_emails)} emaili")
+        return all_emails
+    
+    def iter_new_emails(self, email_configs_override=None):
+        """
+        Strumieniowa wersja fetch_new_emails - generator (source, email_message).
+        Wiadomości oddawane są konto po koncie, zaraz po pobraniu danego konta,
+        więc w pamięci nie jest trzymana cała skrzynka wszystkich kont naraz.
+        Kolejność kont przy pobieraniu równoległym = kolejność zakończenia.
+        """
+        valid_configs, fetch_params = self._prepare_fetch(email_configs_override)
+        total = 0
+        
+        per_account_results = None
+        if getattr(config, 'IMAP_FETCH_BACKEND', 'imaplib') == 'asyncio':
+            # Silnik asyncio oddaje wyniki po zakończeniu wszystkich kont
+            per_account_results = self._fetch_accounts_async(valid_configs, fetch_params)
+        
+        if per_account_results is None:
+            parallel_settings = getattr(config, 'IMAP_PARALLEL_FETCH', {})
+            if parallel_settings.get('enabled', False) and len(valid_configs) > 1:
+                per_account_results = self._iter_accounts_parallel(valid_configs, fetch_params)
+            else:
+                per_account_results = (self._fetch_account_emails(cfg, fetch_params) for cfg in valid_configs)
+        
+        for account_emails in per_account_results:
+            total += len(account_emails)
+            for item in account_emails:
+                yield item
+        
+        if self.session_pool:
+            logging.info(f"🔌 Pula IMAP: {self.session_pool.get_stats()}")
+        
+        logging.info(f"📧 Łącznie pobrano {total} emaili")
+    
+    def _prepare_fetch(self, email_configs_override=None):
+        """Ustala parametry pobierania dla cyklu. Zwraca (poprawne_konfiguracje, fetch_params)."""
         configs = email_configs_override if email_configs_override is not None else config.ALL_EMAIL_CONFIGS
         
         days_back = getattr(config, 'EMAIL_CHECK_SETTINGS', {}).get('days_back', 14)
-        max_emails = getattr(config, 'EMAIL_CHECK_SETTINGS', {}).get('max_emails_per_account', 100)
-        mark_as_read = getattr(config, 'EMAIL_CHECK_SETTINGS', {}).get('mark_as_read', True)
         
         # LOGIKA FLAG
         process_read_forced = getattr(config, 'PROCESS_READ_EMAILS', False)
@@ -214,209 +320,757 @@ class EmailHandler:
         
         logging.info(f"📅 Sprawdzanie emaili od {date_string} ({days_back} dni wstecz)")
         
+        fetch_params = {
+            'days_back': days_back,
+            'cutoff_date': cutoff_date,
+            'date_string': date_string,
+            'max_emails': getattr(config, 'EMAIL_CHECK_SETTINGS', {}).get('max_emails_per_account', 100),
+            'mark_as_read': getattr(config, 'EMAIL_CHECK_SETTINGS', {}).get('mark_as_read', True),
+            'process_read_forced': process_read_forced,
+            'search_only_unseen': search_only_unseen
+        }
+        
+        valid_configs = []
         for email_config in configs:
+            if not email_config.get('email') or not email_config.get('password'):
+                logging.warning(f"Pomijanie {email_config.get('source', 'gmail')}: brak kompletnej konfiguracji")
+                continue
+            valid_configs.append(email_config)
+        
+        if self.session_pool:
+            self.session_pool.prune_idle()
+        
+        return valid_configs, fetch_params
+    
+    def _fetch_accounts_async(self, configs, fetch_params):
+        """
+        Pobiera konta silnikiem asyncio (IMAP_FETCH_BACKEND = 'asyncio').
+        Zwraca None, jeśli silnik jest niedostępny - wtedy używany jest imaplib.
+        """
+        from imap_async_fetcher import AsyncIMAPFetcher, AIOIMAPLIB_AVAILABLE
+        
+        if not AIOIMAPLIB_AVAILABLE:
+            logging.warning("⚠️ IMAP_FETCH_BACKEND='asyncio', ale brak biblioteki aioimaplib - używam imaplib")
+            return None
+        
+        try:
+            return AsyncIMAPFetcher(self).fetch_all(configs, fetch_params)
+        except RuntimeError as e:
+            # np. wywołanie z wnętrza działającej pętli asyncio
+            logging.warning(f"⚠️ Silnik asyncio niedostępny ({e}) - używam imaplib")
+            return None
+    
+    def _fetch_accounts_parallel(self, configs, fetch_params, on_account_done=None):
+        """
+        Pobiera emaile z wielu kont równolegle.
+        Każdy dostawca ma własny limit jednoczesnych połączeń (provider_limits),
+        więc wolny serwer (np. O2) nie blokuje sprawdzania pozostałych kont.
+        Zwraca listę wyników w tej samej kolejności co configs.
+        on_account_done - opcjonalny callback(account_emails) wołany zaraz po pobraniu konta;
+        wyniki nie są wtedy zbierane (zwracane są puste listy).
+        """
+        settings = getattr(config, 'IMAP_PARALLEL_FETCH', {})
+        max_workers = max(1, settings.get('max_workers', 8))
+        provider_limits = settings.get('provider_limits', {})
+        default_limit = settings.get('default_provider_limit', 2)
+        
+        results = [[] for _ in configs]
+        
+        # Kolejka kont per dostawca - każdy "tor" pobiera kolejne konto swojego dostawcy
+        queues = {}
+        for index, email_config in enumerate(configs):
             source = email_config.get('source', 'gmail')
-            email_addr = email_config.get('email')
+            queues.setdefault(source, deque()).append(index)
+        
+        def provider_lane(account_queue):
+            while True:
+                try:
+                    index = account_queue.popleft()
+                except IndexError:
+                    return
+                try:
+                    account_emails = self._fetch_account_emails(configs[index], fetch_params)
+                    if on_account_done:
+                        on_account_done(account_emails)
+                    else:
+                        results[index] = account_emails
+                except Exception as e:
+                    logging.error(f"❌ Błąd równoległego pobierania dla {configs[index].get('email')}: {e}")
+        
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imap-fetch") as executor:
+            futures = []
+            for source, account_queue in queues.items():
+                lanes = max(1, min(provider_limits.get(source, default_limit), len(account_queue)))
+                logging.info(f"⚡ {source}: {len(account_queue)} kont, {lanes} równoległych połączeń")
+                for _ in range(lanes):
+                    futures.append(executor.submit(provider_lane, account_queue))
             
-            if not email_addr or not email_config.get('password'):
-                logging.warning(f"Pomijanie {source}: brak kompletnej konfiguracji")
-                continue
+            for future in futures:
+                future.result()
+        
+        logging.info(f"⚡ Równoległe pobieranie {len(configs)} kont zakończone w {time.time() - start_time:.1f}s")
+        return results
+    
+    def _iter_accounts_parallel(self, configs, fetch_params):
+        """
+        Równoległe pobieranie w trybie strumieniowym - generator wyników per konto.
+        Kolejka jest ograniczona, więc gdy przetwarzanie nie nadąża, wątki pobierające czekają
+        (w pamięci jest najwyżej kilka pobranych kont naraz).
+        """
+        settings = getattr(config, 'IMAP_PARALLEL_FETCH', {})
+        results_queue = queue.Queue(maxsize=max(1, settings.get('max_workers', 8)))
+        finished = object()
+        
+        def run():
+            try:
+                self._fetch_accounts_parallel(configs, fetch_params, on_account_done=results_queue.put)
+            finally:
+                results_queue.put(finished)
+        
+        producer = threading.Thread(target=run, name="imap-fetch-stream", daemon=True)
+        producer.start()
+        
+        while True:
+            account_emails = results_queue.get()
+            if account_emails is finished:
+                break
+            yield account_emails
+        
+        producer.join()
+    
+    def _fetch_account_emails(self, email_config, fetch_params):
+        """Pobiera nowe emaile z jednego konta. Zwraca listę (source, email_message)."""
+        account_emails = []
+        
+        source = email_config.get('source', 'gmail')
+        email_addr = email_config.get('email')
+        
+        date_string = fetch_params['date_string']
+        max_emails = fetch_params['max_emails']
+        mark_as_read = fetch_params['mark_as_read']
+        search_only_unseen = fetch_params['search_only_unseen']
+        
+        logging.info(f"🔍 Sprawdzanie emaili {source}: {email_addr}")
+        
+        client = self._acquire_imap_client(email_config)
+        if not client:
+            return account_emails
+        
+        emails_to_mark_read = []
+        session_healthy = True
             
-            logging.info(f"🔍 Sprawdzanie emaili {source}: {email_addr}")
+        try:
+            self._enable_condstore(client)
+            client = self._select_inbox(client, email_config)
+            mailbox_state = self._read_mailbox_state(client)
             
-            client = self.connect_to_email_account(email_config)
-            if not client:
-                continue
+            # --- Synchronizacja przyrostowa (UID n+1:*) ---
+            sender_filter = self._use_sender_filter(source)
+            search_mode = self._get_search_mode(search_only_unseen, sender_filter)
+            sync_from_uid, unchanged = self._get_sync_start_uid(source, email_addr, mailbox_state, search_mode)
+            if unchanged:
+                return account_emails
             
-            emails_to_mark_read = []
-                
-            try:
-                client.select("INBOX")
+            found_uids, search_mode = self._search_uids(client, source, date_string, sync_from_uid, search_only_unseen, sender_filter)
+            
+            all_msg_list, messages_to_process = self._select_uids_to_process(source, found_uids, sync_from_uid, max_emails)
+            # UID faktycznie obsłużone (pobrane albo odrzucone po nagłówkach) - checkpoint nie przeskoczy reszty
+            handled_uids = set()
+            
+            if messages_to_process:
+                # --- Faza 1: same nagłówki, treść tylko dla wiadomości od przewoźników ---
+                if getattr(config, 'IMAP_HEADER_FIRST_FETCH', {}).get('enabled', False):
+                    messages_to_process, skipped_uids = self._prefilter_by_headers(client, messages_to_process, source)
+                    # Pominięte nie są oznaczane jako przeczytane - zostają w skrzynce do ręcznego sprawdzenia
+                    handled_uids.update(int(uid) for uid in skipped_uids)
                 
-                criteria_parts = [f'(SINCE "{date_string}")']
-                if search_only_unseen:
-                    criteria_parts.append('(UNSEEN)')
+                for num, email_message in self._iter_fetched_messages(client, messages_to_process):
+                    email_message = self.parse_email(email_message)
+                    accepted = self._accept_fetched_message(num, email_message, fetch_params)
+                    handled_uids.add(int(num))
+                    if accepted:
+                        account_emails.append((source, email_message))
+                    if self._should_mark_read(fetch_params, processed=accepted):
+                        emails_to_mark_read.append(num)
+            else:
+                logging.info(f"📭 Brak emaili spełniających kryteria w {source}")
+            
+            self._save_sync_checkpoint(source, email_addr, mailbox_state, sync_from_uid, all_msg_list, search_mode, handled_uids)
                 
-                search_criteria = " ".join(criteria_parts)
-                if len(criteria_parts) > 1:
-                    search_criteria = f"({search_criteria})"
+        except Exception as e:
+            logging.warning(f"⚠️ Błąd wyszukiwania dla {source}: {e}")
+            emails_to_mark_read = []
+            if isinstance(e, (imaplib.IMAP4.abort, OSError)):
+                session_healthy = False
                 
-                logging.info(f"📅 {source} Criteria: {search_criteria}")
+        finally:
+            if mark_as_read and emails_to_mark_read:
+                try:
+                    logging.info(f"📖 Oznaczanie {len(emails_to_mark_read)} emaili jako przeczytane w {source}")
+                    self._store_seen_batched(client, emails_to_mark_read)
+                    client.expunge()
+                except Exception as e:
+                    logging.error(f"❌ Błąd oznaczania emaili: {e}")
+            
+            self._release_imap_client(email_config, client, session_healthy)
+        
+        return account_emails
+    
+    def _get_sync_start_uid(self, source, email_addr, mailbox_state, search_mode):
+        """
+        Na podstawie checkpointu zwraca (sync_from_uid, bez_zmian).
+        sync_from_uid = None oznacza pełny skan SINCE.
+        """
+        if not self.checkpoints:
+            return None, False
+        
+        checkpoint = self.checkpoints.get(source, email_addr)
+        if (checkpoint and mailbox_state['uidvalidity'] is not None
+                and checkpoint.get('uidvalidity') == mailbox_state['uidvalidity']
+                and checkpoint.get('mode') == search_mode):
+            sync_from_uid = checkpoint.get('last_uid') or 0
+            if self._mailbox_unchanged(checkpoint, mailbox_state):
+                logging.info(f"⏩ {source}: brak nowych wiadomości od ostatniego cyklu (UID {sync_from_uid})")
+                return sync_from_uid, True
+            return sync_from_uid, False
+        
+        if checkpoint:
+            logging.info(f"🔄 {source}: zmiana UIDVALIDITY lub trybu skanowania - pełny skan")
+        return None, False
+    
+    def _search_uids(self, client, source, date_string, sync_from_uid, search_only_unseen, sender_filter):
+        """
+        Wykonuje UID SEARCH. Zwraca (znalezione_uid, tryb_skanowania).
+        Gdy serwer odrzuci wyszukiwanie po nadawcach, powtarza je w szerokiej wersji
+        i wyłącza filtr nadawców dla tego dostawcy do końca działania bota.
+        """
+        search_criteria = self._build_search_criteria(date_string, sync_from_uid, search_only_unseen, sender_filter)
+        logging.info(f"📅 {source} Criteria: {search_criteria}")
+        
+        try:
+            status, messages = client.uid('SEARCH', None, search_criteria)
+        except imaplib.IMAP4.error as e:
+            if not sender_filter or isinstance(e, imaplib.IMAP4.abort):
+                raise
+            status, messages = 'BAD', [str(e).encode()]
+        
+        if status != "OK" and sender_filter:
+            logging.warning(f"⚠️ {source}: serwer odrzucił wyszukiwanie po nadawcach ({messages}) - wracam do szerokiego SEARCH")
+            self.sender_filter_disabled.add(source)
+            sender_filter = False
+            search_criteria = self._build_search_criteria(date_string, sync_from_uid, search_only_unseen)
+            status, messages = client.uid('SEARCH', None, search_criteria)
+        
+        found_uids = messages[0].split() if status == "OK" and messages[0] else []
+        return found_uids, self._get_search_mode(search_only_unseen, sender_filter)
+    
+    def _use_sender_filter(self, source):
+        """Czy dla dostawcy zawężać SEARCH do nadawców przewoźników (IMAP_SENDER_FILTER)"""
+        settings = getattr(config, 'IMAP_SENDER_FILTER', {})
+        if not settings.get('enabled', False):
+            return False
+        if source in settings.get('unreliable_providers', []) or source in self.sender_filter_disabled:
+            return False
+        providers = settings.get('providers', [])
+        if providers and source not in providers:
+            return False
+        return bool(self.get_carrier_senders())
+    
+    def _get_search_mode(self, search_only_unseen, sender_filter=False):
+        """Tryb skanowania zapisywany w checkpoincie - zmiana trybu wymusza pełny skan"""
+        search_mode = 'unseen' if search_only_unseen else 'all'
+        if sender_filter:
+            search_mode += '+senders'
+        return search_mode
+    
+    def get_carrier_senders(self):
+        """Zwraca listę wzorców nadawców zebraną z handlerów przewoźników (bez duplikatów)"""
+        senders = []
+        for handler in self.data_handlers:
+            for pattern in getattr(handler, 'sender_patterns', []):
+                if pattern and pattern not in senders:
+                    senders.append(pattern)
+        return senders
+    
+    def _build_sender_criteria(self):
+        """
+        Buduje kryterium OR z terminów FROM dla wszystkich nadawców przewoźników,
+        np. (OR (OR FROM "aliexpress" FROM "inpost") (OR FROM "dhl" FROM "dpd")).
+        IMAP OR przyjmuje dokładnie dwa argumenty - drzewo jest zrównoważone, żeby nie było zbyt głębokie.
+        """
+        terms = [f'FROM "{sender}"' for sender in self.get_carrier_senders()]
+        
+        def join_or(items):
+            if len(items) == 1:
+                return items[0]
+            middle = len(items) // 2
+            return f"(OR {join_or(items[:middle])} {join_or(items[middle:])})"
+        
+        return join_or(terms) if terms else None
+    
+    def _build_search_criteria(self, date_string, sync_from_uid, search_only_unseen, sender_filter=False):
+        """Buduje kryteria UID SEARCH"""
+        criteria_parts = [f'(SINCE "{date_string}")']
+        if sync_from_uid is not None:
+            criteria_parts.insert(0, f'(UID {sync_from_uid + 1}:*)')
+        if search_only_unseen:
+            criteria_parts.append('(UNSEEN)')
+        if sender_filter:
+            sender_criteria = self._build_sender_criteria()
+            if sender_criteria:
+                criteria_parts.append(sender_criteria)
+        
+        search_criteria = " ".join(criteria_parts)
+        if len(criteria_parts) > 1:
+            search_criteria = f"({search_criteria})"
+        return search_criteria
+    
+    def _select_uids_to_process(self, source, found_uids, sync_from_uid, max_emails):
+        """
+        Filtruje wynik SEARCH i nakłada limity.
+        Zwraca (wszystkie_znalezione, do_przetworzenia posortowane od najnowszych).
+        """
+        all_msg_list = list(found_uids)
+        # "n+1:*" zawsze zwraca najwyższy UID, nawet gdy jest <= n - odfiltrowujemy
+        if sync_from_uid is not None:
+            all_msg_list = [uid for uid in all_msg_list if int(uid) > sync_from_uid]
+        
+        messages_to_process = all_msg_list
+        
+        # --- Obsługa specyficzna dla O2 ---
+        if source.lower() == 'o2' and messages_to_process:
+            total_found = len(messages_to_process)
+            logging.info(f"📧 O2: Znaleziono {total_found} emaili")
+            
+            if total_found > 50:
+                messages_to_process = messages_to_process[-50:]
+                logging.info(f"📧 O2: Ograniczenie do 50 najnowszych")
+        
+        if len(messages_to_process) > max_emails:
+            logging.info(f"⚠️ Dodatkowe ograniczenie {source}: {len(messages_to_process)} -> {max_emails} najnowszych")
+            messages_to_process = messages_to_process[-max_emails:]
+        
+        if messages_to_process:
+            logging.info(f"📧 Przetwarzanie {len(messages_to_process)} emaili z {source}")
+        
+        messages_to_process = sorted(messages_to_process, key=lambda x: int(x), reverse=True)
+        return all_msg_list, messages_to_process
+    
+    def _accept_fetched_message(self, num, email_message, fetch_params):
+        """
+        Loguje pobraną wiadomość i sprawdza datę. Zwraca True jeśli trafia do przetwarzania.
+        email_message musi być już ParsedEmail (parse_email u wywołującego) - zdekodowane pola są potem używane dalej.
+        """
+        email_date = email_message.date_string
+        email_subject = email_message.subject
 
-                # --- Obsługa specyficzna dla O2 ---
-                if source.lower() == 'o2':
-                    status, messages = client.search(None, search_criteria)
-                    
-                    if status == "OK" and messages[0]:
-                        all_list = messages[0].split()
-                        total_found = len(all_list)
-                        logging.info(f"📧 O2: Znaleziono {total_found} emaili")
-                        
-                        if total_found > 50:
-                            messages_to_process = all_list[-50:]
-                            logging.info(f"📧 O2: Ograniczenie do 50 najnowszych")
-                        else:
-                            messages_to_process = all_list
-                        
-                        messages = [b' '.join(messages_to_process)]
-                        status = "OK"
-                    else:
-                        messages = [b'']
-                        status = "OK"
-                else:
-                    status, messages = client.search(None, search_criteria)
-                
-                if status == "OK" and messages[0]:
-                    all_msg_list = messages[0].split()
-                    
-                    if len(all_msg_list) > max_emails:
-                        messages_to_process = all_msg_list[-max_emails:]
-                        logging.info(f"⚠️ Dodatkowe ograniczenie {source}: {len(all_msg_list)} -> {max_emails} najnowszych")
-                    else:
-                        messages_to_process = all_msg_list
-                    
-                    logging.info(f"📧 Przetwarzanie {len(messages_to_process)} emaili z {source}")
-                    
-                    messages_to_process.sort(key=lambda x: int(x.decode()), reverse=True)
-                    
-                    for num in messages_to_process:
-                        status, msg_data = client.fetch(num, "(RFC822)")
-                        if status == "OK":
-                            raw_email = msg_data[0][1]
-                            try:
-                                email_message = email.message_from_bytes(raw_email)
-                            except:
-                                try:
-                                    decoded_content = raw_email.decode('utf-8', errors='ignore')
-                                    email_message = email.message_from_string(decoded_content)
-                                except:
-                                    continue
-                            
-                            email_date = self.extract_email_date(email_message)
-
-                            try:
-                                raw_subject = email_message.get('Subject', 'Brak tematu')
-                                email_subject = self.decode_email_subject(raw_subject)
-                            except:
-                                email_subject = "Brak tematu"
-
-                            logging.info(f"📧 Email ID {num.decode()}: {email_date} | {email_subject}")
-
-                            if email_date:
-                                email_dt = datetime.strptime(email_date, '%Y-%m-%d %H:%M:%S')
-                                if email_dt < cutoff_date:
-                                    logging.info(f"⏭️ Email z {email_date} starszy niż {days_back} dni - pomijam")
-                                    if search_only_unseen:
-                                        emails_to_mark_read.append(num)
-                                    continue
-
-                            all_emails.append((source, email_message))
-                            
-                            if search_only_unseen:
-                                emails_to_mark_read.append(num)
-                            elif process_read_forced and mark_as_read:
-                                emails_to_mark_read.append(num)
+        uid_str = num.decode() if isinstance(num, bytes) else str(num)
+        logging.info(f"📧 Email UID {uid_str}: {email_date} | {email_subject}")
+
+        if email_date:
+            email_dt = datetime.strptime(email_date, '%Y-%m-%d %H:%M:%S')
+            if email_dt < fetch_params['cutoff_date']:
+                logging.info(f"⏭️ Email z {email_date} starszy niż {fetch_params['days_back']} dni - pomijam")
+                return False
+        
+        return True
+    
+    def _should_mark_read(self, fetch_params, processed=True):
+        """Czy wiadomość ma zostać oznaczona jako przeczytana (zgodnie z trybem skanowania)"""
+        if fetch_params['search_only_unseen']:
+            return True
+        return processed and fetch_params['process_read_forced'] and fetch_params['mark_as_read']
+    
+    def _save_sync_checkpoint(self, source, email_addr, mailbox_state, sync_from_uid, all_msg_list, search_mode, handled_uids):
+        """
+        Przygotowanie checkpointu - zapis dopiero po przetworzeniu maili (commit_sync_checkpoints).
+        UID odcięte limitami albo niepobrane (błąd FETCH) zatrzymują checkpoint tuż przed najniższym z nich,
+        więc następny cykl sprawdzi je ponownie. Gdy obsłużono wszystko - sprawdzone jest wszystko poniżej UIDNEXT.
+        """
+        if not self.checkpoints or mailbox_state['uidvalidity'] is None:
+            return
+        
+        seen_uids = [int(uid) for uid in all_msg_list]
+        missed_uids = [uid for uid in seen_uids if uid not in handled_uids]
+        if missed_uids:
+            new_last_uid = max(sync_from_uid or 0, min(missed_uids) - 1)
+            logging.info(f"⏸️ {source}: {len(missed_uids)} wiadomości nieobsłużonych - checkpoint na UID {new_last_uid}")
+        else:
+            new_last_uid = max(
+                [sync_from_uid or 0, (mailbox_state['uidnext'] or 1) - 1] + seen_uids
+            )
+        
+        with self._pending_checkpoints_lock:
+            self.pending_checkpoints[(source, email_addr)] = {
+                'uidvalidity': mailbox_state['uidvalidity'],
+                'last_uid': new_last_uid,
+                'highestmodseq': mailbox_state['highestmodseq'],
+                'mode': search_mode
+            }
+    
+    def commit_sync_checkpoints(self):
+        """Zapisuje checkpointy z bieżącego cyklu - wołane po przetworzeniu pobranych maili"""
+        with self._pending_checkpoints_lock:
+            pending = self.pending_checkpoints
+            self.pending_checkpoints = {}
+        
+        for (source, email_addr), checkpoint in pending.items():
+            self.checkpoints.update(source, email_addr, **checkpoint)
+    
+    def _prefilter_by_headers(self, client, uids, source):
+        """
+        Pobiera nagłówki (FROM SUBJECT DATE TO) i RFC822.SIZE dla całego zbioru jednym FETCH
+        i wstępnie klasyfikuje wiadomości regułami handlerów przewoźników.
+        Zwraca (kandydaci, pominięte) - treść pobierana jest tylko dla kandydatów.
+        """
+        if not uids:
+            return uids, []
+        
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('header_chunk_size', 500)
+        headers_by_uid = {}
+        
+        for chunk in chunked(uids, chunk_size):
+            try:
+                status, data = client.uid('FETCH', compress_message_set(chunk), '(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE TO)])')
+            except (imaplib.IMAP4.abort, OSError):
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ {source}: błąd pobierania nagłówków ({e}) - pobieram pełne wiadomości")
+                return uids, []
+            
+            if status != "OK":
+                logging.warning(f"⚠️ {source}: serwer odrzucił pobranie nagłówków - pobieram pełne wiadomości")
+                return uids, []
+            
+            for item in parse_fetch_response(data):
+                if item['uid'] is not None:
+                    headers_by_uid[item['uid']] = item
+        
+        return self._split_header_candidates(uids, headers_by_uid, source)
+    
+    def _split_header_candidates(self, uids, headers_by_uid, source):
+        """Dzieli UID na kandydatów i pominięte na podstawie pobranych nagłówków"""
+        candidates = []
+        skipped = []
+        total_size = 0
+        skipped_size = 0
+        
+        for uid in uids:
+            item = headers_by_uid.get(int(uid))
+            if item is None:
+                # Brak nagłówków w odpowiedzi - bezpieczniej pobrać całość
+                candidates.append(uid)
+                continue
+            
+            size = item['size'] or 0
+            total_size += size
+            
+            headers = email.message_from_bytes(get_section(item, 'BODY[HEADER') or b'')
+            subject = self.decode_email_subject(headers.get('Subject', ''))
+            sender = self.decode_email_subject(headers.get('From', ''))
+            
+            if self._is_carrier_candidate(subject, sender):
+                candidates.append(uid)
+            else:
+                skipped.append(uid)
+                skipped_size += size
+                logging.debug(f"⏭️ {source} UID {int(uid)}: nie od przewoźnika ({sender} | {subject})")
+        
+        logging.info(
+            f"📨 {source}: nagłówki {len(uids)} wiadomości -> {len(candidates)} do pobrania, "
+            f"pominięto {len(skipped)} ({skipped_size // 1024} z {total_size // 1024} KB)"
+        )
+        return candidates, skipped
+    
+    def _fetch_messages_batched(self, client, ids, spec="(RFC822)", use_uid=True):
+        """
+        Pobiera wiadomości paczkami - jeden FETCH na paczkę po skompresowanym zbiorze (np. 4:19,22,31:40).
+        Zwraca generator (id, surowe_bajty) w kolejności ids.
+        """
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('fetch_chunk_size', 50)
+        
+        for chunk in chunked(ids, chunk_size):
+            message_set = compress_message_set(chunk)
+            if use_uid:
+                status, data = client.uid('FETCH', message_set, spec)
+            else:
+                status, data = client.fetch(message_set, spec)
+            
+            if status != "OK":
+                logging.warning(f"⚠️ FETCH {message_set} zwrócił status {status}")
+                continue
+            
+            raw_by_id = {}
+            for item in parse_fetch_response(data):
+                key = item['uid'] if use_uid else item['seq']
+                raw = get_section(item, 'RFC822') or get_section(item, 'BODY[')
+                if key is not None and raw is not None:
+                    raw_by_id[key] = raw
+            
+            for msg_id in chunk:
+                raw = raw_by_id.get(int(msg_id))
+                if raw is not None:
+                    yield msg_id, raw
+    
+    def _iter_fetched_messages(self, client, uids):
+        """
+        Zwraca generator (uid, email_message) dla podanych UID.
+        Przy IMAP_PARTIAL_FETCH pobierane są tylko części tekstowe, w przeciwnym razie całe RFC822.
+        """
+        if getattr(config, 'IMAP_PARTIAL_FETCH', {}).get('enabled', False):
+            yield from self._fetch_messages_partial(client, uids)
+            return
+        
+        for num, raw_email in self._fetch_messages_batched(client, uids):
+            email_message = self._parse_raw_email(raw_email)
+            if email_message is not None:
+                yield num, email_message
+    
+    def _parse_raw_email(self, raw_email):
+        """Parsuje surowe bajty wiadomości (z awaryjnym dekodowaniem)"""
+        try:
+            return email.message_from_bytes(raw_email)
+        except:
+            try:
+                decoded_content = raw_email.decode('utf-8', errors='ignore')
+                return email.message_from_string(decoded_content)
+            except:
+                return None
+    
+    def _fetch_messages_partial(self, client, uids):
+        """
+        Pobiera tylko nagłówki i części text/plain / text/html (BODY.PEEK[n]) na podstawie BODYSTRUCTURE.
+        Załączniki (kody QR, etykiety PDF) nie są w ogóle przesyłane.
+        Wiadomości o nietypowej strukturze (np. załączony message/rfc822) pobierane są w całości.
+        """
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('fetch_chunk_size', 50)
+        
+        for chunk in chunked(uids, chunk_size):
+            status, data = client.uid('FETCH', compress_message_set(chunk), '(UID BODYSTRUCTURE)')
+            text_parts_by_uid = self._text_parts_by_uid(data) if status == "OK" else {}
+            
+            messages = {}
+            for spec, group_uids in self._partial_fetch_groups(chunk, text_parts_by_uid).items():
+                status, data = client.uid('FETCH', compress_message_set(group_uids), spec)
+                if status != "OK":
+                    continue
+                for item in parse_fetch_response(data):
+                    if item['uid'] in text_parts_by_uid:
+                        email_message = self._build_partial_message(item, text_parts_by_uid[item['uid']])
+                        if email_message is not None:
+                            messages[item['uid']] = email_message
+            
+            full_fetch = [num for num in chunk if int(num) not in messages]
+            if full_fetch:
+                logging.info(f"📦 Pełne pobranie {len(full_fetch)} wiadomości (nietypowa struktura MIME)")
+                for num, raw_email in self._fetch_messages_batched(client, full_fetch):
+                    email_message = self._parse_raw_email(raw_email)
+                    if email_message is not None:
+                        messages[int(num)] = email_message
+            
+            for num in chunk:
+                if int(num) in messages:
+                    yield num, messages[int(num)]
+    
+    def _text_parts_by_uid(self, data):
+        """Części tekstowe (find_text_parts) per UID z odpowiedzi FETCH (UID BODYSTRUCTURE)"""
+        text_parts_by_uid = {}
+        for fetch_message in split_fetch_messages(data):
+            uid_match = re.search(rb'\bUID\s+(\d+)', fetch_message)
+            if not uid_match:
+                continue
+            structure = parse_bodystructure(fetch_message)
+            text_parts = find_text_parts(structure) if structure else None
+            if text_parts:
+                text_parts_by_uid[int(uid_match.group(1))] = text_parts
+        return text_parts_by_uid
+    
+    def _partial_fetch_groups(self, uids, text_parts_by_uid):
+        """
+        Grupuje UID po zestawie sekcji - wiadomości z tego samego szablonu idą jednym FETCH.
+        Zwraca {spec: [uid, ...]}; UID bez części tekstowych pomijane (pełne pobranie).
+        """
+        groups = {}
+        for num in uids:
+            text_parts = text_parts_by_uid.get(int(num))
+            if text_parts:
+                sections = tuple(part['section'] for part in text_parts)
+                groups.setdefault(sections, []).append(num)
+        
+        return {
+            "(UID BODY.PEEK[HEADER] " + " ".join(f"BODY.PEEK[{section}]" for section in sections) + ")": group_uids
+            for sections, group_uids in groups.items()
+        }
+    
+    def _build_partial_message(self, fetch_item, text_parts):
+        """
+        Składa wiadomość z nagłówków i pobranych części tekstowych.
+        Części zachowują zadeklarowany charset i Content-Transfer-Encoding,
+        więc get_email_body dekoduje je tak samo jak przy pełnym RFC822.
+        """
+        header_bytes = get_section(fetch_item, 'BODY[HEADER')
+        if header_bytes is None:
+            return None
+        
+        email_message = email.message_from_bytes(header_bytes)
+        mime_parts = []
+        
+        for part in text_parts:
+            payload = fetch_item['sections'].get(f"BODY[{part['section']}]")
+            if payload is None:
+                return None
+            
+            mime_part = Message()
+            content_type = f"text/{part['subtype']}"
+            if part['charset']:
+                content_type += f'; charset="{part["charset"]}"'
+            mime_part['Content-Type'] = content_type
+            mime_part['Content-Transfer-Encoding'] = part['encoding']
+            # Surowe bajty - dekodowanie wg charsetu dopiero w get_email_body
+            mime_part.set_payload(payload.decode('ascii', errors='surrogateescape'))
+            mime_parts.append(mime_part)
+        
+        if email_message.get_content_maintype() == 'multipart':
+            email_message.set_payload(mime_parts)
+        else:
+            email_message.set_payload(mime_parts[0].get_payload())
+        
+        return email_message
+    
+    def _store_seen_batched(self, client, ids, use_uid=True):
+        """Oznacza wiadomości jako przeczytane - jeden STORE na paczkę zamiast jednego na wiadomość"""
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('store_chunk_size', 500)
+        
+        for chunk in chunked(ids, chunk_size):
+            message_set = compress_message_set(chunk)
+            try:
+                if use_uid:
+                    client.uid('STORE', message_set, '+FLAGS', '\\Seen')
                 else:
-                    logging.info(f"📭 Brak emaili spełniających kryteria w {source}")
-                    
+                    client.store(message_set, '+FLAGS', '\\Seen')
+            except (imaplib.IMAP4.abort, OSError):
+                raise
             except Exception as e:
-                logging.warning(f"⚠️ Błąd wyszukiwania dla {source}: {e}")
-                emails_to_mark_read = []
-                    
-            finally:
-                if mark_as_read and emails_to_mark_read:
-                    try:
-                        logging.info(f"📖 Oznaczanie {len(emails_to_mark_read)} emaili jako przeczytane w {source}")
-                        for num in emails_to_mark_read:
-                            try:
-                                client.store(num, '+FLAGS', '\\Seen')
-                            except:
-                                pass
-                        client.expunge()
-                    except Exception as e:
-                        logging.error(f"❌ Błąd oznaczania emaili: {e}")
-                
+                logging.warning(f"⚠️ STORE {message_set} nieudany: {e}")
+    
+    def _is_carrier_candidate(self, subject, sender):
+        """Czy wiadomość (po samych nagłówkach) może pochodzić od przewoźnika / AliExpress"""
+        if self.classifier:
+            if any(handler.matches_sender(sender or "") for handler in self.data_handlers):
+                return True
+            if self.classifier.is_candidate(subject or ""):
+                return True
+        else:
+            for handler in self.data_handlers:
                 try:
-                    client.close()
-                    client.logout()
-                except:
-                    pass
+                    if handler.is_candidate(subject or "", sender or ""):
+                        return True
+                except Exception as e:
+                    logging.debug(f"Błąd wstępnej klasyfikacji {handler.name}: {e}")
+                    return True
         
-        logging.info(f"📧 Łącznie pobrano {len(all_emails)} emaili")
-        return all_emails
+        # Przekazane dalej maile (Fwd) i nietypowe tematy - ogólne słowa kluczowe
+        subject_lower = (subject or "").lower()
+        extra_keywords = getattr(config, 'IMAP_HEADER_FIRST_FETCH', {}).get('extra_subject_keywords', [])
+        return any(keyword in subject_lower for keyword in extra_keywords)
+    
+    def _enable_condstore(self, client):
+        """Włącza CONDSTORE (jeśli serwer wspiera) - SELECT zwróci wtedy HIGHESTMODSEQ"""
+        if not self.checkpoints or getattr(client, '_condstore_enabled', False):
+            return
+        capabilities = getattr(client, 'capabilities', ())
+        if 'CONDSTORE' in capabilities and 'ENABLE' in capabilities:
+            try:
+                client.enable('CONDSTORE')
+                client._condstore_enabled = True
+            except Exception as e:
+                logging.debug(f"Nie udało się włączyć CONDSTORE: {e}")
+    
+    def _read_mailbox_state(self, client):
+        """Odczytuje UIDVALIDITY, UIDNEXT i HIGHESTMODSEQ z odpowiedzi na SELECT"""
+        state = {}
+        for code in ('UIDVALIDITY', 'UIDNEXT', 'HIGHESTMODSEQ'):
+            try:
+                _, data = client.response(code)
+                value = data[-1] if data else None
+                state[code.lower()] = int(value) if value else None
+            except Exception:
+                state[code.lower()] = None
+        return state
+    
+    def _mailbox_unchanged(self, checkpoint, mailbox_state):
+        """Czy od ostatniego checkpointu nie przyszła żadna nowa wiadomość"""
+        if mailbox_state['uidnext']:
+            return mailbox_state['uidnext'] <= (checkpoint.get('last_uid') or 0) + 1
+        if mailbox_state['highestmodseq'] and checkpoint.get('highestmodseq'):
+            return mailbox_state['highestmodseq'] == checkpoint['highestmodseq']
+        return False
+    
+    def _acquire_imap_client(self, email_config):
+        """Zwraca zalogowanego klienta IMAP - z puli sesji lub nowe połączenie"""
+        if self.session_pool:
+            return self.session_pool.acquire(email_config)
+        return self.connect_to_email_account(email_config)
+    
+    def _select_inbox(self, client, email_config):
+        """
+        Wybiera INBOX. Jeśli sesja z puli została zerwana przez serwer,
+        łączy się ponownie (jeden raz) i zwraca nowego klienta.
+        """
+        try:
+            client.select("INBOX")
+            return client
+        except (imaplib.IMAP4.abort, OSError) as e:
+            if not self.session_pool:
+                raise
+            logging.warning(f"⚠️ Sesja IMAP dla {email_config.get('email')} zerwana ({e}) - ponawiam połączenie")
+            client = self.session_pool.reconnect(email_config, client)
+            if not client:
+                raise
+            client.select("INBOX")
+            return client
+    
+    def _release_imap_client(self, email_config, client, healthy=True):
+        """Zamyka skrzynkę i oddaje sesję do puli (lub wylogowuje bez puli)"""
+        try:
+            client.close()
+        except Exception:
+            healthy = False
+        
+        if not self.session_pool:
+            try:
+                client.logout()
+            except:
+                pass
+            return
+        
+        if healthy:
+            self.session_pool.release(email_config, client)
+        else:
+            self.session_pool.discard(email_config, client)
+    
+    def close_connections(self):
+        """Zamyka wszystkie utrzymywane sesje IMAP (wywoływane przy zamknięciu)"""
+        if self.session_pool:
+            self.session_pool.close_all()
+    
+    def parse_email(self, email_message):
+        """Zwraca ParsedEmail (dekodowanie tematu, daty i treści tylko raz) dla Message lub ParsedEmail"""
+        if isinstance(email_message, ParsedEmail):
+            return email_message
+        return ParsedEmail(email_message, self.local_tz)
     
     def get_email_body(self, email_message):
         """Wydobycie treści e-maila z obsługą polskich kodowań"""
-        body = ""
-        try:
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    
-                    if "attachment" in content_disposition:
-                        continue
-                        
-                    if content_type == "text/plain" or content_type == "text/html":
-                        try:
-                            payload = part.get_payload(decode=True)
-                            charset = part.get_content_charset()
-                            
-                            if charset:
-                                try:
-                                    body += payload.decode(charset, errors="replace")
-                                except (LookupError, UnicodeDecodeError):
-                                    try:
-                                        body += payload.decode("utf-8")
-                                    except:
-                                        body += payload.decode("iso-8859-2", errors="replace")
-                            else:
-                                try:
-                                    body += payload.decode("utf-8")
-                                except:
-                                    try:
-                                        body += payload.decode("iso-8859-2")
-                                    except:
-                                        body += payload.decode("windows-1250", errors="replace")
-                        except Exception as e:
-                            logging.warning(f"Błąd dekodowania części maila: {e}")
-            else:
-                payload = email_message.get_payload(decode=True)
-                charset = email_message.get_content_charset()
-                
-                if charset:
-                    try:
-                        body = payload.decode(charset, errors="replace")
-                    except (LookupError, UnicodeDecodeError):
-                        body = payload.decode("iso-8859-2", errors="replace")
-                else:
-                    try:
-                        body = payload.decode("utf-8")
-                    except:
-                        try:
-                            body = payload.decode("iso-8859-2")
-                        except:
-                            body = payload.decode("windows-1250", errors="replace")
-                            
-        except Exception as e:
-            logging.error(f"Krytyczny błąd pobierania treści maila: {e}")
-            
-        return body
+        parsed = self.parse_email(email_message)
+        if getattr(config, 'EMAIL_BODY', {}).get('single_part_body', False):
+            return parsed.compact_body
+        return parsed.body
     
     def extract_email_date(self, email_message):
         """Wyciąga datę z nagłówka emaila"""
-        try:
-            date_header = email_message.get('Date')
-            if date_header:
-                dt_with_tz = parsedate_to_datetime(date_header)
-                dt_local = dt_with_tz.astimezone(self.local_tz)
-                return dt_local.strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                logging.warning("Brak nagłówka Date w emailu")
-                return None
-        except Exception as e:
-            logging.error(f"Błąd podczas wyciągania daty z emaila: {e}")
-            return None
+        return self.parse_email(email_message).date_string
     
     def should_update_based_on_date(self, new_email_date, existing_email_date):
         """Sprawdza czy należy zaktualizować dane na podstawie porównania dat"""
@@ -449,8 +1103,11 @@ class EmailHandler:
             logging.error(f"Błąd podczas porównywania dat: {e}")
             return True
 
-    def process_emails(self, sheets_handler=None):
-        """Przetwarzanie nowych e-maili"""
+    def process_emails(self, sheets_handler=None, only_accounts=None):
+        """
+        Przetwarzanie nowych e-maili.
+        only_accounts - opcjonalny zbiór adresów (np. z powiadomienia IDLE) - sprawdzane są tylko te konta.
+        """
         all_configs = config.ALL_EMAIL_CONFIGS
         configs_to_check = []
 
@@ -460,7 +1117,15 @@ class EmailHandler:
         newest_first = getattr(config, 'PROCESS_FROM_NEWEST', True)
 
         # --- 1. WYBÓR ŹRÓDŁA KONT ---
-        if mode == 'ACCOUNTS' and sheets_handler:
+        if only_accounts:
+            # Wybudzenie z IDLE - konta z ostatniego pełnego cyklu, bez ponownego czytania arkusza
+            only_accounts = {addr.strip().lower() for addr in only_accounts}
+            configs_to_check = [
+                cfg for cfg in (self.last_checked_configs or all_configs)
+                if (cfg.get('email') or '').strip().lower() in only_accounts
+            ]
+            logging.info(f"📬 Sprawdzanie tylko kont z nową pocztą: {', '.join(sorted(only_accounts))}")
+        elif mode == 'ACCOUNTS' and sheets_handler:
             logging.info("🔄 Tryb pracy: ACCOUNTS (Pobieranie emaili z arkusza Google Sheets)")
             from carriers_sheet_handlers import EmailAvailabilityManager
             email_manager = EmailAvailabilityManager(sheets_handler)
@@ -479,7 +1144,17 @@ class EmailHandler:
             logging.info("🔄 Tryb pracy: CONFIG (Wszystkie maile z pliku)")
             configs_to_check = all_configs
 
+        if not only_accounts:
+            self.last_checked_configs = configs_to_check
+
         # --- 2. POBIERANIE I SORTOWANIE ---
+        # Checkpointy z przerwanego cyklu nie są zapisywane - te maile nie zostały przetworzone
+        with self._pending_checkpoints_lock:
+            self.pending_checkpoints = {}
+        
+        if getattr(config, 'EMAIL_STREAMING', {}).get('enabled', False):
+            return self._process_emails_streaming(configs_to_check, newest_first)
+        
         emails = self.fetch_new_emails(email_configs_override=configs_to_check)
         processed_data = []
         
@@ -496,37 +1171,21 @@ class EmailHandler:
         sort_info = "NAJNOWSZYCH do najstarszych" if newest_first else "NAJSTARSZYCH do najnowszych"
         logging.info(f"📧 Przetwarzanie {len(emails_with_dates)} emaili od {sort_info}")
         
+        # Maile, które trafią do AI, wysyłane zbiorczo / równolegle przed przetwarzaniem (AI_BATCH, AI_CONCURRENCY)
+        self._prefetch_ai_responses(
+            ((email_source, email_msg, email_date, self._extract_email_info(email_source, email_msg))
+             for email_source, email_msg, email_date in emails_with_dates if email_date),
+            newest_first
+        )
+        
         processed_users = set() 
 
         for email_source, email_msg, email_date in emails_with_dates:
             try:
                 logging.info(f"🕐 Przetwarzanie emaila z daty: {email_date}")
                 
-                try:
-                    raw_subject = email_msg.get("Subject", "Brak tematu")
-                    subject = self.decode_email_subject(raw_subject)
-                except Exception as e:
-                    logging.warning(f"⚠️ Błąd dekodowania: {e}")
-                    subject = str(email_msg.get("Subject", "Brak tematu"))
-                
-                body = self.get_email_body(email_msg)
-                to_header = email_msg.get("To", "")
-                
-                email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', to_header)
-                recipient = email_match.group(0).lower() if email_match else None
-                recipient_name = self.extract_recipient_name(to_header)
-
-                if not recipient:
-                    name_match = re.search(r"Witaj,\s*([\w\s]+)\s*user", body)
-                    if name_match:
-                        user_name = name_match.group(1).strip().lower()
-                        recipient = f"{user_name}@gmail.com"
-                    else:
-                        if email_source == "gmail": recipient = config.GMAIL_EMAIL.lower()
-                        else: recipient = config.INTERIA_EMAIL.lower()
-
-                user_key = recipient.split('@')[0].lower() if recipient else "unknown"
-                logging.info(f"Użyto klucza użytkownika: {user_key}")
+                email_info = self._extract_email_info(email_source, email_msg)
+                user_key = email_info['user_key']
 
                 # --- 3. LOGIKA POMIJANIA ---
                 # Pomijamy TYLKO wtedy, gdy idziemy od Najnowszych (żeby nie nadpisać nowych starymi).
@@ -538,39 +1197,208 @@ class EmailHandler:
                 if not email_date:
                     logging.warning("Brak daty w nagłówku emaila - pomijam")
                     continue  
-                    
-                logging.info(f"📧 Analiza: {email_date} | {user_key} | {subject[:30]}...")
                 
-                processed = self.analyze_email(
-                    subject, body, recipient, email_source, 
-                    recipient_name, email_message=email_msg, email_date=email_date
-                )
+                processed = self._analyze_email_info(email_info, email_source, email_msg, email_date)
                 
                 if processed:
-                    processed["email_date"] = email_date
-                    processed["user_key"] = user_key
                     processed_data.append(processed)
-                    
-                    logging.info(f"✅ Przetworzono email z {email_date}: {subject[:50]}")
-                    
                     # Zapamiętujemy usera
                     processed_users.add(user_key)
-                        
-                else:
-                    logging.info(f"⏭️ Email z {email_date} pominięty (starszy lub nieobsługiwany)")
                     
             except Exception as e:
                 logging.error(f"❌ Błąd podczas przetwarzania e-maila z {email_date}: {e}")
         
+        self.commit_sync_checkpoints()
         logging.info(f"📊 PODSUMOWANIE: Przetworzono {len(processed_data)} z {len(emails_with_dates)} emaili")
         return processed_data
 
+    def _process_emails_streaming(self, configs_to_check, newest_first):
+        """
+        Tryb strumieniowy (EMAIL_STREAMING): wiadomości przychodzą konto po koncie z iter_new_emails.
+        Zamiast globalnej listy i sortowania każdy użytkownik ma własny kopiec ograniczony do
+        max_emails_per_user najnowszych maili przewoźników - starsze wiadomości są zwalniane od razu,
+        a maile nierozpoznane przez handlery nie trafiają do kopca.
+        Przy PROCESS_FROM_NEWEST = False potrzebna jest pełna historia, więc kopce nie mają limitu.
+        """
+        max_per_user = getattr(config, 'EMAIL_STREAMING', {}).get('max_emails_per_user', 5) if newest_first else None
+        
+        user_heaps = {}
+        received = 0
+        counter = 0
+        
+        for email_source, email_msg in self.iter_new_emails(email_configs_override=configs_to_check):
+            received += 1
+            try:
+                email_date = self.extract_email_date(email_msg)
+                if not email_date:
+                    logging.warning("Brak daty w nagłówku emaila - pomijam")
+                    continue
+                
+                email_info = self._extract_email_info(email_source, email_msg)
+                # Limit kopca dotyczy tylko maili przewoźników - newslettery nie wypierają starszych powiadomień
+                if self._find_carrier_handler(email_info['subject'], email_info['body']) is None:
+                    logging.debug(f"⏭️ [stream] Pomijam mail spoza przewoźników: {email_info['subject'][:50]}")
+                    continue
+                heap = user_heaps.setdefault(email_info['user_key'], [])
+                
+                # Kopiec min wg daty - na szczycie najstarszy mail użytkownika
+                counter += 1
+                entry = (email_date, counter, email_source, email_msg, email_info)
+                if max_per_user and len(heap) >= max_per_user:
+                    heapq.heappushpop(heap, entry)
+                else:
+                    heapq.heappush(heap, entry)
+            except Exception as e:
+                logging.error(f"❌ Błąd podczas wstępnej analizy e-maila: {e}")
+        
+        sort_info = "NAJNOWSZYCH do najstarszych" if newest_first else "NAJSTARSZYCH do najnowszych"
+        logging.info(f"📧 [stream] {received} emaili, {len(user_heaps)} użytkowników - przetwarzanie od {sort_info}")
+        
+        for entries in user_heaps.values():
+            entries.sort(reverse=newest_first)
+        self._prefetch_ai_responses(
+            ((email_source, email_msg, email_date, email_info)
+             for entries in user_heaps.values() for email_date, _, email_source, email_msg, email_info in entries),
+            newest_first
+        )
+        
+        processed_data = []
+        for user_key in list(user_heaps):
+            entries = user_heaps.pop(user_key)
+            
+            for email_date, _, email_source, email_msg, email_info in entries:
+                try:
+                    processed = self._analyze_email_info(email_info, email_source, email_msg, email_date)
+                except Exception as e:
+                    logging.error(f"❌ Błąd podczas przetwarzania e-maila z {email_date}: {e}")
+                    continue
+                
+                if processed:
+                    processed_data.append(processed)
+                    if newest_first:
+                        break
+        
+        self.commit_sync_checkpoints()
+        logging.info(f"📊 PODSUMOWANIE: Przetworzono {len(processed_data)} z {received} emaili")
+        return processed_data
+
+    def _prefetch_ai_responses(self, candidates, newest_first):
+        """
+        Tryby AI_BATCH / AI_CONCURRENCY: maile z cyklu, które trafią do AI, wysyłane do OpenAI zbiorczo
+        (kilka w jednym requeście) i/lub równolegle - wyniki wracają do przetwarzania w kolejności cyklu.
+        candidates - (email_source, email_msg, email_date, email_info) w kolejności przetwarzania.
+        Wybór maili odtwarza analyze_email bez zmiany stanu: rozpoznany przewoźnik, mail nowszy od ostatniego
+        dla użytkownika, niekompletny wynik regexów; przy PROCESS_FROM_NEWEST tylko pierwszy mail użytkownika.
+        """
+        prefetch_enabled = (getattr(config, 'AI_BATCH', {}).get('enabled', False)
+                            or getattr(config, 'AI_CONCURRENCY', {}).get('enabled', False))
+        if not (getattr(config, 'USE_OPENAI_API', False) and prefetch_enabled):
+            return
+        
+        items = []
+        batched_users = set()
+        for email_source, email_msg, email_date, email_info in candidates:
+            user_key = email_info['user_key']
+            if newest_first and user_key in batched_users:
+                continue
+            try:
+                handler, probable_status = self._ai_prefetch_handler(email_info, email_source, email_msg, email_date)
+            except Exception as e:
+                logging.warning(f"⚠️ Wstępna analiza maila do requestu zbiorczego nie powiodła się: {e}")
+                continue
+            if handler is False:
+                continue
+            batched_users.add(user_key)
+            if handler:
+                items.append({
+                    'email_body': email_info['body'],
+                    'subject': email_info['subject'],
+                    'carrier_name': handler.name,
+                    'recipient_email': email_info['recipient'],
+                    'probable_status': probable_status
+                })
+        
+        if len(items) > 1:
+            self.openai_handler.prefetch_carrier_responses(items)
+
+    def _ai_prefetch_handler(self, email_info, email_source, email_msg, email_date, force_process=False):
+        """
+        (handler, prawdopodobny status) - handler, dla którego analyze_email wywoła AI, i status z regexów
+        (wybór szablonu promptu); handler None - mail przetworzony bez AI (szybka ścieżka),
+        False - mail nierozpoznany albo starszy niż ostatni przetworzony dla użytkownika (bez force_process)
+        """
+        subject, body, recipient = email_info['subject'], email_info['body'], email_info['recipient']
+        handler = self._find_carrier_handler(subject, body)
+        if handler is None:
+            return False, None
+        
+        existing_email_date = None if force_process else self._get_user_last_email_date(email_info['user_key'])
+        if (existing_email_date and not self.should_update_based_on_date(email_date, existing_email_date)
+                and not getattr(config, 'IGNORE_LAST_EMAIL_DATE_CHECK', False)):
+            return False, None
+        
+        if getattr(config, 'AI_FAST_PATH', {}).get('enabled', True):
+            quick_data = handler.quick_extract(subject, body, recipient, email_source, email_info['recipient_name'], self.parse_email(email_msg))
+            if handler.missing_fields(quick_data) == []:
+                return None, None
+            return handler, (quick_data or {}).get("status")
+        return handler, None
+
+    def _find_carrier_handler(self, subject, body):
+        """Pierwszy handler przewoźnika (w kolejności priorytetu) obsługujący maila albo None"""
+        matched_handlers = self.classifier.classify(subject, body) if self.classifier else None
+        return next((h for h in self.data_handlers
+                     if ((h in matched_handlers) if matched_handlers is not None else h.can_handle(subject, body))), None)
+
+    def _extract_email_info(self, email_source, email_msg):
+        """Temat, treść, odbiorca i klucz użytkownika dla wiadomości"""
+        parsed = self.parse_email(email_msg)
+        subject = parsed.subject
+        body = self.get_email_body(parsed)
+        recipient = parsed.recipient
+        recipient_name = parsed.recipient_name
+
+        if not recipient:
+            name_match = re.search(r"Witaj,\s*([\w\s]+)\s*user", body)
+            if name_match:
+                user_name = name_match.group(1).strip().lower()
+                recipient = f"{user_name}@gmail.com"
+            else:
+                if email_source == "gmail": recipient = config.GMAIL_EMAIL.lower()
+                else: recipient = config.INTERIA_EMAIL.lower()
+
+        user_key = recipient.split('@')[0].lower() if recipient else "unknown"
+        logging.info(f"Użyto klucza użytkownika: {user_key}")
+        
+        return {
+            'subject': subject,
+            'body': body,
+            'recipient': recipient,
+            'recipient_name': recipient_name,
+            'user_key': user_key
+        }
+
+    def _analyze_email_info(self, email_info, email_source, email_msg, email_date):
+        """Analiza jednej wiadomości. Zwraca dane zamówienia (z email_date i user_key) lub None."""
+        subject = email_info['subject']
+        logging.info(f"📧 Analiza: {email_date} | {email_info['user_key']} | {subject[:30]}...")
+        
+        processed = self.analyze_email(
+            subject, email_info['body'], email_info['recipient'], email_source, 
+            email_info['recipient_name'], email_message=self.parse_email(email_msg), email_date=email_date
+        )
+        
+        if processed:
+            processed["email_date"] = email_date
+            processed["user_key"] = email_info['user_key']
+            logging.info(f"✅ Przetworzono email z {email_date}: {subject[:50]}")
+        else:
+            logging.info(f"⏭️ Email z {email_date} pominięty (starszy lub nieobsługiwany)")
+        return processed
+
     def extract_recipient_name(self, header):
         """Wyciąga nazwę odbiorcy z nagłówka To/From"""
-        name_pattern = re.search(r'"?([^"<]+)"?\s*<', header)
-        if name_pattern:
-            return name_pattern.group(1).strip()
-        return None
+        return extract_recipient_name(header)
 
     def analyze_email(self, subject, body, recipient, email_source, recipient_name=None, email_message=None, email_date=None, force_process=False):
         """Analiza treści e-maila z priorytetem dla AI jeśli włączone"""
@@ -602,8 +1430,10 @@ class EmailHandler:
         
         use_ai = getattr(config, 'USE_OPENAI_API', False) 
         
+        matched_handlers = self.classifier.classify(subject, body) if self.classifier else None
+        
         for handler in self.data_handlers:
-            if handler.can_handle(subject, body):
+            if (handler in matched_handlers) if matched_handlers is not None else handler.can_handle(subject, body):
                 logging.info(f"Wykryto email obsługiwany przez {handler.name}")
                 
                 # --- ZMODYFIKOWANA LOGIKA: Sprawdzenie daty z obsługą IGNORE_LAST_EMAIL_DATE_CHECK ---
@@ -634,12 +1464,19 @@ class EmailHandler:
                          self._update_user_last_email_date(user_key, email_date)
                 # -----------------------------------------------------------------------------------
 
+                # 0. TANIE EKSTRAKTORY: kompletny wynik regexów oszczędza request AI (limit dzienny + odstęp między requestami)
+                probable_status = None
+                if use_ai and getattr(config, 'AI_FAST_PATH', {}).get('enabled', True):
+                    quick_data, probable_status = self._regex_fast_path(handler, subject, body, recipient, email_source, recipient_name, email_message)
+                    if quick_data:
+                        return {**data, **quick_data}
+
                 # 1. PRIORYTET: AI
                 if use_ai:
                     logging.info(f"🤖 Uruchamiam analizę AI dla {handler.name} (Priorytet AI)...")
                     try:
                         openai_data = self.openai_handler.general_extract_carrier_notification_data(
-                            body, subject, handler.name, recipient
+                            body, subject, handler.name, recipient, probable_status
                         )
                         if openai_data:
                             if not openai_data.get("carrier"):
@@ -676,6 +1513,34 @@ class EmailHandler:
         logging.info(f"Mail nie został zakwalifikowany do żadnej kategorii: {subject}")
         return None
 
+    def _regex_fast_path(self, handler, subject, body, recipient, email_source, recipient_name=None, email_message=None):
+        """
+        (wynik, status): wynik tanich ekstraktorów handlera, jeśli zawiera wszystkie pola wymagane dla statusu
+        (handler.required_fields) - wtedy AI nie jest wywoływane. Wynik None = potrzebne AI;
+        status z regexów (także niekompletnego wyniku) wybiera kompaktowy szablon promptu AI.
+        """
+        try:
+            quick_data = handler.quick_extract(subject, body, recipient, email_source, recipient_name, email_message)
+        except Exception as e:
+            logging.warning(f"⚠️ Szybka ekstrakcja {handler.name} nie powiodła się: {e}")
+            return None, None
+
+        status = (quick_data or {}).get("status")
+        missing = handler.missing_fields(quick_data)
+        if missing is None:
+            logging.info(f"🤖 {handler.name}: {f'status {status!r} z regexów' if status else 'brak statusu z regexów'} - wymaga AI")
+            return None, status
+
+        required = handler.required_fields[status]
+        if missing:
+            logging.info(f"📋 {handler.name} ({status}): regex {len(required) - len(missing)}/{len(required)} pól, brak: {', '.join(missing)} - uruchamiam AI")
+            return None, status
+
+        if not quick_data.get("carrier"):
+            quick_data["carrier"] = handler.name
+        logging.info(f"⚡ {handler.name} ({status}): kompletny wynik regexów - pomijam AI")
+        return quick_data, status
+
     # Wklej to wewnątrz klasy EmailHandler w pliku email_handler.py
 
     def sync_mappings_from_sheets(self, sheets_handler):
@@ -828,50 +1693,14 @@ class EmailHandler:
         
     def decode_email_subject(self, subject):
         """Dekoduje temat emaila z różnych encodingów"""
-        if not subject or subject == 'Brak tematu':
-            return subject or 'Brak tematu'
+        return decode_subject(subject)
         
-        try:
-            decoded = decode_header(subject)
-            decoded_parts = []
-            
-            for part, encoding in decoded:
-                if isinstance(part, bytes):
-                    if encoding:
-                        try:
-                            decoded_part = part.decode(encoding)
-                            decoded_parts.append(decoded_part)
-                        except (UnicodeDecodeError, LookupError):
-                            for fallback_encoding in ['iso-8859-2', 'iso-8859-1', 'utf-8']:
-                                try:
-                                    decoded_part = part.decode(fallback_encoding)
-                                    decoded_parts.append(decoded_part)
-                                    break
-                                except UnicodeDecodeError:
-                                    continue
-                            else:
-                                decoded_part = part.decode('utf-8', errors='ignore')
-                                decoded_parts.append(decoded_part)
-                    else:
-                        try:
-                            decoded_part = part.decode('utf-8')
-                            decoded_parts.append(decoded_part)
-                        except UnicodeDecodeError:
-                            decoded_part = part.decode('utf-8', errors='ignore')
-                            decoded_parts.append(decoded_part)
-                else:
-                    decoded_parts.append(str(part))
-            
-            return ''.join(decoded_parts)
-            
-        except Exception as e:
-            logging.warning(f"⚠️ Błąd dekodowania tematu: {e}")
-            return subject
-        
-    def fetch_specific_account_history(self, target_email, days_back=30):
+    def fetch_specific_account_history(self, target_email, days_back=30, offline=False):
         """
         Pobiera historię maili dla konkretnego konta.
         Jeśli nie znajdzie configu, używa danych domyślnych (FALLBACK).
+        Z włączonym MESSAGE_CACHE pobierane są tylko wiadomości, których nie ma w lokalnym cache.
+        offline=True - historia czytana wyłącznie z cache, bez łączenia z serwerem IMAP.
         """
         target_email = target_email.strip().lower()
         all_emails = []
@@ -903,6 +1732,10 @@ class EmailHandler:
         date_string = cutoff_date.strftime('%d-%b-%Y')
         
         source = found_config.get('source', 'unknown')
+        
+        if offline:
+            return self._load_history_from_cache(source, target_email, cutoff_date)
+        
         logging.info(f"🔄 REPROCESS: Łączenie z {target_email} ({source})...")
         
         client = self.connect_to_email_account(found_config)
@@ -915,6 +1748,10 @@ class EmailHandler:
             search_criteria = f'(SINCE "{date_string}")'
             logging.info(f"📅 Kryteria reprocess: {search_criteria}")
             
+            mailbox_state = self._read_mailbox_state(client)
+            if self.message_cache and mailbox_state['uidvalidity'] is not None:
+                return self._fetch_history_cached(client, source, target_email, mailbox_state['uidvalidity'], search_criteria)
+            
             status, messages = client.search(None, search_criteria)
             
             if status == "OK" and messages[0]:
@@ -924,19 +1761,16 @@ class EmailHandler:
                 # Sortowanie od najstarszych
                 msg_ids.sort(key=lambda x: int(x.decode()), reverse=False)
                 
-                for num in msg_ids:
-                    res, msg_data = client.fetch(num, "(RFC822)")
-                    if res == "OK":
-                        raw_email = msg_data[0][1]
+                for num, raw_email in self._fetch_messages_batched(client, msg_ids, use_uid=False):
+                    try:
+                        msg = email.message_from_bytes(raw_email)
+                    except:
                         try:
-                            msg = email.message_from_bytes(raw_email)
+                            msg = email.message_from_string(raw_email.decode('utf-8', errors='ignore'))
                         except:
-                            try:
-                                msg = email.message_from_string(raw_email.decode('utf-8', errors='ignore'))
-                            except:
-                                continue
-                        
-                        all_emails.append((source, msg))
+                            continue
+                    
+                    all_emails.append((source, msg))
             else:
                 logging.warning("📭 Nie znaleziono wiadomości w tym okresie.")
 
@@ -949,4 +1783,66 @@ class EmailHandler:
             except:
                 pass
                 
-        return all_emails
\ No newline at end of file
+        return all_emails
+    
+    def _fetch_history_cached(self, client, source, target_email, uidvalidity, search_criteria):
+        """
+        Historia konta z użyciem cache wiadomości: UID SEARCH, pobranie tylko brakujących UID,
+        zapis do cache, a następnie odczyt wszystkich wiadomości z dysku (od najstarszych).
+        """
+        cache = self.message_cache
+        all_emails = []
+        
+        status, messages = client.uid('SEARCH', None, search_criteria)
+        if status != "OK" or not messages[0]:
+            logging.warning("📭 Nie znaleziono wiadomości w tym okresie.")
+            return all_emails
+        
+        uids = sorted(int(uid) for uid in messages[0].split())
+        keys = {uid: cache.make_key(source, target_email, uidvalidity, uid) for uid in uids}
+        missing = [uid for uid in uids if not cache.contains(keys[uid])]
+        logging.info(f"📧 Znaleziono łącznie {len(uids)} wiadomości ({len(uids) - len(missing)} w cache, {len(missing)} do pobrania).")
+        
+        # Wiadomości, których nie udało się zapisać w cache, zostają w pamięci
+        not_cached = {}
+        for uid, raw_email in self._fetch_messages_batched(client, missing):
+            msg = self._parse_raw_email(raw_email)
+            if msg is None:
+                continue
+            if not cache.put(raw_email, keys[int(uid)], cache.message_id_key(msg.get('Message-ID'))):
+                not_cached[int(uid)] = msg
+        
+        for uid in uids:
+            msg = not_cached.get(uid) or cache.get_message(keys[uid])
+            if msg is not None:
+                all_emails.append((source, msg))
+        
+        # Pliki ponad limit usuwane dopiero po odczycie - wiadomości z tego przebiegu są już w pamięci
+        cache.flush()
+        logging.info(f"💾 Cache wiadomości: {cache.get_stats()}")
+        return all_emails
+    
+    def _load_history_from_cache(self, source, target_email, cutoff_date):
+        """Historia konta wyłącznie z lokalnego cache (bez IMAP), od najstarszych"""
+        if not self.message_cache:
+            logging.error("❌ Tryb offline wymaga włączonego MESSAGE_CACHE w config.py")
+            return []
+        
+        cache = self.message_cache
+        cutoff = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
+        all_emails = []
+        
+        for key in cache.account_keys(source, target_email):
+            # Filtr dat na samych nagłówkach - treść czytana tylko dla wiadomości z zakresu
+            headers = cache.get_headers(key)
+            email_date = self.extract_email_date(headers) if headers is not None else None
+            if email_date and email_date < cutoff:
+                continue
+            
+            msg = cache.get_message(key)
+            if msg is not None:
+                all_emails.append((source, msg))
+        
+        cache.flush()
+        logging.info(f"💾 OFFLINE: {len(all_emails)} wiadomości z cache dla {target_email}")
+        return all_emails
@@ -0,0 +1,171 @@
+import html
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+_SCRIPT_STYLE = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_TAG = re.compile(r'<[^>]+>')
+_WHITESPACE = re.compile(r'\s+')
+_LINK = re.compile(r'<a\b[^>]*?href\s*=\s*["\']([^"\']+)["\'][^>]*>(.*?)</a\s*>', re.IGNORECASE | re.DOTALL)
+_IMAGE = re.compile(r'<img\b[^>]*?src\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def looks_like_html(text):
+    """Czy treść maila jest dokumentem HTML (to samo kryterium co wcześniej w _extract_key_sections)"""
+    return bool(text) and ("<html" in text or "<body" in text)
+
+
+def _strip_tags(markup):
+    """Widoczny tekst bez BeautifulSoup: bez skryptów, stylów i tagów, z rozwiniętymi encjami"""
+    text = _COMMENT.sub(' ', _SCRIPT_STYLE.sub(' ', markup))
+    text = html.unescape(_TAG.sub(' ', text))
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _make_soup(markup):
+    """
+    BeautifulSoup z lxml (gdy zainstalowany i HTML_DOCUMENT['parser'] == 'auto'/'lxml'), inaczej html.parser.
+    None, gdy brak bs4 - wtedy HtmlDocument korzysta z prostego usuwania tagów.
+    """
+    try:
+        from bs4 import BeautifulSoup, FeatureNotFound
+    except ImportError:
+        logging.debug("Brak bs4 - tekst HTML wyciągany bez parsowania drzewa")
+        return None
+
+    import config
+    parser = getattr(config, 'HTML_DOCUMENT', {}).get('parser', 'auto')
+
+    if parser in ('auto', 'lxml'):
+        try:
+            return BeautifulSoup(markup, 'lxml')
+        except FeatureNotFound:
+            if parser == 'lxml':
+                logging.warning("⚠️ Parser lxml niedostępny - używam html.parser")
+    return BeautifulSoup(markup, 'html.parser')
+
+
+class HtmlDocument:
+    """
+    Treść maila HTML parsowana raz i współdzielona przez ekstraktory.
+
+    Drzewo (soup), widoczny tekst, linki i teksty tabel są liczone leniwie i zapamiętywane,
+    więc _extract_key_sections, awaryjne regexy i budowanie promptu nie parsują HTML ponownie.
+    Dla treści, która nie jest HTML, text == oryginalna treść.
+    """
+
+    __slots__ = ('html', 'is_html', '_soup', '_text', '_links', '_image_urls', '_tables')
+
+    def __init__(self, markup):
+        self.html = markup or ""
+        self.is_html = looks_like_html(self.html)
+        self._soup = False  # False = jeszcze nie parsowano (None = brak bs4)
+        self._text = None
+        self._links = None
+        self._image_urls = None
+        self._tables = None
+
+    @property
+    def soup(self):
+        if self._soup is False:
+            self._soup = _make_soup(self.html) if self.is_html else None
+        return self._soup
+
+    @property
+    def text(self):
+        """Widoczny tekst (elementy rozdzielone spacją, jak get_text(separator=' ', strip=True))"""
+        if self._text is None:
+            if not self.is_html:
+                self._text = self.html
+            elif self.soup is not None:
+                self._text = self.soup.get_text(separator=' ', strip=True)
+            else:
+                self._text = _strip_tags(self.html)
+        return self._text
+
+    @property
+    def links(self):
+        """Lista (href, tekst linku) w kolejności w dokumencie"""
+        if self._links is None:
+            if not self.is_html:
+                self._links = []
+            elif self.soup is not None:
+                self._links = [(a['href'], a.get_text(separator=' ', strip=True))
+                               for a in self.soup.find_all('a', href=True)]
+            else:
+                self._links = [(html.unescape(href), _strip_tags(inner)) for href, inner in _LINK.findall(self.html)]
+        return self._links
+
+    @property
+    def image_urls(self):
+        """Adresy obrazków (np. kody QR DHL) w kolejności w dokumencie"""
+        if self._image_urls is None:
+            if not self.is_html:
+                self._image_urls = []
+            elif self.soup is not None:
+                self._image_urls = [img['src'] for img in self.soup.find_all('img', src=True)]
+            else:
+                self._image_urls = [html.unescape(src) for src in _IMAGE.findall(self.html)]
+        return self._image_urls
+
+    @property
+    def tables(self):
+        """Lista (tabela, tekst tabeli) - tekst liczony raz na tabelę (wymaga bs4)"""
+        if self._tables is None:
+            self._tables = []
+            if self.soup is not None:
+                self._tables = [(table, table.get_text()) for table in self.soup.find_all('table')]
+        return self._tables
+
+    @staticmethod
+    def element_text(element):
+        """Tekst fragmentu drzewa - bez ponownego parsowania str(element)"""
+        return element.get_text(separator=' ', strip=True) if hasattr(element, 'get_text') else str(element).strip()
+
+    @property
+    def fallback_text(self):
+        """
+        Tekst dla awaryjnych regexów: oryginalna treść, a po niej widoczny tekst.
+        Wzorce dopasowane wcześniej w surowym HTML trafiają tak samo, a wzorce rozbite
+        przez tagi (np. 'PIN</td><td>123456') mają szansę w widocznym tekście.
+        """
+        if not self.is_html:
+            return self.html
+        return self.html + "\n\n" + self.text
+
+    def prompt_text(self):
+        """Widoczny tekst z listą linków i obrazków - zwarta treść do promptu zamiast surowego HTML"""
+        if not self.is_html:
+            return self.html
+
+        parts = [self.text]
+        urls = [href for href, _ in self.links if href.startswith('http')]
+        urls.extend(src for src in self.image_urls if src.startswith('http'))
+        if urls:
+            parts.append("Linki:\n" + "\n".join(dict.fromkeys(urls)))
+        return "\n\n".join(parts)
+
+
+# Ostatnio używane dokumenty - ta sama treść maila przechodzi przez kilka ekstraktorów
+_CACHE_SIZE = 16
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_document(markup):
+    """Zwraca HtmlDocument dla treści maila (z cache - parsowanie raz na mail)"""
+    markup = markup or ""
+    with _cache_lock:
+        document = _cache.get(markup)
+        if document is not None:
+            _cache.move_to_end(markup)
+            return document
+
+    document = HtmlDocument(markup)
+    with _cache_lock:
+        _cache[markup] = document
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return document
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import re
+import time
+
+import config
+from imap_utils import parse_fetch_response, compress_message_set, chunked
+
+# aioimaplib jest opcjonalny - bez niego EmailHandler wraca do silnika imaplib
+try:
+    import aioimaplib
+    AIOIMAPLIB_AVAILABLE = True
+except ImportError:
+    aioimaplib = None
+    AIOIMAPLIB_AVAILABLE = False
+
+_FETCH_PREFIX = re.compile(rb'^(\d+) FETCH ')
+_LITERAL_END = re.compile(rb'\{\d+\}\s*$')
+_RESPONSE_CODE = re.compile(rb'\[(UIDVALIDITY|UIDNEXT|HIGHESTMODSEQ) (\d+)\]', re.IGNORECASE)
+
+
+def to_imaplib_fetch_data(lines):
+    """
+    Zamienia linie odpowiedzi aioimaplib na format imaplib
+    ([(meta, literał), b')', ...]), żeby korzystać z tych samych parserów z imap_utils.
+    """
+    data = []
+    i = 0
+    while i < len(lines):
+        line = bytes(lines[i])
+        if _LITERAL_END.search(line) and i + 1 < len(lines):
+            data.append((_FETCH_PREFIX.sub(rb'\1 ', line), bytes(lines[i + 1])))
+            i += 2
+        else:
+            data.append(_FETCH_PREFIX.sub(rb'\1 ', line))
+            i += 1
+    return data
+
+
+class AsyncIMAPFetcher:
+    """
+    Alternatywny silnik pobierania oparty o asyncio (aioimaplib).
+
+    Wszystkie konta obsługiwane są na jednej pętli zdarzeń, z limitem połączeń
+    per serwer IMAP i timeoutem na każdą komendę. Wejście i wyjście takie samo
+    jak w EmailHandler.fetch_new_emails - lista (source, email_message) per konto.
+    Logika wyboru wiadomości (checkpointy, limity, filtr nagłówków, daty)
+    pochodzi z EmailHandler, więc oba silniki zwracają te same wiadomości.
+    """
+
+    def __init__(self, email_handler):
+        self.email_handler = email_handler
+
+        settings = getattr(config, 'IMAP_ASYNC_FETCH', {})
+        self.host_limits = settings.get('host_limits', {})
+        self.default_host_limit = settings.get('default_host_limit', 4)
+        self.connect_timeout = settings.get('connect_timeout', 30)
+        self.command_timeout = settings.get('command_timeout', 60)
+
+    def fetch_all(self, configs, fetch_params):
+        """Synchroniczne wejście - zwraca listę wyników w kolejności configs"""
+        return asyncio.run(self.fetch_all_async(configs, fetch_params))
+
+    async def fetch_all_async(self, configs, fetch_params):
+        semaphores = {}
+        start_time = time.time()
+
+        results = await asyncio.gather(
+            *(self._fetch_account_limited(cfg, fetch_params, semaphores) for cfg in configs)
+        )
+
+        logging.info(f"⚡ asyncio: {len(configs)} kont pobrane w {time.time() - start_time:.1f}s")
+        return list(results)
+
+    def _get_server(self, email_config):
+        source = email_config.get('source', 'unknown')
+        server_info = self.email_handler.email_sources.get(source, {})
+        return server_info.get('imap_server'), server_info.get('port', 993)
+
+    async def _fetch_account_limited(self, email_config, fetch_params, semaphores):
+        host, _ = self._get_server(email_config)
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.host_limits.get(host, self.default_host_limit))
+
+        async with semaphores[host]:
+            try:
+                return await self._fetch_account(email_config, fetch_params)
+            except asyncio.TimeoutError:
+                logging.error(f"⏰ asyncio: timeout dla {email_config.get('email')}")
+            except Exception as e:
+                logging.error(f"❌ asyncio: błąd pobierania dla {email_config.get('email')}: {e}")
+            return []
+
+    async def _cmd(self, coro):
+        """Wykonuje komendę IMAP z timeoutem"""
+        return await asyncio.wait_for(coro, self.command_timeout)
+
+    async def _connect(self, email_config):
+        source = email_config.get('source', 'unknown')
+        host, port = self._get_server(email_config)
+        if not host:
+            logging.error(f"❌ Nieznane źródło email: {source}")
+            return None
+
+        logging.info(f"🔗 [asyncio] Łączenie z {host}:{port} dla {email_config['email']}")
+        client = aioimaplib.IMAP4_SSL(host=host, port=port, timeout=self.command_timeout)
+        try:
+            await asyncio.wait_for(client.wait_hello_from_server(), self.connect_timeout)
+            response = await self._cmd(client.login(email_config['email'].lower(), email_config['password']))
+        except Exception:
+            await self._logout(client)
+            raise
+
+        if response.result != 'OK':
+            logging.error(f"❌ Błąd IMAP dla {source}: logowanie nieudane")
+            await self._logout(client)
+            return None
+        return client
+
+    async def _logout(self, client):
+        """Zamyka połączenie po nieudanym logowaniu (bez tego zostaje otwarte gniazdo)"""
+        try:
+            await self._cmd(client.logout())
+        except Exception as e:
+            logging.debug(f"Błąd zamykania połączenia asyncio: {e}")
+
+    async def _fetch_account(self, email_config, fetch_params):
+        handler = self.email_handler
+        account_emails = []
+
+        source = email_config.get('source', 'gmail')
+        email_addr = email_config.get('email')
+        search_only_unseen = fetch_params['search_only_unseen']
+
+        logging.info(f"🔍 [asyncio] Sprawdzanie emaili {source}: {email_addr}")
+
+        client = await self._connect(email_config)
+        if not client:
+            return account_emails
+
+        emails_to_mark_read = []
+
+        try:
+            response = await self._cmd(client.select('INBOX'))
+            mailbox_state = self._read_mailbox_state(response.lines)
+
+            sender_filter = handler._use_sender_filter(source)
+            search_mode = handler._get_search_mode(search_only_unseen, sender_filter)
+            sync_from_uid, unchanged = handler._get_sync_start_uid(source, email_addr, mailbox_state, search_mode)
+            if unchanged:
+                return account_emails
+
+            search_criteria = handler._build_search_criteria(fetch_params['date_string'], sync_from_uid, search_only_unseen, sender_filter)
+            logging.info(f"📅 [asyncio] {source} Criteria: {search_criteria}")
+
+            response = await self._cmd(client.uid_search(search_criteria, charset=None))
+            if response.result != 'OK' and sender_filter:
+                logging.warning(f"⚠️ [asyncio] {source}: serwer odrzucił wyszukiwanie po nadawcach - wracam do szerokiego SEARCH")
+                handler.sender_filter_disabled.add(source)
+                search_mode = handler._get_search_mode(search_only_unseen)
+                search_criteria = handler._build_search_criteria(fetch_params['date_string'], sync_from_uid, search_only_unseen)
+                response = await self._cmd(client.uid_search(search_criteria, charset=None))
+
+            found_uids = []
+            if response.result == 'OK' and response.lines:
+                found_uids = [token for token in bytes(response.lines[0]).split() if token.isdigit()]
+
+            all_msg_list, messages_to_process = handler._select_uids_to_process(
+                source, found_uids, sync_from_uid, fetch_params['max_emails']
+            )
+
+            handled_uids = set()
+
+            if messages_to_process:
+                if getattr(config, 'IMAP_HEADER_FIRST_FETCH', {}).get('enabled', False):
+                    messages_to_process, skipped_uids = await self._prefilter_by_headers(client, messages_to_process, source)
+                    # Pominięte nie są oznaczane jako przeczytane - zostają w skrzynce do ręcznego sprawdzenia
+                    handled_uids.update(int(uid) for uid in skipped_uids)
+
+                async for num, email_message in self._fetch_messages(client, messages_to_process):
+                    email_message = handler.parse_email(email_message)
+                    accepted = handler._accept_fetched_message(num, email_message, fetch_params)
+                    handled_uids.add(int(num))
+                    if accepted:
+                        account_emails.append((source, email_message))
+                    if handler._should_mark_read(fetch_params, processed=accepted):
+                        emails_to_mark_read.append(num)
+            else:
+                logging.info(f"📭 Brak emaili spełniających kryteria w {source}")
+
+            handler._save_sync_checkpoint(source, email_addr, mailbox_state, sync_from_uid, all_msg_list, search_mode, handled_uids)
+
+        except Exception as e:
+            logging.warning(f"⚠️ [asyncio] Błąd wyszukiwania dla {source}: {e}")
+            emails_to_mark_read = []
+
+        finally:
+            if fetch_params['mark_as_read'] and emails_to_mark_read:
+                try:
+                    logging.info(f"📖 Oznaczanie {len(emails_to_mark_read)} emaili jako przeczytane w {source}")
+                    chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('store_chunk_size', 500)
+                    for chunk in chunked(emails_to_mark_read, chunk_size):
+                        await self._cmd(client.uid('store', compress_message_set(chunk), '+FLAGS', '(\\Seen)'))
+                    await self._cmd(client.expunge())
+                except Exception as e:
+                    logging.error(f"❌ Błąd oznaczania emaili: {e}")
+
+            try:
+                await self._cmd(client.close())
+                await self._cmd(client.logout())
+            except Exception:
+                pass
+
+        return account_emails
+
+    def _read_mailbox_state(self, lines):
+        """Odczytuje UIDVALIDITY / UIDNEXT / HIGHESTMODSEQ z linii odpowiedzi SELECT"""
+        state = {'uidvalidity': None, 'uidnext': None, 'highestmodseq': None}
+        for line in lines:
+            for code, value in _RESPONSE_CODE.findall(bytes(line)):
+                state[code.decode().lower()] = int(value)
+        return state
+
+    async def _uid_fetch_data(self, client, message_set, spec):
+        """UID FETCH - odpowiedź w formacie imaplib albo None przy błędzie"""
+        response = await self._cmd(client.uid('fetch', message_set, spec))
+        if response.result != 'OK':
+            return None
+        return to_imaplib_fetch_data(response.lines)
+
+    async def _uid_fetch(self, client, message_set, spec):
+        data = await self._uid_fetch_data(client, message_set, spec)
+        if data is None:
+            return None
+        return parse_fetch_response(data)
+
+    async def _prefilter_by_headers(self, client, uids, source):
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('header_chunk_size', 500)
+        headers_by_uid = {}
+
+        for chunk in chunked(uids, chunk_size):
+            items = await self._uid_fetch(
+                client, compress_message_set(chunk),
+                '(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE TO)])'
+            )
+            if items is None:
+                logging.warning(f"⚠️ {source}: serwer odrzucił pobranie nagłówków - pobieram pełne wiadomości")
+                return uids, []
+            for item in items:
+                if item['uid'] is not None:
+                    headers_by_uid[item['uid']] = item
+
+        return self.email_handler._split_header_candidates(uids, headers_by_uid, source)
+
+    async def _fetch_messages(self, client, uids):
+        """
+        Pobiera wiadomości paczkami, zwraca (uid, email_message) w kolejności uids.
+        Przy IMAP_PARTIAL_FETCH tylko części tekstowe (jak EmailHandler._fetch_messages_partial),
+        wiadomości o nietypowej strukturze MIME pobierane w całości (RFC822).
+        """
+        chunk_size = getattr(config, 'IMAP_BATCH_SETTINGS', {}).get('fetch_chunk_size', 50)
+        partial = getattr(config, 'IMAP_PARTIAL_FETCH', {}).get('enabled', False)
+
+        for chunk in chunked(uids, chunk_size):
+            messages = await self._fetch_partial_chunk(client, chunk) if partial else {}
+
+            full_fetch = [num for num in chunk if int(num) not in messages]
+            if full_fetch:
+                if partial:
+                    logging.info(f"📦 Pełne pobranie {len(full_fetch)} wiadomości (nietypowa struktura MIME)")
+                items = await self._uid_fetch(client, compress_message_set(full_fetch), '(UID RFC822)')
+                for item in items or []:
+                    raw_email = item['sections'].get('RFC822')
+                    if item['uid'] is None or raw_email is None:
+                        continue
+                    email_message = self.email_handler._parse_raw_email(raw_email)
+                    if email_message is not None:
+                        messages[item['uid']] = email_message
+
+            for num in chunk:
+                if int(num) in messages:
+                    yield num, messages[int(num)]
+
+    async def _fetch_partial_chunk(self, client, chunk):
+        """Nagłówki i części text/plain / text/html paczki na podstawie BODYSTRUCTURE - {uid: email_message}"""
+        handler = self.email_handler
+        data = await self._uid_fetch_data(client, compress_message_set(chunk), '(UID BODYSTRUCTURE)')
+        text_parts_by_uid = handler._text_parts_by_uid(data) if data is not None else {}
+
+        messages = {}
+        for spec, group_uids in handler._partial_fetch_groups(chunk, text_parts_by_uid).items():
+            items = await self._uid_fetch(client, compress_message_set(group_uids), spec)
+            for item in items or []:
+                if item['uid'] in text_parts_by_uid:
+                    email_message = handler._build_partial_message(item, text_parts_by_uid[item['uid']])
+                    if email_message is not None:
+                        messages[item['uid']] = email_message
+        return messages
@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class IMAPCheckpointStore:
+    """
+    Punkty kontrolne synchronizacji IMAP per skrzynka.
+
+    Dla każdej skrzynki (source:email:mailbox) zapamiętuje UIDVALIDITY,
+    ostatni sprawdzony UID oraz HIGHESTMODSEQ (jeśli serwer wspiera CONDSTORE).
+    Dzięki temu kolejny cykl pyta tylko o "UID n+1:*" zamiast skanować 30 dni.
+    """
+
+    def __init__(self, checkpoints_file="imap_checkpoints.json"):
+        self.checkpoints_file = checkpoints_file
+        self._lock = threading.Lock()
+        self.checkpoints = self._load()
+
+    @staticmethod
+    def make_key(source, email_addr, mailbox="INBOX"):
+        return f"{source}:{(email_addr or '').strip().lower()}:{mailbox}"
+
+    def _load(self):
+        """Wczytuje punkty kontrolne z pliku"""
+        if os.path.exists(self.checkpoints_file):
+            try:
+                with open(self.checkpoints_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.error(f"Błąd podczas ładowania checkpointów IMAP: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            with open(self.checkpoints_file, 'w', encoding='utf-8') as f:
+                json.dump(self.checkpoints, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logging.error(f"Błąd podczas zapisywania checkpointów IMAP: {e}")
+
+    def get(self, source, email_addr, mailbox="INBOX"):
+        """Zwraca checkpoint skrzynki (dict) lub None"""
+        key = self.make_key(source, email_addr, mailbox)
+        with self._lock:
+            checkpoint = self.checkpoints.get(key)
+            return dict(checkpoint) if checkpoint else None
+
+    def update(self, source, email_addr, uidvalidity, last_uid, highestmodseq=None, mode=None, mailbox="INBOX"):
+        """Zapisuje nowy checkpoint skrzynki"""
+        key = self.make_key(source, email_addr, mailbox)
+        with self._lock:
+            self.checkpoints[key] = {
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'highestmodseq': highestmodseq,
+                'mode': mode,
+                'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self._save()
+
+    def reset(self, source=None, email_addr=None):
+        """Usuwa checkpointy (wszystkie lub dla konkretnego konta) - następny cykl zrobi pełny skan"""
+        with self._lock:
+            if source is None and email_addr is None:
+                self.checkpoints = {}
+            else:
+                prefix = self.make_key(source, email_addr, "")
+                self.checkpoints = {k: v for k, v in self.checkpoints.items() if not k.startswith(prefix)}
+            self._save()
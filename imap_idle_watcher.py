@@ -0,0 +1,199 @@
+import imaplib
+import logging
+import queue
+import socket
+import threading
+import time
+
+import config
+
+
+class IMAPIdleWatcher:
+    """
+    Tryb push: utrzymuje połączenia IMAP w stanie IDLE dla kont, których dostawca
+    wspiera IDLE (gmail, interia). Gdy serwer zgłosi nową wiadomość (EXISTS),
+    adres konta trafia do kolejki, a main_loop przetwarza tylko to konto.
+
+    Konta bez obsługi IDLE (lub z błędem połączenia) są nadal sprawdzane
+    w zwykłym cyklu co CHECK_INTERVAL.
+    """
+
+    def __init__(self, email_handler):
+        self.email_handler = email_handler
+
+        settings = getattr(config, 'IMAP_IDLE', {})
+        self.idle_providers = set(settings.get('providers', ['gmail', 'interia']))
+        self.max_connections = settings.get('max_connections', 20)
+        # RFC 2177: serwer może rozłączyć po 30 min - odnawiamy IDLE wcześniej
+        self.renew_seconds = settings.get('renew_seconds', 25 * 60)
+        self.reconnect_delay = settings.get('reconnect_delay', 60)
+
+        self._events = queue.Queue()
+        self._watchers = {}  # email -> (thread, stop_event)
+        self._interrupts = {}  # email -> funkcja kończąca bieżącą sesję IDLE (wysyła DONE)
+        self._unsupported = set()
+        self._lock = threading.Lock()
+
+    def sync_accounts(self, email_configs):
+        """Uruchamia obserwatorów dla nowych kont i zatrzymuje dla kont, których już nie sprawdzamy"""
+        wanted = {}
+        for email_config in email_configs or []:
+            email_addr = (email_config.get('email') or '').strip().lower()
+            if not email_addr or not email_config.get('password'):
+                continue
+            if email_config.get('source') not in self.idle_providers or email_addr in self._unsupported:
+                continue
+            wanted[email_addr] = email_config
+
+        with self._lock:
+            for email_addr in list(self._watchers):
+                thread, stop_event = self._watchers[email_addr]
+                if email_addr not in wanted or not thread.is_alive():
+                    self._stop_watcher(email_addr, stop_event)
+                    del self._watchers[email_addr]
+
+            for email_addr, email_config in wanted.items():
+                if email_addr in self._watchers:
+                    continue
+                if len(self._watchers) >= self.max_connections:
+                    logging.warning(f"⚠️ IDLE: osiągnięto limit {self.max_connections} połączeń - pozostałe konta w trybie odpytywania")
+                    break
+
+                stop_event = threading.Event()
+                thread = threading.Thread(
+                    target=self._watch_account,
+                    args=(email_config, stop_event),
+                    name=f"imap-idle-{email_addr}",
+                    daemon=True
+                )
+                self._watchers[email_addr] = (thread, stop_event)
+                thread.start()
+
+            active = len(self._watchers)
+
+        logging.info(f"📡 IDLE: aktywnych obserwatorów {active}")
+
+    def wait_for_changes(self, timeout):
+        """
+        Czeka maksymalnie timeout sekund na powiadomienie o nowej poczcie.
+        Zwraca zbiór adresów kont z nową pocztą (pusty, jeśli nic nie przyszło).
+        """
+        changed = set()
+        try:
+            changed.add(self._events.get(timeout=timeout))
+        except queue.Empty:
+            return changed
+
+        # Krótkie okno na zebranie kolejnych powiadomień (kilka maili naraz)
+        time.sleep(getattr(config, 'IMAP_IDLE', {}).get('debounce_seconds', 2))
+        while True:
+            try:
+                changed.add(self._events.get_nowait())
+            except queue.Empty:
+                break
+        return changed
+
+    def stop(self):
+        """Zatrzymuje wszystkich obserwatorów"""
+        with self._lock:
+            for email_addr, (thread, stop_event) in self._watchers.items():
+                self._stop_watcher(email_addr, stop_event)
+            self._watchers.clear()
+
+    def _stop_watcher(self, email_addr, stop_event):
+        stop_event.set()
+        interrupt = self._interrupts.get(email_addr)
+        if interrupt:
+            interrupt()
+
+    def _watch_account(self, email_config, stop_event):
+        """Wątek obserwatora jednego konta"""
+        email_addr = email_config['email'].strip().lower()
+
+        while not stop_event.is_set():
+            client = self.email_handler.connect_to_email_account(email_config)
+            if not client:
+                stop_event.wait(self.reconnect_delay)
+                continue
+
+            try:
+                if 'IDLE' not in client.capabilities:
+                    logging.info(f"📡 IDLE: {email_addr} - serwer nie wspiera IDLE, konto będzie odpytywane")
+                    self._unsupported.add(email_addr)
+                    return
+
+                status, data = client.select('INBOX', readonly=True)
+                state = {'exists': int(data[0]) if status == 'OK' and data and data[0] else 0}
+                # Dłuższy timeout niż odnowienie IDLE - brak odpowiedzi oznacza zerwane połączenie
+                client.sock.settimeout(self.renew_seconds + 60)
+                logging.info(f"📡 IDLE: nasłuchiwanie {email_addr}")
+
+                while not stop_event.is_set():
+                    if self._idle_once(client, email_addr, state):
+                        logging.info(f"📬 IDLE: nowa poczta na {email_addr}")
+                        self._events.put(email_addr)
+
+            except (imaplib.IMAP4.error, OSError, socket.timeout) as e:
+                logging.warning(f"⚠️ IDLE: połączenie {email_addr} przerwane ({e}) - ponawiam za {self.reconnect_delay}s")
+                stop_event.wait(self.reconnect_delay)
+            finally:
+                try:
+                    client.logout()
+                except Exception:
+                    pass
+
+    def _idle_once(self, client, email_addr, state):
+        """
+        Jedna sesja IDLE (do odnowienia, zatrzymania lub zerwania połączenia).
+        Zwraca True, jeśli liczba wiadomości (EXISTS) wzrosła - czyli przyszła nowa poczta.
+        """
+        tag = client._new_tag()
+        client.send(tag + b' IDLE\r\n')
+
+        response = client.readline()
+        if not response.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE odrzucone: {response.strip()}")
+
+        done_lock = threading.Lock()
+        done_sent = []
+
+        def send_done():
+            with done_lock:
+                if done_sent:
+                    return
+                done_sent.append(True)
+                try:
+                    client.send(b'DONE\r\n')
+                except Exception:
+                    pass
+
+        # DONE wysyłany z timera (odnowienie) lub przy zatrzymaniu obserwatora
+        renew_timer = threading.Timer(self.renew_seconds, send_done)
+        renew_timer.daemon = True
+        renew_timer.start()
+        self._interrupts[email_addr] = send_done
+
+        new_mail = False
+        try:
+            while True:
+                line = client.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("serwer zamknął połączenie")
+                if line.startswith(tag):
+                    break
+                parts = line.split()
+                if len(parts) == 3 and parts[0] == b'*' and parts[2].upper() == b'EXISTS' and parts[1].isdigit():
+                    exists = int(parts[1])
+                    # EXISTS przychodzi też po usunięciu wiadomości - liczy się tylko wzrost
+                    if exists > state['exists']:
+                        new_mail = True
+                        # Kończymy IDLE od razu - powiadomienie wysyłane jest zaraz po tej sesji
+                        send_done()
+                    state['exists'] = exists
+                elif len(parts) == 3 and parts[0] == b'*' and parts[2].upper() == b'EXPUNGE':
+                    state['exists'] = max(0, state['exists'] - 1)
+        finally:
+            renew_timer.cancel()
+            self._interrupts.pop(email_addr, None)
+
+        return new_mail
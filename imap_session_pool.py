@@ -0,0 +1,169 @@
+import imaplib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+class IMAPSessionPool:
+    """
+    Pula zalogowanych sesji IMAP utrzymywanych między cyklami.
+
+    Klucz sesji to (source, email). Sesja jest wypożyczana na wyłączność
+    (acquire) i oddawana po zakończeniu pracy (release). Przed ponownym użyciem
+    sprawdzana jest komendą NOOP - martwe połączenie jest po cichu odtwarzane.
+    Przy przekroczeniu limitu zamykane są najdawniej używane sesje (LRU).
+    """
+
+    def __init__(self, connect_func, max_sessions=50, max_idle_seconds=1200):
+        """
+        Args:
+            connect_func: Funkcja (email_config) -> zalogowany klient IMAP lub None
+            max_sessions (int): Maksymalna liczba sesji trzymanych w puli
+            max_idle_seconds (int): Po tylu sekundach bezczynności sesja jest zamykana
+        """
+        self.connect_func = connect_func
+        self.max_sessions = max_sessions
+        self.max_idle_seconds = max_idle_seconds
+
+        self._sessions = OrderedDict()  # key -> (client, last_used)
+        self._lock = threading.Lock()
+        self.stats = {"reused": 0, "connected": 0, "reconnected": 0, "evicted": 0}
+
+        logging.info(f"🔌 Utworzono pulę sesji IMAP (max {max_sessions} sesji, idle {max_idle_seconds}s)")
+
+    @staticmethod
+    def make_key(email_config):
+        """Zwraca klucz sesji (source, email)"""
+        source = email_config.get('source', 'unknown')
+        email_addr = (email_config.get('email') or '').strip().lower()
+        return (source, email_addr)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def acquire(self, email_config):
+        """
+        Zwraca zalogowanego klienta dla konta (z puli lub nowe połączenie).
+        Sesja do czasu release()/discard() nie jest dostępna dla innych wątków.
+        """
+        key = self.make_key(email_config)
+
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+
+        if entry:
+            client, last_used = entry
+            idle_time = time.time() - last_used
+
+            if idle_time <= self.max_idle_seconds and self._is_alive(client):
+                self._count("reused")
+                logging.info(f"♻️ Używam istniejącej sesji IMAP dla {key[1]} (bezczynna {idle_time:.0f}s)")
+                return client
+
+            logging.info(f"🔄 Sesja IMAP dla {key[1]} wygasła - łączę ponownie")
+            self._logout(client)
+            client = self.connect_func(email_config)
+            if client:
+                self._count("reconnected")
+            return client
+
+        client = self.connect_func(email_config)
+        if client:
+            self._count("connected")
+        return client
+
+    def reconnect(self, email_config, old_client=None):
+        """Zamyka zepsutą sesję i zwraca nowe połączenie (lub None)"""
+        if old_client is not None:
+            self._logout(old_client)
+        logging.info(f"🔄 Ponowne łączenie IMAP dla {self.make_key(email_config)[1]}")
+        client = self.connect_func(email_config)
+        if client:
+            self._count("reconnected")
+        return client
+
+    def release(self, email_config, client):
+        """Oddaje sprawną sesję do puli (w stanie AUTH, bez wybranej skrzynki)"""
+        if client is None:
+            return
+
+        key = self.make_key(email_config)
+        evicted = []
+
+        with self._lock:
+            previous = self._sessions.pop(key, None)
+            if previous and previous[0] is not client:
+                evicted.append(previous[0])
+
+            self._sessions[key] = (client, time.time())
+
+            while len(self._sessions) > self.max_sessions:
+                _, (old_client, _) = self._sessions.popitem(last=False)
+                evicted.append(old_client)
+                self.stats["evicted"] += 1
+
+        for old_client in evicted:
+            self._logout(old_client)
+
+        if evicted:
+            logging.info(f"🧹 Pula IMAP: zamknięto {len(evicted)} najstarszych sesji (limit {self.max_sessions})")
+
+    def discard(self, email_config, client):
+        """Zamyka sesję bez oddawania jej do puli (np. po błędzie protokołu)"""
+        if client is not None:
+            self._logout(client)
+
+    def prune_idle(self):
+        """Zamyka sesje bezczynne dłużej niż max_idle_seconds"""
+        now = time.time()
+        expired = []
+
+        with self._lock:
+            for key, (client, last_used) in list(self._sessions.items()):
+                if now - last_used > self.max_idle_seconds:
+                    expired.append(client)
+                    del self._sessions[key]
+
+        for client in expired:
+            self._logout(client)
+
+        if expired:
+            logging.info(f"🧹 Pula IMAP: zamknięto {len(expired)} bezczynnych sesji")
+
+    def close_all(self):
+        """Zamyka wszystkie sesje w puli (graceful shutdown)"""
+        with self._lock:
+            clients = [client for client, _ in self._sessions.values()]
+            self._sessions.clear()
+
+        for client in clients:
+            self._logout(client)
+
+        logging.info(f"🔌 Pula IMAP: zamknięto {len(clients)} sesji")
+
+    def get_stats(self):
+        """Zwraca statystyki puli"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open_sessions"] = len(self._sessions)
+        return stats
+
+    def _is_alive(self, client):
+        """Sprawdza sesję komendą NOOP"""
+        try:
+            status, _ = client.noop()
+            return status == "OK"
+        except (imaplib.IMAP4.error, OSError) as e:
+            logging.debug(f"NOOP nieudany: {e}")
+            return False
+        except Exception as e:
+            logging.debug(f"NOOP nieudany (inny błąd): {e}")
+            return False
+
+    def _logout(self, client):
+        try:
+            client.logout()
+        except Exception:
+            pass
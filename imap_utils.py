@@ -0,0 +1,250 @@
+import re
+
+# Początek odpowiedzi FETCH dla kolejnej wiadomości: "12 (UID 345 ..."
+_FETCH_START = re.compile(rb'^\s*(\d+)\s+\(')
+_FETCH_UID = re.compile(rb'\bUID\s+(\d+)')
+_FETCH_SIZE = re.compile(rb'\bRFC822\.SIZE\s+(\d+)')
+# Nazwa sekcji, po której następuje literał {n}
+_FETCH_LITERAL = re.compile(rb'(BODY\[[^\]]*\](?:<\d+>)?|RFC822(?:\.HEADER|\.TEXT)?)\s*\{\d+\}\s*$')
+
+
+def parse_fetch_response(data):
+    """
+    Parsuje surową odpowiedź imaplib na FETCH (również dla wielu wiadomości naraz).
+
+    Serwery różnie układają elementy (np. Gmail wysyła UID po literale),
+    więc UID/RFC822.SIZE są szukane zarówno w nagłówku literału, jak i w końcówce.
+
+    Returns:
+        list: [{'seq': int|None, 'uid': int|None, 'size': int|None, 'sections': {nazwa_sekcji: bytes}}]
+    """
+    results = []
+    current = None
+
+    for item in data or []:
+        if isinstance(item, tuple):
+            meta = item[0] if isinstance(item[0], bytes) else str(item[0]).encode()
+            start = _FETCH_START.match(meta)
+            if current is None or start:
+                current = _new_fetch_item(start)
+                results.append(current)
+            _parse_fetch_meta(meta, current)
+
+            section = _FETCH_LITERAL.search(meta)
+            if section:
+                current['sections'][section.group(1).decode('ascii', errors='ignore')] = item[1]
+
+        elif isinstance(item, bytes):
+            start = _FETCH_START.match(item)
+            if start:
+                current = _new_fetch_item(start)
+                results.append(current)
+            if current is not None:
+                _parse_fetch_meta(item, current)
+
+    return results
+
+
+def _new_fetch_item(start_match):
+    seq = int(start_match.group(1)) if start_match else None
+    return {'seq': seq, 'uid': None, 'size': None, 'sections': {}}
+
+
+def _parse_fetch_meta(meta, current):
+    uid_match = _FETCH_UID.search(meta)
+    if uid_match and current['uid'] is None:
+        current['uid'] = int(uid_match.group(1))
+
+    size_match = _FETCH_SIZE.search(meta)
+    if size_match and current['size'] is None:
+        current['size'] = int(size_match.group(1))
+
+
+def get_section(fetch_item, prefix):
+    """Zwraca pierwszy literał, którego nazwa sekcji zaczyna się od prefix (np. 'BODY[HEADER')"""
+    for name, payload in fetch_item['sections'].items():
+        if name.upper().startswith(prefix.upper()):
+            return payload
+    return None
+
+
+def compress_message_set(ids):
+    """
+    Kompresuje listę numerów/UID do zbioru IMAP, np. [4, 5, ..., 19, 22, 31, ..., 40] -> "4:19,22,31:40"
+    """
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    start = prev = None
+
+    for number in numbers:
+        if start is None:
+            start = prev = number
+        elif number == prev + 1:
+            prev = number
+        else:
+            ranges.append((start, prev))
+            start = prev = number
+
+    if start is not None:
+        ranges.append((start, prev))
+
+    return ",".join(f"{a}:{b}" if a != b else str(a) for a, b in ranges)
+
+
+def chunked(items, size):
+    """Dzieli listę na paczki o rozmiarze size"""
+    size = max(1, int(size or 1))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# --- BODYSTRUCTURE ---
+
+_LITERAL_SUFFIX = re.compile(rb'\{(\d+)\}\s*$')
+
+
+def split_fetch_messages(data):
+    """
+    Skleja odpowiedź FETCH w jeden ciąg bajtów na wiadomość, wstawiając literały {n}
+    jako zwykłe napisy w cudzysłowie (potrzebne do parsowania BODYSTRUCTURE).
+    """
+    messages = []
+    current = None
+
+    for item in data or []:
+        if isinstance(item, tuple):
+            meta = item[0] if isinstance(item[0], bytes) else str(item[0]).encode()
+            if current is None or _FETCH_START.match(meta):
+                current = bytearray()
+                messages.append(current)
+            current += _LITERAL_SUFFIX.sub(b'', meta)
+            literal = item[1] or b''
+            current += b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+        elif isinstance(item, bytes):
+            if current is None or _FETCH_START.match(item):
+                current = bytearray()
+                messages.append(current)
+            current += item
+
+    return [bytes(message) for message in messages]
+
+
+def _tokenize(data):
+    tokens = []
+    i = 0
+    length = len(data)
+
+    while i < length:
+        char = data[i:i + 1]
+        if char in (b' ', b'\r', b'\n', b'\t'):
+            i += 1
+        elif char in (b'(', b')'):
+            tokens.append(char)
+            i += 1
+        elif char == b'"':
+            i += 1
+            value = bytearray()
+            while i < length and data[i:i + 1] != b'"':
+                if data[i:i + 1] == b'\\' and i + 1 < length:
+                    i += 1
+                value += data[i:i + 1]
+                i += 1
+            tokens.append(('str', bytes(value)))
+            i += 1
+        else:
+            start = i
+            while i < length and data[i:i + 1] not in (b' ', b'(', b')', b'\r', b'\n', b'\t'):
+                i += 1
+            atom = data[start:i]
+            tokens.append(None if atom.upper() == b'NIL' else ('str', atom))
+
+    return tokens
+
+
+def _build_tree(tokens, pos=0):
+    """Zamienia tokeny na zagnieżdżone listy (napisy jako str, NIL jako None)"""
+    result = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        if token == b'(':
+            child, pos = _build_tree(tokens, pos + 1)
+            result.append(child)
+        elif token == b')':
+            return result, pos + 1
+        else:
+            result.append(token[1].decode('utf-8', errors='replace') if token else None)
+            pos += 1
+    return result, pos
+
+
+def parse_bodystructure(fetch_message):
+    """
+    Wyciąga i parsuje BODYSTRUCTURE z odpowiedzi FETCH jednej wiadomości.
+    Zwraca zagnieżdżone listy lub None.
+    """
+    index = fetch_message.upper().find(b'BODYSTRUCTURE')
+    if index == -1:
+        return None
+
+    tree, _ = _build_tree(_tokenize(fetch_message[index + len(b'BODYSTRUCTURE'):]))
+    if not tree or not isinstance(tree[0], list):
+        return None
+    return tree[0]
+
+
+def _params_to_dict(params):
+    if not isinstance(params, list):
+        return {}
+    return {str(params[i]).lower(): params[i + 1] for i in range(0, len(params) - 1, 2)}
+
+
+def find_text_parts(structure, prefix=""):
+    """
+    Zwraca listę części tekstowych (text/plain, text/html, bez załączników) z BODYSTRUCTURE:
+    [{'section': '1.2', 'subtype': 'html', 'charset': 'utf-8', 'encoding': 'base64', 'size': 1234}]
+
+    Zwraca None, gdy struktury nie da się bezpiecznie obsłużyć częściowo
+    (np. załączona wiadomość message/rfc822 - wtedy pobieramy całość).
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+
+    # Multipart: (część)(część)... "SUBTYPE" ...
+    if isinstance(structure[0], list):
+        parts = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            child_parts = find_text_parts(child, f"{prefix}{number}.")
+            if child_parts is None:
+                return None
+            parts.extend(child_parts)
+        return parts
+
+    section = prefix[:-1] if prefix else "1"
+    main_type = (structure[0] or "").lower()
+    sub_type = (structure[1] or "").lower() if len(structure) > 1 else ""
+
+    if main_type == "message" and sub_type == "rfc822":
+        return None
+
+    if main_type != "text" or sub_type not in ("plain", "html"):
+        return []
+
+    # text: typ podtyp parametry id opis kodowanie rozmiar linie md5 dyspozycja ...
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == "attachment":
+        return []
+
+    params = _params_to_dict(structure[2] if len(structure) > 2 else None)
+    size = structure[6] if len(structure) > 6 else None
+
+    return [{
+        'section': section,
+        'subtype': sub_type,
+        'charset': params.get('charset'),
+        'encoding': (structure[5] or '7bit').lower() if len(structure) > 5 else '7bit',
+        'size': int(size) if size and str(size).isdigit() else None
+    }]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class LLMResponseCache:
+    """
+    Trwały cache odpowiedzi AI (SQLite).
+
+    Klucz to skrót SHA-256 z przewoźnika, wersji promptu, tematu, odbiorcy i znormalizowanej treści,
+    wartość - sparsowany JSON odpowiedzi. Ponowne przetworzenie tego samego maila (reprocess,
+    IGNORE_LAST_EMAIL_DATE_CHECK, restart przed oznaczeniem \\Seen) nie zużywa requestu ani tokenów.
+    Wpisy starsze niż ttl_days są pomijane i usuwane, powyżej max_entries usuwane są najdawniej użyte.
+    """
+
+    def __init__(self, db_path="llm_cache.sqlite3", ttl_days=30, max_entries=5000):
+        self.db_path = db_path
+        self.ttl = ttl_days * 24 * 3600
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, carrier TEXT, response TEXT NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self.purge_expired()
+
+    @staticmethod
+    def normalize_body(body):
+        """Treść bez różnic w białych znakach (zawijanie linii, CRLF, wcięcia)"""
+        return _WHITESPACE.sub(' ', body or '').strip()
+
+    @classmethod
+    def make_key(cls, carrier, prompt_version, subject, recipient, body):
+        digest = hashlib.sha256()
+        for part in (carrier.lower(), str(prompt_version), subject or '', (recipient or '').lower(), cls.normalize_body(body)):
+            digest.update(part.encode('utf-8', errors='replace'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Zapamiętana odpowiedź (dict) albo None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+
+        try:
+            return json.loads(row[0])
+        except ValueError as e:
+            logging.warning(f"⚠️ Cache AI: uszkodzony wpis {key[:12]}: {e}")
+            return None
+
+    def __contains__(self, key):
+        """Czy jest aktualna odpowiedź (bez liczenia trafień i odświeżania wpisu)"""
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def put(self, key, carrier, response):
+        """Zapisuje odpowiedź i usuwa najdawniej użyte wpisy ponad limit"""
+        now = time.time()
+        try:
+            payload = json.dumps(response, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"⚠️ Cache AI: odpowiedź nie do zapisania: {e}")
+            return
+
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, carrier, response, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, carrier, payload, now, now)
+                )
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.commit()
+                self.stores += 1
+            except sqlite3.Error as e:
+                logging.error(f"Błąd zapisu cache AI: {e}")
+
+    def purge_expired(self):
+        """Usuwa wpisy starsze niż TTL"""
+        with self._lock:
+            try:
+                removed = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Błąd czyszczenia cache AI: {e}")
+                return
+        if removed:
+            logging.info(f"🧹 Cache AI: usunięto {removed} przeterminowanych odpowiedzi")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -14,6 +14,7 @@ from log_cleaner import auto_cleanup_logs
 from rate_limiter import create_api_limiters
 from graceful_shutdown import init_graceful_shutdown, set_handlers, increment_processed_emails, increment_iterations, save_periodic_state, is_shutdown_requested, set_main_loop_running, get_stats
 from telegram_notifier import TelegramNotifier
+from carrier_patterns import PATTERNS
 import config
 
 # Importy z modułów pomocniczych
@@ -39,6 +40,37 @@ logging.basicConfig(
 logging.raiseExceptions = False 
 logging.getLogger('openai').setLevel(logging.WARNING)
 
+def handle_processed_emails(processed_emails, email_handler, sheets_handler, limiters, telegram):
+    """Aktualizacja arkusza i powiadomienia dla przetworzonych emaili"""
+    if processed_emails:
+        increment_processed_emails(len(processed_emails))
+        logging.info(f"Przetworzono {len(processed_emails)} nowych e-maili")
+    
+    for order_data in processed_emails:
+        if is_shutdown_requested(): break
+        
+        # Dodatkowe powiadomienie mailowe dla odbioru
+        if order_data.get("status") == "pickup":
+            send_pickup_notification(order_data)
+
+        # ✅ GŁÓWNA AKTUALIZACJA ARKUSZA
+        # Teraz sheets_handler robi wszystko: tworzy, aktualizuje, archiwizuje, czyści konta.
+        limiters.wait_for("sheets_write")
+        sheets_handler.handle_order_update(order_data, telegram_notifier=telegram)
+
+        # ✅ CZYSZCZENIE LOKALNEGO PLIKU JSON
+        # SheetsHandler czyści arkusz, a my tutaj doczyszczamy pamięć bota
+        if order_data.get("status") == "delivered":
+            user_key = order_data.get("user_key")
+            logging.info(f"🧹 Status 'delivered'. Usuwam lokalne mapowanie dla {user_key}...")
+            
+            email_handler.remove_user_mapping(
+                user_key,
+                order_data.get("package_number"),
+                order_data.get("order_number")
+            )
+            # UWAGA: Usunięto stąd free_up_account, bo SheetsHandler robi to automatycznie
+
 def main_loop():
     """Główna pętla programu"""
     
@@ -54,6 +86,9 @@ def main_loop():
     email_handler = EmailHandler()
     sheets_handler = SheetsHandler()
     
+    # Limiter "openai" dla równoległych requestów AI (AI_CONCURRENCY)
+    email_handler.openai_handler.limiters = limiters
+    
     # 🔌 Wstrzyknięcie email_handler do sheets_handler
     # Pozwala to arkuszowi czyścić lokalne mapowania przy archiwizacji
     sheets_handler.email_handler = email_handler
@@ -70,6 +105,13 @@ def main_loop():
     except Exception as e:
         logging.warning(f'⚠️ Nie udało się uruchomić health check: {e}')
         
+    # Tryb push (IMAP IDLE) - opcjonalny
+    idle_watcher = None
+    if getattr(config, 'IMAP_IDLE', {}).get('enabled', False):
+        from imap_idle_watcher import IMAPIdleWatcher
+        idle_watcher = IMAPIdleWatcher(email_handler)
+        logging.info('📡 Tryb IMAP IDLE włączony (konta bez IDLE nadal odpytywane co CHECK_INTERVAL)')
+        
     logging.info("🚀 Bot wystartował (Tryb PROSTY: 1 Email = 1 Wiersz).")
 
     first_run = True
@@ -103,35 +145,12 @@ def main_loop():
             limiters.wait_for("imap")
             processed_emails = email_handler.process_emails(sheets_handler=sheets_handler)
             
-            if processed_emails:
-                increment_processed_emails(len(processed_emails))
-                logging.info(f"Przetworzono {len(processed_emails)} nowych e-maili")
-            
             # 5. Przetwarzanie wyników
-            for order_data in processed_emails:
-                if is_shutdown_requested(): break
-                
-                # Dodatkowe powiadomienie mailowe dla odbioru
-                if order_data.get("status") == "pickup":
-                    send_pickup_notification(order_data)
-
-                # ✅ GŁÓWNA AKTUALIZACJA ARKUSZA
-                # Teraz sheets_handler robi wszystko: tworzy, aktualizuje, archiwizuje, czyści konta.
-                limiters.wait_for("sheets_write")
-                sheets_handler.handle_order_update(order_data, telegram_notifier=telegram)
-
-                # ✅ CZYSZCZENIE LOKALNEGO PLIKU JSON
-                # SheetsHandler czyści arkusz, a my tutaj doczyszczamy pamięć bota
-                if order_data.get("status") == "delivered":
-                    user_key = order_data.get("user_key")
-                    logging.info(f"🧹 Status 'delivered'. Usuwam lokalne mapowanie dla {user_key}...")
-                    
-                    email_handler.remove_user_mapping(
-                        user_key,
-                        order_data.get("package_number"),
-                        order_data.get("order_number")
-                    )
-                    # UWAGA: Usunięto stąd free_up_account, bo SheetsHandler robi to automatycznie
+            handle_processed_emails(processed_emails, email_handler, sheets_handler, limiters, telegram)
+            
+            # 5a. Obserwator IDLE śledzi konta sprawdzone w tym cyklu
+            if idle_watcher:
+                idle_watcher.sync_accounts(email_handler.last_checked_configs)
 
             # 6. Aktualizacja kolorów w Accounts (tylko kosmetyka)
             if len(processed_emails) > 0 or first_run:
@@ -155,6 +174,11 @@ def main_loop():
             main_loop.counter = loop_counter + 1
             if loop_counter % 100 == 0:
                 logging.info(f"📊 STATYSTYKI: {get_stats()}")
+                PATTERNS.log_stats()
+                if email_handler.openai_handler.response_cache:
+                    logging.info(f"💾 Cache AI: {email_handler.openai_handler.response_cache.stats()}")
+                if email_handler.openai_handler.prompt_builder:
+                    logging.info(f"🔢 Tokeny AI: {email_handler.openai_handler.prompt_builder.stats()}")
 
             # 8. INTELIGENTNE OCZEKIWANIE (Smart Sleep)
             # To naprawia problem z Ctrl+C
@@ -166,11 +190,24 @@ def main_loop():
             logging.info(f"💤 Usypianie na {sleep_seconds}s (Naciśnij Ctrl+C aby przerwać)...")
             
             # Sprawdzamy co sekundę, czy nie ma żądania wyjścia
+            # W trybie IDLE drzemka jest przerywana powiadomieniem o nowej poczcie -
+            # przetwarzane jest wtedy tylko konto, na które przyszedł mail.
             for _ in range(int(sleep_seconds)):
                 if is_shutdown_requested():
                     logging.info("🛑 Wykryto żądanie zamknięcia podczas drzemki.")
                     break
-                time.sleep(1)
+                
+                if not idle_watcher:
+                    time.sleep(1)
+                    continue
+                
+                changed_accounts = idle_watcher.wait_for_changes(1)
+                if changed_accounts and not is_shutdown_requested():
+                    limiters.wait_for("imap")
+                    processed_emails = email_handler.process_emails(
+                        sheets_handler=sheets_handler, only_accounts=changed_accounts
+                    )
+                    handle_processed_emails(processed_emails, email_handler, sheets_handler, limiters, telegram)
                 
         except Exception as e:
             logging.error(f"🔥 Krytyczny błąd w pętli: {e}")
@@ -180,6 +217,11 @@ def main_loop():
     
     set_main_loop_running(False)
     
+    # Zamknięcie sesji IMAP utrzymywanych w puli i obserwatorów IDLE
+    if idle_watcher:
+        idle_watcher.stop()
+    email_handler.close_connections()
+    
     # Dodatkowe wywołanie stopu serwera (dla pewności, jeśli wyjdziemy z pętli while)
     from health_check import stop_health_server
     stop_health_server()
@@ -193,6 +235,8 @@ if __name__ == "__main__":
     parser.add_argument("--menu", action="store_true", help="Uruchom menu diagnostyczne")
     parser.add_argument("--reprocess-email", type=str, help="Wymuś ponowne przetworzenie maili dla podanego adresu")
     parser.add_argument("--limit", type=int, help="Maksymalna liczba maili do przetworzenia (dla trybu reprocess)")
+    parser.add_argument("--offline", action="store_true", help="Reprocess z lokalnego cache wiadomości, bez łączenia z IMAP")
+    parser.add_argument("--batch", action="store_true", help="Reprocess z ekstrakcją AI przez kolejkę offline (Batch API) zamiast requestów na żywo")
 
     args = parser.parse_args()
 
@@ -200,7 +244,7 @@ if __name__ == "__main__":
         show_diagnostic_menu()
     
     elif args.reprocess_email:
-        run_reprocess(args.reprocess_email, limit=args.limit)
+        run_reprocess(args.reprocess_email, limit=args.limit, offline=args.offline, batch=args.batch)
         
     else:
         print("Uruchamianie głównej pętli. Naciśnij Ctrl+C aby zatrzymać.")
@@ -0,0 +1,236 @@
+import email
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from email.parser import BytesParser
+
+
+class RawMessageCache:
+    """
+    Lokalny magazyn surowych wiadomości (RFC822) adresowany treścią.
+
+    Plik .eml zapisywany jest pod skrótem SHA-256 swojej zawartości (objects/ab/abcd....eml),
+    a indeks mapuje klucze (source:email:UIDVALIDITY:UID oraz msgid:<Message-ID>) na skrót.
+    Ta sama wiadomość pod kilkoma kluczami zajmuje miejsce tylko raz.
+    Po przekroczeniu max_bytes usuwane są najdawniej używane pliki (LRU) - dopiero w flush(),
+    więc wiadomości zapisane w trakcie jednego przebiegu (np. reprocess 60 dni) są dostępne do jego końca.
+
+    Reprocess, debugowanie ekstraktorów i powtórki benchmarków czytają z dysku
+    zamiast ponownie pobierać historię z Interii/O2.
+    """
+
+    def __init__(self, cache_dir="message_cache", max_bytes=500 * 1024 * 1024, mmap_threshold=256 * 1024):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        # Większe pliki są mapowane do pamięci zamiast wczytywane w całości
+        self.mmap_threshold = mmap_threshold
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load()
+        self._total_bytes = sum(entry['size'] for entry in self.index['objects'].values())
+
+    @staticmethod
+    def make_key(source, email_addr, uidvalidity, uid):
+        return f"{source}:{(email_addr or '').strip().lower()}:{uidvalidity}:{int(uid)}"
+
+    @staticmethod
+    def message_id_key(message_id):
+        return f"msgid:{message_id.strip()}" if message_id else None
+
+    def _load(self):
+        """Wczytuje indeks z pliku"""
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                index.setdefault('objects', {})
+                index.setdefault('keys', {})
+                return index
+            except Exception as e:
+                logging.error(f"Błąd podczas ładowania indeksu cache wiadomości: {e}")
+        return {'objects': {}, 'keys': {}}
+
+    def flush(self):
+        """Usuwa pliki ponad max_bytes i zapisuje indeks na dysk (atomowo), jeśli się zmienił"""
+        with self._lock:
+            self._evict()
+            if not self._dirty:
+                return
+            tmp_file = self.index_file + ".tmp"
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.index, f)
+                os.replace(tmp_file, self.index_file)
+                self._dirty = False
+            except Exception as e:
+                logging.error(f"Błąd podczas zapisywania indeksu cache wiadomości: {e}")
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest + ".eml")
+
+    def _resolve(self, key):
+        """Zwraca (skrót, ścieżka) dla klucza lub (None, None)"""
+        digest = self.index['keys'].get(key) if key else None
+        if not digest or digest not in self.index['objects']:
+            return None, None
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            return None, None
+        return digest, path
+
+    def _touch(self, digest):
+        self.index['objects'][digest]['last_access'] = time.time()
+        self._dirty = True
+
+    def contains(self, key):
+        with self._lock:
+            return self._resolve(key)[0] is not None
+
+    def get(self, key):
+        """Zwraca surowe bajty wiadomości lub None"""
+        with self._lock:
+            digest, path = self._resolve(key)
+            if not digest:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(digest)
+
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            logging.warning(f"⚠️ Cache wiadomości: błąd odczytu {path}: {e}")
+            return None
+
+    def get_message(self, key):
+        """
+        Zwraca sparsowaną wiadomość (email.message.Message) lub None.
+        Parser czyta plik strumieniowo - surowe bajty nie są trzymane w pamięci obok wiadomości.
+        """
+        with self._lock:
+            digest, path = self._resolve(key)
+            if not digest:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(digest)
+
+        try:
+            with open(path, 'rb') as f:
+                return BytesParser().parse(f)
+        except Exception as e:
+            logging.warning(f"⚠️ Cache wiadomości: błąd parsowania {path}: {e}")
+            return None
+
+    def get_headers(self, key):
+        """
+        Zwraca same nagłówki wiadomości (Message bez treści) lub None.
+        Duże pliki są mapowane do pamięci - czytany jest tylko fragment do pustej linii.
+        """
+        with self._lock:
+            digest, path = self._resolve(key)
+            if not digest:
+                return None
+            size = self.index['objects'][digest]['size']
+
+        try:
+            with open(path, 'rb') as f:
+                if size < self.mmap_threshold:
+                    header_bytes = f.read().split(b'\r\n\r\n', 1)[0].split(b'\n\n', 1)[0]
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        end = mapped.find(b'\r\n\r\n')
+                        if end == -1:
+                            end = mapped.find(b'\n\n')
+                        header_bytes = mapped[:end if end != -1 else len(mapped)]
+            return email.message_from_bytes(header_bytes + b'\r\n\r\n')
+        except Exception as e:
+            logging.warning(f"⚠️ Cache wiadomości: błąd odczytu nagłówków {path}: {e}")
+            return None
+
+    def put(self, raw_email, *keys):
+        """Zapisuje wiadomość pod podanymi kluczami (None są pomijane). Zwraca skrót zawartości."""
+        if not raw_email:
+            return None
+
+        raw_email = bytes(raw_email)
+        digest = hashlib.sha256(raw_email).hexdigest()
+        path = self._object_path(digest)
+
+        with self._lock:
+            if digest not in self.index['objects'] or not os.path.exists(path):
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(raw_email)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    logging.warning(f"⚠️ Cache wiadomości: błąd zapisu {path}: {e}")
+                    return None
+                if digest not in self.index['objects']:
+                    self._total_bytes += len(raw_email)
+                self.index['objects'][digest] = {'size': len(raw_email), 'last_access': time.time()}
+
+            for key in keys:
+                if key:
+                    self.index['keys'][key] = digest
+            self._touch(digest)
+
+        return digest
+
+    def _evict(self):
+        """Usuwa najdawniej używane pliki, dopóki rozmiar cache przekracza max_bytes"""
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        objects = self.index['objects']
+        removed = set()
+        for digest in sorted(objects, key=lambda d: objects[d]['last_access']):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._object_path(digest))
+            except OSError:
+                pass
+            self._total_bytes -= objects[digest]['size']
+            removed.add(digest)
+
+        for digest in removed:
+            del objects[digest]
+        self.index['keys'] = {k: d for k, d in self.index['keys'].items() if d not in removed}
+        self._dirty = True
+        logging.info(f"🧹 Cache wiadomości: usunięto {len(removed)} najstarszych plików (limit {self.max_bytes // (1024 * 1024)} MB)")
+
+    def account_keys(self, source, email_addr, uidvalidity=None):
+        """Klucze UID zapisane dla konta (posortowane rosnąco po UID)"""
+        prefix = f"{source}:{(email_addr or '').strip().lower()}:"
+        if uidvalidity is not None:
+            prefix += f"{uidvalidity}:"
+
+        with self._lock:
+            keys = [k for k in self.index['keys'] if k.startswith(prefix) and self._resolve(k)[0]]
+
+        return sorted(keys, key=lambda k: (k.split(':')[-2], int(k.split(':')[-1])))
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'objects': len(self.index['objects']),
+                'keys': len(self.index['keys']),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -2,16 +2,34 @@ from openai import OpenAI
 import logging
 import json
 import config
+import itertools
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html_document import get_document
+from section_extractor import SectionExtractor, find_section
+from carrier_patterns import PATTERNS
+from llm_cache import LLMResponseCache
+from prompt_templates import PROMPT_TEMPLATES
 
 class OpenAIHandler:
+    # Wersja promptu - część klucza cache odpowiedzi AI. Zwiększ po każdej zmianie treści promptu
+    # albo tego, co trafia do AI z maila (wybór fragmentów, przycinanie do budżetu tokenów).
+    # Kompaktowe szablony (prompt_templates.py) dokładają do klucza własne version_id.
+    # 2 - fragmenty treści wg ważności i budżet tokenów (PROMPT_BUDGET), kompaktowe szablony
+    PROMPT_VERSION = 2
+    MODEL = "gpt-4o"
+
     def __init__(self):
         self.api_key = config.OPENAI_API_KEY
         self.last_request_time = 0
         self.min_request_interval = 3  # 3 sekundy między requestami
         self.daily_request_count = 0
         self.daily_limit = 45  # Limit 45 requestów dziennie (zostawiamy margines)
+        self._rate_lock = threading.Lock()
+        # MultiRateLimiter z create_api_limiters (ustawiany w main) - przy AI_CONCURRENCY zastępuje stały odstęp
+        self.limiters = None
     
         # Konfiguracja zgodna z działającym przykładem
         self.client = OpenAI(
@@ -19,25 +37,73 @@ class OpenAIHandler:
             api_key=self.api_key
         )
 
+        # Odpowiedzi przygotowane przed przetwarzaniem (AI_BATCH / AI_CONCURRENCY / kolejka offline), klucz jak w cache
+        self.prefetched_responses = {}
+        # False = brak requestów na żywo (reprocess przez kolejkę offline) - mail bez odpowiedzi idzie do regexów
+        self.allow_live_requests = True
+
+        # Budżet tokenów promptu (liczenie tokenizerem modelu, zużycie tokenów z odpowiedzi API)
+        self.prompt_builder = None
+        if getattr(config, 'PROMPT_BUDGET', {}).get('enabled', False):
+            try:
+                from prompt_builder import PromptBuilder
+                self.prompt_builder = PromptBuilder.from_config(self.MODEL)
+            except Exception as e:
+                logging.error(f"❌ Nie udało się utworzyć budżetu tokenów promptu: {e}")
+
+        # Trwały cache odpowiedzi (ponowne przetworzenie maila nie zużywa requestu)
+        cache_settings = getattr(config, 'LLM_CACHE', {})
+        self.response_cache = None
+        if cache_settings.get('enabled', False):
+            try:
+                self.response_cache = LLMResponseCache(
+                    cache_settings.get('db_path', 'llm_cache.sqlite3'),
+                    ttl_days=cache_settings.get('ttl_days', 30),
+                    max_entries=cache_settings.get('max_entries', 5000)
+                )
+            except Exception as e:
+                logging.error(f"❌ Nie udało się otworzyć cache odpowiedzi AI: {e}")
+
+        # Szablony powiadomień (maile z tego samego szablonu wyciągane kotwicami bez requestu)
+        template_settings = getattr(config, 'TEMPLATE_FINGERPRINT', {})
+        self.template_store = None
+        if template_settings.get('enabled', False):
+            try:
+                from template_fingerprint import TemplateStore
+                self.template_store = TemplateStore(
+                    template_settings.get('path', 'template_fingerprints.json'),
+                    min_confirmations=template_settings.get('min_confirmations', 2),
+                    max_templates=template_settings.get('max_templates', 500)
+                )
+            except Exception as e:
+                logging.error(f"❌ Nie udało się wczytać szablonów maili: {e}")
+
     def _rate_limit(self):
-        """Ograniczenie częstotliwości requestów"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        
-        # Sprawdź dzienny limit
-        if self.daily_request_count >= self.daily_limit:
-            logging.warning(f"🚫 Osiągnięto dzienny limit requestów OpenAI ({self.daily_limit})")
-            return False
+        """Ograniczenie częstotliwości requestów (bezpieczne dla wątków puli AI_CONCURRENCY)"""
+        use_limiter = self.limiters is not None and getattr(config, 'AI_CONCURRENCY', {}).get('enabled', False)
         
-        # Sprawdź interwał czasowy
-        if time_since_last < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last
-            logging.info(f"⏱️ Rate limiting: czekam {sleep_time:.1f}s")
-            time.sleep(sleep_time)
+        with self._rate_lock:
+            current_time = time.time()
+            time_since_last = current_time - self.last_request_time
+            
+            # Sprawdź dzienny limit
+            if self.daily_request_count >= self.daily_limit:
+                logging.warning(f"🚫 Osiągnięto dzienny limit requestów OpenAI ({self.daily_limit})")
+                return False
+            
+            # Sprawdź interwał czasowy (bez limitera - requesty jeden po drugim)
+            if not use_limiter and time_since_last < self.min_request_interval:
+                sleep_time = self.min_request_interval - time_since_last
+                logging.info(f"⏱️ Rate limiting: czekam {sleep_time:.1f}s")
+                time.sleep(sleep_time)
+            
+            self.last_request_time = time.time()
+            self.daily_request_count += 1
+            logging.info(f"📊 Request {self.daily_request_count}/{self.daily_limit}")
         
-        self.last_request_time = time.time()
-        self.daily_request_count += 1
-        logging.info(f"📊 Request {self.daily_request_count}/{self.daily_limit}")
+        # Limiter "openai" (wywołania na minutę) pozwala na równoległe requesty
+        if use_limiter:
+            self.limiters.wait_for("openai")
         return True
         
     def _clean_json_response(self, response_text):
@@ -503,29 +569,34 @@ class OpenAIHandler:
     def _extract_key_sections(self, email_body, order_number=None):
         """Ekstrahuje tylko kluczowe sekcje z dużego maila HTML"""
         import re
-        from bs4 import BeautifulSoup
         
         # Jeśli to nie jest HTML, zwróć oryginalny tekst
-        if not ("<html" in email_body or "<body" in email_body):
+        document = get_document(email_body)
+        if not document.is_html:
             return email_body[:15000]
             
         try:
-            # Parsuj HTML
-            soup = BeautifulSoup(email_body, 'html.parser')
+            # HTML parsowany raz na mail (wspólny dokument dla wszystkich ekstraktorów)
+            soup = document.soup
+            if soup is None:
+                # Brak bs4 - sam widoczny tekst
+                return document.text[:15000]
             
             # Przygotuj kontener na istotne sekcje
             important_parts = []
             extracted_text = []
             
             # 1. Szukaj tabeli z informacjami o zamówieniu (typowa struktura AliExpress)
-            order_tables = soup.find_all('table', width=re.compile(r'(100%|600|650)'))
-            for table in order_tables[:3]:  # Weź tylko pierwsze 3 tabele
-                if table.get_text() and (
-                    'zamówienie' in table.get_text().lower() or 
-                    'order' in table.get_text().lower() or
-                    'produkt' in table.get_text().lower()
+            width_pattern = re.compile(r'(100%|600|650)')
+            order_tables = [(table, text) for table, text in document.tables if width_pattern.search(table.get('width') or '')]
+            for table, table_text in order_tables[:3]:  # Weź tylko pierwsze 3 tabele
+                table_text_lower = table_text.lower()
+                if table_text and (
+                    'zamówienie' in table_text_lower or 
+                    'order' in table_text_lower or
+                    'produkt' in table_text_lower
                 ):
-                    important_parts.append(str(table))
+                    important_parts.append(table)
             
             # 2. Szukaj konkretnych fragmentów związanych z zamówieniem
             if order_number:
@@ -534,7 +605,7 @@ class OpenAIHandler:
                     # Znajdź rodzica tego elementu
                     parent = elem.parent
                     if parent:
-                        important_parts.append(str(parent))
+                        important_parts.append(parent)
             
             # 3. Szukaj adresu dostawy
             address_keywords = ['adres', 'dostawa', 'shipping', 'address']
@@ -546,7 +617,7 @@ class OpenAIHandler:
                         if parent:
                             parent = parent.parent
                     if parent:
-                        important_parts.append(str(parent))
+                        important_parts.append(parent)
             
             # 4. Szukaj informacji o produkcie
             product_keywords = ['produkt', 'item', 'towar']
@@ -558,18 +629,16 @@ class OpenAIHandler:
                         if parent:
                             parent = parent.parent
                     if parent:
-                        important_parts.append(str(parent))
+                        important_parts.append(parent)
             
             # 5. Szukaj linku do zamówienia
             links = soup.find_all('a', href=re.compile(r'aliexpress\.com/p/order/detail'))
             for link in links[:2]:
-                important_parts.append(str(link))
+                important_parts.append(link)
                 
-            # Wyodrębnij tekst z sekcji HTML
+            # Wyodrębnij tekst z sekcji HTML (bezpośrednio z drzewa, bez ponownego parsowania)
             for part in important_parts:
-                part_soup = BeautifulSoup(part, 'html.parser')
-                text = part_soup.get_text(separator=' ', strip=True)
-                extracted_text.append(text)
+                extracted_text.append(document.element_text(part))
                 
             # Dodaj nagłówki
             extracted_text.insert(0, "=== POCZĄTEK ISTOTNYCH DANYCH ===")
@@ -579,7 +648,7 @@ class OpenAIHandler:
             
             # Jeśli wynik jest zbyt mały, dodaj część oryginalnego tekstu
             if len(result) < 1000:
-                plain_text = soup.get_text(separator=' ', strip=True)
+                plain_text = document.text
                 result += "\n\n=== DODATKOWY TEKST ===\n\n" + plain_text[:10000]
                 
             return result
@@ -607,80 +676,57 @@ class OpenAIHandler:
         try:
             logging.info(f"Rozpoczynam awaryjną ekstrakcję InPost dla adresu: {recipient_email}")
             
-            # Szukaj kodu odbioru (różne formaty w mailach InPost)
-            pickup_code_patterns = [
-                # Pattern 1: Standardowy format "Kod odbioru: 123456"
-                r'[Kk]od\s+odbioru[:=\s]*[\s<>]*(\d{6})[\s<>]*',
-                # Pattern 2: Format HTML z ozdobnikami
-                r'<[^>]*>Kod\s+odbioru<[^>]*>[^<]*<[^>]*>(\d{6})<',
-                # Pattern 3: Format w tytule lub nagłówku
-                r'Twój kod[^\d]*(\d{6})',
-                # Pattern 4: W elemencie <b> lub <strong>
-                r'<(?:b|strong)[^>]*>(\d{6})<\/(?:b|strong)>',
-                # Pattern 5: Po frazie "kod paczki" lub "kod przesyłki"
-                r'(?:kod\s+(?:paczki|przesyłki|do\s+odbioru))[^\d<>]*(\d{6})'
-            ]
+            # Surowy HTML, a po nim widoczny tekst (wzorce rozbite przez tagi)
+            email_body = get_document(email_body).fallback_text
             
-            # Spróbuj znaleźć kod odbioru przy użyciu różnych wzorców
-            for pattern in pickup_code_patterns:
-                match = re.search(pattern, email_body, re.IGNORECASE)
-                if match and match.group(1) and len(match.group(1)) == 6:
-                    result["pickup_code"] = match.group(1)
-                    logging.info(f"Znaleziono kod odbioru: {match.group(1)} przy użyciu wzorca: {pattern}")
+            # Szukaj kodu odbioru (różne formaty w mailach InPost)
+            # Spróbuj znaleźć kod odbioru przy użyciu różnych wzorców (carrier_patterns.py: InPost.pickup_code_html)
+            for match in PATTERNS.search_each('InPost', 'pickup_code_html', email_body):
+                if len(match.group('pickup_code')) == 6:
+                    result["pickup_code"] = match.group('pickup_code')
+                    logging.info(f"Znaleziono kod odbioru: {match.group('pickup_code')} przy użyciu wzorca: {match.re.pattern}")
                     break
             
             # Wyciągnij lokalizację paczkomatu (format XXX00XXX)
-            location_match = re.search(r'([A-Z]{3}\d{2}[A-Z]{3,4})', email_body)
+            location_match = PATTERNS.search('InPost', 'location_code', email_body)
             if location_match:
-                location_code = location_match.group(1)
+                location_code = location_match.group('location_code')
                 result["pickup_location_code"] = location_code
                 
-                # Szukaj adresu paczkomatu z różnymi wzorcami
-                address_patterns = [
-                    # Pattern 1: Adres po kodzie paczkomatu z niewielką odległością
-                    rf'{location_code}[^<>\n]*?([^<>\n]{{10,100}}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{{1,3}})[^<>\n]{{5,100}})',
-                    # Pattern 2: Po konkretnych frazach
-                    r'(?:adres|miejsce|znajduje się|lokalizacja)[^<>\n:]*:?[^<>\n]*?([^<>\n]{10,100}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{1,3})[^<>\n]{5,100})',
-                    # Pattern 3: "na stacji" lub "przy"
-                    r'(?:na stacji|przy)[^<>\n]*?([^<>\n]{5,100})'
-                ]
-                
-                for pattern in address_patterns:
-                    address_match = re.search(pattern, email_body, re.IGNORECASE)
-                    if address_match:
-                        # Oczyść tekst adresu
-                        address = address_match.group(1).strip()
-                        # Usuń zbędne HTML tagi
-                        address = re.sub(r'<[^>]+>', ' ', address)
-                        # Oczyść wielokrotne spacje
-                        address = re.sub(r'\s+', ' ', address).strip()
-                        
-                        # Sprawdź czy adres jest sensownej długości
-                        if len(address) > 5 and len(address) < 150:
-                            result["pickup_address"] = address
-                            result["pickup_location"] = f"{location_code}: {address}"
-                            logging.info(f"Znaleziono adres: {address[:30]}...")
-                            break
+                # Szukaj adresu paczkomatu: najpierw tuż po kodzie paczkomatu, potem po frazach
+                # ("adres", "znajduje się"...) i "na stacji" / "przy"
+                address_matches = itertools.chain(
+                    PATTERNS.search_each('InPost', 'pickup_address_after_code', email_body, code=location_code),
+                    PATTERNS.search_each('InPost', 'pickup_address', email_body)
+                )
+                
+                for address_match in address_matches:
+                    # Oczyść tekst adresu
+                    address = address_match.group('address').strip()
+                    # Usuń zbędne HTML tagi
+                    address = re.sub(r'<[^>]+>', ' ', address)
+                    # Oczyść wielokrotne spacje
+                    address = re.sub(r'\s+', ' ', address).strip()
+                    
+                    # Sprawdź czy adres jest sensownej długości
+                    if len(address) > 5 and len(address) < 150:
+                        result["pickup_address"] = address
+                        result["pickup_location"] = f"{location_code}: {address}"
+                        logging.info(f"Znaleziono adres: {address[:30]}...")
+                        break
             
             # Wyciągnij termin odbioru
-            deadline_patterns = [
-                r'[Cc]zas na odbi[óo]r\s+do[:\s]*[^<]*?(\d{1,2}[/-]\d{1,2}).*?(\d{1,2}:\d{2})',
-                r'[Tt]ermin\s+odbioru[:\s]*[^<]*?(\d{1,2}[/-]\d{1,2})'
-            ]
-            
-            for pattern in deadline_patterns:
-                deadline_match = re.search(pattern, email_body)
-                if deadline_match:
-                    result["pickup_deadline"] = deadline_match.group(1).replace("/", ".")
-                    # Jeśli znaleziono również godzinę
-                    if len(deadline_match.groups()) > 1 and deadline_match.group(2):
-                        result["available_hours"] = f"do {deadline_match.group(2)}"
-                    break
+            deadline_match = PATTERNS.search('InPost', 'pickup_deadline', email_body)
+            if deadline_match:
+                result["pickup_deadline"] = deadline_match.group('date').replace("/", ".")
+                # Jeśli znaleziono również godzinę
+                if deadline_match.groupdict().get('hour'):
+                    result["available_hours"] = f"do {deadline_match.group('hour')}"
             
             # Wyciągnij numer telefonu
-            phone_match = re.search(r'(?:telefon|phone|tel)[^<>:\d]*[:<>]*\s*([+]?[\d\s\-]{7,15})', email_body, re.IGNORECASE)
+            phone_match = PATTERNS.search('InPost', 'phone', email_body)
             if phone_match:
-                phone = self._format_phone_for_display(phone_match.group(1))
+                phone = self._format_phone_for_display(phone_match.group('phone'))
                 result["phone_number"] = phone
             
             # Dodaj kompletność dla diagnostyki
@@ -701,34 +747,24 @@ class OpenAIHandler:
 
     def _extract_section(self, text, section_marker, chars_after=300):
         """Wyciąga fragment tekstu zaczynający się od określonego markera"""
-        import re
-    
-        if isinstance(section_marker, str):
-            flexible_marker = section_marker.replace(" ", "\\s+")
-            patterns = [
-                # ZWIĘKSZ KONTEKST - więcej znaków przed i po
-                f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})",  # ZWIĘKSZ KONTEKST PRZED
-                f"(.{{0,200}}{flexible_marker}.{{0,{chars_after}}})",
-                f"(<[^>]*>{section_marker}[^<]*</[^>]*>.{{0,{chars_after}}})"
-            ]
-        else:
-            patterns = [
-                f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})"
-            ]
-    
-        for pattern in patterns:
-            try:
-                match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-                if match:
-                    return match.group(1)
-            except Exception as e:
-                logging.error(f"Błąd w _extract_section dla wzorca {pattern}: {e}")
-    
-        return None
+        # Marker szukany raz (skompilowany i zapamiętany), okno wycinane po indeksach - bez regexa (.{0,200}marker.{0,N})
+        return find_section(text, section_marker, chars_after)
+
+    def _chat_messages(self, prompt):
+        return [
+            {"role": "system", "content": "Jesteś pomocnikiem, który wyciąga strukturalne dane z maili."},
+            {"role": "user", "content": prompt}
+        ]
 
     def _call_openai_api(self, prompt):
         prompt_size = len(prompt)
-        estimated_tokens = prompt_size / 4
+        messages = self._chat_messages(prompt)
+        if self.prompt_builder:
+            estimated_tokens = self.prompt_builder.count_messages(messages)
+            token_limit = self.prompt_builder.max_prompt_tokens
+        else:
+            estimated_tokens = prompt_size / 4
+            token_limit = 7600
         
         # ✅ DODAJ PEŁNY DEBUG PROMPTU
         logging.info(f"📝 PEŁNY PROMPT WYSYŁANY DO AI:")
@@ -738,22 +774,23 @@ class OpenAIHandler:
         logging.info("="*80)
     
         # Sprawdź rozmiar przed wysłaniem
-        if estimated_tokens > 7600:
-            logging.warning(f"Prompt przekracza limit tokenów ({estimated_tokens:.0f} > 8000). Przerwanie przetwarzania.")
+        if estimated_tokens > token_limit:
+            logging.warning(f"Prompt przekracza limit tokenów ({estimated_tokens:.0f} > {token_limit}). Przerwanie przetwarzania.")
             # Zwróć None lub rzuć wyjątek, aby przerwać normalne przetwarzanie
             return None
             
         # Kontynuuj tylko jeśli prompt jest odpowiedniego rozmiaru    
         try:
             response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Jesteś pomocnikiem, który wyciąga strukturalne dane z maili."},
-                    {"role": "user", "content": prompt}
-                ],
+                model=self.MODEL,
+                messages=messages,
                 temperature=0.1
             )
             
+            # Rzeczywiste zużycie tokenów (usage z odpowiedzi API)
+            if self.prompt_builder:
+                self.prompt_builder.record_usage(getattr(response, 'usage', None), estimated_tokens)
+            
             response_text = response.choices[0].message.content
             
             # ✅ ROZSZERZ DEBUG ODPOWIEDZI
@@ -900,44 +937,47 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
         """Awaryjna ekstrakcja danych DHL za pomocą wyrażeń regularnych"""
         result = {"carrier": "DHL"}
         
+        # Surowy HTML, a po nim widoczny tekst (wzorce rozbite przez tagi)
+        email_body = get_document(email_body).fallback_text
+        
         # Wyciągnij numer przesyłki JJD
-        jjd_match = re.search(r'(JJD\d+)', email_body)
+        jjd_match = PATTERNS.search('DHL', 'jjd', email_body)
         if jjd_match:
-            result["package_number"] = jjd_match.group(1)
+            result["package_number"] = jjd_match.group('package_number')
         
         # Wyciągnij numer przesyłki w nawiasie
-        secondary_match = re.search(r'przesyłki\s+(\d{8,15})', email_body)
+        secondary_match = PATTERNS.search('DHL', 'secondary_package_number', email_body)
         if secondary_match:
-            result["secondary_package_number"] = secondary_match.group(1)
+            result["secondary_package_number"] = secondary_match.group('package_number')
         
         # Wyciągnij PIN do odbioru
-        pin_match = re.search(r'PIN\s+(\d{6})', email_body)
+        pin_match = PATTERNS.search('DHL', 'pickup_code_pin', email_body)
         if pin_match:
-            result["pickup_code"] = pin_match.group(1)
+            result["pickup_code"] = pin_match.group('pickup_code')
         
         # Wyciągnij termin odbioru
-        deadline_match = re.search(r'odbierz ją do (\d{2}-\d{2}-\d{4})', email_body)
+        deadline_match = PATTERNS.search('DHL', 'pickup_deadline_exact', email_body)
         if deadline_match:
-            result["pickup_deadline"] = deadline_match.group(1)
+            result["pickup_deadline"] = deadline_match.group('date')
         
         # Wyciągnij adres automatu
-        location_match = re.search(r'AUTOMAT[^A-Z0-9]*([A-Za-z\s,.]+\d{1,5},\s*\d{5}\s[A-Załż]+)', email_body, re.IGNORECASE)
+        location_match = PATTERNS.search('DHL', 'pickup_location_automat', email_body)
         if location_match:
-            result["pickup_location"] = location_match.group(1).strip()
+            result["pickup_location"] = location_match.group('location').strip()
         
         # Wyciągnij godziny otwarcia
-        hours_match = re.search(r'Godziny otwarcia:(.*?)(?:\n\n|\r\n\r\n|$)', email_body, re.DOTALL)
+        hours_match = PATTERNS.search('DHL', 'available_hours', email_body)
         if hours_match:
-            result["available_hours"] = hours_match.group(1).strip().replace('\n', ' ')
+            result["available_hours"] = hours_match.group('hours').strip().replace('\n', ' ')
         
         # Wyciągnij nadawcę
-        sender_match = re.search(r'paczk[aę] od ([A-Z]+)[?]', email_body)
+        sender_match = PATTERNS.search('DHL', 'sender_uppercase', email_body)
         if sender_match:
-            result["sender"] = sender_match.group(1)
+            result["sender"] = sender_match.group('sender')
         
         return result
     
-    def general_extract_carrier_notification_data(self, email_body, subject, carrier_name, recipient_email):
+    def general_extract_carrier_notification_data(self, email_body, subject, carrier_name, recipient_email, probable_status=None):
         """
         Uniwersalna funkcja ekstrakcji danych z powiadomień przewoźników
         
@@ -946,39 +986,141 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             email_body: Treść wiadomości email
             subject: Temat wiadomości
             recipient_email: Email odbiorcy (z nagłówka To:)
+            probable_status: Status z szybkiej ścieżki (regexy) - wybiera kompaktowy szablon promptu
             
         Returns:
             dict: Słownik z wyodrębnionymi danymi
         """
     
         try:
-            
-            if not self._rate_limit():
-                logging.warning("⚠️ Skipping OpenAI request - rate limit exceeded")
+            # Ten sam mail przetworzony ponownie - odpowiedź z cache, bez zużywania limitu requestów
+            cache_key = self._carrier_cache_key(carrier_name, subject, recipient_email, email_body, probable_status)
+            if self.response_cache:
+                cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    logging.info(f"💾 Odpowiedź AI dla {carrier_name} z cache - pomijam request")
+                    return self._complete_carrier_response(cached_response, carrier_name, recipient_email)
+
+            # Mail z potwierdzonego szablonu - pola wyciągane kotwicami wyuczonymi z wcześniejszych odpowiedzi AI
+            template_signature = template_source = None
+            if self.template_store:
+                template_source = self.template_store.source_text(subject, email_body)
+                template_signature = self.template_store.signature(carrier_name, template_source)
+                template_response = self.template_store.extract(template_signature, template_source)
+                if template_response is not None:
+                    logging.info(f"🧩 {carrier_name}: znany szablon {template_signature[:10]} - pomijam request")
+                    return self._complete_carrier_response(template_response, carrier_name, recipient_email)
+            
+            # Odpowiedź przygotowana wcześniej (prefetch_carrier_responses: request zbiorczy lub równoległy)
+            response = self.prefetched_responses.pop(cache_key, None)
+            if response is not None:
+                logging.info(f"📦 {carrier_name}: odpowiedź przygotowana przed przetwarzaniem - pomijam request")
+            elif not self.allow_live_requests:
+                logging.info(f"⏭️ {carrier_name}: brak odpowiedzi z kolejki offline - bez requestu na żywo")
                 return None
-        
-            to_header = f"Adres email odbiorcy (To:): {recipient_email}" if recipient_email else "Brak informacji o odbiorcy"
-                     
-            # ZMIEŃ LIMIT Z 25000 NA 15000 - bo template promptu też zajmuje miejsce
-            if len(email_body) > 15000: 
-                
-                if hasattr(self, 'general_extract_carrier_content'):
-                    email_body = self.general_extract_carrier_content(email_body, carrier_name)
-                    logging.info(f"Po ekstrakcji: {len(email_body)} znaków")
-                else:
-                    email_body = email_body[:12000] + "\n[SKRÓCONO - BRAK FUNKCJI]"
             else:
-                logging.info(f"Email {carrier_name} w limicie: {len(email_body)} znaków")
+                if not self._rate_limit():
+                    logging.warning("⚠️ Skipping OpenAI request - rate limit exceeded")
+                    return None
             
-            # DODAJ SPRAWDZENIE PRZED UTWORZENIEM PROMPTU
-            estimated_prompt_size = len(email_body) + 7000  # +7000 na template promptu
-            if estimated_prompt_size > 28000:
-                logging.warning(f"Przewidywany rozmiar promptu za duży ({estimated_prompt_size}). Dodatkowe skrócenie.")
-                email_body = email_body[:12000] + "\n[SKRÓCONO PRZED PROMPTEM]"
+                to_header = f"Adres email odbiorcy (To:): {recipient_email}" if recipient_email else "Brak informacji o odbiorcy"
+                email_body = self._prepare_carrier_body(email_body, carrier_name, subject, recipient_email, probable_status)
+                prompt = self._build_carrier_prompt(carrier_name, subject, email_body, to_header, recipient_email, probable_status)
+
+                # Wywołaj OpenAI API
+                response = self._call_openai_api(prompt)
+                
+                if response is None:
+                    logging.warning(f"Brak odpowiedzi z API dla {carrier_name}. Używam awaryjnej ekstrakcji.")
+                    return self.general_fallback_extraction(email_body, subject, carrier_name, recipient_email)
             
+            if self.response_cache:
+                self.response_cache.put(cache_key, carrier_name, response)
+            if template_signature:
+                self.template_store.learn(template_signature, carrier_name, template_source, response)
+            
+            return self._complete_carrier_response(response, carrier_name, recipient_email)
+    
+        except Exception as e:
+            logging.error(f"Błąd podczas ekstrakcji danych z powiadomienia {carrier_name}: {e}")
+            return self.general_fallback_extraction(email_body, subject, carrier_name, recipient_email)
+
+    def _prepare_carrier_body(self, email_body, carrier_name, subject="", recipient_email=None, probable_status=None):
+        """Treść maila do promptu: widoczny tekst zamiast HTML, skrócenie zbyt długich treści"""
+        # Widoczny tekst + linki zamiast surowego HTML (dokument parsowany raz, wspólny z ekstraktorami)
+        if getattr(config, 'HTML_DOCUMENT', {}).get('prompt_text', False):
+            document = get_document(email_body)
+            if document.is_html:
+                email_body = document.prompt_text()
+                logging.info(f"📄 Treść HTML zamieniona na tekst: {len(document.html)} -> {len(email_body)} znaków")
         
-            # Reszta kodu z promptem pozostaje bez zmian...
-            prompt = f"""
+        if self.prompt_builder:
+            return self._fit_carrier_body(email_body, carrier_name, subject, recipient_email, probable_status)
+                 
+        # ZMIEŃ LIMIT Z 25000 NA 15000 - bo template promptu też zajmuje miejsce
+        if len(email_body) > 15000: 
+            
+            if hasattr(self, 'general_extract_carrier_content'):
+                email_body = self.general_extract_carrier_content(email_body, carrier_name)
+                logging.info(f"Po ekstrakcji: {len(email_body)} znaków")
+            else:
+                email_body = email_body[:12000] + "\n[SKRÓCONO - BRAK FUNKCJI]"
+        else:
+            logging.info(f"Email {carrier_name} w limicie: {len(email_body)} znaków")
+        
+        # DODAJ SPRAWDZENIE PRZED UTWORZENIEM PROMPTU
+        estimated_prompt_size = len(email_body) + 7000  # +7000 na template promptu
+        if estimated_prompt_size > 28000:
+            logging.warning(f"Przewidywany rozmiar promptu za duży ({estimated_prompt_size}). Dodatkowe skrócenie.")
+            email_body = email_body[:12000] + "\n[SKRÓCONO PRZED PROMPTEM]"
+
+        return email_body
+
+    def _fit_carrier_body(self, email_body, carrier_name, subject, recipient_email, probable_status=None):
+        """
+        Treść maila w budżecie tokenów (PROMPT_BUDGET): limit promptu minus szablon przewoźnika
+        (tokeny szablonu liczone raz), nagłówki i wiadomość systemowa. Za długa treść - najpierw
+        fragmenty z wzorców przewoźnika (od najważniejszych), potem reszta maila do wyczerpania budżetu.
+        """
+        head, tail = self._carrier_prompt_sections(carrier_name, recipient_email, probable_status)
+        to_header = f"Adres email odbiorcy (To:): {recipient_email}" if recipient_email else "Brak informacji o odbiorcy"
+        budget = self.prompt_builder.body_budget(
+            f"Nagłówek To: {to_header}\nTemat maila: {subject}\n\nTreść maila:",
+            self._chat_messages("")[0]['content'],
+            template=head + tail
+        )
+
+        body_tokens = self.prompt_builder.count(email_body)
+        if body_tokens <= budget:
+            logging.info(f"Email {carrier_name} w limicie: {body_tokens}/{budget} tokenów")
+            return email_body
+
+        email_body = self._remove_forward_headers(email_body)
+        extractor = SectionExtractor(email_body)
+        self._carrier_key_sections(extractor, carrier_name)
+        sections = extractor.ranked_sections()
+        fitted = self.prompt_builder.fit_sections(sections, budget)
+        logging.info(f"✂️ Treść {carrier_name} przycięta do budżetu: {body_tokens} -> "
+                     f"{self.prompt_builder.count(fitted)}/{budget} tokenów ({len(sections)} fragmentów)")
+        return fitted
+
+    def _prompt_template(self, carrier_name, probable_status):
+        """Kompaktowy szablon dla (przewoźnik, prawdopodobny status) albo None - pełny prompt"""
+        if not getattr(config, 'PROMPT_TEMPLATES', {}).get('enabled', False):
+            return None
+        return PROMPT_TEMPLATES.get(carrier_name, probable_status)
+
+    def _carrier_prompt_sections(self, carrier_name, recipient_email, probable_status=None):
+        """
+        Instrukcje promptu przewoźnika bez treści maila: (część przed treścią,
+        część po treści - uwagi, przykładowe odpowiedzi i dopiski dla przewoźnika)
+        """
+        # Znany prawdopodobny status - tylko jego schemat i jeden przykład (prompt_templates.py)
+        template = self._prompt_template(carrier_name, probable_status)
+        if template:
+            return template.sections(carrier_name, recipient_email)
+
+        head = f"""
             Przeanalizuj poniższy email od {carrier_name}. Email może dotyczyć jednego z etapów przesyłki:
 
             1. NADANIE PRZESYŁKI - Email zawiera informację o nadaniu paczki. Tylko gdy paczka dotrze do POLSKI i zostanie przekaza dla kuriera jak INPOST, DPD, DHL, POCZTA POLSKA
@@ -1033,12 +1175,8 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             5. TRANSIT - paczka po potwierdzeniu wyruszyla do Polski (mail od Aliexpress)
             - Ustaw status przesyłki: "transit" (OBOWIĄZKOWO) 
 
-            Nagłówek To: {to_header}
-            Temat maila: {subject}
-
-            Treść maila:
-            {email_body}
-
+"""
+        tail = f"""
             WAŻNE: 
             - OBOWIĄZKOWO zwróć odpowiedni status w polu "status" dla typu powiadomienia:
               * "shipment_sent" - dla powiadomienia o nadaniu - JESLI ZNASZ PRZEWOZNIKA I NIE JEST NIM ALIEXPRESS
@@ -1125,66 +1263,312 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             }}
             """
 
-            # Dostosuj prompt dla AliExpress
-            if carrier_name.lower() == "aliexpress":
-                prompt += """
-                Dodatkowo zwróć szczególną uwagę na:
-                - Numer zamówienia (format: liczba 10+ cyfr)
-                - Link do zamówienia (zaczynający się od https://www.aliexpress.com/)
-                - Dane produktu - nazwa, cena, ilość
-                - Przewidywany czas dostawy
-                - CZY JUZ ZOSTALA WYSLANA - WTEDY ZMIANIASZ TYLKO STATUS NA TRANSIT
-                """
-        
-            # Dostosuj prompt dla InPost
-            elif carrier_name.lower() == "inpost":
-                prompt += """
-                Dodatkowo zwróć szczególną uwagę na:
-                - Kod paczkomatu (format: XXX00XXX, np. POZ01M)
-                - Kod odbioru (6 cyfr)
-                - Adres paczkomatu
-                - Link do kodu QR lub informację o załączniku zawierającym kod QR
-                - Godziny otwarcia paczkomatu
-                """
-
-            elif carrier_name.lower() == "pocztapolska":
-                prompt += """
-                Specyficzne instrukcje dla Poczty Polskiej / Pocztex:
-                1. STATUSY:
-                   - Jeśli treść zawiera "została do Ciebie nadana" -> ustaw status "shipment_sent"
-                   - Jeśli treść zawiera "została wydana do doręczenia" -> ustaw status "pickup" (ponieważ kurier jedzie i wymaga PINu)
-                   - Jeśli treść zawiera "awizo" lub "do odbioru w placówce" -> ustaw status "pickup"
-                   - Jeśli treść zawiera "dziękujemy za odbiór" -> ustaw status "delivered"
-                
-                2. DANE DO WYCIĄGNIĘCIA:
-                   - Numer przesyłki: często format PX + cyfry (np. PX1945096838) lub (00)...
-                   - Kod odbioru: szukaj frazy "Kod PIN" (np. 849938) -> wpisz to w polu "pickup_code"
-                   - Telefon kuriera: szukaj frazy "Telefon do kuriera" -> wpisz w "courier_phone"
-                   - W polu "info" połącz telefon kuriera i nadawcę (np. "Kurier tel: 887850473 | Od: CAINIAO")
-                """
-
-            # Wywołaj OpenAI API
-            response = self._call_openai_api(prompt)
-            
-            if response is None:
-                logging.warning(f"Brak odpowiedzi z API dla {carrier_name}. Używam awaryjnej ekstrakcji.")
-                return self.general_fallback_extraction(email_body, subject, carrier_name, recipient_email)
-            
-            # Dalsze przetwarzanie odpowiedzi...
-            response["carrier"] = carrier_name
-            if recipient_email and not response.get("email"):
-                response["email"] = recipient_email
-            if recipient_email:
-                response["user_key"] = recipient_email.split('@')[0]
-            if not response.get("customer_name") and recipient_email:
-                response["customer_name"] = recipient_email
-            
-            logging.info(f"Wyciągnięte dane z powiadomienia {carrier_name}: {response}")
-            return response
+        # Dostosuj prompt dla AliExpress
+        if carrier_name.lower() == "aliexpress":
+            tail += """
+            Dodatkowo zwróć szczególną uwagę na:
+            - Numer zamówienia (format: liczba 10+ cyfr)
+            - Link do zamówienia (zaczynający się od https://www.aliexpress.com/)
+            - Dane produktu - nazwa, cena, ilość
+            - Przewidywany czas dostawy
+            - CZY JUZ ZOSTALA WYSLANA - WTEDY ZMIANIASZ TYLKO STATUS NA TRANSIT
+            """
     
-        except Exception as e:
-            logging.error(f"Błąd podczas ekstrakcji danych z powiadomienia {carrier_name}: {e}")
-            return self.general_fallback_extraction(email_body, subject, carrier_name, recipient_email)
+        # Dostosuj prompt dla InPost
+        elif carrier_name.lower() == "inpost":
+            tail += """
+            Dodatkowo zwróć szczególną uwagę na:
+            - Kod paczkomatu (format: XXX00XXX, np. POZ01M)
+            - Kod odbioru (6 cyfr)
+            - Adres paczkomatu
+            - Link do kodu QR lub informację o załączniku zawierającym kod QR
+            - Godziny otwarcia paczkomatu
+            """
+
+        elif carrier_name.lower() == "pocztapolska":
+            tail += """
+            Specyficzne instrukcje dla Poczty Polskiej / Pocztex:
+            1. STATUSY:
+               - Jeśli treść zawiera "została do Ciebie nadana" -> ustaw status "shipment_sent"
+               - Jeśli treść zawiera "została wydana do doręczenia" -> ustaw status "pickup" (ponieważ kurier jedzie i wymaga PINu)
+               - Jeśli treść zawiera "awizo" lub "do odbioru w placówce" -> ustaw status "pickup"
+               - Jeśli treść zawiera "dziękujemy za odbiór" -> ustaw status "delivered"
+            
+            2. DANE DO WYCIĄGNIĘCIA:
+               - Numer przesyłki: często format PX + cyfry (np. PX1945096838) lub (00)...
+               - Kod odbioru: szukaj frazy "Kod PIN" (np. 849938) -> wpisz to w polu "pickup_code"
+               - Telefon kuriera: szukaj frazy "Telefon do kuriera" -> wpisz w "courier_phone"
+               - W polu "info" połącz telefon kuriera i nadawcę (np. "Kurier tel: 887850473 | Od: CAINIAO")
+            """
+
+        return head, tail
+
+    def _build_carrier_prompt(self, carrier_name, subject, email_body, to_header, recipient_email, probable_status=None):
+        """Prompt dla jednego maila przewoźnika"""
+        head, tail = self._carrier_prompt_sections(carrier_name, recipient_email, probable_status)
+        return head + f"""            Nagłówek To: {to_header}
+            Temat maila: {subject}
+
+            Treść maila:
+            {email_body}
+""" + tail
+
+    def _carrier_cache_key(self, carrier_name, subject, recipient_email, email_body, probable_status=None):
+        """Klucz odpowiedzi AI dla maila (cache SQLite i odpowiedzi przygotowane przed przetwarzaniem)"""
+        template = self._prompt_template(carrier_name, probable_status)
+        prompt_version = f"{self.PROMPT_VERSION}/{template.version_id}" if template else self.PROMPT_VERSION
+        return LLMResponseCache.make_key(carrier_name, prompt_version, subject, recipient_email, email_body)
+
+    # --- Odpowiedzi przygotowane przed przetwarzaniem: requesty zbiorcze (AI_BATCH) i równoległe (AI_CONCURRENCY) ---
+
+    BATCH_STATUSES = ('shipment_sent', 'pickup', 'delivered', 'confirmed', 'transit', 'unknown')
+
+    def prefetch_carrier_responses(self, items):
+        """
+        Odpowiedzi AI dla maili z cyklu przygotowane przed ich sekwencyjnym przetwarzaniem.
+
+        AI_BATCH - kilka maili jednego przewoźnika w jednym requeście: instrukcje promptu (~7000 znaków)
+        wysyłane raz, jeden request z limitu dziennego na cały batch.
+        AI_CONCURRENCY - requesty (pojedyncze i zbiorcze) wysyłane równolegle przez pulę wątków,
+        ograniczone liczbą wątków i limiterem "openai" (create_api_limiters) zamiast stałego odstępu.
+
+        items - słowniki z kluczami email_body, subject, carrier_name, recipient_email i opcjonalnie probable_status
+        (kolejność przetwarzania); request zbiorczy obejmuje maile z tym samym przewoźnikiem i statusem.
+        Odpowiedzi czekają w prefetched_responses na general_extract_carrier_notification_data, więc maile
+        są dalej przetwarzane w kolejności process_emails (PROCESS_FROM_NEWEST).
+        Mail bez poprawnej odpowiedzi przechodzi zwykłą ścieżką (osobny request).
+        Zwraca liczbę maili z odpowiedzią.
+        """
+        batch_settings = getattr(config, 'AI_BATCH', {})
+        concurrency = getattr(config, 'AI_CONCURRENCY', {})
+        use_batch = batch_settings.get('enabled', False)
+        use_workers = concurrency.get('enabled', False)
+
+        self.prefetched_responses = {}
+        groups = self._pending_items(items)
+
+        # Podział na requesty: przy AI_BATCH limit maili i budżet tokenów (instrukcje + treści maili)
+        max_emails = batch_settings.get('max_emails', 8) if use_batch else 1
+        # Tokeny jak w _call_openai_api: tokenizer PROMPT_BUDGET albo szacunek 1 token ~ 4 znaki
+        if self.prompt_builder:
+            measure, budget = self.prompt_builder.count, batch_settings.get('max_prompt_tokens', 7000)
+        else:
+            measure, budget = len, batch_settings.get('max_prompt_tokens', 7000) * 4
+        requests = []
+        for (carrier_name, probable_status), pending in groups.items():
+            base_size = measure(self._build_carrier_batch_prompt(carrier_name, [], probable_status)) if use_batch else 0
+            batch, size = [], base_size
+            for key, item in pending.items():
+                email_body = self._prepare_carrier_body(item['email_body'], carrier_name, item['subject'],
+                                                        item['recipient_email'], probable_status)
+                entry_size = measure(self._batch_email_section(max_emails, item, email_body)) if use_batch else 0
+                if base_size + entry_size > budget:
+                    requests.append((carrier_name, [(key, item, email_body)]))  # za duży na batch - osobny request
+                    continue
+                if batch and (len(batch) >= max_emails or size + entry_size > budget):
+                    requests.append((carrier_name, batch))
+                    batch, size = [], base_size
+                batch.append((key, item, email_body))
+                size += entry_size
+            if batch:
+                requests.append((carrier_name, batch))
+
+        # Bez puli wątków pojedynczy mail i tak idzie zwykłym promptem w general_extract_carrier_notification_data
+        if not use_workers:
+            requests = [request for request in requests if len(request[1]) > 1]
+        if not requests:
+            return 0
+
+        if use_workers and len(requests) > 1:
+            responses = self._run_requests_parallel(requests, concurrency.get('max_workers', 4))
+        else:
+            responses = {}
+            for carrier_name, batch in requests:
+                result = self._run_prefetch_request(carrier_name, batch)
+                if result is None:
+                    break
+                responses.update(result)
+
+        self.prefetched_responses = responses
+        if responses:
+            logging.info(f"📦 Odpowiedzi AI przygotowane dla {len(responses)} maili ({len(requests)} requestów)")
+        return len(responses)
+
+    def _pending_items(self, items):
+        """
+        Maile bez odpowiedzi w cache i bez potwierdzonego szablonu maila:
+        {(przewoźnik, prawdopodobny status): {klucz: item}} (bez duplikatów)
+        """
+        groups = {}
+        for item in items:
+            carrier_name = item['carrier_name']
+            probable_status = item.get('probable_status')
+            key = self._carrier_cache_key(carrier_name, item['subject'], item['recipient_email'], item['email_body'], probable_status)
+            if self.response_cache and key in self.response_cache:
+                continue
+            if self.template_store:
+                source = self.template_store.source_text(item['subject'], item['email_body'])
+                if self.template_store.is_active(self.template_store.signature(carrier_name, source)):
+                    continue
+            groups.setdefault((carrier_name, probable_status), {}).setdefault(key, item)
+        return groups
+
+    def queue_carrier_jobs(self, queue, items):
+        """
+        Zadania kolejki offline (BatchExtractionQueue) dla maili przewoźników - ten sam prompt co na żywo,
+        custom_id = klucz odpowiedzi (jak w cache), więc wyniki pasują do maili po ponownym pobraniu.
+        Zwraca liczbę zadań.
+        """
+        queued = 0
+        for (carrier_name, probable_status), pending in self._pending_items(items).items():
+            for key, item in pending.items():
+                email_body = self._prepare_carrier_body(item['email_body'], carrier_name, item['subject'],
+                                                        item['recipient_email'], probable_status)
+                to_header = f"Adres email odbiorcy (To:): {item['recipient_email']}" if item['recipient_email'] else "Brak informacji o odbiorcy"
+                prompt = self._build_carrier_prompt(carrier_name, item['subject'], email_body, to_header,
+                                                    item['recipient_email'], probable_status)
+                queue.add(key, self.MODEL, self._chat_messages(prompt))
+                queued += 1
+        return queued
+
+    def load_queue_results(self, contents):
+        """Odpowiedzi z kolejki offline ({custom_id: treść odpowiedzi}) -> prefetched_responses; zwraca liczbę poprawnych"""
+        loaded = 0
+        for key, content in contents.items():
+            try:
+                response = json.loads(self._clean_json_response(content))
+            except (TypeError, ValueError) as e:
+                logging.warning(f"⚠️ Kolejka offline: niepoprawny JSON dla {key[:12]}: {e}")
+                continue
+            if isinstance(response, dict):
+                self.prefetched_responses[key] = response
+                loaded += 1
+        return loaded
+
+    def _run_requests_parallel(self, requests, max_workers):
+        """Requesty w puli wątków; po wyczerpaniu limitu dziennego pozostałe nie są wysyłane"""
+        responses = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-extract") as executor:
+            futures = [executor.submit(self._run_prefetch_request, carrier_name, batch) for carrier_name, batch in requests]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"❌ Błąd requestu AI w puli wątków: {e}")
+                    continue
+                if result is None:
+                    for pending in futures:
+                        pending.cancel()
+                    continue
+                responses.update(result)
+        return responses
+
+    def _run_prefetch_request(self, carrier_name, batch):
+        """Jeden request (pojedynczy mail albo batch); {klucz: odpowiedź} albo None, gdy limit requestów wyczerpany"""
+        if len(batch) > 1:
+            return self._run_carrier_batch(carrier_name, batch)
+
+        key, item, email_body = batch[0]
+        if not self._rate_limit():
+            logging.warning("⚠️ Requesty AI wstrzymane - rate limit exceeded")
+            return None
+        to_header = f"Adres email odbiorcy (To:): {item['recipient_email']}" if item['recipient_email'] else "Brak informacji o odbiorcy"
+        prompt = self._build_carrier_prompt(carrier_name, item['subject'], email_body, to_header,
+                                            item['recipient_email'], item.get('probable_status'))
+        response = self._call_openai_api(prompt)
+        return {key: response} if isinstance(response, dict) else {}
+
+    def _batch_email_section(self, email_id, item, email_body):
+        to_header = f"Adres email odbiorcy (To:): {item['recipient_email']}" if item['recipient_email'] else "Brak informacji o odbiorcy"
+        return f"""
+            ===== EMAIL {email_id} =====
+            Nagłówek To: {to_header}
+            Temat maila: {item['subject']}
+
+            Treść maila:
+            {email_body}
+"""
+
+    def _build_carrier_batch_prompt(self, carrier_name, batch, probable_status=None):
+        """Prompt dla kilku maili przewoźnika: wspólne instrukcje, maile oznaczone numerem (email_id)"""
+        head, tail = self._carrier_prompt_sections(carrier_name, "adres z nagłówka To danego maila", probable_status)
+        emails = "".join(self._batch_email_section(email_id, item, email_body)
+                         for email_id, (_, item, email_body) in enumerate(batch, 1))
+        return head + f"""            Poniżej {len(batch)} osobnych maili. Każdy przeanalizuj niezależnie według instrukcji.
+{emails}""" + tail + """
+            TRYB ZBIORCZY - zamiast jednego obiektu JSON:
+            - Zwróć TYLKO tablicę JSON z jednym obiektem dla każdego maila
+            - Każdy obiekt ma pole "email_id" (numer z nagłówka ===== EMAIL N =====) i pola jak w przykładach powyżej
+            - W polu email umieść adres z nagłówka To danego maila
+            - Przykład: [{"email_id": 1, "status": "pickup", "package_number": "..."}, {"email_id": 2, "status": "delivered"}]
+            """
+
+    def _run_carrier_batch(self, carrier_name, batch):
+        """Request zbiorczy; {klucz: odpowiedź} dla poprawnych elementów albo None, gdy limit requestów wyczerpany"""
+        if not self._rate_limit():
+            logging.warning("⚠️ Requesty zbiorcze wstrzymane - rate limit exceeded")
+            return None
+
+        prompt = self._build_carrier_batch_prompt(carrier_name, batch, batch[0][1].get('probable_status'))
+        logging.info(f"📦 Request zbiorczy {carrier_name}: {len(batch)} maili, {len(prompt)} znaków")
+        response = self._call_openai_api(prompt)
+
+        # Model czasem opakowuje tablicę w obiekt, np. {"results": [...]}
+        if isinstance(response, dict):
+            response = next((value for value in response.values() if isinstance(value, list)), None)
+        if not isinstance(response, list):
+            logging.warning(f"⚠️ Request zbiorczy {carrier_name}: odpowiedź nie jest tablicą - maile osobno")
+            return {}
+
+        by_id = {}
+        duplicated = set()
+        for element in response:
+            email_id, data = self._batch_element(element, len(batch))
+            if email_id is None:
+                logging.warning(f"⚠️ Request zbiorczy {carrier_name}: niepoprawny element odpowiedzi: {element}")
+            elif email_id in by_id:
+                duplicated.add(email_id)
+            else:
+                by_id[email_id] = data
+
+        responses = {}
+        for email_id, (key, _, _) in enumerate(batch, 1):
+            data = by_id.get(email_id)
+            if data is None or email_id in duplicated:
+                logging.warning(f"⚠️ Request zbiorczy {carrier_name}: brak poprawnej odpowiedzi dla maila {email_id} - osobny request")
+                continue
+            responses[key] = data
+        return responses
+
+    def _batch_element(self, element, batch_size):
+        """(email_id, dane) dla poprawnego elementu odpowiedzi zbiorczej, inaczej (None, None)"""
+        if not isinstance(element, dict):
+            return None, None
+        try:
+            email_id = int(str(element.get('email_id')).strip())
+        except ValueError:
+            return None, None
+        if not 1 <= email_id <= batch_size or element.get('status') not in self.BATCH_STATUSES:
+            return None, None
+        # Pola to wartości proste (jak w odpowiedzi dla pojedynczego maila)
+        if any(isinstance(value, (dict, list)) for value in element.values()):
+            return None, None
+        return email_id, {field: value for field, value in element.items() if field != 'email_id'}
+
+    def _complete_carrier_response(self, response, carrier_name, recipient_email):
+        """Uzupełnia odpowiedź AI (z API lub z cache) o przewoźnika i dane odbiorcy"""
+        response["carrier"] = carrier_name
+        if recipient_email and not response.get("email"):
+            response["email"] = recipient_email
+        if recipient_email:
+            response["user_key"] = recipient_email.split('@')[0]
+        if not response.get("customer_name") and recipient_email:
+            response["customer_name"] = recipient_email
+        
+        logging.info(f"Wyciągnięte dane z powiadomienia {carrier_name}: {response}")
+        return response
             
     def _standardize_date(self, date_string):
         """Konwertuje różne formaty dat na DD.MM.YYYY"""
@@ -1236,6 +1620,55 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             
             logging.info(f"Treść maila {carrier_name} jest bardzo duża ({len(email_body)} znaków). Wykonuję celowaną ekstrakcję.")
             
+            extractor = SectionExtractor(email_body)
+            important_sections = self._carrier_key_sections(extractor, carrier_name)
+            
+            if important_sections is None:
+                logging.info(f"Nieznany przewoźnik {carrier_name}, używam ogólnej strategii...")
+                # Dla nieznanych przewoźników - użyj ogólnej strategii
+                order_match = re.search(r'[Oo]rder(?:\s+|\s*[:#]\s*)(\d+)|[Zz]amów[^\d]+(\d+)', 
+                                    email_body[:1000])
+                order_number = None
+                if order_match:
+                    order_number = order_match.group(1) or order_match.group(2)
+                
+                return self._extract_key_sections(email_body, order_number)
+            
+            # Połącz wyekstrahowane części
+            extracted_body = extractor.join(important_sections, max_chars)
+            logging.info(f"Połączono {len(important_sections)} sekcji, razem: {len(extracted_body)} znaków")
+            
+            # ZWIĘKSZ PRÓG I DODAJ WIĘCEJ TEKSTU
+            if len(extracted_body) < 12000:
+                logging.info(f"Za mało tekstu ({len(extracted_body)} znaków), dodaję więcej...")
+                # Dodaj pierwsze 15000 znaków z oryginalnego maila
+                additional_text = email_body[:10000]
+                extracted_body += "\n\n--- DODATKOWY TEKST ---\n\n" + additional_text
+                logging.info(f"Po dodaniu dodatkowego tekstu: {len(extracted_body)} znaków")
+            
+            # JEŚLI NADAL ZA MAŁO
+            if len(extracted_body) < 10000:
+                logging.info(f"Nadal za mało ({len(extracted_body)} znaków), dodaję środek emaila...")
+                middle_start = len(email_body) // 3
+                middle_text = email_body[middle_start:middle_start + 8000]
+                extracted_body += "\n\n--- ŚRODEK TEKSTU ---\n\n" + middle_text
+                logging.info(f"Po dodaniu środka tekstu: {len(extracted_body)} znaków")
+            
+            logging.info(f"FINAL: Po celowanej ekstrakcji rozmiar tekstu: {len(extracted_body)} znaków")
+            logging.debug(f"PEŁNA TREŚĆ EMAILA PO EXTRAKCJI ({len(extracted_body)} znaków):\n{extracted_body}")
+
+            return extracted_body
+                
+        except Exception as e:
+            logging.error(f"Błąd podczas ekstrakcji treści {carrier_name}: {e}")
+            return email_body[:15000]
+        
+    def _carrier_key_sections(self, extractor, carrier_name):
+        """
+        Fragmenty treści maila (extractor.text) z wzorców przewoźnika, w kolejności ważności.
+        None dla nieznanego przewoźnika (brak wzorców).
+        """
+        try:
             important_sections = []
             
             if carrier_name.lower() == "dhl":
@@ -1244,7 +1677,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 1. Numer przesyłki DHL (JJD, 3S, JVGL) - DODAJ DEBUGGING
                 tracking_patterns = ["JJD\\d{18,25}", "3S\\d{10,15}", "JVGL\\d{10,15}"]
                 for pattern in tracking_patterns:
-                    section = self._extract_section(email_body, pattern, 1500)
+                    section = extractor.extract(pattern, 1500)
                     if section:
                         logging.info(f"Znaleziono sekcję tracking dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1256,7 +1689,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 status_patterns = ["czekasz na paczkę", "już do Ciebie jedzie", "poinformujemy cię ponownie", 
                                 "czeka na ciebie w automacie", "przesyłka dotarła", "PIN", "odbierz ją do"]
                 for pattern in status_patterns:
-                    section = self._extract_section(email_body, pattern, 2000)
+                    section = extractor.extract(pattern, 2000)
                     if section:
                         logging.info(f"Znaleziono sekcję status dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1266,7 +1699,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 3. Lokalizacja - DODAJ DEBUGGING  
                 location_patterns = ["automat dhl", "dhl box", "lokalizacja automatu", "adres automatu", "punkt odbioru"]
                 for pattern in location_patterns:
-                    section = self._extract_section(email_body, pattern, 2000)
+                    section = extractor.extract(pattern, 2000)
                     if section:
                         logging.info(f"Znaleziono sekcję lokalizacji dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1276,7 +1709,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 4. PIN i kod odbioru - DODAJ DEBUGGING
                 pin_patterns = ["PIN", "kod odbioru", "\\d{6}", "odbierz.*podając"]
                 for pattern in pin_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję PIN dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1286,7 +1719,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 5. Termin odbioru - DODAJ DEBUGGING
                 deadline_patterns = ["odbierz ją do", "termin odbioru", "dostępna do", "planowane doręczenie"]
                 for pattern in deadline_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję terminu dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1296,7 +1729,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 6. DODAJ WIĘCEJ WZORCÓW DLA DHL
                 additional_patterns = ["godziny otwarcia", "nadawca", "CAINIAO", "przedmiot", "uwagi"]
                 for pattern in additional_patterns:
-                    section = self._extract_section(email_body, pattern, 800)
+                    section = extractor.extract(pattern, 800)
                     if section:
                         logging.info(f"Znaleziono dodatkową sekcję dla wzorca {pattern}: {len(section)} znaków")
                         important_sections.append(section)
@@ -1309,7 +1742,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 1. Numer przesyłki InPost
                 tracking_patterns = ["\\d{20}", "numer przesyłki", "nr przesyłki"]
                 for pattern in tracking_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję tracking InPost: {len(section)} znaków")
                         important_sections.append(section)
@@ -1318,7 +1751,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 2. Kod paczkomatu i lokalizacja
                 location_patterns = ["[A-Z]{3}\\d{2}[A-Z]{2,4}", "paczkomat", "appkomat", "lokalizacja"]
                 for pattern in location_patterns:
-                    section = self._extract_section(email_body, pattern, 2000)
+                    section = extractor.extract(pattern, 2000)
                     if section:
                         logging.info(f"Znaleziono sekcję lokalizacji InPost: {len(section)} znaków")
                         important_sections.append(section)
@@ -1326,7 +1759,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 3. Kod odbioru
                 code_patterns = ["kod odbioru", "\\d{6}", "zeskanuj kod QR"]
                 for pattern in code_patterns:
-                    section = self._extract_section(email_body, pattern, 1200)
+                    section = extractor.extract(pattern, 1200)
                     if section:
                         logging.info(f"Znaleziono sekcję kodu InPost: {len(section)} znaków")
                         important_sections.append(section)
@@ -1335,7 +1768,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 status_patterns = ["została nadana", "czeka na ciebie", "została dostarczona", 
                                 "potwierdzenie nadania", "paczka już na ciebie czeka"]
                 for pattern in status_patterns:
-                    section = self._extract_section(email_body, pattern, 1500)
+                    section = extractor.extract(pattern, 1500)
                     if section:
                         logging.info(f"Znaleziono sekcję statusu InPost: {len(section)} znaków")
                         important_sections.append(section)
@@ -1346,7 +1779,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 1. Numer przesyłki DPD
                 tracking_patterns = ["\\d{13}[A-Z]", "numer przesyłki", "nr paczki"]
                 for pattern in tracking_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję tracking DPD: {len(section)} znaków")
                         important_sections.append(section)
@@ -1356,7 +1789,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 status_patterns = ["została nadana", "bezpieczne doręczenie", "doręczone", 
                                 "kurier doręczy", "oceń jakość dostawy"]
                 for pattern in status_patterns:
-                    section = self._extract_section(email_body, pattern, 1500)
+                    section = extractor.extract(pattern, 1500)
                     if section:
                         logging.info(f"Znaleziono sekcję statusu DPD: {len(section)} znaków")
                         important_sections.append(section)
@@ -1364,7 +1797,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 3. Informacje o kurierze
                 courier_patterns = ["kurier", "data doręczenia", "godzina doręczenia"]
                 for pattern in courier_patterns:
-                    section = self._extract_section(email_body, pattern, 1200)
+                    section = extractor.extract(pattern, 1200)
                     if section:
                         logging.info(f"Znaleziono sekcję kuriera DPD: {len(section)} znaków")
                         important_sections.append(section)
@@ -1372,7 +1805,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 4. Adres dostawy
                 address_patterns = ["adres dostawy", "doręczamy pod adres"]
                 for pattern in address_patterns:
-                    section = self._extract_section(email_body, pattern, 1200)
+                    section = extractor.extract(pattern, 1200)
                     if section:
                         logging.info(f"Znaleziono sekcję adresu DPD: {len(section)} znaków")
                         important_sections.append(section)
@@ -1383,7 +1816,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 1. Numer zamówienia
                 order_patterns = ["zamówienie \\d+", "order \\d+", "\\d{13,16}"]
                 for pattern in order_patterns:
-                    section = self._extract_section(email_body, pattern, 1200)
+                    section = extractor.extract(pattern, 1200)
                     if section:
                         logging.info(f"Znaleziono sekcję zamówienia AliExpress: {len(section)} znaków")
                         important_sections.append(section)
@@ -1392,7 +1825,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 2. Status zamówienia
                 status_patterns = ["zamówienie potwierdzone", "order confirmed", "payment received"]
                 for pattern in status_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję statusu AliExpress: {len(section)} znaków")
                         important_sections.append(section)
@@ -1401,7 +1834,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 3. Szczegóły produktu
                 product_patterns = ["szczegóły zamówienia", "order details", "produkt"]
                 for pattern in product_patterns:
-                    section = self._extract_section(email_body, pattern, 1500)
+                    section = extractor.extract(pattern, 1500)
                     if section:
                         logging.info(f"Znaleziono sekcję produktu AliExpress: {len(section)} znaków")
                         important_sections.append(section)
@@ -1410,7 +1843,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 4. Adres dostawy
                 address_patterns = ["adres dostawy", "shipping address", "dostawa"]
                 for pattern in address_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję adresu AliExpress: {len(section)} znaków")
                         important_sections.append(section)
@@ -1422,7 +1855,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 1. Numer przesyłki (PX... lub (00)...)
                 tracking_patterns = ["PX\\d{10,}", "\\(00\\)\\d{18}", "numer przesyłki", "nr przesyłki"]
                 for pattern in tracking_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję tracking Poczty: {len(section)} znaków")
                         important_sections.append(section)
@@ -1431,7 +1864,7 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 2. Kod PIN / Odbiór
                 pickup_patterns = ["Kod PIN", "kod odbioru", "do odbioru w placówce", "awizo"]
                 for pattern in pickup_patterns:
-                    section = self._extract_section(email_body, pattern, 800)
+                    section = extractor.extract(pattern, 800)
                     if section:
                         logging.info(f"Znaleziono sekcję pickup Poczty: {len(section)} znaków")
                         important_sections.append(section)
@@ -1439,51 +1872,20 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
                 # 3. Statusy
                 status_patterns = ["została do Ciebie nadana", "wydana do doręczenia", "doręczona", "odebrana"]
                 for pattern in status_patterns:
-                    section = self._extract_section(email_body, pattern, 1000)
+                    section = extractor.extract(pattern, 1000)
                     if section:
                         logging.info(f"Znaleziono sekcję statusu Poczty: {len(section)} znaków")
                         important_sections.append(section)
 
             else:
-                logging.info(f"Nieznany przewoźnik {carrier_name}, używam ogólnej strategii...")
-                # Dla nieznanych przewoźników - użyj ogólnej strategii
-                order_match = re.search(r'[Oo]rder(?:\s+|\s*[:#]\s*)(\d+)|[Zz]amów[^\d]+(\d+)', 
-                                    email_body[:1000])
-                order_number = None
-                if order_match:
-                    order_number = order_match.group(1) or order_match.group(2)
-                
-                return self._extract_key_sections(email_body, order_number)
-            
-            # Połącz wyekstrahowane części
-            extracted_body = "\n\n".join(important_sections)
-            logging.info(f"Połączono {len(important_sections)} sekcji, razem: {len(extracted_body)} znaków")
-            
-            # ZWIĘKSZ PRÓG I DODAJ WIĘCEJ TEKSTU
-            if len(extracted_body) < 12000:
-                logging.info(f"Za mało tekstu ({len(extracted_body)} znaków), dodaję więcej...")
-                # Dodaj pierwsze 15000 znaków z oryginalnego maila
-                additional_text = email_body[:10000]
-                extracted_body += "\n\n--- DODATKOWY TEKST ---\n\n" + additional_text
-                logging.info(f"Po dodaniu dodatkowego tekstu: {len(extracted_body)} znaków")
-            
-            # JEŚLI NADAL ZA MAŁO
-            if len(extracted_body) < 10000:
-                logging.info(f"Nadal za mało ({len(extracted_body)} znaków), dodaję środek emaila...")
-                middle_start = len(email_body) // 3
-                middle_text = email_body[middle_start:middle_start + 8000]
-                extracted_body += "\n\n--- ŚRODEK TEKSTU ---\n\n" + middle_text
-                logging.info(f"Po dodaniu środka tekstu: {len(extracted_body)} znaków")
-            
-            logging.info(f"FINAL: Po celowanej ekstrakcji rozmiar tekstu: {len(extracted_body)} znaków")
-            logging.debug(f"PEŁNA TREŚĆ EMAILA PO EXTRAKCJI ({len(extracted_body)} znaków):\n{extracted_body}")
+                return None
+
+            return important_sections
 
-            return extracted_body
-                
         except Exception as e:
-            logging.error(f"Błąd podczas ekstrakcji treści {carrier_name}: {e}")
-            return email_body[:15000]
-        
+            logging.error(f"Błąd podczas wyszukiwania fragmentów {carrier_name}: {e}")
+            return []
+
     def _remove_forward_headers(self, email_body):
         """
         Usuwa nagłówki przekazywania wiadomości (Forward headers) z treści emaila.
@@ -1532,12 +1934,13 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
         Łączy logikę general_fallback_extraction i general_fallback_extraction.
         Używa wyrażeń regularnych, gdy AI zawiedzie.
         """
-        import re
-        
         # 1. Wstępne czyszczenie
         try:
             email_body = self._remove_forward_headers(email_body)
         except: pass
+        
+        # Surowy HTML, a po nim widoczny tekst (wzorce rozbite przez tagi)
+        email_body = get_document(email_body).fallback_text
 
         # 2. Przygotuj podstawowy obiekt wyniku
         result = {
@@ -1557,20 +1960,20 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             if "dhl" in carrier_lower:
                 # Numer przesyłki (JJD / 3S / JVGL)
-                tracking_match = re.search(r'(JJD\d{18,25}|3S\d{10,15}|JVGL\d{10,15})', email_body)
+                tracking_match = PATTERNS.search('DHL', 'tracking_number', email_body)
                 if tracking_match:
-                    result["package_number"] = tracking_match.group(1)
+                    result["package_number"] = tracking_match.group('package_number')
                 
                 # PIN do odbioru
-                pin_match = re.search(r'PIN\s*(\d{6})', email_body, re.IGNORECASE)
+                pin_match = PATTERNS.search('DHL', 'pickup_code_fallback', email_body)
                 if pin_match:
-                    result["pickup_code"] = pin_match.group(1)
+                    result["pickup_code"] = pin_match.group('pickup_code')
                     result["status"] = "pickup"
 
                 # Termin odbioru
-                deadline_match = re.search(r'odbierz ją do (\d{2}-\d{2}-\d{4})', email_body)
+                deadline_match = PATTERNS.search('DHL', 'pickup_deadline_exact', email_body)
                 if deadline_match:
-                    result["pickup_deadline"] = deadline_match.group(1)
+                    result["pickup_deadline"] = deadline_match.group('date')
 
                 # Wykrywanie statusu po słowach kluczowych
                 body_lower = email_body.lower()
@@ -1588,19 +1991,19 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             elif "inpost" in carrier_lower:
                 # Numer przesyłki (24 cyfry)
-                tracking_match = re.search(r'(\d{24})', email_body)
+                tracking_match = PATTERNS.search('InPost', 'package_number_fallback', email_body)
                 if tracking_match:
-                    result["package_number"] = tracking_match.group(1)
+                    result["package_number"] = tracking_match.group('package_number')
                 
                 # Kod paczkomatu (np. POZ01M)
-                locker_match = re.search(r'([A-Z]{3}\d{2}[A-Z]{2,4})', email_body)
+                locker_match = PATTERNS.search('InPost', 'location_code_short', email_body)
                 if locker_match:
-                    result["pickup_location_code"] = locker_match.group(1)
+                    result["pickup_location_code"] = locker_match.group('location_code')
                 
                 # Kod odbioru (6 cyfr)
-                code_match = re.search(r'(?:kod odbioru|kodem|kod)[:\s]*(\d{6})', email_body, re.IGNORECASE)
+                code_match = PATTERNS.search('InPost', 'pickup_code_fallback', email_body)
                 if code_match:
-                    result["pickup_code"] = code_match.group(1)
+                    result["pickup_code"] = code_match.group('pickup_code')
                     result["status"] = "pickup"
 
                 # Wykrywanie statusu
@@ -1617,14 +2020,14 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             elif "dpd" in carrier_lower:
                 # Numer przesyłki (13 cyfr + litera)
-                tracking_match = re.search(r'(\d{13}[A-Z]?)', email_body)
+                tracking_match = PATTERNS.search('DPD', 'package_number_fallback', email_body)
                 if tracking_match:
-                    result["package_number"] = tracking_match.group(1)
+                    result["package_number"] = tracking_match.group('package_number')
                 
                 # Numer referencyjny
-                ref_match = re.search(r'Numer\s+referencyjny[^:]*:\s*([A-Z0-9]+)', email_body)
+                ref_match = PATTERNS.search('DPD', 'reference_number', email_body)
                 if ref_match:
-                    result["reference_number"] = ref_match.group(1)
+                    result["reference_number"] = ref_match.group('reference_number')
 
                 # Wykrywanie statusu
                 body_lower = email_body.lower()
@@ -1642,14 +2045,14 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             elif "aliexpress" in carrier_lower or "cainiao" in carrier_lower:
                 # Numer zamówienia
-                order_match = re.search(r'[Oo]rder(?:\s+|\s*[:#]\s*)(\d{10,})|[Zz]amów[^\d]+(\d{10,})', subject + " " + email_body[:1000])
+                order_match = PATTERNS.search('AliExpress', 'order_number_any', subject + " " + email_body[:1000])
                 if order_match:
-                    result["order_number"] = order_match.group(1) or order_match.group(2)
+                    result["order_number"] = order_match.group('order_number') or order_match.group('order_number_pl')
                 
                 # Link do zamówienia
-                link_match = re.search(r'(https://www\.aliexpress\.com/p/order/detail\.html\?orderId=\d+[^\s"<>]+)', email_body)
+                link_match = PATTERNS.search('AliExpress', 'order_link', email_body)
                 if link_match:
-                    result["item_link"] = link_match.group(1)
+                    result["item_link"] = link_match.group('link')
 
                 # Wykrywanie statusu (uwzględnij temat!)
                 body_lower = email_body.lower()
@@ -1672,9 +2075,9 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             elif "poczta" in carrier_lower:
                 # Numer przesyłki (PX... lub (00)...)
-                tracking_match = re.search(r'(PX\d{10,})|(\(00\)\d{18})', email_body)
+                tracking_match = PATTERNS.search('PocztaPolska', 'package_number_fallback', email_body)
                 if tracking_match:
-                    result["package_number"] = tracking_match.group(1) or tracking_match.group(2)
+                    result["package_number"] = tracking_match.group('package_number') or tracking_match.group('package_number_00')
 
                 # Status
                 body_lower = email_body.lower()
@@ -1686,26 +2089,19 @@ Zwróć TYLKO JSON w następującym formacie (puste pola pozostaw jako puste str
             # =================================================================
             # EKSTRAKCJA DAT (Wspólna dla wszystkich)
             # =================================================================
-            date_patterns = [
-                r'(\d{2}[.-]\d{2}[.-]\d{4})', # DD.MM.YYYY
-                r'(\d{4}-\d{2}-\d{2})',       # YYYY-MM-DD
-                r'(\d{2}/\d{2}/\d{4})'        # DD/MM/YYYY
-            ]
-            
-            for pattern in date_patterns:
-                date_match = re.search(pattern, email_body)
-                if date_match:
-                    found_date = self._standardize_date(date_match.group(1))
-                    
-                    # Logika przypisania daty
-                    if result.get("status") == "delivered":
-                        result["delivery_date"] = found_date
-                    elif result.get("status") == "shipment_sent":
-                        result["shipping_date"] = found_date
-                    elif result.get("status") == "pickup" and "pickup_deadline" not in result:
-                        # Czasami data w mailu o odbiorze to deadline
-                        pass 
-                    break
+            # DD.MM.YYYY, YYYY-MM-DD, DD/MM/YYYY (pierwszy pasujący format)
+            date_match = PATTERNS.search('Common', 'date', email_body)
+            if date_match:
+                found_date = self._standardize_date(date_match.group('date'))
+                
+                # Logika przypisania daty
+                if result.get("status") == "delivered":
+                    result["delivery_date"] = found_date
+                elif result.get("status") == "shipment_sent":
+                    result["shipping_date"] = found_date
+                elif result.get("status") == "pickup" and "pickup_deadline" not in result:
+                    # Czasami data w mailu o odbiorze to deadline
+                    pass 
 
             logging.info(f"⚡ Awaryjna ekstrakcja ({carrier_name}): Status={result.get('status')}, Nr={result.get('package_number') or result.get('order_number')}")
             return result
@@ -0,0 +1,290 @@
+import codecs
+import logging
+import re
+from email.header import decode_header
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+_RECIPIENT_EMAIL = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+_RECIPIENT_NAME = re.compile(r'"?([^"<]+)"?\s*<')
+
+# Nazwy charsetów spotykane w nagłówkach, których codecs nie zna
+_CHARSET_ALIASES = {
+    'win-1250': 'cp1250', 'windows1250': 'cp1250', 'x-cp1250': 'cp1250', 'cp-1250': 'cp1250',
+    'iso-8859-2-i': 'iso8859-2', 'unicode-1-1-utf-8': 'utf-8', 'utf8mb4': 'utf-8',
+}
+
+# Kodowania, w których bajty ASCII nie oznaczają znaków ASCII (bez szybkiej ścieżki i walidacji UTF-8)
+_NON_ASCII_CODECS = ('utf-16', 'utf-16-le', 'utf-16-be', 'utf-32', 'utf-32-le', 'utf-32-be', 'utf-7')
+
+# Bajty 0x80-0x9F to w ISO-8859 znaki sterujące - w polskim tekście oznaczają Windows-1250.
+# Sprawdzane przez bytes.translate (usuwa wszystkie pozostałe bajty) - kilka razy szybciej niż regex.
+_NOT_C1_BYTES = bytes(range(0x80)) + bytes(range(0xa0, 0x100))
+# ą i Ą: Windows-1250 vs ISO-8859-2 (ś, ź, Ś, Ź w Windows-1250 to bajty 0x80-0x9F)
+_CP1250_LETTERS = b'\xb9\xa5'
+_ISO8859_2_LETTERS = b'\xb1\xa1\xb6\xa6\xbc\xac'
+_NOT_LETTER_BYTES = bytes(b for b in range(0x100) if b not in _CP1250_LETTERS + _ISO8859_2_LETTERS)
+
+# Znacznik "jeszcze nie zdekodowano" (None jest poprawną wartością, np. brak daty)
+_UNSET = object()
+
+
+def decode_subject(subject):
+    """Dekoduje temat emaila z różnych encodingów"""
+    if not subject or subject == 'Brak tematu':
+        return subject or 'Brak tematu'
+
+    try:
+        decoded_parts = []
+
+        for part, encoding in decode_header(subject):
+            if isinstance(part, bytes):
+                if encoding:
+                    try:
+                        decoded_parts.append(part.decode(encoding))
+                    except (UnicodeDecodeError, LookupError):
+                        for fallback_encoding in ['iso-8859-2', 'iso-8859-1', 'utf-8']:
+                            try:
+                                decoded_parts.append(part.decode(fallback_encoding))
+                                break
+                            except UnicodeDecodeError:
+                                continue
+                        else:
+                            decoded_parts.append(part.decode('utf-8', errors='ignore'))
+                else:
+                    try:
+                        decoded_parts.append(part.decode('utf-8'))
+                    except UnicodeDecodeError:
+                        decoded_parts.append(part.decode('utf-8', errors='ignore'))
+            else:
+                decoded_parts.append(str(part))
+
+        return ''.join(decoded_parts)
+
+    except Exception as e:
+        logging.warning(f"⚠️ Błąd dekodowania tematu: {e}")
+        return subject
+
+
+@lru_cache(maxsize=64)
+def lookup_codec(charset):
+    """Nazwa kodeka dla charsetu z nagłówka (None, gdy brak lub nieznany) - wynik zapamiętywany"""
+    if not charset:
+        return None
+    name = charset.strip().strip('"\'').lower()
+    try:
+        return codecs.lookup(_CHARSET_ALIASES.get(name, name)).name
+    except LookupError:
+        logging.debug(f"Nieznany charset '{charset}' - kodowanie zostanie rozpoznane z treści")
+        return None
+
+
+def _has_c1_bytes(payload):
+    return bool(payload.translate(None, _NOT_C1_BYTES))
+
+
+def guess_polish_codec(payload):
+    """Windows-1250 czy ISO-8859-2 dla bajtów, które nie są poprawnym UTF-8"""
+    if _has_c1_bytes(payload):
+        return 'cp1250'
+    letters = payload.translate(None, _NOT_LETTER_BYTES)
+    cp1250_hits = sum(letters.count(letter) for letter in _CP1250_LETTERS)
+    return 'cp1250' if cp1250_hits * 2 > len(letters) else 'iso8859-2'
+
+
+def decode_payload(payload, charset):
+    """
+    Dekoduje bajty części maila z obsługą polskich kodowań.
+
+    Jedno sprawdzone dekodowanie zamiast łańcucha prób na wyjątkach:
+    - czyste ASCII (większość maili HTML) - bez zgadywania, wynik identyczny w każdym kodowaniu,
+    - poprawny UTF-8 z polskimi znakami jest UTF-8 także przy błędnej etykiecie (częste w Interii/O2),
+    - pozostałe bajty: zadeklarowane kodowanie jednobajtowe albo Windows-1250 / ISO-8859-2 rozpoznane z treści.
+    """
+    if payload is None:
+        return ""
+
+    codec = lookup_codec(charset)
+    if codec in _NON_ASCII_CODECS:
+        return payload.decode(codec, errors="replace")
+
+    if payload.isascii():
+        return payload.decode("ascii")
+
+    try:
+        text = payload.decode("utf-8")
+        if codec and codec != "utf-8":
+            logging.debug(f"Charset {charset} nie pasuje do treści - użyto UTF-8")
+        return text
+    except UnicodeDecodeError:
+        pass
+
+    # Bajty 0x80-0x9F w "ISO-8859" to w praktyce Windows-1250 z błędną etykietą
+    if codec in (None, "utf-8", "ascii") or (codec.startswith("iso8859") and _has_c1_bytes(payload)):
+        codec = guess_polish_codec(payload)
+    return payload.decode(codec, errors="replace")
+
+
+def extract_recipient_name(header):
+    """Wyciąga nazwę odbiorcy z nagłówka To/From"""
+    name_pattern = _RECIPIENT_NAME.search(header or "")
+    if name_pattern:
+        return name_pattern.group(1).strip()
+    return None
+
+
+class ParsedEmail:
+    """
+    Wiadomość dekodowana jednokrotnie.
+
+    Opakowuje email.message.Message i leniwie dekoduje (oraz zapamiętuje) temat, datę,
+    odbiorcę i treść. Ten sam obiekt przechodzi przez pobieranie, process_emails,
+    analyze_email i handlery przewoźników, więc nic nie jest dekodowane ponownie.
+
+    Dostęp w stylu Message (get, [], walk, is_multipart...) jest przekazywany do
+    oryginalnej wiadomości, więc obiekt można podać wszędzie tam, gdzie wcześniej Message.
+    """
+
+    __slots__ = (
+        'message', 'local_tz',
+        '_subject', '_date', '_date_string', '_recipient', '_recipient_name',
+        '_plain_body', '_html_body', '_body'
+    )
+
+    def __init__(self, message, local_tz=None):
+        self.message = message
+        self.local_tz = local_tz
+        self._subject = _UNSET
+        self._date = _UNSET
+        self._date_string = _UNSET
+        self._recipient = _UNSET
+        self._recipient_name = _UNSET
+        self._plain_body = _UNSET
+        self._html_body = _UNSET
+        self._body = _UNSET
+
+    # --- Dostęp jak do email.message.Message ---
+
+    def get(self, name, failobj=None):
+        return self.message.get(name, failobj)
+
+    def __getitem__(self, name):
+        return self.message[name]
+
+    def __contains__(self, name):
+        return name in self.message
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+    # --- Leniwie dekodowane pola ---
+
+    @property
+    def subject(self):
+        if self._subject is _UNSET:
+            try:
+                self._subject = decode_subject(self.message.get("Subject", "Brak tematu"))
+            except Exception as e:
+                logging.warning(f"⚠️ Błąd dekodowania: {e}")
+                self._subject = str(self.message.get("Subject", "Brak tematu"))
+        return self._subject
+
+    @property
+    def date(self):
+        """Data wysłania jako datetime ze strefą czasową (None, gdy brak lub błąd)"""
+        if self._date is _UNSET:
+            self._date = None
+            try:
+                date_header = self.message.get('Date')
+                if date_header:
+                    self._date = parsedate_to_datetime(date_header)
+                else:
+                    logging.warning("Brak nagłówka Date w emailu")
+            except Exception as e:
+                logging.error(f"Błąd podczas wyciągania daty z emaila: {e}")
+        return self._date
+
+    @property
+    def date_string(self):
+        """Data w strefie local_tz w formacie '%Y-%m-%d %H:%M:%S' (jak w arkuszu)"""
+        if self._date_string is _UNSET:
+            self._date_string = None
+            if self.date is not None:
+                try:
+                    self._date_string = self.date.astimezone(self.local_tz).strftime('%Y-%m-%d %H:%M:%S')
+                except Exception as e:
+                    logging.error(f"Błąd podczas wyciągania daty z emaila: {e}")
+        return self._date_string
+
+    @property
+    def recipient(self):
+        """Adres z nagłówka To (małe litery) lub None"""
+        if self._recipient is _UNSET:
+            email_match = _RECIPIENT_EMAIL.search(self.message.get("To", "") or "")
+            self._recipient = email_match.group(0).lower() if email_match else None
+        return self._recipient
+
+    @property
+    def recipient_name(self):
+        if self._recipient_name is _UNSET:
+            self._recipient_name = extract_recipient_name(self.message.get("To", "") or "")
+        return self._recipient_name
+
+    @property
+    def plain_body(self):
+        if self._plain_body is _UNSET:
+            self._decode_bodies()
+        return self._plain_body
+
+    @property
+    def html_body(self):
+        if self._html_body is _UNSET:
+            self._decode_bodies()
+        return self._html_body
+
+    @property
+    def body(self):
+        """Wszystkie części tekstowe (text/plain i text/html) w kolejności z wiadomości"""
+        if self._body is _UNSET:
+            self._decode_bodies()
+        return self._body
+
+    @property
+    def compact_body(self):
+        """Mniejsza z części (text/plain albo text/html), gdy wiadomość ma obie - zamiast ich sklejenia"""
+        plain_body, html_body = self.plain_body, self.html_body
+        if plain_body and html_body:
+            return plain_body if len(plain_body) <= len(html_body) else html_body
+        return self.body
+
+    def _decode_bodies(self):
+        """Jedno przejście po częściach MIME - części zbierane do list i łączone raz"""
+        plain_parts = []
+        html_parts = []
+        all_parts = []
+
+        try:
+            if self.message.is_multipart():
+                for part in self.message.walk():
+                    content_type = part.get_content_type()
+                    if "attachment" in str(part.get("Content-Disposition")):
+                        continue
+                    if content_type not in ("text/plain", "text/html"):
+                        continue
+                    try:
+                        text = decode_payload(part.get_payload(decode=True), part.get_content_charset())
+                    except Exception as e:
+                        logging.warning(f"Błąd dekodowania części maila: {e}")
+                        continue
+                    all_parts.append(text)
+                    (html_parts if content_type == "text/html" else plain_parts).append(text)
+            else:
+                text = decode_payload(self.message.get_payload(decode=True), self.message.get_content_charset())
+                all_parts.append(text)
+                (html_parts if self.message.get_content_type() == "text/html" else plain_parts).append(text)
+        except Exception as e:
+            logging.error(f"Krytyczny błąd pobierania treści maila: {e}")
+
+        self._plain_body = "".join(plain_parts)
+        self._html_body = "".join(html_parts)
+        self._body = "".join(all_parts)
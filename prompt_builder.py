@@ -0,0 +1,175 @@
+import logging
+import math
+import re
+import threading
+
+# Bez tiktoken: słowa ASCII ~4 znaki na token, słowa z polskimi znakami ~3 (diakrytyki dzielą słowa
+# na więcej tokenów), liczby po 3 cyfry, każdy znak interpunkcji i koniec linii osobno
+_ESTIMATE_PIECES = re.compile(r"\d{1,3}|[^\W\d_]+|[^\w\s]|\n")
+
+# Narzut formatu czatu: tokeny na każdą wiadomość i na początek odpowiedzi
+TOKENS_PER_MESSAGE = 4
+TOKENS_REPLY_PRIMING = 3
+
+TRUNCATED_MARKER = "\n[SKRÓCONO DO LIMITU TOKENÓW]"
+
+
+class TokenCounter:
+    """
+    Liczenie tokenów tokenizerem modelu (tiktoken, opcjonalny - pip install tiktoken).
+    Bez tiktoken (albo bez pobranego pliku kodowania) - szacunek z _ESTIMATE_PIECES.
+    """
+
+    def __init__(self, model="gpt-4o"):
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            logging.info("ℹ️ Brak tiktoken - tokeny promptu szacowane")
+        except Exception as e:
+            # tiktoken pobiera plik kodowania przy pierwszym użyciu - bez sieci zostaje szacunek
+            logging.warning(f"⚠️ Nie udało się wczytać tokenizera {model}: {e} - tokeny promptu szacowane")
+
+    @property
+    def exact(self):
+        return self.encoding is not None
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        tokens = 0
+        for piece in _ESTIMATE_PIECES.findall(text):
+            if piece[0].isalpha():
+                tokens += math.ceil(len(piece) / (4 if piece.isascii() else 3))
+            else:
+                tokens += 1
+        return tokens
+
+    def truncate(self, text, max_tokens):
+        """Początek tekstu mieszczący się w max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        cut = int(len(text) * max_tokens / tokens)
+        while cut > 0 and self.count(text[:cut]) > max_tokens:
+            cut = int(cut * 0.9)
+        return text[:cut]
+
+
+class PromptBuilder:
+    """
+    Budżet tokenów promptu: instrukcje (szablon) + treść maila z fragmentów w kolejności ważności.
+
+    Liczba tokenów szablonu (instrukcje przewoźnika bez treści maila) jest zapamiętywana - liczona raz
+    na szablon. Zużycie tokenów z odpowiedzi API (usage) sumowane dla statystyk.
+    """
+
+    def __init__(self, counter=None, max_prompt_tokens=7600, reserve_tokens=100, max_templates=64):
+        self.counter = counter or TokenCounter()
+        self.max_prompt_tokens = max_prompt_tokens
+        self.reserve_tokens = reserve_tokens
+        self.max_templates = max_templates
+        self._template_tokens = {}
+        self._lock = threading.Lock()
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'estimate_error': 0}
+
+    @classmethod
+    def from_config(cls, model="gpt-4o"):
+        """Budżet z ustawień PROMPT_BUDGET"""
+        import config
+
+        settings = getattr(config, 'PROMPT_BUDGET', {})
+        return cls(
+            TokenCounter(model),
+            max_prompt_tokens=settings.get('max_prompt_tokens', 7600),
+            reserve_tokens=settings.get('reserve_tokens', 100)
+        )
+
+    def count(self, text):
+        return self.counter.count(text)
+
+    def count_messages(self, messages):
+        """Tokeny całego promptu czatu (treści wiadomości + narzut formatu)"""
+        return sum(self.count(message['content']) + TOKENS_PER_MESSAGE for message in messages) + TOKENS_REPLY_PRIMING
+
+    def template_tokens(self, template):
+        """Tokeny szablonu (zapamiętane - ten sam szablon liczony raz)"""
+        with self._lock:
+            tokens = self._template_tokens.get(template)
+        if tokens is None:
+            tokens = self.count(template)
+            with self._lock:
+                if len(self._template_tokens) >= self.max_templates:
+                    self._template_tokens.clear()
+                self._template_tokens[template] = tokens
+        return tokens
+
+    def body_budget(self, *parts, template=""):
+        """Tokeny dostępne dla treści maila po odjęciu szablonu, pozostałych części promptu i zapasu"""
+        used = self.template_tokens(template) + sum(self.count(part) for part in parts)
+        return self.max_prompt_tokens - used - self.reserve_tokens
+
+    def fit_sections(self, sections, budget, separator="\n\n"):
+        """
+        Fragmenty (w kolejności ważności) mieszczące się w budżecie tokenów.
+        Pierwszy fragment, który się nie mieści, jest przycinany; kolejne pomijane.
+        """
+        separator_tokens = self.count(separator)
+        marker_tokens = self.count(TRUNCATED_MARKER)
+        chosen = []
+        used = 0
+        truncated = False
+        for section in sections:
+            if not section.strip() or any(section in previous for previous in chosen):
+                continue
+            cost = self.count(section) + (separator_tokens if chosen else 0)
+            if used + cost <= budget - marker_tokens:
+                chosen.append(section)
+                used += cost
+                continue
+            remaining = budget - marker_tokens - used - (separator_tokens if chosen else 0)
+            part = self.counter.truncate(section, remaining)
+            if part.strip():
+                chosen.append(part)
+            truncated = True
+            break
+
+        text = separator.join(chosen)
+        return text + TRUNCATED_MARKER if truncated else text
+
+    def record_usage(self, usage, counted_tokens=None):
+        """Zapisuje zużycie tokenów z odpowiedzi API (response.usage); zwraca (prompt, odpowiedź) albo None"""
+        if usage is None:
+            return None
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+        with self._lock:
+            self.usage['requests'] += 1
+            self.usage['prompt_tokens'] += prompt_tokens
+            self.usage['completion_tokens'] += completion_tokens
+            if counted_tokens:
+                self.usage['estimate_error'] += abs(counted_tokens - prompt_tokens)
+
+        counted = f" (policzono {counted_tokens})" if counted_tokens else ""
+        logging.info(f"🔢 Tokeny: prompt {prompt_tokens}{counted}, odpowiedź {completion_tokens}")
+        return prompt_tokens, completion_tokens
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.usage)
+        requests = stats['requests'] or 1
+        stats['avg_prompt_tokens'] = round(stats['prompt_tokens'] / requests)
+        stats['avg_estimate_error'] = round(stats.pop('estimate_error') / requests)
+        stats['tokenizer'] = 'tiktoken' if self.counter.exact else 'szacunek'
+        return stats
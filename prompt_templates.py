@@ -0,0 +1,251 @@
+import hashlib
+import json
+import textwrap
+
+# Wcięcie treści promptu (jak w _carrier_prompt_sections)
+INDENT = " " * 12
+
+# Schemat odpowiedzi dla statusu: (opis typu powiadomienia, pola do wyciągnięcia, przykładowa odpowiedź)
+# "email" / "carrier" w przykładzie są uzupełniane adresem odbiorcy i nazwą przewoźnika
+STATUS_SCHEMAS = {
+    'shipment_sent': (
+        "NADANIE PRZESYŁKI - Email zawiera informację o nadaniu paczki (przekazanej do doręczenia w Polsce).",
+        [
+            "Numer przesyłki (package_number)",
+            "Data nadania (shipping_date) - format DD.MM.YYYY",
+            "Planowany termin doręczenia (expected_delivery_date) - format DD.MM.YYYY",
+            "Adres dostawy (delivery_address)",
+            "Email odbiorcy (email)",
+        ],
+        {
+            "package_number": "0000363570900W",
+            "shipping_date": "24.05.2025",
+            "expected_delivery_date": "28.05.2025",
+            "delivery_address": "ul. Matejki 10/1, 71-614 Szczecin",
+            "email": None,
+            "carrier": None,
+            "status": "shipment_sent",
+            "info": "Nadano paczkę do punktu odbioru. Przewidywany czas dostawy: 28.05.2025."
+        }
+    ),
+    'pickup': (
+        "DOSTAWA DZIŚ / GOTOWE DO ODBIORU - Email informujący o paczce gotowej do odbioru lub kurierze w drodze.",
+        [
+            "Numer przesyłki (package_number)",
+            "Miejsce odbioru (pickup_location) - punkt, paczkomat, automat, adres doręczenia",
+            "Kod punktu odbioru (pickup_location_code) - jeśli dostępny",
+            "Kod odbioru (pickup_code) - PIN, kod odbioru",
+            "Termin odbioru (pickup_deadline) - format DD.MM.YYYY",
+            "Godziny dostępności (available_hours) - godziny otwarcia punktu odbioru, np. \"PN-SB 06-20\"",
+            "Imię i telefon kuriera (courier_name, courier_phone)",
+            "Telefon do odbioru (phone_number) - jeśli dostępny",
+            "Link do kodu QR (qr_code) - jeśli dostępny",
+        ],
+        {
+            "package_number": "0000363570900W",
+            "pickup_location": "Paczkomat SZC01M, ul. Bazarowa 10, 71-614 Szczecin",
+            "pickup_location_code": "SZC01M",
+            "pickup_code": "123456",
+            "pickup_deadline": "28.05.2025",
+            "available_hours": "PN-SB 06-20",
+            "courier_name": "Jakub",
+            "courier_phone": "506 575 068",
+            "phone_number": "502 575 068",
+            "qr_code": "https://link-do-qr.pl/123456",
+            "email": None,
+            "carrier": None,
+            "status": "pickup",
+            "info": "Kurier Jakub dostarczy paczkę dzisiaj. Jego tel: 412512123."
+        }
+    ),
+    'delivered': (
+        "DORĘCZONO - Email potwierdzający dostarczenie paczki.",
+        [
+            "Numer przesyłki (package_number)",
+            "Data doręczenia (delivery_date) - format DD.MM.YYYY",
+            "Email odbiorcy (email)",
+        ],
+        {
+            "package_number": "0000363570900W",
+            "delivery_date": "24.05.2025",
+            "email": None,
+            "recipient_info": "Przesyłka odebrana osobiście przez adresata",
+            "carrier": None,
+            "status": "delivered"
+        }
+    ),
+    'confirmed': (
+        "POTWIERDZENIE ZAMÓWIENIA - Potwierdzenie zakupu w sklepie internetowym Aliexpress.",
+        [
+            "Numer zamówienia (order_number)",
+            "Data zamówienia (order_date) - format DD.MM.YYYY",
+            "Nazwa produktu (product_name)",
+            "Adres dostawy (delivery_address)",
+            "Numer telefonu (phone_number)",
+            "Email zamawiającego (email)",
+            "Link do zamówienia (item_link)",
+            "Przewidywany czas dostawy (estimated_delivery)",
+        ],
+        {
+            "order_number": "8041215699357896",
+            "order_date": "20.05.2025",
+            "product_name": "Słuchawki bezprzewodowe Xiaomi",
+            "delivery_address": "ul. Matejki 10/1, 71-614 Szczecin",
+            "phone_number": "506 575 068",
+            "email": None,
+            "item_link": "https://www.aliexpress.com/p/order/detail.html?orderId=8041215699357896",
+            "estimated_delivery": "10.06.2025 - 25.06.2025",
+            "carrier": None,
+            "status": "confirmed"
+        }
+    ),
+    'transit': (
+        "TRANSIT - paczka po potwierdzeniu zamówienia wyruszyła do Polski (mail od Aliexpress).",
+        [],
+        {
+            "email": None,
+            "carrier": None,
+            "status": "transit"
+        }
+    ),
+}
+
+
+class PromptTemplate:
+    """
+    Kompaktowy prompt dla prawdopodobnego statusu: schemat i jeden przykład odpowiedzi
+    (STATUS_SCHEMAS) + uwagi przewoźnika, zamiast opisu wszystkich pięciu typów powiadomień.
+
+    version_id trafia do klucza cache odpowiedzi AI - zawiera numer wersji (zwiększ po zmianie
+    treści) i skrót treści szablonu, więc zmiana schematu lub uwag unieważnia stare odpowiedzi.
+    """
+
+    def __init__(self, template_id, status, notes="", version=1):
+        self.template_id = template_id
+        self.status = status
+        self.notes = textwrap.dedent(notes).strip()
+        self.version = version
+        title, fields, example = STATUS_SCHEMAS[status]
+        digest = hashlib.sha1(json.dumps([title, fields, example, self.notes], ensure_ascii=False).encode('utf-8'))
+        self.version_id = f"{template_id}@v{version}-{digest.hexdigest()[:8]}"
+
+    def _lines(self, lines):
+        return "".join(f"{INDENT}{line}\n" if line else "\n" for line in lines)
+
+    def sections(self, carrier_name, recipient_email):
+        """(część promptu przed treścią maila, część po treści) - jak _carrier_prompt_sections"""
+        title, fields, example = STATUS_SCHEMAS[self.status]
+        example = dict(example, email=recipient_email, carrier=carrier_name)
+
+        head = "\n" + self._lines([
+            f"Przeanalizuj poniższy email od {carrier_name}. Najprawdopodobniej jest to powiadomienie typu:",
+            "",
+            title,
+            "Z tego typu maila wyciągnij:",
+            f"- Ustaw status przesyłki: \"{self.status}\" (OBOWIĄZKOWO)",
+        ] + [f"- {field}" for field in fields]) + "\n"
+
+        tail = "\n" + self._lines([
+            "WAŻNE:",
+            f"- Jeśli treść wyraźnie wskazuje inny etap niż \"{self.status}\", ustaw właściwy status:",
+            "  \"shipment_sent\" (nadanie), \"pickup\" (do odbioru / kurier doręczy dziś), \"delivered\" (doręczono),",
+            "  \"confirmed\" (potwierdzenie zamówienia AliExpress), \"transit\" (AliExpress - paczka wyruszyła do Polski)",
+            "  i wypełnij pola, które znajdziesz w treści",
+            "- Format daty powinien być zawsze DD.MM.YYYY (np. 18.05.2025)",
+            "- W polu email umieść adres email odbiorcy z nagłówka To",
+            "- Jeśli nie możesz znaleźć niektórych danych, pozostaw te pola puste",
+            "- W polu info połącz dodatkowe informacje (np. o kurierze, czasie dostawy)",
+            "- Telefon podawaj po 3 cyfry, np. 506 575 068",
+            "- ZWRÓĆ TYLKO JSON z danymi, nie dodawaj żadnych dodatkowych informacji ani komentarzy",
+            "",
+            "Jeśli dostałeś przypadkowy mail to zwróć pusty JSON: {}, jedynie w info i status zwróć \"unknown\" i \"unknown\" jako status.",
+            "",
+            "Przykładowa odpowiedź JSON:",
+        ] + json.dumps(example, ensure_ascii=False, indent=2).split("\n"))
+
+        if self.notes:
+            tail += "\n" + self._lines(self.notes.split("\n"))
+        return head, tail
+
+
+class PromptTemplateRegistry:
+    """
+    Rejestr kompaktowych promptów (klucz: przewoźnik + prawdopodobny status z szybkiej ścieżki).
+    Przewoźnik "*" = szablon ogólny dla statusu. Brak szablonu (status nieznany) - pełny prompt.
+    """
+
+    def __init__(self):
+        self._templates = {}
+
+    def add(self, carrier, status, template):
+        self._templates[(carrier.lower(), status)] = template
+
+    def get(self, carrier, status):
+        if not status:
+            return None
+        return self._templates.get((carrier.lower(), status)) or self._templates.get(('*', status))
+
+
+PROMPT_TEMPLATES = PromptTemplateRegistry()
+
+for _status in STATUS_SCHEMAS:
+    PROMPT_TEMPLATES.add('*', _status, PromptTemplate(_status, _status))
+
+# --- InPost ---
+PROMPT_TEMPLATES.add('InPost', 'pickup', PromptTemplate('inpost.pickup', 'pickup', """
+    Dodatkowo zwróć szczególną uwagę na:
+    - Numer przesyłki InPost: zazwyczaj 24 cyfry, np. 520000012680041086770098
+    - Kod paczkomatu (format: XXX00XXX, np. POZ01M) -> pickup_location_code
+    - Kod odbioru (6 cyfr)
+    - Adres paczkomatu i godziny otwarcia
+    - qr_code: "P|telefon|kod_odbioru" (bez spacji) wstaw do https://api.qrserver.com/v1/create-qr-code/?size=200x200&data=QR_CONTENT
+      np. https://api.qrserver.com/v1/create-qr-code/?size=200x200&data=P|908009092|464714
+"""))
+PROMPT_TEMPLATES.add('InPost', 'shipment_sent', PromptTemplate('inpost.shipment_sent', 'shipment_sent', """
+    Numer przesyłki InPost: zazwyczaj 24 cyfry, np. 520000012680041086770098
+"""))
+
+# --- DHL ---
+PROMPT_TEMPLATES.add('DHL', 'pickup', PromptTemplate('dhl.pickup', 'pickup', """
+    Dodatkowo zwróć szczególną uwagę na:
+    - Numer przesyłki DHL: JJD/3S/JVGL + cyfry, np. JJD000030185064000048049759
+    - Czy paczka JEST JUŻ w automacie / punkcie, czy dopiero do niego jedzie (np. "Poinformujemy Cię ponownie,
+      gdy paczka dotrze do automatu DHL BOX" = dopiero wysłana -> "shipment_sent")
+    - PIN do odbioru -> pickup_code, automat DHL BOX / punkt -> pickup_location
+    - Link do kodu QR, np. https://ccs-image.dhl.com/barcodes/e845cbd1-eac1-4a2a-ab05-d039c8b9ce78.jpg
+"""))
+PROMPT_TEMPLATES.add('DHL', 'shipment_sent', PromptTemplate('dhl.shipment_sent', 'shipment_sent', """
+    Dodatkowo zwróć szczególną uwagę na:
+    - Numer przesyłki DHL: JJD/3S/JVGL + cyfry, np. JJD000030185064000048049759
+    - PRZEANALIZUJ DOKŁADNIE CZY PACZKA JEST DOPIERO WYSŁANA CZY JUŻ DO ODBIORU (PIN, termin odbioru = "pickup")
+"""))
+
+# --- DPD ---
+for _status in ('shipment_sent', 'pickup', 'delivered'):
+    PROMPT_TEMPLATES.add('DPD', _status, PromptTemplate(f'dpd.{_status}', _status, """
+        Numer przesyłki DPD: zazwyczaj 13 cyfr + 1 litera, np. 0000363570900W
+    """))
+
+# --- Poczta Polska ---
+for _status in ('shipment_sent', 'pickup', 'delivered'):
+    PROMPT_TEMPLATES.add('PocztaPolska', _status, PromptTemplate(f'pocztapolska.{_status}', _status, """
+        Specyficzne instrukcje dla Poczty Polskiej / Pocztex:
+        - "została do Ciebie nadana" -> status "shipment_sent"
+        - "została wydana do doręczenia", "awizo" lub "do odbioru w placówce" -> status "pickup"
+        - "dziękujemy za odbiór" -> status "delivered"
+        - Numer przesyłki: często PX + cyfry (np. PX1945096838) lub (00)...
+        - Kod odbioru: fraza "Kod PIN" (np. 849938) -> pickup_code
+        - Telefon kuriera: fraza "Telefon do kuriera" -> courier_phone
+        - W polu "info" połącz telefon kuriera i nadawcę (np. "Kurier tel: 887850473 | Od: CAINIAO")
+    """))
+
+# --- AliExpress ---
+for _status in ('confirmed', 'transit'):
+    PROMPT_TEMPLATES.add('AliExpress', _status, PromptTemplate(f'aliexpress.{_status}', _status, """
+        Dodatkowo zwróć szczególną uwagę na:
+        - Numer zamówienia (format: liczba 10+ cyfr)
+        - Link do zamówienia (zaczynający się od https://www.aliexpress.com/)
+        - Dane produktu - nazwa, cena, ilość
+        - Przewidywany czas dostawy
+        - CZY JUZ ZOSTALA WYSLANA - WTEDY ZMIANIASZ TYLKO STATUS NA TRANSIT
+    """))
@@ -1,5 +1,6 @@
 import time
 import logging
+import threading
 from datetime import datetime, timedelta
 
 class SimpleRateLimiter:
@@ -18,6 +19,8 @@ class SimpleRateLimiter:
         self.time_window = time_window
         self.name = name
         self.calls = []
+        # Wywołania z wielu wątków (pula requestów AI) - sprawdzenie i zapis pod blokadą
+        self._lock = threading.Lock()
         
         logging.info(f"🚦 Utworzono rate limiter '{name}': {max_calls} wywołań na {time_window}s")
     
@@ -25,34 +28,35 @@ class SimpleRateLimiter:
         """
         Sprawdza czy można wykonać wywołanie, jeśli nie - czeka
         """
-        now = datetime.now()
+        with self._lock:
+            now = datetime.now()
         
-        # Usuń stare wywołania (starsze niż time_window)
-        cutoff = now - timedelta(seconds=self.time_window)
-        old_count = len(self.calls)
-        self.calls = [call for call in self.calls if call > cutoff]
+            # Usuń stare wywołania (starsze niż time_window)
+            cutoff = now - timedelta(seconds=self.time_window)
+            old_count = len(self.calls)
+            self.calls = [call for call in self.calls if call > cutoff]
         
-        if len(self.calls) < old_count:
-            logging.debug(f"🧹 {self.name}: Usunięto {old_count - len(self.calls)} starych wywołań")
+            if len(self.calls) < old_count:
+                logging.debug(f"🧹 {self.name}: Usunięto {old_count - len(self.calls)} starych wywołań")
         
-        # Sprawdź czy przekroczono limit
-        if len(self.calls) >= self.max_calls:
-            # Oblicz ile trzeba czekać
-            oldest_call = min(self.calls)
-            sleep_time = self.time_window - (now - oldest_call).total_seconds()
+            # Sprawdź czy przekroczono limit
+            if len(self.calls) >= self.max_calls:
+                # Oblicz ile trzeba czekać
+                oldest_call = min(self.calls)
+                sleep_time = self.time_window - (now - oldest_call).total_seconds()
             
-            if sleep_time > 0:
-                logging.warning(f"🕐 {self.name} Rate limit! Czekam {sleep_time:.1f}s (wywołania: {len(self.calls)}/{self.max_calls})")
-                time.sleep(sleep_time)
+                if sleep_time > 0:
+                    logging.warning(f"🕐 {self.name} Rate limit! Czekam {sleep_time:.1f}s (wywołania: {len(self.calls)}/{self.max_calls})")
+                    time.sleep(sleep_time)
                 
-                # Odśwież listę po oczekiwaniu
-                now = datetime.now()
-                cutoff = now - timedelta(seconds=self.time_window)
-                self.calls = [call for call in self.calls if call > cutoff]
+                    # Odśwież listę po oczekiwaniu
+                    now = datetime.now()
+                    cutoff = now - timedelta(seconds=self.time_window)
+                    self.calls = [call for call in self.calls if call > cutoff]
         
-        # Zapisz obecne wywołanie
-        self.calls.append(now)
-        logging.debug(f"📊 {self.name}: {len(self.calls)}/{self.max_calls} wywołań w oknie {self.time_window}s")
+            # Zapisz obecne wywołanie
+            self.calls.append(now)
+            logging.debug(f"📊 {self.name}: {len(self.calls)}/{self.max_calls} wywołań w oknie {self.time_window}s")
     
     def get_stats(self):
         """
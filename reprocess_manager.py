@@ -1,14 +1,21 @@
 import logging
+import re
 from email_handler import EmailHandler
 from sheets_handler import SheetsHandler
 from carriers_sheet_handlers import EmailAvailabilityManager
+from parsed_email import extract_recipient_name
 
 #example use: python3 main.py --reprocess-email jan.kowalski@interia.pl --limit 10
-def run_reprocess(target_email, limit=None):
+#             python3 main.py --reprocess-email jan.kowalski@interia.pl --offline  (z lokalnego cache)
+#             python3 main.py --reprocess-email jan.kowalski@interia.pl --batch    (AI przez kolejkę offline)
+def run_reprocess(target_email, limit=None, offline=False, batch=False):
     """
     Wymusza ponowne pobranie maili dla konkretnego adresu.
+    offline=True - maile czytane z lokalnego cache wiadomości (MESSAGE_CACHE), bez IMAP.
+    batch=True   - ekstrakcja AI przez kolejkę offline (Batch API, BATCH_QUEUE) zamiast requestów na żywo;
+                   arkusz aktualizowany jednym przebiegiem po otrzymaniu wyników.
     """
-    logging.info(f"🛠️ URUCHAMIAM TRYB REPROCESS DLA: {target_email}")
+    logging.info(f"🛠️ URUCHAMIAM TRYB REPROCESS DLA: {target_email}{' (OFFLINE)' if offline else ''}{' (BATCH)' if batch else ''}")
     if limit:
         logging.info(f"🔢 Limit: {limit} zamówień")
     
@@ -20,7 +27,7 @@ def run_reprocess(target_email, limit=None):
         return
 
     # 1. Pobierz maile z ostatnich 60 dni
-    emails = email_handler.fetch_specific_account_history(target_email, days_back=60)
+    emails = email_handler.fetch_specific_account_history(target_email, days_back=60, offline=offline)
     
     if not emails:
         logging.warning("Brak maili do przetworzenia.")
@@ -29,36 +36,29 @@ def run_reprocess(target_email, limit=None):
     logging.info(f"Pobrano {len(emails)} maili. Analiza...")
     processed_count = 0 
     
-    # 2. Przetwarzaj maile
-    for source, msg in emails:
+    # 2. Wstępna analiza (leniwie - maile dekodowane dopiero, gdy pętla po nie sięga)
+    entries = _iter_entries(email_handler, emails, target_email)
+
+    # 3. Tryb batch: odpowiedzi AI z kolejki offline, bez requestów na żywo.
+    # Do kolejki (płatny batch) trafiają maile najwyżej limit zamówień rozpoznanych przez handlery.
+    if batch:
+        entries = _prefetch_from_batch_queue(email_handler, entries, limit)
+        if entries is None:
+            return
+    
+    # 4. Przetwarzaj maile
+    for source, msg, email_date, subject, body, recipient, recipient_name in entries:
         if limit and processed_count >= limit:
             logging.info(f"🛑 Osiągnięto limit {limit}.")
             break
 
         try:
-            email_date = email_handler.extract_email_date(msg)
-            raw_subject = msg.get("Subject", "")
-            subject = email_handler.decode_email_subject(raw_subject)
-            
-            # Szybki filtr po słowach kluczowych
-            keywords = ["paczka", "zamówienie", "order", "delivery", "dostawa", "odbierz", "nadana", "status", "inpost", "dhl", "dpd", "gls", "poczta"]
-            if not any(k in subject.lower() for k in keywords):
-                continue
-
-            body = email_handler.get_email_body(msg)
-            
-            # Wyciągnij odbiorcę
-            import re
-            to_header = msg.get("To", "")
-            match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', to_header)
-            recipient = match.group(0) if match else target_email
-            
             logging.info(f"🔍 Analiza: {email_date} | {subject[:50]}...")
             
             # Wymuś przetwarzanie (force_process=True)
             order_data = email_handler.analyze_email(
                 subject, body, recipient, source, 
-                recipient_name=recipient, email_message=msg, email_date=email_date,
+                recipient_name=recipient_name, email_message=msg, email_date=email_date,
                 force_process=True 
             )
             
@@ -98,4 +98,84 @@ def run_reprocess(target_email, limit=None):
     except Exception as e:
         logging.error(f"❌ Błąd aktualizacji kolorów: {e}")
             
-    logging.info(f"🏁 Zakończono reprocess. Przetworzono: {processed_count} zamówień.")
\ No newline at end of file
+    logging.info(f"🏁 Zakończono reprocess. Przetworzono: {processed_count} zamówień.")
+
+
+def _iter_entries(email_handler, emails, target_email):
+    """Generator (source, msg, data, temat, treść, odbiorca, nazwa odbiorcy) dla maili z pasującym tematem"""
+    for source, msg in emails:
+        try:
+            email_date = email_handler.extract_email_date(msg)
+            raw_subject = msg.get("Subject", "")
+            subject = email_handler.decode_email_subject(raw_subject)
+            
+            # Szybki filtr po słowach kluczowych
+            keywords = ["paczka", "zamówienie", "order", "delivery", "dostawa", "odbierz", "nadana", "status", "inpost", "dhl", "dpd", "gls", "poczta"]
+            if not any(k in subject.lower() for k in keywords):
+                continue
+
+            body = email_handler.get_email_body(msg)
+            
+            # Wyciągnij odbiorcę
+            to_header = msg.get("To", "")
+            match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', to_header)
+            recipient = match.group(0) if match else target_email
+            yield source, msg, email_date, subject, body, recipient, extract_recipient_name(to_header)
+        except Exception as e:
+            logging.error(f"Błąd przy reprocess maila: {e}")
+
+
+def _select_batch_entries(email_handler, entries, limit=None):
+    """
+    Maile rozpoznane przez handlery przewoźników (najwyżej limit) i zadania AI dla tych, które wymagają AI.
+    Zwraca (maile, zadania). Mail obsłużony szybką ścieżką liczy się do limitu, ale nie trafia do kolejki.
+    """
+    selected, items = [], []
+    for entry in entries:
+        if limit and len(selected) >= limit:
+            break
+        source, msg, email_date, subject, body, recipient, recipient_name = entry
+        email_info = {'subject': subject, 'body': body, 'recipient': recipient, 'recipient_name': recipient_name,
+                      'user_key': recipient.split('@')[0].lower()}
+        handler, probable_status = email_handler._ai_prefetch_handler(email_info, source, msg, email_date, force_process=True)
+        if handler is False:
+            continue
+        selected.append(entry)
+        if handler:
+            items.append({'email_body': body, 'subject': subject, 'carrier_name': handler.name,
+                          'recipient_email': recipient, 'probable_status': probable_status})
+    return selected, items
+
+
+def _prefetch_from_batch_queue(email_handler, entries, limit=None):
+    """
+    Odpowiedzi AI dla maili reprocessu z kolejki offline (BatchExtractionQueue).
+    Zadania wysyłane są jednym batchem; przerwany reprocess wznawia oczekiwanie na wysłany wcześniej batch.
+    Po powrocie requesty na żywo są wyłączone - mail bez odpowiedzi z kolejki idzie do regexów.
+    Zwraca maile do przetworzenia albo None, gdy batch nie zakończył się w czasie max_wait_hours
+    (wyniki przy kolejnym uruchomieniu).
+    """
+    from batch_extraction_queue import BatchExtractionQueue
+
+    openai_handler = email_handler.openai_handler
+    openai_handler.allow_live_requests = False
+    queue = BatchExtractionQueue.from_config()
+    selected, items = _select_batch_entries(email_handler, entries, limit)
+
+    if queue.submitted:
+        logging.info(f"🔁 Kolejka offline: wznawiam oczekiwanie na batch {queue.state['batch_id']}")
+    else:
+        queue.clear()
+        if not openai_handler.queue_carrier_jobs(queue, items):
+            logging.info("📭 Kolejka offline: brak maili wymagających AI")
+            return selected
+        queue.submit()
+
+    batch = queue.wait()
+    if batch is None:
+        return None
+
+    loaded = openai_handler.load_queue_results(queue.results(batch))
+    logging.info(f"📦 Kolejka offline: {loaded} odpowiedzi AI gotowych do zapisu w arkuszu")
+    queue.clear()
+    return selected
@@ -0,0 +1,170 @@
+import logging
+import re
+from functools import lru_cache
+
+# Te same flagi co we wzorcach (.{0,200}marker.{0,N}) używanych wcześniej w _extract_section
+_FLAGS = re.IGNORECASE | re.DOTALL
+
+# Ile znaków przed markerem trafia do fragmentu
+CHARS_BEFORE = 200
+
+
+@lru_cache(maxsize=512)
+def compile_marker(marker):
+    """Kompiluje marker raz (cache na cały proces)"""
+    return re.compile(marker, _FLAGS)
+
+
+def _window_span(text, marker_regex, chars_after, chars_before=CHARS_BEFORE):
+    """
+    Indeksowy odpowiednik re.search(f"(.{{0,{chars_before}}}marker.{{0,{chars_after}}})", text, IGNORECASE | DOTALL).
+
+    Regex z wiodącym .{0,200} dla każdej pozycji startu cofa się do 200 znaków, szukając markera.
+    Wynik da się wyznaczyć bez tego:
+    - start = (pierwsze wystąpienie markera) - chars_before (nie mniej niż 0),
+    - zachłanne .{0,200} wybiera ostatnie wystąpienie markera w [start, start + chars_before],
+    - koniec = koniec tego wystąpienia + chars_after (nie więcej niż długość tekstu).
+    Zwraca (start, koniec) albo None.
+    """
+    first = marker_regex.search(text)
+    if not first:
+        return None
+
+    start = max(0, first.start() - chars_before)
+    last = first
+    while True:
+        following = marker_regex.search(text, last.start() + 1)
+        if not following or following.start() > start + chars_before:
+            break
+        last = following
+
+    return start, min(len(text), last.end() + chars_after)
+
+
+def find_section_span(text, section_marker, chars_after=300):
+    """
+    Zakres (start, koniec) fragmentu wokół markera - ten sam wynik co dawne _extract_section
+    (kolejno: marker, marker ze spacjami jako \\s+, marker w tagu HTML). None, gdy brak.
+    """
+    # Marker z | zmieniałby znaczenie całego wzorca (.{0,200}a|b.{0,N}) - zostaje stary regex
+    if isinstance(section_marker, str) and '|' not in section_marker:
+        flexible_marker = section_marker.replace(" ", "\\s+")
+        for marker in (section_marker, flexible_marker):
+            try:
+                span = _window_span(text, compile_marker(marker), chars_after)
+            except re.error as e:
+                logging.error(f"Błąd w _extract_section dla wzorca {marker}: {e}")
+                continue
+            if span:
+                return span
+        patterns = [f"(<[^>]*>{section_marker}[^<]*</[^>]*>.{{0,{chars_after}}})"]
+    elif isinstance(section_marker, str):
+        flexible_marker = section_marker.replace(" ", "\\s+")
+        patterns = [
+            f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})",
+            f"(.{{0,200}}{flexible_marker}.{{0,{chars_after}}})",
+            f"(<[^>]*>{section_marker}[^<]*</[^>]*>.{{0,{chars_after}}})"
+        ]
+    else:
+        patterns = [f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})"]
+
+    for pattern in patterns:
+        try:
+            match = compile_marker(pattern).search(text)
+            if match:
+                return match.span(1)
+        except Exception as e:
+            logging.error(f"Błąd w _extract_section dla wzorca {pattern}: {e}")
+
+    return None
+
+
+def find_section(text, section_marker, chars_after=300):
+    """Fragment tekstu wokół markera (jak dawne _extract_section) albo None"""
+    span = find_section_span(text, section_marker, chars_after)
+    return text[span[0]:span[1]] if span else None
+
+
+def merge_spans(spans):
+    """Łączy nakładające się / stykające się zakresy, wynik w kolejności w tekście"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged]
+
+
+class SectionExtractor:
+    """
+    Ekstrakcja wielu fragmentów z jednej treści maila (general_extract_carrier_content).
+
+    Wynik każdego markera jest zapamiętywany - ten sam marker użyty w kilku grupach wzorców
+    (np. "PIN" w statusie i w kodzie odbioru) jest szukany tylko raz.
+    Zapamiętane zakresy pozwalają połączyć nakładające się fragmenty (SECTION_EXTRACTION['merge_overlapping']).
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._results = {}
+        self._spans = []
+
+    def extract(self, section_marker, chars_after=300):
+        key = (section_marker, chars_after)
+        if key not in self._results:
+            self._results[key] = find_section_span(self.text, section_marker, chars_after)
+
+        span = self._results[key]
+        if not span:
+            return None
+        self._spans.append(span)
+        return self.text[span[0]:span[1]]
+
+    def join(self, sections, max_chars=None):
+        """
+        Łączy znalezione fragmenty.
+        Domyślnie jak dotąd ("\\n\\n".join w kolejności wzorców). Przy merge_overlapping
+        nakładające się fragmenty są łączone (bez powtórzeń tekstu) i przycinane do max_chars.
+        """
+        import config
+
+        if not getattr(config, 'SECTION_EXTRACTION', {}).get('merge_overlapping', False):
+            return "\n\n".join(sections)
+
+        parts = []
+        total = 0
+        for start, end in merge_spans(self._spans):
+            if max_chars is not None:
+                end = min(end, start + max_chars - total)
+                if end <= start:
+                    break
+            parts.append(self.text[start:end])
+            total += end - start
+
+        logging.info(f"✂️ Połączono {len(self._spans)} fragmentów w {len(parts)} rozłącznych sekcji ({total} znaków)")
+        return "\n\n".join(parts)
+
+    def ranked_sections(self, include_rest=True):
+        """
+        Fragmenty w kolejności wzorców (od najważniejszego) bez powtórzeń tekstu - z każdego zakresu
+        tylko część nieobjęta wcześniejszymi. include_rest - na końcu reszta treści (w kolejności w mailu).
+        """
+        spans = list(self._spans)
+        if include_rest:
+            spans.append((0, len(self.text)))
+
+        sections = []
+        covered = []
+        for start, end in spans:
+            position = start
+            for covered_start, covered_end in covered:
+                if covered_end <= position or covered_start >= end:
+                    continue
+                if covered_start > position:
+                    sections.append(self.text[position:covered_start])
+                position = max(position, covered_end)
+            if position < end:
+                sections.append(self.text[position:end])
+            covered = merge_spans(covered + [(start, end)])
+        return [section for section in sections if section.strip()]
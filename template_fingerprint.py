@@ -0,0 +1,267 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from html_document import get_document
+
+_URL = re.compile(r'https?://\S+')
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+# Ciągi zamaskowanych tokenów (także rozdzielone interpunkcją, np. "71-637 Szczecin") liczone jako jeden
+_MASKED_RUN = re.compile(r'#(?: [^\w\s#]? ?#)+')
+_DATE_VALUE = re.compile(r'^\d{1,2}\.\d{1,2}\.\d{4}$')
+
+# Pola uzupełniane z nagłówków (odbiorca), a nie z treści - nie są uczone
+IGNORED_FIELDS = ('email', 'customer_name', 'user_key', 'email_source', 'email_date', 'carrier')
+# Pola, które w obrębie jednego szablonu mają zawsze tę samą wartość
+CONSTANT_FIELDS = ('status',)
+
+# Skróty w adresach (ul./al./os./pl.) - część zmiennego adresu, nie szablonu
+ADDRESS_PREFIXES = ('ul', 'al', 'os', 'pl')
+# Powitania i etykiety, po których następuje imię / nazwa (np. "Cześć Jan", "Odbiorca: Anna Nowak")
+NAME_MARKERS = ('cześć', 'witaj', 'witamy', 'hej', 'dobry', 'szanowny', 'szanowna', 'drogi', 'droga',
+                'nadawca', 'odbiorca', 'sprzedawca')
+# Interpunkcja wewnątrz adresu lub nazwy ("5/7", "71-637", "Firlika 20, 71-637 Szczecin")
+_RUN_PUNCTUATION = (',', '-', '/')
+
+# Ile tokenów przed/po wartości tworzy kotwicę
+ANCHOR_TOKENS = 3
+
+
+def _variable_mask(tokens):
+    """
+    Tokeny zmienne w obrębie szablonu (jedna linia): numery i kody (z cyframi), skróty adresowe,
+    a słowa z wielkiej litery tylko na pozycjach nazw - za skrótem adresowym, powitaniem / etykietą
+    albo w ciągu za zmiennym tokenem ("ul. Teofila Firlika 20, 71-637 Szczecin").
+    Pozostałe słowa (początek zdania, statusy "Doręczona" / "Nadana") zostają w szkielecie.
+    """
+    mask = []
+    in_name = False
+    previous = ''
+    for token in tokens:
+        lower = token.lower()
+        variable = False
+        if any(ch.isdigit() for ch in token) or token in ADDRESS_PREFIXES:
+            variable = in_name = True
+        elif lower in NAME_MARKERS:
+            in_name = True
+        elif token[:1].isupper() and in_name:
+            variable = True
+        elif token in _RUN_PUNCTUATION:
+            pass
+        elif token in ('.', ':') and (previous in ADDRESS_PREFIXES or previous.lower() in NAME_MARKERS):
+            pass
+        else:
+            in_name = False
+        mask.append(variable)
+        previous = token
+    return mask
+
+
+def skeleton(text):
+    """Szkielet szablonu: treść bez numerów, kodów, adresów, imion, linków i emaili"""
+    text = _EMAIL.sub(' ', _URL.sub(' ', text or ''))
+    tokens = []
+    for line in text.splitlines():
+        line_tokens = _TOKEN.findall(line)
+        tokens.extend('#' if variable else token.lower() for token, variable in zip(line_tokens, _variable_mask(line_tokens)))
+    return _MASKED_RUN.sub('#', ' '.join(tokens))
+
+
+def _context_regex(tokens):
+    """Regex dla tokenów kontekstu - tokeny z cyframi dowolne, pozostałe dosłownie, białe znaki elastyczne"""
+    parts = [r'\S+?' if any(ch.isdigit() for ch in token) else re.escape(token) for token in tokens]
+    return r'\s*'.join(parts)
+
+
+def _shape_regex(value):
+    """
+    Kształt wartości jednowyrazowej: same cyfry (numer paczki, PIN) - dokładna liczba cyfr;
+    kody mieszane (paczkomat SZC15APP / GDA9N) - ciągi cyfr i liter dowolnej długości; reszta dosłownie
+    """
+    if value.isdigit():
+        return rf'\d{{{len(value)}}}'
+    parts = []
+    for run in re.finditer(r'\d+|[A-ZĄĆĘŁŃÓŚŹŻ]+|[a-ząćęłńóśźż]+|.', value):
+        text = run.group(0)
+        if text.isdigit():
+            parts.append(r'\d+')
+        elif text.isalpha():
+            parts.append('[A-ZĄĆĘŁŃÓŚŹŻ]+' if text.isupper() else '[a-ząćęłńóśźż]+' if text.islower() else re.escape(text))
+        else:
+            parts.append(re.escape(text))
+    return ''.join(parts)
+
+
+class TemplateStore:
+    """
+    Szablony powiadomień przewoźników rozpoznawane po odcisku (fingerprint) treści.
+
+    Maile InPost/DHL/DPD generowane są z szablonów - zmieniają się tylko numery, PIN-y, kody
+    paczkomatów, adresy i daty. Po ekstrakcji AI dla każdego pola zapamiętywana jest kotwica
+    (stały tekst przed wartością, kształt wartości, dla wartości wielowyrazowych - tekst po niej).
+    Kolejny mail z tym samym odciskiem jest wyciągany kotwicami bez requestu AI.
+
+    Szablon staje się aktywny dopiero, gdy kotwice odtworzyły odpowiedź AI dla min_confirmations maili
+    (pierwszy uczy, kolejne potwierdzają). Rozbieżność z AI uczy kotwice od nowa.
+    """
+
+    def __init__(self, path="template_fingerprints.json", min_confirmations=2, max_templates=500):
+        self.path = path
+        self.min_confirmations = min_confirmations
+        self.max_templates = max_templates
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.templates = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.error(f"Błąd podczas ładowania szablonów maili: {e}")
+        return {}
+
+    def _save(self):
+        tmp_file = self.path + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.templates, f, ensure_ascii=False)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            logging.error(f"Błąd podczas zapisywania szablonów maili: {e}")
+
+    @staticmethod
+    def source_text(subject, body):
+        """Tekst, w którym szukane są wartości: temat i widoczny tekst treści"""
+        return f"{subject or ''}\n{get_document(body).text}"
+
+    @staticmethod
+    def signature(carrier, source):
+        return hashlib.sha1(f"{carrier.lower()}\n{skeleton(source)}".encode('utf-8')).hexdigest()
+
+    # --- Uczenie ---
+
+    @staticmethod
+    def _locate(source, value):
+        """(start, koniec, transformacja) pierwszego wystąpienia wartości jako całych słów albo None"""
+        # Daty AI zwraca jako DD.MM.YYYY, w treści bywają z '-' lub '/'
+        variants = [(value, None)]
+        if _DATE_VALUE.match(value):
+            variants += [(value.replace('.', separator), 'date') for separator in ('-', '/')]
+        for variant, transform in variants:
+            # Całe słowa - kod odbioru "123456" nie może zostać znaleziony wewnątrz numeru paczki
+            match = re.search(r'(?<!\w)' + re.escape(variant) + r'(?!\w)', source)
+            if match:
+                return match.start(), match.end(), transform
+        return None
+
+    @staticmethod
+    def _build_anchor(source, start, end, value):
+        prefix = _context_regex(_TOKEN.findall(source[max(0, start - 80):start])[-ANCHOR_TOKENS:])
+        if not re.search(r'\s', value):
+            return prefix + r'\s*(?P<value>' + _shape_regex(value) + ')'
+
+        suffix_tokens = _TOKEN.findall(source[end:end + 80])[:ANCHOR_TOKENS]
+        suffix = r'\s*' + _context_regex(suffix_tokens) if suffix_tokens else r'\s*$'
+        return prefix + r'\s*(?P<value>[^\n]+?)' + suffix
+
+    @staticmethod
+    def _apply_anchor(anchor, source):
+        match = re.search(anchor['regex'], source, re.MULTILINE)
+        if not match:
+            return None
+        value = match.group('value').strip()
+        return re.sub(r'[-/]', '.', value) if anchor.get('transform') == 'date' else value
+
+    def _build_template(self, source, response):
+        """Kotwice dla pól odpowiedzi AI; None, gdy któregoś pola nie da się odnaleźć w treści"""
+        anchors = {}
+        constants = {}
+        for field, value in response.items():
+            if field in IGNORED_FIELDS or value in (None, "", [], {}):
+                continue
+            if field in CONSTANT_FIELDS:
+                constants[field] = value
+                continue
+            location = self._locate(source, value.strip()) if isinstance(value, str) else None
+            if location is None:
+                logging.debug(f"Szablon: pole {field} nie występuje w treści - szablon nie będzie używany")
+                return None
+            start, end, transform = location
+            anchor = {'regex': self._build_anchor(source, start, end, source[start:end]), 'transform': transform}
+            if self._apply_anchor(anchor, source) != value.strip():
+                logging.debug(f"Szablon: kotwica pola {field} nie odtwarza wartości - szablon nie będzie używany")
+                return None
+            anchors[field] = anchor
+        return {'anchors': anchors, 'constants': constants}
+
+    def _extract_with(self, template, source):
+        record = dict(template['constants'])
+        for field, anchor in template['anchors'].items():
+            value = self._apply_anchor(anchor, source)
+            if not value:
+                return None
+            record[field] = value
+        return record
+
+    @staticmethod
+    def _same_values(record, response):
+        learned = {k: v for k, v in response.items() if k not in IGNORED_FIELDS and v not in (None, "", [], {})}
+        return record is not None and all(str(record.get(k, '')).strip() == str(v).strip() for k, v in learned.items())
+
+    def learn(self, signature, carrier, source, response):
+        """Zapamiętuje (albo potwierdza) szablon na podstawie odpowiedzi AI"""
+        if not isinstance(response, dict):
+            return
+        with self._lock:
+            template = self.templates.get(signature)
+            if template and template.get('anchors') is not None and self._same_values(self._extract_with(template, source), response):
+                template['confirmations'] += 1
+                template['last_used'] = time.time()
+                if template['confirmations'] == self.min_confirmations:
+                    logging.info(f"🧩 Szablon {carrier} {signature[:10]} potwierdzony - kolejne maile bez AI")
+            else:
+                built = self._build_template(source, response) or {'anchors': None, 'constants': {}}
+                self.templates[signature] = dict(built, carrier=carrier, confirmations=1, last_used=time.time())
+                self._evict()
+            self._save()
+
+    def _evict(self):
+        if len(self.templates) <= self.max_templates:
+            return
+        oldest = sorted(self.templates, key=lambda key: self.templates[key].get('last_used', 0))
+        for key in oldest[:len(self.templates) - self.max_templates]:
+            del self.templates[key]
+
+    # --- Ekstrakcja ---
+
+    def is_active(self, signature):
+        """Czy szablon jest potwierdzony (maile z nim zwykle nie potrzebują AI)"""
+        with self._lock:
+            template = self.templates.get(signature)
+            return bool(template) and template.get('anchors') is not None and template['confirmations'] >= self.min_confirmations
+
+    def extract(self, signature, source):
+        """Rekord wyciągnięty kotwicami aktywnego szablonu albo None (potrzebne AI)"""
+        with self._lock:
+            template = self.templates.get(signature)
+            if not template or template.get('anchors') is None or template['confirmations'] < self.min_confirmations:
+                return None
+            record = self._extract_with(template, source)
+            if record is None:
+                return None
+            template['last_used'] = time.time()
+            self.hits += 1
+        return record
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for t in self.templates.values()
+                         if t.get('anchors') is not None and t['confirmations'] >= self.min_confirmations)
+            return {'templates': len(self.templates), 'active': active, 'hits': self.hits}
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Lokalny serwer udający Batch API OpenAI (pliki + batche) dla testów kolejki offline.
+
+Obsługiwane: POST /v1/files, POST /v1/batches, GET /v1/batches/{id}, GET /v1/files/{id}/content.
+Batch kończy się po complete_after odpytaniach statusu; odpowiedź na każde zadanie tworzy funkcja
+responder(body) -> treść wiadomości (str) albo None (zadanie z błędem).
+
+Uruchomienie ręczne: python3 tests/batch_stub_server.py  (port 8765)
+"""
+
+import json
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(body):
+    return json.dumps({"status": "unknown", "info": "unknown"})
+
+
+class BatchStubServer:
+    def __init__(self, responder=default_responder, complete_after=1, port=0):
+        self.responder = responder
+        self.complete_after = complete_after
+        self.files = {}
+        self.batches = {}
+        self.polls = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Logika Batch API ---
+
+    def _add_file(self, filename, content, purpose):
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed", "content": content
+        }
+        return {k: v for k, v in self.files[file_id].items() if k != "content"}
+
+    def _create_batch(self, request):
+        batch_id = f"batch_{len(self.batches) + 1}"
+        jobs = [json.loads(line) for line in self.files[request["input_file_id"]]["content"].decode("utf-8").splitlines() if line.strip()]
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"], "errors": None,
+            "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+            "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "request_counts": {"total": len(jobs), "completed": 0, "failed": 0},
+            "_jobs": jobs
+        }
+        self.polls[batch_id] = 0
+        return self._public(self.batches[batch_id])
+
+    def _retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        self.polls[batch_id] += 1
+        if batch["status"] == "in_progress" and self.polls[batch_id] >= self.complete_after:
+            self._complete(batch)
+        return self._public(batch)
+
+    def _complete(self, batch):
+        lines = []
+        failed = 0
+        for number, job in enumerate(batch["_jobs"], 1):
+            content = self.responder(job["body"])
+            if content is None:
+                failed += 1
+                lines.append({"id": f"req_{number}", "custom_id": job["custom_id"], "response": None,
+                              "error": {"code": "server_error", "message": "stub"}})
+                continue
+            lines.append({
+                "id": f"req_{number}", "custom_id": job["custom_id"], "error": None,
+                "response": {"status_code": 200, "request_id": f"r{number}", "body": {
+                    "id": f"chatcmpl-{number}", "object": "chat.completion", "model": job["body"]["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+                }}
+            })
+        output = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+        batch["output_file_id"] = self._add_file("output.jsonl", output, "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["request_counts"] = {"total": len(lines), "completed": len(lines) - failed, "failed": failed}
+
+    @staticmethod
+    def _public(batch):
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, raw=False):
+                data = payload if raw else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/v1/files":
+                    # multipart/form-data: pole "purpose" i plik "file"
+                    message = BytesParser().parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body)
+                    fields = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+                    upload = fields["file"]
+                    self._send(200, stub._add_file(upload.get_filename() or "jobs.jsonl", upload.get_payload(decode=True),
+                                                   fields["purpose"].get_payload(decode=True).decode("utf-8")))
+                elif self.path == "/v1/batches":
+                    self._send(200, stub._create_batch(json.loads(body)))
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in stub.batches:
+                    self._send(200, stub._retrieve_batch(parts[2]))
+                elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in stub.files:
+                    self._send(200, stub.files[parts[2]]["content"], raw=True)
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    server = BatchStubServer(port=8765).start()
+    print(f"🧪 Stub Batch API: {server.base_url} (Ctrl+C - koniec)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
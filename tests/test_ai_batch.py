@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Walidacja odpowiedzi requestu zbiorczego (OpenAIHandler._run_carrier_batch / _batch_element).
+
+Odpowiedź AI podstawiona zamiast _call_openai_api. Mail z poprawnym elementem dostaje odpowiedź,
+pozostałe (brak w odpowiedzi, duplikat, numer spoza batcha, element nie-obiekt, zagnieżdżone pola,
+nieznany status) wracają do osobnego requestu - brak ich klucza w wyniku.
+
+Uruchomienie: python3 tests/test_ai_batch.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from openai_handler import OpenAIHandler
+
+KEYS = ['k1', 'k2', 'k3', 'k4']
+
+
+def run_batch(reply, keys=KEYS):
+    handler = OpenAIHandler.__new__(OpenAIHandler)
+    handler._rate_limit = lambda: True
+    handler._build_carrier_batch_prompt = lambda carrier_name, batch, probable_status=None: "prompt"
+    handler._call_openai_api = lambda prompt: reply
+    batch = [(key, {'subject': 'Paczka', 'recipient_email': 'jan@example.com'}, 'treść') for key in keys]
+    return handler._run_carrier_batch("InPost", batch)
+
+
+def test_valid_elements():
+    reply = [
+        {"email_id": 2, "status": "delivered"},
+        {"email_id": "1", "status": "pickup", "pickup_code": "123456"},
+    ]
+    assert run_batch(reply, KEYS[:2]) == {
+        'k1': {"status": "pickup", "pickup_code": "123456"},
+        'k2': {"status": "delivered"},
+    }
+
+
+def test_invalid_elements_fall_back():
+    reply = [
+        {"email_id": 1, "status": "pickup"},
+        {"email_id": 2, "status": "delivered"},
+        {"email_id": 2, "status": "pickup"},                          # duplikat - oba odrzucone
+        {"email_id": 5, "status": "pickup"},                          # spoza batcha
+        {"email_id": 0, "status": "pickup"},
+        "email_id 3: pickup",                                         # nie obiekt
+        {"email_id": 3, "status": "pickup", "info": {"code": "1"}},   # zagnieżdżone pole
+        {"email_id": 4, "status": "odebrana"},                        # nieznany status
+        {"status": "pickup"},                                         # bez email_id
+    ]
+    assert set(run_batch(reply)) == {'k1'}
+
+
+def test_wrapped_and_non_array_replies():
+    wrapped = {"results": [{"email_id": 1, "status": "pickup"}, {"email_id": 3, "status": "transit"}]}
+    assert set(run_batch(wrapped)) == {'k1', 'k3'}
+
+    assert run_batch({"email_id": 1, "status": "pickup"}) == {}
+    assert run_batch(None) == {}
+    assert run_batch("[]") == {}
+
+
+def test_rate_limit_stops_batch():
+    handler = OpenAIHandler.__new__(OpenAIHandler)
+    handler._rate_limit = lambda: False
+    assert handler._run_carrier_batch("InPost", [('k1', {}, ''), ('k2', {}, '')]) is None
+
+
+if __name__ == "__main__":
+    test_valid_elements()
+    test_invalid_elements_fall_back()
+    test_wrapped_and_non_array_replies()
+    test_rate_limit_stops_batch()
+    print("✅ Request zbiorczy: poprawne elementy przyjęte, pozostałe maile osobno")
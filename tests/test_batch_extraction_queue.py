@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Kolejka offline (batch_extraction_queue.BatchExtractionQueue) na lokalnym serwerze Batch API.
+
+Zadania zapisane do pliku JSONL, wysłane jednym batchem, wyniki pobrane po zakończeniu;
+zadanie z błędem pomijane, stan batcha pozwala wznowić oczekiwanie w nowym procesie.
+
+Uruchomienie: python3 tests/test_batch_extraction_queue.py  (wymaga: pip install openai pytest; bez openai testy są pomijane)
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_extraction_queue import BatchExtractionQueue
+from batch_stub_server import BatchStubServer
+
+
+def openai_client(base_url):
+    """Klient openai; bez biblioteki test jest pomijany (skip), a nie zaliczany"""
+    openai = pytest.importorskip("openai")
+    return openai.OpenAI(base_url=base_url, api_key="test")
+
+
+def responder(body):
+    """Odpowiedź modelu: kod odbioru z treści promptu; prompt z 'BŁĄD' kończy się błędem zadania"""
+    prompt = body["messages"][-1]["content"]
+    if "BŁĄD" in prompt:
+        return None
+    return json.dumps({"status": "pickup", "pickup_code": prompt.split()[-1]})
+
+
+def messages(text):
+    return [{"role": "system", "content": "Wyciągnij dane"}, {"role": "user", "content": text}]
+
+
+def test_queue_round_trip():
+    server = BatchStubServer(responder, complete_after=2).start()
+    try:
+        client = openai_client(server.base_url)
+        job_file = os.path.join(tempfile.mkdtemp(), "jobs.jsonl")
+        queue = BatchExtractionQueue(client, job_file=job_file, poll_interval=0)
+        queue.add("mail-1", "gpt-4o", messages("Kod odbioru 111111"))
+        queue.add("mail-2", "gpt-4o", messages("BŁĄD"))
+        queue.add("mail-3", "gpt-4o", messages("Kod odbioru 333333"))
+        batch_id = queue.submit()
+
+        # Nowy proces (np. po przerwaniu reprocessu) wznawia oczekiwanie na ten sam batch
+        resumed = BatchExtractionQueue(client, job_file=job_file, poll_interval=0)
+        assert resumed.submitted and resumed.state['batch_id'] == batch_id
+
+        batch = resumed.wait()
+        assert batch.status == "completed"
+        contents = resumed.results(batch)
+        assert set(contents) == {"mail-1", "mail-3"}
+        assert json.loads(contents["mail-3"])["pickup_code"] == "333333"
+
+        resumed.clear()
+        assert not os.path.exists(job_file) and not BatchExtractionQueue(client, job_file=job_file).submitted
+    finally:
+        server.stop()
+
+
+def test_wait_timeout_keeps_state():
+    server = BatchStubServer(responder, complete_after=1000).start()
+    try:
+        client = openai_client(server.base_url)
+        job_file = os.path.join(tempfile.mkdtemp(), "jobs.jsonl")
+        queue = BatchExtractionQueue(client, job_file=job_file, poll_interval=0, max_wait_hours=0)
+        queue.add("mail-1", "gpt-4o", messages("Kod odbioru 111111"))
+        queue.submit()
+        assert queue.wait() is None
+        assert BatchExtractionQueue(client, job_file=job_file).submitted
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_queue_round_trip()
+    test_wait_timeout_keeps_state()
+    print("✅ Kolejka offline: wysyłka, wznowienie i wyniki batcha")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Rejestr wzorców przewoźników (carrier_patterns.py) a dawne wzorce wpisane w handlerach.
+
+1. Zgodność: dla każdego maila z syntetycznego korpusu (każdy przewoźnik i typ powiadomienia)
+   wzorzec z rejestru musi zwrócić tę samą wartość co dawny re.search z handlera / fallbacku.
+2. Mikro-benchmark: re.search(wzorzec, tekst, flagi) vs PATTERNS.search + statystyki wzorców.
+
+Uruchomienie: python3 tests/test_carrier_patterns.py
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from carrier_patterns import PATTERNS
+
+# (przewoźnik, nazwa w rejestrze, nazwa grupy) -> dawne wzorce (w kolejności sprawdzania) i flagi
+LEGACY = [
+    ('AliExpress', 'order_number_subject', 'order_number',
+     [r'(?:Zamówienie|Order|Order ID|Your)[:\s#]+(\d{10,})', r'(\d{15,16})\s+is\s+closed'], re.IGNORECASE),
+    ('AliExpress', 'order_number_body', 'order_number',
+     [r'(?:Order ID|Order No\.|Numer zamówienia|Zamówienie)[:\s]+(\d{10,})'], re.IGNORECASE),
+    ('AliExpress', 'order_link', 'link',
+     [r'(https://www\.aliexpress\.com/p/order/detail\.html\?orderId=\d+[^\s"<>]+)'], 0),
+    ('InPost', 'package_number_24', 'package_number', [r'(?<!\d)(\d{24})(?!\d)'], 0),
+    ('InPost', 'package_number_long', 'package_number', [r'(\d{20,30})'], 0),
+    ('InPost', 'package_number_subject', 'package_number', [r'[Pp]aczka\s+(\d+)'], 0),
+    ('InPost', 'package_number_fallback', 'package_number', [r'(\d{24})'], 0),
+    ('InPost', 'pickup_code', 'pickup_code', [r'(?:Kod odbioru|Kod|PIN)[:\s]+(\d{6})'], 0),
+    ('InPost', 'pickup_code_label', 'pickup_code', [r"Kod odbioru:\s*(\d+)"], 0),
+    ('InPost', 'pickup_code_fallback', 'pickup_code', [r'(?:kod odbioru|kodem|kod)[:\s]*(\d{6})'], re.IGNORECASE),
+    ('InPost', 'pickup_code_html', 'pickup_code', [
+        r'[Kk]od\s+odbioru[:=\s]*[\s<>]*(\d{6})[\s<>]*',
+        r'<[^>]*>Kod\s+odbioru<[^>]*>[^<]*<[^>]*>(\d{6})<',
+        r'Twój kod[^\d]*(\d{6})',
+        r'<(?:b|strong)[^>]*>(\d{6})<\/(?:b|strong)>',
+        r'(?:kod\s+(?:paczki|przesyłki|do\s+odbioru))[^\d<>]*(\d{6})'
+    ], re.IGNORECASE),
+    ('InPost', 'location_code', 'location_code', [r'([A-Z]{3}\d{2}[A-Z]{3,4})'], 0),
+    ('InPost', 'location_code_short', 'location_code', [r'([A-Z]{3}\d{2}[A-Z]{2,4})'], 0),
+    ('InPost', 'pickup_address', 'address', [
+        r'(?:adres|miejsce|znajduje się|lokalizacja)[^<>\n:]*:?[^<>\n]*?([^<>\n]{10,100}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{1,3})[^<>\n]{5,100})',
+        r'(?:na stacji|przy)[^<>\n]*?([^<>\n]{5,100})'
+    ], re.IGNORECASE),
+    ('InPost', 'pickup_deadline', 'date', [
+        r'[Cc]zas na odbi[óo]r\s+do[:\s]*[^<]*?(\d{1,2}[/-]\d{1,2}).*?(\d{1,2}:\d{2})',
+        r'[Tt]ermin\s+odbioru[:\s]*[^<]*?(\d{1,2}[/-]\d{1,2})'
+    ], 0),
+    ('InPost', 'phone', 'phone', [r'(?:telefon|phone|tel)[^<>:\d]*[:<>]*\s*([+]?[\d\s\-]{7,15})'], re.IGNORECASE),
+    ('InPost', 'trade_order_id', 'order_number', [r'tradeOrderId=(\d+)'], 0),
+    ('DHL', 'jjd', 'package_number', [r'(JJD\d+)'], 0),
+    ('DHL', 'jjd_numbered', 'package_number', [r'o numerze (JJD\d+)'], 0),
+    ('DHL', 'tracking_number', 'package_number', [r'(JJD\d{18,25}|3S\d{10,15}|JVGL\d{10,15})'], 0),
+    ('DHL', 'secondary_package_number', 'package_number', [r'przesyłki\s+(\d{8,15})'], 0),
+    ('DHL', 'expected_delivery_date', 'date',
+     [r'planowane doręczenie[^\d]+([\d]{1,2}-[\d]{1,2}-[\d]{4})'], re.IGNORECASE),
+    ('DHL', 'delivery_date', 'date', [r'w dniu (\d{2}-\d{2}-\d{4})'], 0),
+    ('DHL', 'sender', 'sender', [r'paczkę od ([^?]+)\?'], 0),
+    ('DHL', 'sender_uppercase', 'sender', [r'paczk[aę] od ([A-Z]+)[?]'], 0),
+    ('DHL', 'pickup_code', 'pickup_code',
+     [r'podając PIN (\d{6})', r'PIN do odbioru[^:]*:\s*(\d{6})', r'PIN:\s*(\d{6})'], re.IGNORECASE),
+    ('DHL', 'pickup_code_pin', 'pickup_code', [r'PIN\s+(\d{6})'], 0),
+    ('DHL', 'pickup_code_fallback', 'pickup_code', [r'PIN\s*(\d{6})'], re.IGNORECASE),
+    ('DHL', 'pickup_deadline', 'date', [r'odbierz ją do (\d{2}-\d{2}-\d{4})'], re.IGNORECASE),
+    ('DHL', 'pickup_deadline_exact', 'date', [r'odbierz ją do (\d{2}-\d{2}-\d{4})'], 0),
+    ('DHL', 'pickup_location', 'location', [
+        r'DHL BOX[^A-Z0-9]*([A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)',
+        r'AUTOMAT[^A-Z0-9]*([A-Za-z0-9\s,.]+\d{5}\s[A-Za:z]+)'
+    ], re.IGNORECASE),
+    ('DHL', 'pickup_location_automat', 'location',
+     [r'AUTOMAT[^A-Z0-9]*([A-Za-z\s,.]+\d{1,5},\s*\d{5}\s[A-Załż]+)'], re.IGNORECASE),
+    ('DHL', 'available_hours', 'hours', [r'Godziny otwarcia:(.*?)(?:\n\n|\r\n\r\n|$)'], re.DOTALL),
+    ('DPD', 'pickup_code_label', 'pickup_code', [r"Kod odbioru:\s*(\d+)"], 0),
+    ('DPD', 'package_number_long', 'package_number', [r'(\d{20,30})'], 0),
+    ('DPD', 'delivery_date', 'date', [r'w dniu (\d{2}-\d{2}-\d{4})'], 0),
+    ('DPD', 'package_number_fallback', 'package_number', [r'(\d{13}[A-Z]?)'], 0),
+    ('DPD', 'reference_number', 'reference_number', [r'Numer\s+referencyjny[^:]*:\s*([A-Z0-9]+)'], 0),
+    ('GLS', 'package_number', 'package_number',
+     [r'(GL\d+)', r'(\d{10,15})', r'przesyłki[:\s]+(\w+)'], re.IGNORECASE),
+    ('GLS', 'package_number_sent', 'package_number',
+     [r'(GL\d+)', r'(\d{10,15})', r'przesyłki[:\s]+(\w+)', r'numer[:\s]+(\w+)'], re.IGNORECASE),
+    ('PocztaPolska', 'package_number', 'package_number',
+     [r'(?:numerze|numer=)\s*(?:<strong>|<b>|&nbsp;)?\s*([A-Z]{2}\d{9,}[A-Z]{0,2}|00\d{18})'], 0),
+    ('PocztaPolska', 'package_number_px', 'package_number', [r'\b(PX\d{9,}[A-Z]{0,2})\b'], 0),
+    ('PocztaPolska', 'pickup_code', 'pickup_code', [r'(?:Kod|PIN)[:\s]+(\d{6})'], re.IGNORECASE),
+    ('PocztaPolska', 'courier_phone', 'phone', [r'Telefon do kuriera:?\s*(\d{3}[\s-]?\d{3}[\s-]?\d{3})'], 0),
+    ('Common', 'date', 'date', [r'(\d{2}[.-]\d{2}[.-]\d{4})', r'(\d{4}-\d{2}-\d{2})', r'(\d{2}/\d{2}/\d{4})'], 0),
+]
+
+# Syntetyczne powiadomienia: każdy przewoźnik i typ powiadomienia
+NOTIFICATIONS = [
+    "Order 3054169918883922: Zamówienie potwierdzone. Your 3054169918883922 is closed",
+    "Numer zamówienia: 8201234567890123 https://www.aliexpress.com/p/order/detail.html?orderId=8201234567890123&x=1",
+    "InPost: Paczka 620123456789012345678901 została nadana. tradeOrderId=3054169918883922",
+    "Twoja paczka czeka w Paczkomacie SZC15APP, ul. Mickiewicza 12, 70-001 Szczecin. "
+    "Kod odbioru: 654321. Czas na odbiór do: 12/05 godz. 14:30. Telefon: +48 600 100 200",
+    "<td>Kod odbioru</td><td><b>123456</b></td> Termin odbioru: 15-06 Paczkomat POZ01M przy stacji Orlen",
+    "Paczka 620123456789012345678901 została dostarczona. Odebrana w dniu 12-05-2025",
+    "DHL: Twoja przesyłka JJD000030212345678901234 już do Ciebie jedzie. Czekasz na paczkę od CAINIAO? "
+    "Numer przesyłki 12345678901, planowane doręczenie: 14-05-2025",
+    "DHL: paczka o numerze JJD000030212345678901234 czeka. Odbierz, podając PIN 445566. "
+    "Odbierz ją do 20-05-2025. AUTOMAT DHL BOX 24/7, Teofila Firlika 20, 71-637 Szczecin\n"
+    "Godziny otwarcia: pon-nd 00:00-24:00\n\nPozdrawiamy",
+    "DHL: przesyłka o numerze JJD000030212345678901234 została doręczona w dniu 21-05-2025. 3S1234567890123",
+    "DPD: Twoja paczka 1234567890123A została nadana. Numer referencyjny (sklep): ABC123XYZ",
+    "DPD Pickup: Kod odbioru: 987654, paczka 12345678901234567890123 w punkcie. Doręczone w dniu 01-06-2025",
+    "GLS: Numer przesyłki: GL12345678901, paczka gotowa do odbioru. numer: XYZ987",
+    "GLS: Twoja przesyłka 123456789012 została dostarczona",
+    "Poczta Polska: przesyłka o numerze <strong>PX1234567890PL</strong> awizo, Kod PIN: 112233. "
+    "Telefon do kuriera: 600-100-200. Nadana 2025-05-10, doręczona 12/05/2025",
+    "Poczta Polska: śledź numer=00123456789012345678 oraz PX9876543210",
+    "Newsletter bez numerów przesyłek - nic do znalezienia.",
+]
+
+FILLER = '<table width="100%"><tr><td style="font-family:Arial">Regulamin, polityka prywatności.</td></tr></table>\n'
+
+
+def build_corpus(filler_repeat=0):
+    return [FILLER * filler_repeat + text + FILLER * filler_repeat for text in NOTIFICATIONS]
+
+
+def legacy_search(patterns, flags, text):
+    for pattern in patterns:
+        match = re.search(pattern, text, flags)
+        if match:
+            return match.group(1)
+    return None
+
+
+def test_registry_matches_legacy():
+    mismatches = []
+    for text in build_corpus() + build_corpus(filler_repeat=20):
+        for carrier, name, group, patterns, flags in LEGACY:
+            expected = legacy_search(patterns, flags, text)
+            match = PATTERNS.search(carrier, name, text)
+            actual = match.group(group) if match else None
+            if expected != actual:
+                mismatches.append((carrier, name, expected, actual))
+
+    for mismatch in mismatches:
+        print(f"❌ {mismatch}")
+    assert not mismatches, f"{len(mismatches)} różnic między rejestrem a dawnymi wzorcami"
+
+
+def test_pickup_address_template():
+    text = "Paczkomat SZC15APP, ul. Mickiewicza 12, 70-001 Szczecin"
+    legacy = re.search(r'SZC15APP[^<>\n]*?([^<>\n]{10,100}(?:ul\.|ulica|aleja|al\.|plac|[0-9]{1,3})[^<>\n]{5,100})',
+                       text, re.IGNORECASE)
+    match = PATTERNS.search('InPost', 'pickup_address_after_code', text, code="SZC15APP")
+    assert match and match.group('address') == legacy.group(1)
+
+
+def test_search_each_and_stats():
+    PATTERNS.reset_stats()
+    text = "<b>123456</b> Twój kod: 654321"
+    codes = [m.group('pickup_code') for m in PATTERNS.search_each('InPost', 'pickup_code_html', text)]
+    assert codes == ['654321', '123456']
+
+    stats = {row['pattern']: row for row in PATTERNS.get_stats()}
+    assert stats['InPost.pickup_code_html[2]'] == dict(stats['InPost.pickup_code_html[2]'], calls=1, hits=1)
+    assert stats['InPost.pickup_code_html[0]']['hits'] == 0
+    assert PATTERNS.search('DHL', 'jjd', "") is None
+
+
+def run_benchmark(rounds=50, repeat=3):
+    corpus = build_corpus(filler_repeat=20)
+
+    def legacy():
+        for text in corpus:
+            for _, _, _, patterns, flags in LEGACY:
+                legacy_search(patterns, flags, text)
+
+    def registry():
+        for text in corpus:
+            for carrier, name, _, _, _ in LEGACY:
+                PATTERNS.search(carrier, name, text)
+
+    def measure(func):
+        # Najlepszy z kilku przebiegów - pojedynczy pomiar jest zaszumiony
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    legacy_time = measure(legacy)
+    PATTERNS.reset_stats()
+    registry_time = measure(registry)
+
+    searches = rounds * len(corpus) * len(LEGACY)
+    print(f"📊 {len(corpus)} maili x {len(LEGACY)} wzorców x {rounds} powtórzeń ({searches} wyszukiwań)")
+    print(f"   re.search w handlerach: {legacy_time * 1000:.0f} ms")
+    print(f"   PATTERNS.search:        {registry_time * 1000:.0f} ms (ze statystykami)")
+    print("   Najwolniejsze wzorce:")
+    for row in PATTERNS.get_stats(top=5):
+        print(f"   {row['pattern']}: {row['calls']} wywołań, {row['hits']} trafień, {row['total_ms']} ms")
+
+
+if __name__ == "__main__":
+    test_registry_matches_legacy()
+    test_pickup_address_template()
+    test_search_each_and_stats()
+    print("✅ Rejestr wzorców zgodny z dawnymi wzorcami handlerów")
+    run_benchmark()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Dekodowanie części maila (parsed_email.decode_payload).
+
+1. Poprawność: polski tekst w UTF-8 / ISO-8859-2 / Windows-1250, także z błędną etykietą charsetu
+   (częste w Interii/O2), czyste ASCII i nieznane nazwy charsetów.
+2. Mikro-benchmark względem dawnego łańcucha prób na wyjątkach.
+
+Uruchomienie: python3 tests/test_decode_payload.py
+"""
+
+import os
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parsed_email import ParsedEmail, decode_payload, lookup_codec
+
+TEXT = "Paczka czeka w Paczkomacie. Źródło: Łódź, ul. Śląska 5. Zażółć gęślą jaźń. Kod odbioru: 123456"
+
+
+def legacy_decode_payload(payload, charset):
+    """Dawna implementacja (wzorzec odniesienia dla benchmarku)"""
+    if payload is None:
+        return ""
+    if charset:
+        try:
+            return payload.decode(charset, errors="replace")
+        except (LookupError, UnicodeDecodeError):
+            pass
+    for encoding in ("utf-8", "iso-8859-2"):
+        try:
+            return payload.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return payload.decode("windows-1250", errors="replace")
+
+
+def test_labelled_charsets():
+    for encoding in ("utf-8", "iso-8859-2", "windows-1250"):
+        assert decode_payload(TEXT.encode(encoding), encoding) == TEXT
+
+
+def test_mislabelled_charsets():
+    # Treść w UTF-8 opisana jako ISO-8859-2 i odwrotnie, Windows-1250 opisany jako ISO-8859-2
+    assert decode_payload(TEXT.encode("utf-8"), "iso-8859-2") == TEXT
+    assert decode_payload(TEXT.encode("iso-8859-2"), "utf-8") == TEXT
+    assert decode_payload(TEXT.encode("windows-1250"), "iso-8859-2") == TEXT
+    assert decode_payload(TEXT.encode("windows-1250"), "utf-8") == TEXT
+    assert decode_payload(TEXT.encode("windows-1250"), None) == TEXT
+    assert decode_payload(TEXT.encode("iso-8859-2"), "x-unknown") == TEXT
+
+
+def test_ascii_and_aliases():
+    assert decode_payload(b"Kod odbioru: 123456", "iso-8859-2") == "Kod odbioru: 123456"
+    assert decode_payload(None, "utf-8") == ""
+    assert lookup_codec('"Windows-1250"') == lookup_codec("win-1250") == "cp1250"
+    assert lookup_codec("nie-ma-takiego") is None
+    assert decode_payload(TEXT.encode("utf-16"), "utf-16") == TEXT
+
+
+def test_compact_body():
+    message = EmailMessage()
+    message.set_content("Kod odbioru: 123456")
+    message.add_alternative("<html><body><b>Kod odbioru: 123456</b></body></html>", subtype="html")
+    parsed = ParsedEmail(message)
+    assert parsed.compact_body == parsed.plain_body
+    assert parsed.body == parsed.plain_body + parsed.html_body
+
+
+def run_benchmark(rounds=20000):
+    # Przy błędnej etykiecie dawna wersja jest szybka, ale zwraca znaki zastępcze / krzaki
+    payloads = [
+        ("ASCII (HTML), utf-8", ("<html><body>" + "Regulamin i polityka. " * 300 + "</body></html>").encode(), "utf-8"),
+        ("UTF-8, utf-8", (TEXT * 20).encode("utf-8"), "utf-8"),
+        ("Windows-1250, iso-8859-2", (TEXT * 20).encode("windows-1250"), "iso-8859-2"),
+        ("ISO-8859-2, utf-8", (TEXT * 20).encode("iso-8859-2"), "utf-8"),
+    ]
+    print(f"📊 {rounds} dekodowań na przypadek (treść, etykieta charsetu)")
+    for label, payload, charset in payloads:
+        timings = []
+        for func in (legacy_decode_payload, decode_payload):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                func(payload, charset)
+            timings.append((time.perf_counter() - start) * 1000)
+        correct = legacy_decode_payload(payload, charset) == decode_payload(payload, charset)
+        print(f"   {label:28} dawniej {timings[0]:.0f} ms, teraz {timings[1]:.0f} ms"
+              f"{'' if correct else ' (dawniej błędny tekst)'}")
+
+
+if __name__ == "__main__":
+    test_labelled_charsets()
+    test_mislabelled_charsets()
+    test_ascii_and_aliases()
+    test_compact_body()
+    print("✅ decode_payload poprawnie rozpoznaje kodowania")
+    run_benchmark()
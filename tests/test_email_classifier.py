@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Porównanie skompilowanego klasyfikatora (email_classifier.py) z sekwencyjnym can_handle.
+
+1. Zgodność: dla każdego maila z korpusu obie metody muszą wskazać te same handlery.
+2. Mikro-benchmark: czas klasyfikacji całego korpusu obiema metodami.
+
+Uruchomienie: python3 tests/test_email_classifier.py
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from carriers_data_handlers import (
+    AliexpressDataHandler, InPostDataHandler, DHLDataHandler,
+    DPDDataHandler, GLSDataHandler, PocztaPolskaDataHandler
+)
+from email_classifier import CarrierClassifier
+
+# Ta sama kolejność (priorytet) co w EmailHandler.data_handlers
+HANDLERS = [
+    PocztaPolskaDataHandler(None),
+    GLSDataHandler(None),
+    InPostDataHandler(None),
+    DHLDataHandler(None),
+    AliexpressDataHandler(None),
+    DPDDataHandler(None),
+]
+
+SUBJECTS = [
+    "Zamówienie potwierdzone: 3054169918883922",
+    "Order confirmed - AliExpress",
+    "Twoje zamówienie zostało zamknięte",
+    "Zamówienie wysłane",
+    "Paczka już na Ciebie czeka!",
+    "InPost - Potwierdzenie nadania przesyłki",
+    "Twoja paczka została dostarczona",
+    "Paczkomat SZC15APP - kod odbioru",
+    "Powiadomienie o przesylce JJD000030212345678",
+    "Powiadomienie o przesylce",
+    "DHL Parcel - przesyłka w drodze",
+    "Automat DHL BOX - odbierz paczkę",
+    "Kurier DPD: Twoja paczka jest w drodze",
+    "Kurier GLS: przesyłka nadana",
+    "GLS: Twoja przesyłka jest w drodze",
+    "Przesyłka GLS - opcje dostawy",
+    "DPD i GLS - porównanie",
+    "Twoja paczka od Sklep XYZ: informacja o dostawie",
+    "Poczta Polska: przesyłka o numerze PX123456789",
+    "Pocztex - awizo",
+    "e-INFO: przesyłka w drodze",
+    "Newsletter - promocje tygodnia -50%",
+    "Faktura VAT 12/2024",
+    "Re: spotkanie w piątek",
+    "",
+]
+
+BODIES = [
+    "",
+    "Dzień dobry, Twoja paczka JJD000030212345678 została nadana.",
+    "Numer przesyłki: 12345. Śledź na https://tracktrace.dpd.com.pl/",
+    "Szczegóły na stronie www.dpd.com.pl - kurier DPD",
+    "Kurier GLS dostarczy przesyłkę jutro.",
+    "General Logistics Systems Poland Sp. z o.o.",
+    "Nadawca: informacja@poczta-polska.pl",
+    "Zamówienie potwierdzone. Dziękujemy za zakupy na AliExpress.",
+    "Paczkomat InPost czeka na Ciebie. Kod odbioru: 123456",
+    "Automat DHL - przesyłka gotowa do odbioru",
+    "Promocja! " * 200 + " kurier DPD",
+    "Lorem ipsum dolor sit amet " * 60 + "JJD000030212345678 DHL",
+    "Witaj, Jan user. Order completed.",
+]
+
+
+def chain_classify(subject, body):
+    """Obecna metoda - can_handle każdego handlera po kolei"""
+    return [handler for handler in HANDLERS if handler.can_handle(subject, body)]
+
+
+def build_corpus(size=2000, seed=42):
+    rng = random.Random(seed)
+    corpus = [(subject, body) for subject in SUBJECTS for body in BODIES]
+    while len(corpus) < size:
+        corpus.append((rng.choice(SUBJECTS), rng.choice(BODIES)))
+    return corpus
+
+
+def test_classifier_matches_chain():
+    classifier = CarrierClassifier(HANDLERS)
+    mismatches = []
+
+    for subject, body in build_corpus(size=0):
+        expected = [handler.name for handler in chain_classify(subject, body)]
+        actual = [handler.name for handler in classifier.classify(subject, body)]
+        if expected != actual:
+            mismatches.append((subject, body[:60], expected, actual))
+
+    for mismatch in mismatches:
+        print(f"❌ {mismatch}")
+    assert not mismatches, f"{len(mismatches)} różnic między klasyfikatorem a can_handle"
+
+
+def run_benchmark(size=2000, rounds=3):
+    corpus = build_corpus(size)
+    classifier = CarrierClassifier(HANDLERS)
+
+    def measure(func):
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for subject, body in corpus:
+                func(subject, body)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    chain_time = measure(chain_classify)
+    classifier_time = measure(classifier.classify)
+
+    print(f"📊 Korpus: {len(corpus)} maili, najlepszy z {rounds} przebiegów")
+    print(f"   can_handle po kolei: {chain_time * 1000:.1f} ms ({chain_time / len(corpus) * 1e6:.1f} µs/mail)")
+    print(f"   klasyfikator:        {classifier_time * 1000:.1f} ms ({classifier_time / len(corpus) * 1e6:.1f} µs/mail)")
+    print(f"   przyspieszenie:      x{chain_time / classifier_time:.1f}")
+
+
+if __name__ == "__main__":
+    # Logi INFO z can_handle zafałszowałyby pomiar
+    logging.basicConfig(level=logging.WARNING)
+
+    test_classifier_matches_chain()
+    print("✅ Klasyfikator zgodny z can_handle dla całego korpusu")
+    run_benchmark()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tryb strumieniowy (EmailHandler._process_emails_streaming).
+
+Limit max_emails_per_user dotyczy tylko maili przewoźników: użytkownik, którego najnowsze maile
+to newslettery, nie traci starszego powiadomienia InPost.
+
+Uruchomienie: python3 tests/test_email_streaming.py
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import config
+from carriers_data_handlers import InPostDataHandler
+from email_handler import EmailHandler
+
+INPOST = ("InPost: paczka czeka na odbiór", "InPost: Twoja paczka czeka w Paczkomacie WAW01M. Kod odbioru: 123456")
+NEWSLETTER = ("Promocje tygodnia", "Sprawdź nasze najnowsze oferty i rabaty")
+
+
+def make_handler(messages, analyzed):
+    handler = EmailHandler.__new__(EmailHandler)
+    handler.data_handlers = [InPostDataHandler(handler)]
+    handler.classifier = None
+    handler.checkpoints = None
+    handler.pending_checkpoints = {}
+    handler._pending_checkpoints_lock = threading.Lock()
+
+    handler.iter_new_emails = lambda email_configs_override=None: iter(messages)
+    handler.extract_email_date = lambda email_msg: email_msg['date']
+    handler._extract_email_info = lambda email_source, email_msg: {
+        'subject': email_msg['subject'], 'body': email_msg['body'], 'user_key': 'jan'
+    }
+    handler._prefetch_ai_responses = lambda candidates, newest_first: list(candidates)
+
+    def analyze(email_info, email_source, email_msg, email_date):
+        analyzed.append(email_info['subject'])
+        return {'status': 'pickup', 'user_key': 'jan'} if email_msg['carrier'] else None
+    handler._analyze_email_info = analyze
+    return handler
+
+
+def test_newsletters_do_not_evict_carrier_mail():
+    messages = [('gmail', {'date': "2025-05-01 10:00:00", 'subject': INPOST[0], 'body': INPOST[1], 'carrier': True})]
+    for day in range(2, 10):
+        messages.append(('gmail', {'date': f"2025-05-0{day} 10:00:00", 'subject': NEWSLETTER[0],
+                                   'body': NEWSLETTER[1], 'carrier': False}))
+
+    saved_settings = getattr(config, 'EMAIL_STREAMING', {})
+    config.EMAIL_STREAMING = dict(saved_settings, max_emails_per_user=5)
+    try:
+        analyzed = []
+        processed = make_handler(messages, analyzed)._process_emails_streaming([], newest_first=True)
+    finally:
+        config.EMAIL_STREAMING = saved_settings
+
+    assert processed == [{'status': 'pickup', 'user_key': 'jan'}]
+    assert analyzed == [INPOST[0]]
+
+
+if __name__ == "__main__":
+    test_newsletters_do_not_evict_carrier_mail()
+    print("✅ Strumień: limit na użytkownika tylko dla maili przewoźników")
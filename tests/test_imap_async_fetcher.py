@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Silnik asyncio (imap_async_fetcher.AsyncIMAPFetcher) z podstawionym klientem aioimaplib.
+
+1. IMAP_PARTIAL_FETCH: tylko sekcje tekstowe z BODYSTRUCTURE, nietypowa struktura -> pełne RFC822
+   (te same komendy FETCH co w silniku imaplib), oznaczenie przeczytanych jednym STORE.
+2. IMAP_HEADER_FIRST_FETCH: treść pobierana tylko dla kandydatów, pominięte nie są oznaczane
+   jako przeczytane, a checkpoint przesuwa się za nie.
+
+Uruchomienie: python3 tests/test_imap_async_fetcher.py
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytz
+
+import config
+import imap_async_fetcher
+from email_handler import EmailHandler
+from imap_async_fetcher import AsyncIMAPFetcher
+from test_imap_utils import MIXED, FORWARDED, HEADER, MIXED_HEADER, PLAIN_PART, HTML_PART
+
+Response = namedtuple('Response', 'result lines')
+
+NEWSLETTER_HEADER = b"Subject: Promocje tygodnia\r\nFrom: Sklep <news@sklep.pl>\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n\r\n"
+ACCOUNT = {'source': 'gmail', 'email': 'jan@gmail.com', 'password': 'haslo'}
+FETCH_PARAMS = {
+    'search_only_unseen': True, 'mark_as_read': True, 'process_read_forced': False,
+    'date_string': "01-Jan-2023", 'cutoff_date': datetime(2023, 1, 1), 'days_back': 365, 'max_emails': 50
+}
+
+
+def parse_message_set(message_set):
+    uids = []
+    for part in message_set.split(','):
+        low, _, high = part.partition(':')
+        uids.extend(range(int(low), int(high or low) + 1))
+    return uids
+
+
+class FakeAioClient:
+    """Odpowiada jak aioimaplib: linie 'n FETCH (...)', literały jako osobne linie, na końcu linia statusu"""
+
+    instances = []
+
+    def __init__(self, host, port, timeout):
+        self.commands = []
+        FakeAioClient.instances.append(self)
+
+    async def wait_hello_from_server(self):
+        return None
+
+    async def login(self, user, password):
+        return Response('OK', [b'LOGIN completed'])
+
+    async def select(self, mailbox):
+        return Response('OK', [b'[UIDVALIDITY 7] UIDs valid', b'[UIDNEXT 104] Predicted next UID', b'SELECT completed'])
+
+    async def uid_search(self, criteria, charset=None):
+        return Response('OK', [b'101 102 103', b'SEARCH completed'])
+
+    async def uid(self, command, message_set, *args):
+        self.commands.append((command, message_set) + args)
+        if command == 'store':
+            return Response('OK', [b'STORE completed'])
+        return Response('OK', self._fetch_lines(parse_message_set(message_set), args[0]) + [b'FETCH completed'])
+
+    def _fetch_lines(self, uids, spec):
+        lines = []
+        for seq, uid in enumerate(uids, 1):
+            if 'BODYSTRUCTURE' in spec:
+                structure = {101: MIXED[0], 102: FORWARDED[0]}.get(uid)
+                if structure:
+                    lines.append(re.sub(rb'^\d+ \(UID \d+', b'%d FETCH (UID %d' % (seq, uid), structure))
+            elif 'HEADER.FIELDS' in spec:
+                header = NEWSLETTER_HEADER if uid == 102 else HEADER
+                lines += [b'%d FETCH (UID %d RFC822.SIZE 2048 BODY[HEADER.FIELDS (FROM SUBJECT DATE TO)] {%d}' % (seq, uid, len(header)),
+                          bytearray(header), b')']
+            elif 'BODY.PEEK[HEADER]' in spec:
+                lines += [b'%d FETCH (UID %d BODY[HEADER] {%d}' % (seq, uid, len(MIXED_HEADER)), bytearray(MIXED_HEADER),
+                          b' BODY[1.1] {%d}' % len(PLAIN_PART), bytearray(PLAIN_PART),
+                          b' BODY[1.2] {%d}' % len(HTML_PART), bytearray(HTML_PART), b')']
+            else:
+                raw = HEADER + b"Pelna wiadomosc %d" % uid
+                lines += [b'%d FETCH (UID %d RFC822 {%d}' % (seq, uid, len(raw)), bytearray(raw), b')']
+        return lines
+
+    async def expunge(self):
+        return Response('OK', [b'EXPUNGE completed'])
+
+    async def close(self):
+        return Response('OK', [b'CLOSE completed'])
+
+    async def logout(self):
+        return Response('OK', [b'LOGOUT completed'])
+
+
+class FakeCheckpoints:
+    def get(self, source, email_addr):
+        return None
+
+
+def run_fetch(header_first, partial):
+    handler = EmailHandler.__new__(EmailHandler)
+    handler.email_sources = {'gmail': {'imap_server': 'imap.gmail.com', 'port': 993}}
+    handler.local_tz = pytz.timezone('Europe/Warsaw')
+    handler.sender_filter_disabled = set()
+    handler.checkpoints = FakeCheckpoints()
+    handler.pending_checkpoints = {}
+    handler._pending_checkpoints_lock = threading.Lock()
+    handler._is_carrier_candidate = lambda subject, sender: 'inpost' in sender.lower()
+
+    saved = (imap_async_fetcher.aioimaplib, getattr(config, 'IMAP_HEADER_FIRST_FETCH', {}),
+             getattr(config, 'IMAP_PARTIAL_FETCH', {}), getattr(config, 'IMAP_SENDER_FILTER', {}))
+    imap_async_fetcher.aioimaplib = SimpleNamespace(IMAP4_SSL=FakeAioClient)
+    config.IMAP_HEADER_FIRST_FETCH = dict(saved[1], enabled=header_first)
+    config.IMAP_PARTIAL_FETCH = dict(saved[2], enabled=partial)
+    config.IMAP_SENDER_FILTER = dict(saved[3], enabled=False)
+    FakeAioClient.instances = []
+    try:
+        results = AsyncIMAPFetcher(handler).fetch_all([ACCOUNT], FETCH_PARAMS)
+    finally:
+        (imap_async_fetcher.aioimaplib, config.IMAP_HEADER_FIRST_FETCH,
+         config.IMAP_PARTIAL_FETCH, config.IMAP_SENDER_FILTER) = saved
+
+    checkpoint = handler.pending_checkpoints[('gmail', 'jan@gmail.com')]
+    return results[0], FakeAioClient.instances[0].commands, checkpoint
+
+
+def test_partial_fetch():
+    emails, commands, checkpoint = run_fetch(header_first=False, partial=True)
+
+    assert [cmd[1:] for cmd in commands] == [
+        ('101:103', '(UID BODYSTRUCTURE)'),
+        ('101', '(UID BODY.PEEK[HEADER] BODY.PEEK[1.1] BODY.PEEK[1.2])'),
+        ('102:103', '(UID RFC822)'),
+        ('101:103', '+FLAGS', '(\\Seen)'),
+    ]
+    assert [cmd[0] for cmd in commands] == ['fetch', 'fetch', 'fetch', 'store']
+
+    # Kolejność od najnowszych: 103 i 102 pełne RFC822, 101 złożony z sekcji tekstowych
+    assert [source for source, _ in emails] == ['gmail'] * 3
+    assert "Pelna wiadomosc 103" in emails[0][1].body and "Pelna wiadomosc 102" in emails[1][1].body
+    partial = emails[2][1]
+    assert partial.subject == "Paczka czeka"
+    assert "Kod odbioru: 123456, ul. Łąkowa" in partial.body
+    assert checkpoint['last_uid'] == 103
+
+
+def test_header_first_skips_without_marking_read():
+    emails, commands, checkpoint = run_fetch(header_first=True, partial=False)
+
+    assert [cmd[1:] for cmd in commands] == [
+        ('101:103', '(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE TO)])'),
+        ('101,103', '(UID RFC822)'),
+        ('101,103', '+FLAGS', '(\\Seen)'),
+    ]
+    assert len(emails) == 2
+    assert "Pelna wiadomosc 103" in emails[0][1].body and "Pelna wiadomosc 101" in emails[1][1].body
+    # 102 (newsletter) nie jest pobierany ani oznaczany, ale checkpoint go nie zatrzymuje
+    assert checkpoint['last_uid'] == 103
+
+
+if __name__ == "__main__":
+    test_partial_fetch()
+    test_header_first_skips_without_marking_read()
+    print("✅ Silnik asyncio: pobieranie częściowe i filtr nagłówków jak w imaplib")
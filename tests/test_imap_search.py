@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Kryteria UID SEARCH z filtrem nadawców (EmailHandler._build_sender_criteria / _search_uids).
+
+1. Zrównoważone drzewo OR dla 1, 2, 3 i więcej nadawców (bez duplikatów).
+2. Serwer odrzuca SEARCH z OR/FROM (wyjątek albo status BAD) - powtórka szerokim SEARCH
+   i wyłączenie filtra dla dostawcy.
+
+Uruchomienie: python3 tests/test_imap_search.py
+"""
+
+import imaplib
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_handler import EmailHandler
+
+
+def make_handler(*senders):
+    handler = EmailHandler.__new__(EmailHandler)
+    handler.data_handlers = [SimpleNamespace(sender_patterns=list(senders)), SimpleNamespace(sender_patterns=[senders[0]])]
+    handler.sender_filter_disabled = set()
+    return handler
+
+
+class SearchClient:
+    """Odrzuca wyszukiwanie po nadawcach wyjątkiem (raise_error) albo statusem BAD"""
+
+    def __init__(self, raise_error=True):
+        self.raise_error = raise_error
+        self.searches = []
+
+    def uid(self, command, charset, criteria):
+        self.searches.append(criteria)
+        if 'FROM' in criteria:
+            if self.raise_error:
+                raise imaplib.IMAP4.error("SEARCH command error: BAD [b'Could not parse command']")
+            return 'BAD', [b'Could not parse command']
+        return 'OK', [b'11 12']
+
+
+def test_sender_criteria_tree():
+    assert make_handler('inpost')._build_sender_criteria() == 'FROM "inpost"'
+    assert make_handler('inpost', 'dhl')._build_sender_criteria() == '(OR FROM "inpost" FROM "dhl")'
+    assert make_handler('inpost', 'dhl', 'dpd')._build_sender_criteria() == '(OR FROM "inpost" (OR FROM "dhl" FROM "dpd"))'
+    assert make_handler('a', 'b', 'c', 'd', 'a')._build_sender_criteria() == (
+        '(OR (OR FROM "a" FROM "b") (OR FROM "c" FROM "d"))'
+    )
+
+    criteria = make_handler('inpost', 'dhl')._build_search_criteria("01-May-2025", 10, True, sender_filter=True)
+    assert criteria == '((UID 11:*) (SINCE "01-May-2025") (UNSEEN) (OR FROM "inpost" FROM "dhl"))'
+
+
+def test_search_fallback():
+    for raise_error in (True, False):
+        handler = make_handler('inpost', 'dhl')
+        client = SearchClient(raise_error)
+        found, search_mode = handler._search_uids(client, 'interia', "01-May-2025", None, True, True)
+
+        assert found == [b'11', b'12'] and search_mode == 'unseen'
+        assert client.searches[1] == '((SINCE "01-May-2025") (UNSEEN))'
+        assert handler.sender_filter_disabled == {'interia'}
+
+
+if __name__ == "__main__":
+    test_sender_criteria_tree()
+    test_search_fallback()
+    print("✅ SEARCH: drzewo OR nadawców i powrót do szerokiego wyszukiwania")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Pomocnicze funkcje IMAP (imap_utils.py) i paczkowanie STORE w EmailHandler.
+
+1. compress_message_set: nieposortowane i powtórzone UID, pojedyncze elementy, zakresy.
+2. _store_seen_batched: jeden STORE na paczkę store_chunk_size, błąd paczki nie przerywa kolejnych.
+3. BODYSTRUCTURE (odpowiedzi w formacie imaplib): multipart/alternative, zagnieżdżony multipart/mixed
+   z załącznikami, literały {n}, charset NIL, załączona wiadomość message/rfc822.
+4. parse_fetch_response: UID po literale (Gmail), kilka sekcji i kilka wiadomości w jednej odpowiedzi.
+5. Pobieranie częściowe: wiadomość złożona z sekcji tekstowych, nietypowa struktura -> pełne RFC822.
+
+Uruchomienie: python3 tests/test_imap_utils.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import config
+from imap_utils import (compress_message_set, chunked, parse_fetch_response, get_section,
+                        split_fetch_messages, parse_bodystructure, find_text_parts)
+
+# multipart/alternative (Gmail)
+ALTERNATIVE = [
+    b'1 (UID 101 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "QUOTED-PRINTABLE" 1234 30 NIL NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "UTF-8") NIL NIL "BASE64" 5678 74 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "000abc") NIL NIL NIL))'
+]
+# multipart/mixed: alternative + kod QR + załącznik tekstowy (Interia)
+MIXED = [
+    b'2 (UID 102 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "iso-8859-2") NIL NIL "7BIT" 100 5 NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "iso-8859-2") NIL NIL "QUOTED-PRINTABLE" 900 20 NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL)'
+    b'("IMAGE" "PNG" ("NAME" "qr.png") "<qr@inpost>" NIL "BASE64" 4000 NIL ("INLINE" ("FILENAME" "qr.png")) NIL)'
+    b'("TEXT" "PLAIN" ("NAME" "regulamin.txt") NIL NIL "BASE64" 50 1 NIL ("ATTACHMENT" ("FILENAME" "regulamin.txt")) NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL))'
+]
+# Parametr jako literał {n} i charset NIL (O2)
+LITERAL = [
+    (b'3 (UID 103 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8" "NAME" {16}', b'Paczka "A" 1.txt'),
+    b') NIL NIL "7BIT" 20 1 NIL NIL NIL)("TEXT" "HTML" NIL NIL NIL "8BIT" 42 2 NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "x") NIL NIL))'
+]
+# Przekazany mail jako załącznik message/rfc822
+FORWARDED = [
+    b'4 (UID 104 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+    b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 ("Mon, 1 Jan 2024 10:00:00 +0000" "Paczka" NIL NIL NIL NIL NIL NIL NIL NIL)'
+    b' ("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 20 1 NIL NIL NIL) 12 NIL NIL NIL) "MIXED" ("BOUNDARY" "f") NIL NIL))'
+]
+
+HEADER = b"Subject: Paczka czeka\r\nFrom: InPost <info@inpost.pl>\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n\r\n"
+MIXED_HEADER = HEADER[:-2] + b'MIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+PLAIN_PART = "Kod odbioru: 123456, ul. Łąkowa".encode('iso-8859-2')
+HTML_PART = b"<p>Kod odbioru: <b>123456</b>, ul. =A3=B1kowa</p>"
+
+
+class StoreClient:
+    def __init__(self, failing_set=None):
+        self.stores = []
+        self.failing_set = failing_set
+
+    def uid(self, command, message_set, *args):
+        self.stores.append((command, message_set) + args)
+        if message_set == self.failing_set:
+            raise RuntimeError("STORE odrzucony")
+        return 'OK', [b'']
+
+
+def test_compress_message_set():
+    assert compress_message_set([]) == ""
+    assert compress_message_set([7]) == "7"
+    assert compress_message_set([b'5', b'3', b'4', b'4', b'10']) == "3:5,10"
+    assert compress_message_set(['22', 19, 4, 5, 6, 40, 31, 32, 33]) == "4:6,19,22,31:33,40"
+    assert compress_message_set([1, 3, 5]) == "1,3,5"
+    assert compress_message_set([2, 1, 2, 1]) == "1:2"
+
+
+def test_chunked():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunked([1, 2], 0)) == [[1], [2]]
+    assert list(chunked([], 3)) == []
+
+
+def test_store_seen_batched():
+    from email_handler import EmailHandler
+
+    handler = EmailHandler.__new__(EmailHandler)
+    saved_settings = getattr(config, 'IMAP_BATCH_SETTINGS', {})
+    config.IMAP_BATCH_SETTINGS = dict(saved_settings, store_chunk_size=3)
+    try:
+        client = StoreClient(failing_set="3:4,9")
+        handler._store_seen_batched(client, [b'9', b'3', b'4', b'3', b'21', b'20', b'1'])
+    finally:
+        config.IMAP_BATCH_SETTINGS = saved_settings
+
+    # Paczki po 3 w kolejności wejścia; powtórzony UID w paczce wysyłany raz
+    assert [store[1] for store in client.stores] == ["3:4,9", "3,20:21", "1"]
+    assert all(store[0] == 'STORE' and store[2:] == ('+FLAGS', '\\Seen') for store in client.stores)
+
+
+def text_parts(data):
+    return find_text_parts(parse_bodystructure(split_fetch_messages(data)[0]))
+
+
+def test_bodystructure_text_parts():
+    assert text_parts(ALTERNATIVE) == [
+        {'section': '1', 'subtype': 'plain', 'charset': 'UTF-8', 'encoding': 'quoted-printable', 'size': 1234},
+        {'section': '2', 'subtype': 'html', 'charset': 'UTF-8', 'encoding': 'base64', 'size': 5678},
+    ]
+    # Załączniki (obraz, text/plain z dyspozycją attachment) pomijane
+    assert [(part['section'], part['subtype'], part['charset']) for part in text_parts(MIXED)] == [
+        ('1.1', 'plain', 'iso-8859-2'), ('1.2', 'html', 'iso-8859-2')
+    ]
+    parts = text_parts(LITERAL)
+    assert [part['section'] for part in parts] == ['1', '2']
+    assert parts[1]['charset'] is None and parts[1]['encoding'] == '8bit'
+    assert text_parts(FORWARDED) is None
+
+    single = [b'5 (UID 105 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 42 2 NIL NIL NIL NIL))']
+    assert text_parts(single) == [{'section': '1', 'subtype': 'plain', 'charset': None, 'encoding': '7bit', 'size': 42}]
+
+    # Kilka wiadomości w jednej odpowiedzi
+    messages = split_fetch_messages(ALTERNATIVE + LITERAL + MIXED)
+    assert len(messages) == 3 and b'UID 103' in messages[1] and b'Paczka \\"A\\" 1.txt' in messages[1]
+
+
+def test_parse_fetch_response():
+    data = [
+        (b'1 (BODY[HEADER] {%d}' % len(HEADER), HEADER), b' UID 201 RFC822.SIZE 3000)',
+        (b'2 (UID 202 RFC822.SIZE 4000 BODY[HEADER] {%d}' % len(HEADER), HEADER),
+        (b' BODY[1] {%d}' % len(PLAIN_PART), PLAIN_PART), (b' BODY[2] {%d}' % len(HTML_PART), HTML_PART), b')',
+    ]
+    first, second = parse_fetch_response(data)
+    assert (first['seq'], first['uid'], first['size']) == (1, 201, 3000)
+    assert (second['seq'], second['uid'], second['size']) == (2, 202, 4000)
+    assert get_section(second, 'BODY[HEADER') == HEADER
+    assert second['sections']['BODY[1]'] == PLAIN_PART and second['sections']['BODY[2]'] == HTML_PART
+
+
+class PartialFetchClient:
+    """Odpowiada na FETCH BODYSTRUCTURE / sekcje tekstowe / RFC822 jak imaplib"""
+
+    def __init__(self):
+        self.specs = []
+
+    def uid(self, command, message_set, spec):
+        self.specs.append((message_set, spec))
+        uids = []
+        for part in message_set.split(','):
+            low, _, high = part.partition(':')
+            uids.extend(range(int(low), int(high or low) + 1))
+        if 'BODYSTRUCTURE' in spec:
+            structures = {101: MIXED[0].replace(b'2 (UID 102', b'1 (UID 101'), 102: FORWARDED[0].replace(b'4 (UID 104', b'2 (UID 102')}
+            return 'OK', [structures[uid] for uid in uids if uid in structures]
+        if 'BODY.PEEK[HEADER]' in spec:
+            return 'OK', [
+                (b'1 (UID 101 BODY[HEADER] {%d}' % len(MIXED_HEADER), MIXED_HEADER),
+                (b' BODY[1.1] {%d}' % len(PLAIN_PART), PLAIN_PART), (b' BODY[1.2] {%d}' % len(HTML_PART), HTML_PART), b')'
+            ]
+        raw = HEADER + b"Przekazana wiadomosc"
+        data = []
+        for seq, uid in enumerate(uids, 1):
+            data += [(b'%d (UID %d RFC822 {%d}' % (seq, uid, len(raw)), raw), b')']
+        return 'OK', data
+
+
+def test_partial_fetch_and_full_fallback():
+    from email_handler import EmailHandler
+
+    handler = EmailHandler.__new__(EmailHandler)
+    client = PartialFetchClient()
+    messages = dict(handler._fetch_messages_partial(client, [b'101', b'102', b'103']))
+
+    # 101 - tylko sekcje tekstowe; 102 (message/rfc822) i 103 (brak BODYSTRUCTURE) - pełne RFC822
+    assert [spec for _, spec in client.specs] == [
+        '(UID BODYSTRUCTURE)', '(UID BODY.PEEK[HEADER] BODY.PEEK[1.1] BODY.PEEK[1.2])', '(RFC822)'
+    ]
+    assert client.specs[2][0] == "102:103"
+    assert set(messages) == {b'101', b'102', b'103'}
+
+    partial = messages[b'101']
+    assert partial['Subject'] == "Paczka czeka"
+    plain, html = partial.get_payload()
+    assert plain.get_content_charset() == 'iso-8859-2' and html['Content-Transfer-Encoding'] == 'quoted-printable'
+    assert plain.get_payload(decode=True).decode('iso-8859-2') == "Kod odbioru: 123456, ul. Łąkowa"
+    assert "Łąkowa" in html.get_payload(decode=True).decode('iso-8859-2')
+    assert messages[b'102'].get_payload() == "Przekazana wiadomosc"
+
+
+if __name__ == "__main__":
+    test_compress_message_set()
+    test_chunked()
+    test_store_seen_batched()
+    test_bodystructure_text_parts()
+    test_parse_fetch_response()
+    test_partial_fetch_and_full_fallback()
+    print("✅ Zbiory wiadomości IMAP i paczkowanie STORE")
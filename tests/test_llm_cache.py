@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Cache odpowiedzi AI (llm_cache.py) i klucz cache w OpenAIHandler.
+
+1. TTL: przeterminowany wpis to chybienie i znika przy purge_expired.
+2. max_entries: powyżej limitu usuwane są najdawniej użyte wpisy.
+3. Liczniki trafień / chybień / zapisów w stats().
+4. Klucz zmienia się z PROMPT_VERSION i version_id szablonu, nie zmienia się z białymi znakami treści.
+
+Uruchomienie: python3 tests/test_llm_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from llm_cache import LLMResponseCache
+from openai_handler import OpenAIHandler
+from prompt_templates import PromptTemplate
+
+
+def make_cache(**kwargs):
+    return LLMResponseCache(os.path.join(tempfile.mkdtemp(), 'llm_cache.sqlite3'), **kwargs)
+
+
+def test_ttl_expiry():
+    cache = make_cache(ttl_days=1)
+    cache.put('fresh', 'InPost', {'status': 'pickup'})
+    cache.put('old', 'InPost', {'status': 'delivered'})
+    cache._conn.execute("UPDATE responses SET created = created - ? WHERE key = 'old'", (2 * 24 * 3600,))
+    cache._conn.commit()
+
+    assert cache.get('fresh') == {'status': 'pickup'}
+    assert cache.get('old') is None
+    assert 'old' not in cache and 'fresh' in cache
+
+    cache.purge_expired()
+    assert cache.stats()['entries'] == 1
+
+
+def test_max_entries_eviction():
+    cache = make_cache(max_entries=2)
+    cache.put('a', 'DHL', {'n': 1})
+    time.sleep(0.01)
+    cache.put('b', 'DHL', {'n': 2})
+    time.sleep(0.01)
+    assert cache.get('a') == {'n': 1}  # 'a' użyty później niż 'b'
+    time.sleep(0.01)
+    cache.put('c', 'DHL', {'n': 3})
+
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.stats()['entries'] == 2
+
+
+def test_hit_miss_counters():
+    cache = make_cache()
+    cache.put('a', 'DPD', {'status': 'transit'})
+    cache.get('a')
+    cache.get('a')
+    cache.get('missing')
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (2, 1, 1)
+    assert stats['hit_rate'] == round(2 / 3, 3)
+
+
+def test_carrier_cache_key_versions():
+    handler = OpenAIHandler.__new__(OpenAIHandler)
+    handler._prompt_template = lambda carrier_name, probable_status: None
+    args = ('InPost', 'Paczka czeka', 'jan@example.com', 'Kod odbioru: 123456')
+
+    base = handler._carrier_cache_key(*args)
+    assert base == handler._carrier_cache_key('InPost', 'Paczka czeka', 'JAN@example.com', ' Kod  odbioru:\r\n123456 ')
+
+    handler.PROMPT_VERSION = OpenAIHandler.PROMPT_VERSION + 1
+    assert handler._carrier_cache_key(*args) != base
+    del handler.PROMPT_VERSION
+
+    handler._prompt_template = lambda carrier_name, probable_status: PromptTemplate('test', 'pickup', "Uwaga A")
+    template_a = handler._carrier_cache_key(*args, 'pickup')
+    handler._prompt_template = lambda carrier_name, probable_status: PromptTemplate('test', 'pickup', "Uwaga B")
+    template_b = handler._carrier_cache_key(*args, 'pickup')
+    assert len({base, template_a, template_b}) == 3
+
+    handler.PROMPT_VERSION = OpenAIHandler.PROMPT_VERSION + 1
+    assert handler._carrier_cache_key(*args, 'pickup') != template_b
+
+
+if __name__ == "__main__":
+    test_ttl_expiry()
+    test_max_entries_eviction()
+    test_hit_miss_counters()
+    test_carrier_cache_key_versions()
+    print("✅ Cache AI: TTL, limit wpisów, liczniki i wersje klucza")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Cache surowych wiadomości (message_cache.RawMessageCache).
+
+1. Wiadomości zapisane w jednym przebiegu są czytelne do flush(), nawet ponad max_bytes.
+2. flush() usuwa najdawniej używane pliki do limitu; licznik rozmiaru zgodny z indeksem.
+3. Ta sama treść pod kilkoma kluczami liczona raz.
+
+Uruchomienie: python3 tests/test_message_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from message_cache import RawMessageCache
+
+
+def raw_message(uid):
+    return f"Subject: Paczka {uid}\r\nMessage-ID: <{uid}@test>\r\n\r\n{'Tresc ' * 30}{uid}".encode()
+
+
+def test_eviction_after_flush():
+    sizes = [len(raw_message(uid)) for uid in range(1, 6)]
+    cache = RawMessageCache(tempfile.mkdtemp(), max_bytes=sum(sizes[:2]))
+    keys = [cache.make_key('interia', 'jan@interia.pl', 7, uid) for uid in range(1, 6)]
+
+    for uid, key in enumerate(keys, 1):
+        assert cache.put(raw_message(uid), key)
+        time.sleep(0.01)
+
+    # Przebieg ponad limit - nic nie znika przed flush()
+    assert all(cache.get_message(key) is not None for key in keys)
+    assert cache.get_stats()['bytes'] == sum(sizes)
+
+    cache.get_message(keys[0])  # najstarszy zapis, ale ostatnio użyty
+    cache.flush()
+    stats = cache.get_stats()
+    assert stats['objects'] == 2 and stats['bytes'] <= cache.max_bytes
+    assert stats['bytes'] == sum(entry['size'] for entry in cache.index['objects'].values())
+    assert cache.contains(keys[0]) and cache.contains(keys[4]) and not cache.contains(keys[1])
+
+    reloaded = RawMessageCache(cache.cache_dir, max_bytes=cache.max_bytes)
+    assert reloaded.get_stats()['bytes'] == stats['bytes']
+
+
+def test_same_content_counted_once():
+    cache = RawMessageCache(tempfile.mkdtemp())
+    raw = raw_message(1)
+    digest = cache.put(raw, cache.make_key('o2', 'jan@o2.pl', 1, 1), cache.message_id_key('<1@test>'))
+    assert cache.put(raw, cache.make_key('o2', 'jan@o2.pl', 2, 9)) == digest
+    assert cache.get_stats()['bytes'] == len(raw) and cache.get_stats()['keys'] == 3
+
+
+if __name__ == "__main__":
+    test_eviction_after_flush()
+    test_same_content_counted_once()
+    print("✅ Cache wiadomości: usuwanie ponad limit dopiero w flush()")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Budżet tokenów promptu (prompt_builder.py).
+
+1. Szacunek bez tiktoken: polski tekst z diakrytykami liczony drożej niż 4 znaki = 1 token.
+2. Fragmenty w kolejności ważności: mieszczące się w całości, pierwszy za duży przycięty, reszta pominięta.
+3. Tokeny szablonu liczone raz; zużycie tokenów z odpowiedzi API sumowane w statystykach.
+
+Uruchomienie: python3 tests/test_prompt_builder.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from prompt_builder import PromptBuilder, TokenCounter, TRUNCATED_MARKER
+
+
+class CountingCounter(TokenCounter):
+    """Szacunek bez tokenizera + licznik wywołań count()"""
+
+    def __init__(self):
+        self.encoding = None
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return super().count(text)
+
+
+def test_estimate_polish_text():
+    counter = CountingCounter()
+    polish = "Przesyłka została doręczona. Paczka czeka w automacie – odbiór do środy, kod 123456."
+    ascii_text = "Przesylka zostala doreczona. Paczka czeka w automacie - odbior do srody, kod 123456."
+    assert counter.count(polish) > counter.count(ascii_text)
+    assert counter.count(polish) > len(polish) / 4
+    assert counter.count("") == 0
+
+    truncated = counter.truncate(polish * 20, 30)
+    assert counter.count(truncated) <= 30 and (polish * 20).startswith(truncated)
+
+
+def test_fit_sections_by_rank():
+    builder = PromptBuilder(CountingCounter())
+    code = "Kod odbioru: 123456, paczkomat WAW01A"
+    status = "Paczka czeka na Ciebie w paczkomacie"
+    rest = "Stopka maila " * 200
+    budget = builder.count(code) + builder.count(status) + 40
+
+    fitted = builder.fit_sections([code, status, code, rest], budget)
+    assert fitted.startswith(code + "\n\n" + status)
+    assert fitted.count(code) == 1
+    assert fitted.endswith(TRUNCATED_MARKER)
+    assert builder.count(fitted) <= budget
+
+    # Wszystko mieści się - bez znacznika skrócenia
+    assert builder.fit_sections([code, status], 1000) == code + "\n\n" + status
+
+
+def test_template_tokens_and_usage():
+    counter = CountingCounter()
+    builder = PromptBuilder(counter, max_prompt_tokens=1000, reserve_tokens=50)
+    template = "Instrukcje dla przewoźnika InPost " * 20
+
+    first = builder.body_budget("Temat maila: Paczka", template=template)
+    calls = counter.calls
+    second = builder.body_budget("Temat maila: Paczka", template=template)
+    assert first == second
+    assert counter.calls == calls + 1  # szablon z pamięci, liczony tylko temat
+    assert first == 1000 - 50 - counter.count(template) - counter.count("Temat maila: Paczka")
+
+    assert builder.record_usage(SimpleNamespace(prompt_tokens=900, completion_tokens=60), 950) == (900, 60)
+    assert builder.record_usage(None) is None
+    stats = builder.stats()
+    assert stats['requests'] == 1 and stats['completion_tokens'] == 60
+    assert stats['avg_estimate_error'] == 50 and stats['tokenizer'] == 'szacunek'
+
+
+if __name__ == "__main__":
+    test_estimate_polish_text()
+    test_fit_sections_by_rank()
+    test_template_tokens_and_usage()
+    print("✅ Budżet tokenów: szacunek, fragmenty wg ważności, tokeny szablonu i zużycie")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Kompaktowe szablony promptu (prompt_templates.py).
+
+1. Wybór szablonu: (przewoźnik, status) -> szablon przewoźnika, inaczej ogólny dla statusu,
+   brak statusu / status bez schematu -> None (pełny prompt).
+2. Prompt zawiera tylko schemat i jeden przykład dla statusu, z adresem odbiorcy i przewoźnikiem.
+3. version_id: różny dla szablonów, stały między importami, zmienia się po zmianie treści.
+
+Uruchomienie: python3 tests/test_prompt_templates.py
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from prompt_templates import PROMPT_TEMPLATES, PromptTemplate
+
+
+def test_registry_lookup():
+    assert PROMPT_TEMPLATES.get('InPost', 'pickup').template_id == 'inpost.pickup'
+    assert PROMPT_TEMPLATES.get('inpost', 'pickup').template_id == 'inpost.pickup'
+    assert PROMPT_TEMPLATES.get('GLS', 'pickup').template_id == 'pickup'
+    assert PROMPT_TEMPLATES.get('DHL', None) is None
+    assert PROMPT_TEMPLATES.get('DHL', 'unknown') is None
+
+
+def test_compact_sections():
+    head, tail = PROMPT_TEMPLATES.get('DHL', 'pickup').sections('DHL', 'jan@example.com')
+    prompt = head + tail
+    assert '"pickup" (OBOWIĄZKOWO)' in head
+    assert 'POTWIERDZENIE ZAMÓWIENIA' not in prompt and 'NADANIE PRZESYŁKI' not in prompt
+    assert 'DHL BOX' in tail
+
+    example = tail[tail.index('{', tail.index('Przykładowa odpowiedź JSON:')):tail.rindex('}') + 1]
+    data = json.loads(example)
+    assert data['email'] == 'jan@example.com' and data['carrier'] == 'DHL' and data['status'] == 'pickup'
+
+
+def test_version_ids():
+    version_ids = {PROMPT_TEMPLATES.get(carrier, status).version_id
+                   for carrier, status in [('InPost', 'pickup'), ('DHL', 'pickup'), ('GLS', 'pickup'), ('DPD', 'delivered')]}
+    assert len(version_ids) == 4
+
+    assert PromptTemplate('test', 'pickup', "Uwaga").version_id == PromptTemplate('test', 'pickup', "Uwaga").version_id
+    assert PromptTemplate('test', 'pickup', "Uwaga").version_id != PromptTemplate('test', 'pickup', "Inna uwaga").version_id
+    assert PromptTemplate('test', 'pickup', version=2).version_id.startswith('test@v2-')
+
+
+if __name__ == "__main__":
+    test_registry_lookup()
+    test_compact_sections()
+    test_version_ids()
+    print("✅ Szablony promptu: wybór, treść i wersje")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Porównanie indeksowej ekstrakcji fragmentów (section_extractor.py) z dawnym _extract_section
+opartym o regex (.{0,200}marker.{0,N}).
+
+1. Zgodność: dla każdego maila z korpusu i każdego markera używanego w openai_handler
+   obie metody muszą zwrócić ten sam fragment.
+   Korpus: maile wygenerowane w teście + zapisane wiadomości z message_cache/ (jeśli istnieją).
+2. Mikro-benchmark na dużych (20k+ znaków) treściach.
+
+Uruchomienie: python3 tests/test_section_extractor.py
+"""
+
+import glob
+import os
+import random
+import re
+import sys
+import time
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parsed_email import ParsedEmail
+from section_extractor import SectionExtractor, find_section, merge_spans
+
+# Markery i długości kontekstu z openai_handler (DHL, InPost, DPD, AliExpress, Poczta Polska)
+MARKERS = [
+    ("JJD\\d{18,25}", 1500), ("3S\\d{10,15}", 1500), ("JVGL\\d{10,15}", 1500),
+    ("czekasz na paczkę", 2000), ("już do Ciebie jedzie", 2000), ("PIN", 2000), ("odbierz ją do", 2000),
+    ("automat dhl", 2000), ("dhl box", 2000), ("punkt odbioru", 2000),
+    ("PIN", 1000), ("kod odbioru", 1000), ("\\d{6}", 1000), ("odbierz.*podając", 1000),
+    ("godziny otwarcia", 800), ("nadawca", 800), ("CAINIAO", 800),
+    ("\\d{20}", 1000), ("numer przesyłki", 1000), ("[A-Z]{3}\\d{2}[A-Z]{2,4}", 2000), ("paczkomat", 2000),
+    ("zeskanuj kod QR", 1200), ("została nadana", 1500), ("paczka już na ciebie czeka", 1500),
+    ("\\d{13}[A-Z]", 1000), ("kurier", 1200), ("adres dostawy", 1200),
+    ("zamówienie \\d+", 1200), ("order \\d+", 1200), ("\\d{13,16}", 1200), ("produkt", 1500),
+    ("PX\\d{10,}", 1000), ("\\(00\\)\\d{18}", 1000), ("Kod PIN", 800), ("awizo", 800),
+    ("Kod odbioru", 500), ("kod\\s+\\d{6}", 500), ("Numer\\s+telefonu.*Kod\\s+odbioru", 500),
+    ("Termin odbioru", 500), ("nie ma takiego markera", 400),
+]
+
+SNIPPETS = [
+    "Twoja przesyłka JJD000030212345678901 już do Ciebie jedzie!",
+    "Czekasz na paczkę od CAINIAO. Nadawca: CAINIAO Warehouse",
+    "Kod odbioru: 123456, PIN 987654. Odbierz ją do 12.05.2025",
+    "<td>Kod odbioru</td><td><b>654321</b></td>",
+    "Automat DHL BOX 24/7, Teofila Firlika 20, Szczecin - punkt odbioru",
+    "Paczkomat SZC15APP, przy wejściu do sklepu. Zeskanuj kod QR",
+    "Numer przesyłki: 12345678901234567890, została nadana",
+    "Kurier DPD doręczy paczkę 1234567890123A pod adres dostawy",
+    "Zamówienie 3054169918883922 - szczegóły zamówienia, produkt: kabel USB",
+    "Poczta Polska PX1234567890 (00)123456789012345678 awizo, Kod PIN 1111",
+    "Godziny otwarcia: pon-pt 8-20. Odbierz, podając kod",
+    "Numer telefonu: 600100200 Kod odbioru: 445566",
+]
+
+FILLER = [
+    '<table width="100%"><tr><td style="padding:0;font-family:Arial">',
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit. ",
+    "</td></tr></table>\n",
+    "Zgoda marketingowa, regulamin, polityka prywatności. ",
+    '<img src="https://example.com/pixel.gif" width="1" height="1">',
+]
+
+
+def legacy_extract_section(text, section_marker, chars_after=300):
+    """Dawna implementacja _extract_section (wzorzec odniesienia)"""
+    if isinstance(section_marker, str):
+        flexible_marker = section_marker.replace(" ", "\\s+")
+        patterns = [
+            f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})",
+            f"(.{{0,200}}{flexible_marker}.{{0,{chars_after}}})",
+            f"(<[^>]*>{section_marker}[^<]*</[^>]*>.{{0,{chars_after}}})"
+        ]
+    else:
+        patterns = [f"(.{{0,200}}{section_marker}.{{0,{chars_after}}})"]
+
+    for pattern in patterns:
+        try:
+            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+            if match:
+                return match.group(1)
+        except Exception:
+            pass
+    return None
+
+
+def build_corpus(count=30, size=22000, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        parts = []
+        length = 0
+        while length < size:
+            part = rng.choice(SNIPPETS) if rng.random() < 0.08 else rng.choice(FILLER)
+            parts.append(part)
+            length += len(part)
+        corpus.append("".join(parts))
+
+    # Krótkie przypadki brzegowe: marker na początku, na końcu, brak markera
+    corpus.extend(["PIN", "abc PIN", "x" * 50 + "kod odbioru", "", "Lorem ipsum " * 100])
+    return corpus
+
+
+def load_recorded_corpus(cache_dir="message_cache"):
+    """Treści zapisanych wiadomości (cache z message_cache.py), jeśli są na dysku"""
+    bodies = []
+    for path in glob.glob(os.path.join(cache_dir, "objects", "*", "*.eml")):
+        try:
+            with open(path, 'rb') as f:
+                bodies.append(ParsedEmail(BytesParser().parse(f)).body)
+        except Exception as e:
+            print(f"⚠️ Pominięto {path}: {e}")
+    return bodies
+
+
+def test_find_section_matches_legacy():
+    mismatches = []
+    for text in build_corpus(count=10) + load_recorded_corpus():
+        for marker, chars_after in MARKERS:
+            expected = legacy_extract_section(text, marker, chars_after)
+            actual = find_section(text, marker, chars_after)
+            if expected != actual:
+                mismatches.append((marker, chars_after, len(text)))
+
+    for mismatch in mismatches:
+        print(f"❌ {mismatch}")
+    assert not mismatches, f"{len(mismatches)} różnic między find_section a dawnym _extract_section"
+
+
+def test_merge_spans():
+    assert merge_spans([(50, 80), (0, 10), (5, 20), (20, 30)]) == [(0, 30), (50, 80)]
+    assert merge_spans([]) == []
+
+
+def test_ranked_sections():
+    # Fragmenty w kolejności wzorców, bez powtórzeń nakładającego się tekstu, reszta treści na końcu
+    text = "AAAA" * 100 + " Kod odbioru: 123456 " + "BBBB" * 100 + " PIN 654321 " + "CCCC" * 100
+    extractor = SectionExtractor(text)
+    pin = extractor.extract("PIN", 50)
+    code = extractor.extract("kod odbioru", 300)
+    sections = extractor.ranked_sections()
+    assert sections[0] == pin
+    assert "123456" in code and sections[1] in code and sections[1] not in pin
+    assert "".join(sorted(sections, key=text.index)) == text
+    assert extractor.ranked_sections(include_rest=False) == sections[:2]
+
+
+def run_benchmark(count=6):
+    corpus = build_corpus(count=count)
+
+    def measure(func):
+        start = time.perf_counter()
+        for text in corpus:
+            for marker, chars_after in MARKERS:
+                func(text, marker, chars_after)
+        return time.perf_counter() - start
+
+    legacy_time = measure(legacy_extract_section)
+    new_time = measure(find_section)
+
+    print(f"📊 {len(corpus)} maili (~{sum(map(len, corpus)) // len(corpus)} znaków) x {len(MARKERS)} markerów")
+    print(f"   regex (.{{0,200}}marker.{{0,N}}): {legacy_time * 1000:.0f} ms")
+    print(f"   find_section:                {new_time * 1000:.0f} ms")
+    print(f"   przyspieszenie:              x{legacy_time / new_time:.1f}")
+
+
+if __name__ == "__main__":
+    test_find_section_matches_legacy()
+    test_merge_spans()
+    test_ranked_sections()
+    print("✅ find_section zgodne z dawnym _extract_section")
+    run_benchmark()
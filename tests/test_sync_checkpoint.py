@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Checkpoint synchronizacji przyrostowej (EmailHandler._save_sync_checkpoint).
+
+1. Limit O2 / max_emails: checkpoint zatrzymuje się przed najstarszym odciętym UID.
+2. Paczka FETCH z błędem: checkpoint zatrzymuje się przed najniższym niepobranym UID.
+3. Wszystko obsłużone: checkpoint przesuwa się do UIDNEXT - 1.
+4. Zapis dopiero w commit_sync_checkpoints (po przetworzeniu maili).
+
+Uruchomienie: python3 tests/test_sync_checkpoint.py
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import config
+from email_handler import EmailHandler
+
+MAILBOX_STATE = {'uidvalidity': 7, 'uidnext': 21, 'highestmodseq': None}
+RAW_EMAIL = b"Subject: Paczka\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n\r\nTresc"
+
+
+class FakeCheckpoints:
+    def __init__(self):
+        self.saved = {}
+
+    def update(self, source, email_addr, **checkpoint):
+        self.saved[(source, email_addr)] = checkpoint
+
+
+class FailingChunkClient:
+    """FETCH zwraca NO dla paczki zawierającej failing_uid"""
+
+    def __init__(self, failing_uid):
+        self.failing_uid = failing_uid
+
+    def uid(self, command, message_set, spec):
+        uids = []
+        for part in message_set.split(','):
+            low, _, high = part.partition(':')
+            uids.extend(range(int(low), int(high or low) + 1))
+        if self.failing_uid in uids:
+            return 'NO', [b'FETCH failed']
+        data = []
+        for seq, uid in enumerate(uids, 1):
+            data.append((f"{seq} (UID {uid} RFC822 {{{len(RAW_EMAIL)}}}".encode(), RAW_EMAIL))
+            data.append(b")")
+        return 'OK', data
+
+
+def make_handler():
+    handler = EmailHandler.__new__(EmailHandler)
+    handler.checkpoints = FakeCheckpoints()
+    handler.pending_checkpoints = {}
+    handler._pending_checkpoints_lock = threading.Lock()
+    return handler
+
+
+def last_uid(handler, all_msg_list, handled_uids):
+    handler._save_sync_checkpoint('o2', 'jan@o2.pl', MAILBOX_STATE, 10, all_msg_list, 'unseen', handled_uids)
+    return handler.pending_checkpoints[('o2', 'jan@o2.pl')]['last_uid']
+
+
+def test_capped_uids_hold_checkpoint():
+    handler = make_handler()
+    found = [str(uid).encode() for uid in range(11, 21)]
+    all_msg_list, to_process = handler._select_uids_to_process('o2', found, 10, 4)
+    assert [int(uid) for uid in to_process] == [20, 19, 18, 17]
+
+    assert last_uid(handler, all_msg_list, {int(uid) for uid in to_process}) == 10
+    # Obsłużone wszystko od 11 do 14 - następny cykl zaczyna od 15
+    assert last_uid(handler, all_msg_list, set(range(11, 15)) | {17, 18, 19, 20}) == 14
+
+
+def test_failed_chunk_holds_checkpoint():
+    handler = make_handler()
+    uids = [str(uid).encode() for uid in range(20, 10, -1)]
+    saved_settings = getattr(config, 'IMAP_BATCH_SETTINGS', {})
+    config.IMAP_BATCH_SETTINGS = dict(saved_settings, fetch_chunk_size=3)
+    try:
+        fetched = [int(num) for num, _ in handler._iter_fetched_messages(FailingChunkClient(16), uids)]
+    finally:
+        config.IMAP_BATCH_SETTINGS = saved_settings
+
+    assert fetched == [20, 19, 18, 14, 13, 12, 11]
+    assert last_uid(handler, uids, set(fetched)) == 14
+
+
+def test_commit_after_processing():
+    handler = make_handler()
+    uids = [str(uid).encode() for uid in range(11, 16)]
+    assert last_uid(handler, uids, set(range(11, 16))) == 20
+    assert handler.checkpoints.saved == {}
+
+    handler.commit_sync_checkpoints()
+    assert handler.checkpoints.saved[('o2', 'jan@o2.pl')]['last_uid'] == 20
+    assert handler.pending_checkpoints == {}
+
+
+if __name__ == "__main__":
+    test_capped_uids_hold_checkpoint()
+    test_failed_chunk_holds_checkpoint()
+    test_commit_after_processing()
+    print("✅ Checkpoint: limity, błędy FETCH i zapis po przetworzeniu")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Szablony powiadomień (template_fingerprint.TemplateStore).
+
+Maile z jednego szablonu InPost (inne numery, kody, paczkomaty, adresy, daty) mają ten sam odcisk;
+po potwierdzeniu kotwic kolejne maile są wyciągane bez AI, a mail z innego szablonu - nie.
+Słowa statusu zostają w odcisku, więc "Doręczona" i "Nadana" to różne szablony.
+
+Uruchomienie: python3 tests/test_template_fingerprint.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from template_fingerprint import TemplateStore, skeleton
+
+TEMPLATE = (
+    "<html><body><p>Cześć {name}!</p><p>Twoja paczka {pkg} czeka w Paczkomacie {loc}, {addr}.</p>"
+    "<p>Kod odbioru: <b>{code}</b></p><p>Odbierz ją do {date} do godz. 12:00.</p></body></html>"
+)
+MAILS = [
+    dict(name="Jan", pkg="620212345678901234567890", loc="SZC15APP",
+         addr="ul. Teofila Firlika 20, 71-637 Szczecin", code="123456", date="20-05-2025"),
+    dict(name="Anna", pkg="620299999999999999999999", loc="WAW01M",
+         addr="al. Jana Pawła II 5/7, 00-001 Warszawa", code="654321", date="01-06-2025"),
+    dict(name="Ola", pkg="620211111111111111111111", loc="GDA9N",
+         addr="os. Kolorowe 12B, 80-001 Gdańsk", code="111222", date="15-07-2025"),
+]
+
+
+def ai_response(mail):
+    """Odpowiedź, jaką zwróciłoby AI (daty w formacie DD.MM.YYYY)"""
+    return {
+        "status": "pickup",
+        "package_number": mail['pkg'],
+        "pickup_location": f"{mail['loc']}, {mail['addr']}",
+        "pickup_code": mail['code'],
+        "pickup_deadline": mail['date'].replace('-', '.'),
+    }
+
+
+def source(store, mail):
+    return store.source_text(f"Paczka {mail['pkg']} czeka", TEMPLATE.format(**mail))
+
+
+def test_same_template_same_signature():
+    skeletons = {skeleton(TEMPLATE.format(**mail)) for mail in MAILS}
+    assert len(skeletons) == 1
+    assert skeleton("Paczka odebrana. Dziękujemy!") not in skeletons
+
+
+def test_status_word_changes_signature():
+    # Maile różniące się tylko słowem statusu (także na początku zdania) to różne szablony
+    store = TemplateStore(os.path.join(tempfile.mkdtemp(), "templates.json"))
+    delivered = "Przesyłka PX1945096838 została. Doręczona dnia 12.05.2025 w Szczecinie."
+    sent = "Przesyłka PX1945096838 została. Nadana dnia 12.05.2025 w Szczecinie."
+    assert skeleton(delivered) != skeleton(sent)
+    assert store.signature("PocztaPolska", delivered) != store.signature("PocztaPolska", sent)
+
+
+def test_learn_confirm_extract():
+    store = TemplateStore(os.path.join(tempfile.mkdtemp(), "templates.json"), min_confirmations=2)
+    sources = [source(store, mail) for mail in MAILS]
+    signature = store.signature("InPost", sources[0])
+
+    # Pierwszy mail uczy, drugi potwierdza - dopiero potem szablon zastępuje AI
+    assert store.extract(signature, sources[0]) is None
+    store.learn(signature, "InPost", sources[0], ai_response(MAILS[0]))
+    assert store.extract(signature, sources[1]) is None
+    store.learn(signature, "InPost", sources[1], ai_response(MAILS[1]))
+
+    assert store.signature("InPost", sources[2]) == signature
+    assert store.extract(signature, sources[2]) == ai_response(MAILS[2])
+    assert store.stats() == {'templates': 1, 'active': 1, 'hits': 1}
+
+    # Szablony przetrwają restart
+    reloaded = TemplateStore(store.path, min_confirmations=2)
+    assert reloaded.extract(signature, sources[2]) == ai_response(MAILS[2])
+
+
+def test_disagreement_relearns():
+    store = TemplateStore(os.path.join(tempfile.mkdtemp(), "templates.json"), min_confirmations=2)
+    sources = [source(store, mail) for mail in MAILS]
+    signature = store.signature("InPost", sources[0])
+    store.learn(signature, "InPost", sources[0], ai_response(MAILS[0]))
+
+    # AI wyciągnęło pole, którego kotwice nie znają - szablon uczony od nowa, dalej nieaktywny
+    response = dict(ai_response(MAILS[1]), info="Paczkomat 24/7")
+    store.learn(signature, "InPost", sources[1], response)
+    assert store.extract(signature, sources[2]) is None
+    assert store.templates[signature]['confirmations'] == 1
+
+
+if __name__ == "__main__":
+    test_same_template_same_signature()
+    test_status_word_changes_signature()
+    test_learn_confirm_extract()
+    test_disagreement_relearns()
+    print("✅ Szablony powiadomień rozpoznawane i wyciągane bez AI")